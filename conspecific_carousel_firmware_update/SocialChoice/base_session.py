@@ -11,23 +11,23 @@
 #   and the door proximity sensor are clear before rotating the turntable,
 #   so the motor never moves while the animal is in the way.
 
-import random
 import threading
 import time
 
+import state_machine
+import tracing
 from hardware import (
     deliver_reward,
     incremental_reward,
-    sensor_held,
     wait_for_table_stopped,
     turn_table_degrees,
     shutdown_outputs,
     SharedSensorState,
-    STOP_EVENT,
 )
+from session_common import SessionCommon
 
 
-class BaseSCSession:
+class BaseSCSession(SessionCommon):
 
     _session_name = "Social Choice Session"
     ITI_MIN = 5.0
@@ -43,6 +43,7 @@ class BaseSCSession:
     ):
         self.ser = ser
         self.shared = shared
+        self.stop_event = shared.stop_event   # the rig's stop token (rig.py)
         self.species = species
         self.valve_time = valve_time
         self.session_duration = session_duration
@@ -52,6 +53,7 @@ class BaseSCSession:
         self.max_trials    = None
         self.running       = False
         self.thread        = None
+        self._init_common()   # schedule, adaptation, params (session_common.py)
 
         self._current_angle = 0  # local turntable angle tracking
 
@@ -66,7 +68,7 @@ class BaseSCSession:
 
     def stop(self):
         self.running = False
-        STOP_EVENT.set()
+        self.stop_event.set()
         if self.thread is not None:
             self.thread.join()
 
@@ -74,15 +76,20 @@ class BaseSCSession:
         start_time = time.time()
         print(f"[INFO] {self._session_name} started")
 
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if self.session_duration is not None:
                 if time.time() - start_time >= self.session_duration:
                     print("[INFO] Session duration reached")
                     break
             self.trial_counter += 1
             print(f"\n=== Trial {self.trial_counter} ===")
+            self.params.apply_pending()
+            self.adaptation.before_trial()
             try:
-                self._run_trial()
+                with tracing.span(self.shared, "trial", cat="trial", trial=self.trial_counter):
+                    self._run_trial()
+                self._adapt_from_log()
+                self.params.annotate()
             except TimeoutError as e:
                 print(f"[ERROR] Trial {self.trial_counter} aborted — serial timeout: {e}")
                 try:
@@ -112,41 +119,29 @@ class BaseSCSession:
     # ── Sensor helpers ────────────────────────────────────────────────────────
 
     def _wait_for_poke(self, port: str, deadline: float = None) -> bool:
-        while True:
-            if not self.running or STOP_EVENT.is_set():
-                return False
-            if deadline is not None and time.time() >= deadline:
-                return False
-            state, _ = self.shared.get_port(port)
-            if state == "triggered" and sensor_held(self.shared, port):
-                return True
-            time.sleep(0.001)
+        with tracing.span(self.shared, "wait poke", port=port):
+            return state_machine.wait_for_poke(self.shared, port, deadline,
+                                               should_stop=lambda: not self.running)
 
     def _wait_for_any_poke(self, ports, deadline: float = None):
         """Returns port name on first poke, or None on stop/deadline."""
-        while True:
-            if not self.running or STOP_EVENT.is_set():
-                return None
-            if deadline is not None and time.time() >= deadline:
-                return None
-            for port in ports:
-                state, _ = self.shared.get_port(port)
-                if state == "triggered" and sensor_held(self.shared, port):
-                    return port
-            time.sleep(0.001)
+        with tracing.span(self.shared, "wait poke", port="/".join(ports)):
+            return state_machine.wait_for_any_poke(self.shared, ports, deadline,
+                                                   should_stop=lambda: not self.running)
 
     def _wait_for_sensors_clear(self) -> bool:
         """Block until the table sensor and door proximity sensor are both clear.
         Safe to call before rotating the turntable.
         Returns False if session stopped."""
-        while self.running and not STOP_EVENT.is_set():
-            table_state, _  = self.shared.get_port("table")
-            snap            = self.shared.get()
-            door_prox_clear = (snap.doorsensor != "triggered")
-            if table_state == "cleared" and door_prox_clear:
-                return True
-            time.sleep(0.05)
-        return False
+        with tracing.span(self.shared, "wait sensors clear"):
+            while self.running and not self.stop_event.is_set():
+                table_state, _  = self.shared.get_port("table")
+                snap            = self.shared.get()
+                door_prox_clear = (snap.doorsensor != "triggered")
+                if table_state == "cleared" and door_prox_clear:
+                    return True
+                time.sleep(0.05)
+            return False
 
     # ── Turntable ─────────────────────────────────────────────────────────────
 
@@ -165,13 +160,15 @@ class BaseSCSession:
     # ── Timing ───────────────────────────────────────────────────────────────
 
     def _wait(self, duration: float) -> None:
-        start = time.time()
-        while self.running and not STOP_EVENT.is_set() and (time.time() - start < duration):
-            time.sleep(0.02)
+        with tracing.span(self.shared, "wait"):
+            start = time.time()
+            while self.running and not self.stop_event.is_set() and (time.time() - start < duration):
+                time.sleep(0.02)
 
     def _run_iti(self, iti: float = None) -> None:
         if iti is None:
-            iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
-        start = time.time()
-        while self.running and not STOP_EVENT.is_set() and (time.time() - start < iti):
-            time.sleep(0.05)
+            iti = self._next_iti()
+        with tracing.span(self.shared, "iti", iti_s=round(iti, 3)):
+            start = time.time()
+            while self.running and not self.stop_event.is_set() and (time.time() - start < iti):
+                time.sleep(0.05)
@@ -7,12 +7,11 @@
 #   rat   — incremental_reward
 #   mouse — fixed deliver_reward
 
-import random
 import time
 import numpy as np
 import pandas as pd
 
-from hardware import set_led, STOP_EVENT
+from hardware import set_led
 from .base_session import BaseSCSession
 
 
@@ -51,7 +50,7 @@ class LearningSession(BaseSCSession):
         rewarded        = False
 
         # Wait for port C to clear before lighting
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if self.shared.get_port("C")[0] == "cleared":
                 break
             time.sleep(0.005)
@@ -73,7 +72,7 @@ class LearningSession(BaseSCSession):
         self.reward_count += 1
         print(f"Reward at port C (#{self.reward_count}, valve={valve_time_used:.3f} s)")
 
-        iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
+        iti = self._next_iti()
         self.results_df.loc[len(self.results_df)] = {
             "trial_num":        self.trial_counter,
             "reward_triggered": rewarded,
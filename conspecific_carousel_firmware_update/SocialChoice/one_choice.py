@@ -7,12 +7,11 @@
 #      Deadline expires              → miss
 #   4. ITI
 
-import random
 import time
 import numpy as np
 import pandas as pd
 
-from hardware import set_led, STOP_EVENT
+from hardware import set_led
 from .base_session import BaseSCSession
 
 
@@ -57,7 +56,7 @@ class OneChoiceSession(BaseSCSession):
         outcome         = "miss"
 
         # Wait for port A to clear before lighting
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if self.shared.get_port("A")[0] == "cleared":
                 break
             time.sleep(0.005)
@@ -78,7 +77,7 @@ class OneChoiceSession(BaseSCSession):
         print(f"Port A poked (rt_a={rt_a:.3f} s)")
 
         # Step 2: Port C LED on → decision window
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if self.shared.get_port("C")[0] == "cleared":
                 break
             time.sleep(0.005)
@@ -106,7 +105,7 @@ class OneChoiceSession(BaseSCSession):
             outcome = "miss"
             print("Miss: port C window expired")
 
-        iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
+        iti = self._next_iti()
         self.results_df.loc[len(self.results_df)] = {
             "trial_num":        self.trial_counter,
             "outcome":          outcome,
@@ -10,14 +10,15 @@
 #       Wait sensors clear → rotate to social_angle → social_duration s
 #       → wait sensors clear → rotate back to 0°
 #
-# Anti-bias: 10 consecutive same choices → force other port for 1 trial.
+# Anti-bias: 10 consecutive same choices → force other port for 1 trial
+# (an adaptation.SideStreak on _forced_port, fed each trial's logged row).
 
-import random
 import time
 import numpy as np
 import pandas as pd
 
-from hardware import set_led, wait_for_table_stopped, STOP_EVENT
+from adaptation import SideStreak
+from hardware import set_led, wait_for_table_stopped
 from .base_session import BaseSCSession
 
 BIAS_THRESHOLD = 10
@@ -47,9 +48,9 @@ class TwoChoiceSession(BaseSCSession):
         self.ITI_MIN         = iti_min
         self.ITI_MAX         = iti_max
 
-        self._streak_port  = None
-        self._streak_count = 0
         self._forced_port  = None  # not None → only this LED is shown next trial
+        self.adaptation.add(SideStreak("_forced_port", "poked_port", length=BIAS_THRESHOLD,
+                                       release="next", skip_missing=False))
 
         self.results_df = pd.DataFrame(columns=[
             "trial_num",
@@ -76,28 +77,6 @@ class TwoChoiceSession(BaseSCSession):
             return [self._forced_port]
         return ["A", "B"]
 
-    def _update_anti_bias(self, poked_port):
-        if self._forced_port is not None:
-            # Reset unconditionally after forced trial
-            self._forced_port  = None
-            self._streak_port  = None
-            self._streak_count = 0
-            return
-
-        if poked_port == self._streak_port:
-            self._streak_count += 1
-        else:
-            self._streak_port  = poked_port
-            self._streak_count = 1
-
-        if self._streak_count >= BIAS_THRESHOLD:
-            other = "B" if poked_port == "A" else "A"
-            self._forced_port  = other
-            self._streak_count = 0
-            self._streak_port  = None
-            print(f"[Anti-bias] {BIAS_THRESHOLD} consecutive {poked_port} choices "
-                  f"→ forcing {other}")
-
     # ── Trial ─────────────────────────────────────────────────────────────────
 
     def _run_trial(self):
@@ -115,7 +94,7 @@ class TwoChoiceSession(BaseSCSession):
 
         # Ensure A and B clear before lighting
         for p in ["A", "B"]:
-            while self.running and not STOP_EVENT.is_set():
+            while self.running and not self.stop_event.is_set():
                 if self.shared.get_port(p)[0] == "cleared":
                     break
                 time.sleep(0.005)
@@ -142,7 +121,7 @@ class TwoChoiceSession(BaseSCSession):
             choice_type = "sucrose"
             outcome     = "miss"
 
-            while self.running and not STOP_EVENT.is_set():
+            while self.running and not self.stop_event.is_set():
                 if self.shared.get_port("C")[0] == "cleared":
                     break
                 time.sleep(0.005)
@@ -185,7 +164,7 @@ class TwoChoiceSession(BaseSCSession):
             print(f"Social stimulus visible — {self.social_duration:.1f} s timer started")
 
             social_start = time.time()
-            while self.running and not STOP_EVENT.is_set():
+            while self.running and not self.stop_event.is_set():
                 elapsed        = time.time() - social_start
                 table_state, _ = self.shared.get_port("table")
                 snap           = self.shared.get()
@@ -197,7 +176,7 @@ class TwoChoiceSession(BaseSCSession):
             social_dur_rec = time.time() - social_start
             trial_end      = time.time()
 
-            if not self.running or STOP_EVENT.is_set():
+            if not self.running or self.stop_event.is_set():
                 return
 
             # Rotate back to default position
@@ -206,9 +185,7 @@ class TwoChoiceSession(BaseSCSession):
             wait_for_table_stopped(self.shared)
             print("Table returned to default")
 
-        self._update_anti_bias(poked_port)
-
-        iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
+        iti = self._next_iti()
         self.results_df.loc[len(self.results_df)] = {
             "trial_num":        self.trial_counter,
             "active_ports":     str(active_ports),
@@ -2,7 +2,7 @@
 #
 # Key differences from SocialReward/base_session:
 #   _deliver_reward(port) takes port as an argument (not fixed to self.port)
-#   stop_internal()       stops this session only, without setting global STOP_EVENT
+#   stop_internal()       stops this session only, without setting the rig's stop_event
 #
 # _run_presentation / _run_cc_iti / _turn_to / _turn_ccw_partial are shared by any
 # subclass that presents a stimulus on the turntable with a CC-filled ITI between
@@ -17,10 +17,11 @@ import time
 
 import pandas as pd
 
+import state_machine
+import tracing
 from hardware import (
     deliver_reward,
     incremental_reward,
-    sensor_held,
     shutdown_outputs,
     open_door,
     close_door_safe,
@@ -28,11 +29,12 @@ from hardware import (
     wait_for_table_stopped,
     turn_table_degrees,
     SharedSensorState,
-    STOP_EVENT,
 )
+from session_common import SessionCommon
+from trial_schedule import TrialSchedule
 
 
-class BaseSMSession:
+class BaseSMSession(SessionCommon):
 
     _session_name = "Session"
     ITI_MIN = 5.0
@@ -53,6 +55,7 @@ class BaseSMSession:
     ):
         self.ser = ser
         self.shared = shared
+        self.stop_event = shared.stop_event   # the rig's stop token (rig.py)
         self.species = species
         self.valve_times = valve_times
         self.session_duration = session_duration
@@ -62,6 +65,7 @@ class BaseSMSession:
         self.max_trials = None
         self.running = False
         self.thread = None
+        self._init_common()   # schedule, adaptation, params (session_common.py)
 
         # Used by subclasses that present stimuli on the turntable
         self._current_angle = 0
@@ -71,6 +75,15 @@ class BaseSMSession:
         # session thread (appends rows) and the main thread (polls for the GUI).
         self._df_lock = threading.Lock()
 
+    # ── Trial schedule ────────────────────────────────────────────────────────
+
+    def _cc_iti(self, iti_min: float, iti_max: float) -> float:
+        """CC ITI before the next presentation. Presentation sessions run no
+        trials, so row n of the schedule is free for the ITI before presentation n."""
+        if self.schedule is not None:
+            return self.schedule.iti(self._presentation_counter + 1, iti_min, iti_max)
+        return random.uniform(iti_min, iti_max)
+
     # ── Session control ───────────────────────────────────────────────────────
 
     def start(self):
@@ -81,14 +94,15 @@ class BaseSMSession:
         self.thread.start()
 
     def stop(self):
-        """Full stop — also sets global STOP_EVENT to halt all sessions."""
+        """Full stop — also sets the rig's stop_event (STOP_EVENT for a single-rig
+        main) to halt everything on that rig."""
         self.running = False
-        STOP_EVENT.set()
+        self.stop_event.set()
         if self.thread is not None:
             self.thread.join()
 
     def stop_internal(self):
-        """Stop only this session; does not affect global STOP_EVENT."""
+        """Stop only this session; does not set stop_event."""
         self.running = False
         if self.thread is not None:
             self.thread.join(timeout=5)
@@ -99,15 +113,20 @@ class BaseSMSession:
         start_time = time.time()
         print(f"[INFO] {self._session_name} started")
 
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if self.session_duration is not None:
                 if time.time() - start_time >= self.session_duration:
                     print("[INFO] Session duration reached")
                     break
             self.trial_counter += 1
             print(f"\n=== Trial {self.trial_counter} ===")
+            self.params.apply_pending()
+            self.adaptation.before_trial()
             try:
-                self._run_trial()
+                with tracing.span(self.shared, "trial", cat="trial", trial=self.trial_counter):
+                    self._run_trial()
+                self._adapt_from_log()
+                self.params.annotate()
             except TimeoutError as e:
                 print(f"[ERROR] Trial {self.trial_counter} aborted — serial timeout: {e}")
                 try:
@@ -143,41 +162,38 @@ class BaseSMSession:
     def _wait_for_table_contact(self):
         """Wait for table sensor to trigger; measure hold duration.
         Returns seconds held, or None if session stopped."""
-        while self.running and not STOP_EVENT.is_set():
-            state, _ = self.shared.get_port("table")
-            if state == "triggered":
-                start = time.time()
-                while self.running and not STOP_EVENT.is_set():
-                    if self.shared.get_port("table")[0] != "triggered":
-                        break
-                    time.sleep(0.001)
-                return time.time() - start
-            time.sleep(0.001)
-        return None
+        with tracing.span(self.shared, "table contact"):
+            while self.running and not self.stop_event.is_set():
+                state, _ = self.shared.get_port("table")
+                if state == "triggered":
+                    start = time.time()
+                    while self.running and not self.stop_event.is_set():
+                        if self.shared.get_port("table")[0] != "triggered":
+                            break
+                        time.sleep(0.001)
+                    return time.time() - start
+                time.sleep(0.001)
+            return None
 
     def _wait_for_poke(self, port: str, deadline: float = None) -> bool:
         """Block until port is triggered and held. Returns True on poke, False on stop/deadline."""
-        while True:
-            if not self.running or STOP_EVENT.is_set():
-                return False
-            if deadline is not None and time.time() >= deadline:
-                return False
-            state, _ = self.shared.get_port(port)
-            if state == "triggered" and sensor_held(self.shared, port):
-                return True
-            time.sleep(0.001)
+        with tracing.span(self.shared, "wait poke", port=port):
+            return state_machine.wait_for_poke(self.shared, port, deadline,
+                                               should_stop=lambda: not self.running)
 
     def _wait(self, duration: float) -> None:
-        start = time.time()
-        while self.running and not STOP_EVENT.is_set() and (time.time() - start < duration):
-            time.sleep(0.02)
+        with tracing.span(self.shared, "wait"):
+            start = time.time()
+            while self.running and not self.stop_event.is_set() and (time.time() - start < duration):
+                time.sleep(0.02)
 
     def _run_iti(self, iti: float = None) -> None:
         if iti is None:
-            iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
-        start = time.time()
-        while self.running and not STOP_EVENT.is_set() and (time.time() - start < iti):
-            time.sleep(0.05)
+            iti = self._next_iti()
+        with tracing.span(self.shared, "iti", iti_s=round(iti, 3)):
+            start = time.time()
+            while self.running and not self.stop_event.is_set() and (time.time() - start < iti):
+                time.sleep(0.05)
 
     # ── Turntable stimulus presentation (shared by task/passive-test sessions) ──
 
@@ -237,7 +253,7 @@ class BaseSMSession:
         # 3. Wait for first table beam trigger → start presentation timer
         print(f"[INFO] {period}: waiting for beam break...")
         pres_start = None
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             state, _ = self.shared.get_port("table")
             if state == "triggered":
                 pres_start = time.time()
@@ -260,7 +276,7 @@ class BaseSMSession:
         contact_start = pres_start  # beam is already triggered at pres_start
         bout_count = 1              # the initial contact counts as the first bout
 
-        while self.running and not STOP_EVENT.is_set() and time.time() < deadline:
+        while self.running and not self.stop_event.is_set() and time.time() < deadline:
             state, _ = self.shared.get_port("table")
             if state == "triggered" and contact_start is None:
                 contact_start = time.time()
@@ -295,7 +311,8 @@ class BaseSMSession:
         # (0°) for the ITI, turning the opposite direction from the outbound
         # trip. The next presentation turns from home into position before
         # its door opens (see step 1).
-        time.sleep(self.TABLE_SETTLE_DELAY)
+        with tracing.span(self.shared, "table settle"):
+            time.sleep(self.TABLE_SETTLE_DELAY)
         self._turn_home_opposite(arrival_direction)
         wait_for_table_stopped(self.shared)
 
@@ -325,16 +342,16 @@ class BaseSMSession:
         # Deferred import: training.py imports BaseSMSession from this module.
         from .training import ClassicalConditioningSession
 
-        iti = random.uniform(iti_min, iti_max)
+        iti = self._cc_iti(iti_min, iti_max)
         print(f"\n[INFO] {period_label}: CC ITI = {iti:.1f} s"
               + (f" (CC starts after {self.cc_delay:.1f} s delay)" if self.cc_delay > 0 else ""))
 
         # Idle delay before conditioning begins
         if self.cc_delay > 0:
             delay_deadline = time.time() + self.cc_delay
-            while self.running and not STOP_EVENT.is_set() and time.time() < delay_deadline:
+            while self.running and not self.stop_event.is_set() and time.time() < delay_deadline:
                 time.sleep(0.05)
-            if not self.running or STOP_EVENT.is_set():
+            if not self.running or self.stop_event.is_set():
                 return
 
         cc_duration = max(0.0, iti - self.cc_delay)
@@ -353,10 +370,14 @@ class BaseSMSession:
             reward_prob=self.cc_reward_prob,
             session_duration=cc_duration,
         )
+        if self.schedule is not None:
+            cc.schedule = TrialSchedule(self.schedule.seed,
+                                        stream=(self._presentation_counter + 1,))
         cc.start()
 
-        while cc.running and self.running and not STOP_EVENT.is_set():
-            time.sleep(0.05)
+        with tracing.span(self.shared, "cc iti", period=period_label):
+            while cc.running and self.running and not self.stop_event.is_set():
+                time.sleep(0.05)
 
         cc.stop_internal()
 
@@ -3,7 +3,8 @@
 # Session sequence:
 #   A fixed number of presentations per box (0–3) is pseudorandomly ordered so
 #   that no two consecutive presentations use the same box
-#   (e.g. 1, 3, 1, 4 is acceptable; 1, 1, 3, 4 is not).
+#   (e.g. 1, 3, 1, 4 is acceptable; 1, 1, 3, 4 is not), with box-to-box
+#   transitions and each box's place in the session balanced (trial_sequence).
 #   All presentations share one duration and are separated by a CC-filled ITI
 #   drawn from one shared [iti_min, iti_max] range.
 #
@@ -23,63 +24,27 @@
 #   presentations_df — one row per stimulus presentation (includes box + label)
 #   conditioning_df  — one row per CC trial across all ITIs
 
-import heapq
-import random
-
 import pandas as pd
 
-from hardware import SharedSensorState, STOP_EVENT
+from hardware import SharedSensorState
+from trial_sequence import SequenceConstraints, generate_sequence
 from .base_session import BaseSMSession
 
 N_BOXES = 4
+# One block (the whole session): the search has the sequence to itself
+PASSIVE_SEQUENCE = SequenceConstraints(max_run=1, candidates=4096)
 
 
 def generate_box_sequence(counts: dict) -> list:
     """Pseudorandomly order presentations so no two consecutive entries use the
     same box. `counts` maps box index -> number of presentations.
 
-    Uses a randomized greedy (always place a box with the most remaining
-    presentations that isn't equal to the previous one, breaking ties
-    randomly) — the standard approach for the "rearrange so no two adjacent
-    are equal" problem. Raises ValueError if no valid ordering exists (i.e.
-    one box's count exceeds ceil(total / 2))."""
-    total = sum(counts.values())
-    if total == 0:
-        return []
-
-    max_count = max(counts.values())
-    if max_count > (total + 1) // 2:
-        raise ValueError(
-            "Cannot arrange presentations without consecutive repeats: "
-            f"one box has {max_count} of {total} total presentations "
-            f"(max allowed is {(total + 1) // 2})."
-        )
-
-    heap = [(-n, random.random(), box) for box, n in counts.items() if n > 0]
-    heapq.heapify(heap)
-
-    result = []
-    prev_box = None
-    while heap:
-        negcount, _, box = heapq.heappop(heap)
-        if box == prev_box:
-            # Most-remaining box repeats the previous one — place the next
-            # most-remaining box instead, and push this one back for later.
-            negcount2, _, box2 = heapq.heappop(heap)
-            result.append(box2)
-            prev_box = box2
-            negcount2 += 1
-            if negcount2 < 0:
-                heapq.heappush(heap, (negcount2, random.random(), box2))
-            heapq.heappush(heap, (negcount, random.random(), box))
-        else:
-            result.append(box)
-            prev_box = box
-            negcount += 1
-            if negcount < 0:
-                heapq.heappush(heap, (negcount, random.random(), box))
-
-    return result
+    Among orderings that avoid repeats, trial_sequence picks one with balanced
+    box-to-box transitions and every box's presentations spread over the
+    session. Draws from `random` (seeded by build_session). Raises ValueError
+    if no valid ordering exists (i.e. one box's count exceeds
+    ceil(total / 2))."""
+    return generate_sequence(counts, PASSIVE_SEQUENCE)
 
 
 def label_sequence(sequence: list) -> list:
@@ -186,11 +151,11 @@ class PassiveTestSession(BaseSMSession):
 
         try:
             for i, (box, period) in enumerate(zip(self.sequence, periods)):
-                if not self.running or STOP_EVENT.is_set():
+                if not self.running or self.stop_event.is_set():
                     break
                 if i > 0:
                     self._run_cc_iti(self.iti_min, self.iti_max, f"CC_pre{i + 1}")
-                if not self.running or STOP_EVENT.is_set():
+                if not self.running or self.stop_event.is_set():
                     break
                 self._run_presentation(
                     box * 90, self.presentation_duration, period,
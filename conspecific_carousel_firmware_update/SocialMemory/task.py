@@ -22,6 +22,9 @@
 #   presentations_df — one row per stimulus presentation
 #   conditioning_df  — one row per CC trial across all ITIs
 
+import threading
+import time
+
 import pandas as pd
 
 from hardware import (
@@ -32,8 +35,8 @@ from hardware import (
     turn_table_degrees,
     SharedSensorState,
     CameraTriggerLogger,
-    STOP_EVENT,
 )
+from trial_schedule import TrialSchedule
 from .base_session import BaseSMSession
 
 
@@ -130,16 +133,6 @@ class SocialMemoryTaskSession(BaseSMSession):
 
         self._presentation_counter = 0
 
-        # One row per camera sync pulse (~1 Hz heartbeat from cameracontrol's
-        # UserOutput, not a per-frame strobe) captured during a presentation's
-        # door-open → stimulus-removal window (passive viewing only; not CC ITIs).
-        self.camera_sync_df = pd.DataFrame(columns=[
-            "presentation_num",
-            "period",
-            "pulse_num",
-            "t_rel_s",      # sync-pulse timestamp, relative to session start (s)
-        ])
-
     # ── Session loop (override — fixed sequence, not open-ended trials) ───────
 
     def _run_session(self):
@@ -152,19 +145,19 @@ class SocialMemoryTaskSession(BaseSMSession):
         try:
             # ── S1 presentations ─────────────────────────────────────────────
             for i in range(self.n_s1):
-                if not self.running or STOP_EVENT.is_set():
+                if not self.running or self.stop_event.is_set():
                     break
                 if i > 0:
                     self._run_cc_iti(
                         self.s1_iti_min, self.s1_iti_max,
                         f"CC_S1_pre{i + 1}"
                     )
-                if not self.running or STOP_EVENT.is_set():
+                if not self.running or self.stop_event.is_set():
                     break
                 self._run_presentation(self.s1_angle, self.s1_duration, f"S1_{i + 1}")
 
             # ── Transition ITI (last S1 → first S2) ──────────────────────────
-            if self.n_s2 > 0 and self.running and not STOP_EVENT.is_set():
+            if self.n_s2 > 0 and self.running and not self.stop_event.is_set():
                 self._run_cc_iti(
                     self.s1_iti_min, self.s1_iti_max,
                     "CC_transition"
@@ -172,14 +165,14 @@ class SocialMemoryTaskSession(BaseSMSession):
 
             # ── S2 presentations ─────────────────────────────────────────────
             for i in range(self.n_s2):
-                if not self.running or STOP_EVENT.is_set():
+                if not self.running or self.stop_event.is_set():
                     break
                 if i > 0:
                     self._run_cc_iti(
                         self.s2_iti_min, self.s2_iti_max,
                         f"CC_S2_pre{i + 1}"
                     )
-                if not self.running or STOP_EVENT.is_set():
+                if not self.running or self.stop_event.is_set():
                     break
                 self._run_presentation(self.s2_angle, self.s2_duration, f"S2_{i + 1}")
 
@@ -216,7 +209,7 @@ class SocialMemoryTaskSession(BaseSMSession):
         # 3. Wait for first table beam trigger → start presentation timer
         print(f"[INFO] {period}: waiting for beam break...")
         pres_start = None
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             state, _ = self.shared.get_port("table")
             if state == "triggered":
                 pres_start = time.time()
@@ -241,7 +234,7 @@ class SocialMemoryTaskSession(BaseSMSession):
         contact_start = pres_start  # beam is already triggered at pres_start
         bout_count = 1              # the initial contact counts as the first bout
 
-        while self.running and not STOP_EVENT.is_set() and time.time() < deadline:
+        while self.running and not self.stop_event.is_set() and time.time() < deadline:
             state, _ = self.shared.get_port("table")
             if state == "triggered" and contact_start is None:
                 contact_start = time.time()
@@ -305,22 +298,23 @@ class SocialMemoryTaskSession(BaseSMSession):
     def _run_cc_iti(
         self, iti_min: float, iti_max: float, period_label: str
     ) -> None:
-        iti = random.uniform(iti_min, iti_max)
+        iti = self._cc_iti(iti_min, iti_max)
         print(f"\n[INFO] {period_label}: CC ITI = {iti:.1f} s"
               + (f" (CC starts after {self.cc_delay:.1f} s delay)" if self.cc_delay > 0 else ""))
 
         # Idle delay before conditioning begins
         if self.cc_delay > 0:
             delay_deadline = time.time() + self.cc_delay
-            while self.running and not STOP_EVENT.is_set() and time.time() < delay_deadline:
+            while self.running and not self.stop_event.is_set() and time.time() < delay_deadline:
                 time.sleep(0.05)
-            if not self.running or STOP_EVENT.is_set():
+            if not self.running or self.stop_event.is_set():
                 return
 
         cc_duration = max(0.0, iti - self.cc_delay)
         if cc_duration <= 0:
             return
 
+        from .training import ClassicalConditioningSession
         cc = ClassicalConditioningSession(
             ser=self.ser,
             shared=self.shared,
@@ -333,9 +327,12 @@ class SocialMemoryTaskSession(BaseSMSession):
             reward_prob=self.cc_reward_prob,
             session_duration=cc_duration,
         )
+        if self.schedule is not None:
+            cc.schedule = TrialSchedule(self.schedule.seed,
+                                        stream=(self._presentation_counter + 1,))
         cc.start()
 
-        while cc.running and self.running and not STOP_EVENT.is_set():
+        while cc.running and self.running and not self.stop_event.is_set():
             time.sleep(0.05)
 
         cc.stop_internal()
@@ -5,7 +5,8 @@
 #
 # Port selection rules (applied in priority order):
 #   1. Anti-camping forced port — if animal camps at one port (last 3 hits there,
-#      last 3 misses at another), the neglected port is forced next.
+#      last 3 misses at another), the neglected port is forced next
+#      (adaptation.PortCamping, fed each trial's logged row).
 #   2. Anti-3-in-a-row — if last 3 picks were the same port, exclude it.
 #   3. Random from remaining valid ports.
 #
@@ -22,7 +23,8 @@ import time
 import numpy as np
 import pandas as pd
 
-from hardware import set_led, STOP_EVENT
+from adaptation import PortCamping
+from hardware import set_led
 from .base_session import BaseSMSession
 
 
@@ -51,8 +53,8 @@ class ClassicalConditioningSession(BaseSMSession):
         self.reward_prob = reward_prob
 
         self._presentation_history = []          # last 3 port choices
-        self._reward_history = {p: [] for p in self.ports}  # last 3 outcomes per port
         self._forced_port = None
+        self.adaptation.add(PortCamping("_forced_port", self.ports, length=3))
 
         self.results_df = pd.DataFrame(columns=[
             "trial_num",
@@ -84,36 +86,15 @@ class ClassicalConditioningSession(BaseSMSession):
         if not choices:
             choices = list(self.ports)  # fallback (only one port available)
 
+        if self.schedule is not None:
+            draw = self.schedule.row(self.trial_counter)["choice_draw"]
+            return choices[int(draw * len(choices))], False
         return random.choice(choices), False
 
-    def _update_anti_camping(self, port: str, rewarded: bool) -> None:
-        self._reward_history[port].append(rewarded)
-        if len(self._reward_history[port]) > 3:
-            self._reward_history[port].pop(0)
-
-        # Clear forced port once animal pokes it successfully
-        if rewarded and port == self._forced_port:
-            self._forced_port = None
-            for p in self.ports:
-                self._reward_history[p] = []
-            return
-
-        if self._forced_port is not None:
-            return
-
-        # Check for camping: one port always missed, another always hit
-        always_miss = [
-            p for p in self.ports
-            if len(self._reward_history[p]) == 3 and not any(self._reward_history[p])
-        ]
-        always_hit = [
-            p for p in self.ports
-            if len(self._reward_history[p]) == 3 and all(self._reward_history[p])
-        ]
-
-        if always_miss and always_hit:
-            self._forced_port = always_miss[0]
-            print(f"[INFO] Anti-camping: forcing port {self._forced_port}")
+    def _reward_draw(self) -> float:
+        if self.schedule is not None:
+            return float(self.schedule.row(self.trial_counter)["reward_draw"])
+        return random.random()
 
     # ── Trial ─────────────────────────────────────────────────────────────────
 
@@ -140,7 +121,7 @@ class ClassicalConditioningSession(BaseSMSession):
 
         if poked:
             rt = trial_end - trial_start
-            if random.random() < self.reward_prob:
+            if self._reward_draw() < self.reward_prob:
                 rewarded = True
                 valve_time_used = self._deliver_reward(port)
                 self.reward_count += 1
@@ -152,9 +133,7 @@ class ClassicalConditioningSession(BaseSMSession):
         else:
             print(f"Port {port} — no poke within {self.led_on_time:.1f} s")
 
-        self._update_anti_camping(port, rewarded)
-
-        iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
+        iti = self._next_iti()
         self._log(port, was_forced, rewarded, prob_withheld,
                   trial_start, trial_end, rt, iti, valve_time_used)
         self._run_iti(iti)
@@ -6,12 +6,11 @@
 #   rat   — reward volume increases incrementally (incremental_reward)
 #   mouse — fixed reward volume (deliver_reward)
 
-import random
 import time
 import numpy as np
 import pandas as pd
 
-from hardware import set_led, SharedSensorState, STOP_EVENT
+from hardware import set_led, SharedSensorState
 from .base_session import BaseSocialSession
 
 
@@ -43,7 +42,7 @@ class Phase1Session(BaseSocialSession):
         set_led(self.ser, self.port, True)
 
         # Require port to be cleared before accepting a new poke
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if self.shared.get_port(self.port)[0] == "cleared":
                 break
             time.sleep(0.005)
@@ -59,7 +58,7 @@ class Phase1Session(BaseSocialSession):
 
         set_led(self.ser, self.port, False)
 
-        iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
+        iti = self._next_iti()
         self.results_df.loc[len(self.results_df)] = {
             "trial_num":        self.trial_counter,
             "port":             self.port,
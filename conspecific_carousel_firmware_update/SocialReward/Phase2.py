@@ -11,7 +11,6 @@
 #   rat   — reward volume scales incrementally (incremental_reward)
 #   mouse — fixed reward volume (deliver_reward)
 
-import random
 import threading
 import time
 import numpy as np
@@ -24,7 +23,6 @@ from hardware import (
     wait_for_door_state,
     wait_for_table_clear,
     SharedSensorState,
-    STOP_EVENT,
 )
 from .base_session import BaseSocialSession
 
@@ -92,7 +90,7 @@ class Phase2Session(BaseSocialSession):
         first_contact_time = None
 
         deadline = door_open_time + TABLE_SENSOR_TIMEOUT
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if time.time() >= deadline:
                 print(f"Sensory minimum not met within {TABLE_SENSOR_TIMEOUT} s → missed trial")
                 break
@@ -118,7 +116,7 @@ class Phase2Session(BaseSocialSession):
                              if first_contact_time is not None else np.nan)
 
         if not sm_met:
-            iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
+            iti = self._next_iti()
             threading.Thread(
                 target=close_door_safe, args=(self.ser, self.shared), daemon=True
             ).start()
@@ -138,7 +136,7 @@ class Phase2Session(BaseSocialSession):
         set_led(self.ser, self.port, True)
         print("LED C on — waiting for port C poke")
 
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if self.shared.get_port(self.port)[0] == "cleared":
                 break
             time.sleep(0.005)
@@ -160,7 +158,7 @@ class Phase2Session(BaseSocialSession):
             print(f"Reward delivered "
                   f"(reward #{self.reward_count}, valve={valve_time_used:.3f} s)")
 
-        iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
+        iti = self._next_iti()
 
         # ── 6. Close door; wait for fully closed before ITI ───────────────────
         threading.Thread(
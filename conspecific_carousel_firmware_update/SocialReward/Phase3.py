@@ -6,8 +6,8 @@
 #
 # Phase 3b sequence:
 #   identical to 3a, but sensory_minimum increases gradually across trials.
-#   Pass a callable as sensory_minimum that accepts the session instance and
-#   returns the required hold time for that trial.
+#   build_session adds an adaptation.TrialSteps rule that sets sensory_minimum
+#   before each trial (phase3b_thresholds / phase3b_holds).
 #
 # Port A: 200 s deadline — door auto-opens if not poked in time (logged).
 # Sensory minimum: 200 s timeout from door open — missed trial if not met.
@@ -18,7 +18,6 @@
 #   rat   — reward volume scales incrementally (incremental_reward)
 #   mouse — fixed reward volume (deliver_reward)
 
-import random
 import threading
 import time
 import numpy as np
@@ -31,7 +30,6 @@ from hardware import (
     wait_for_door_state,
     wait_for_table_clear,
     SharedSensorState,
-    STOP_EVENT,
 )
 from .base_session import BaseSocialSession
 
@@ -48,7 +46,7 @@ class Phase3Session(BaseSocialSession):
         ser,
         shared: SharedSensorState,
         species: str,
-        sensory_minimum,            # float, or callable(session) → float for 3b
+        sensory_minimum: float,     # 3b: first hold, then stepped by adaptation
         valve_time: float,
         session_duration: float = None,
     ):
@@ -91,11 +89,7 @@ class Phase3Session(BaseSocialSession):
         auto_dooropen       = False
         outcome             = "missed"
 
-        required_sm = (
-            self.sensory_minimum(self)
-            if callable(self.sensory_minimum)
-            else self.sensory_minimum
-        )
+        required_sm = self.sensory_minimum
         print(f"Sensory minimum this trial: {required_sm:.3f} s")
 
         # ── 1. Port A LED — wait for poke (200 s auto-open) ──────────────────
@@ -104,7 +98,7 @@ class Phase3Session(BaseSocialSession):
         ledA_onset = time.time()
         deadlineA  = ledA_onset + PORT_A_TIMEOUT
 
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if self.shared.get_port("A")[0] == "cleared":
                 break
             time.sleep(0.005)
@@ -133,7 +127,7 @@ class Phase3Session(BaseSocialSession):
         first_contact_time = None
 
         deadline = door_open_time + TABLE_SENSOR_TIMEOUT
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if time.time() >= deadline:
                 print(f"Sensory minimum not met within {TABLE_SENSOR_TIMEOUT} s → missed trial")
                 break
@@ -159,7 +153,7 @@ class Phase3Session(BaseSocialSession):
                              if first_contact_time is not None else np.nan)
 
         if not sm_met:
-            iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
+            iti = self._next_iti()
             threading.Thread(
                 target=close_door_safe, args=(self.ser, self.shared), daemon=True
             ).start()
@@ -180,7 +174,7 @@ class Phase3Session(BaseSocialSession):
         set_led(self.ser, self.port, True)
         print("LED C on — waiting for port C poke")
 
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if self.shared.get_port(self.port)[0] == "cleared":
                 break
             time.sleep(0.005)
@@ -202,7 +196,7 @@ class Phase3Session(BaseSocialSession):
             print(f"Reward delivered "
                   f"(reward #{self.reward_count}, valve={valve_time_used:.3f} s)")
 
-        iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
+        iti = self._next_iti()
 
         # ── 7. Close door; wait for fully closed before ITI ───────────────────
         threading.Thread(
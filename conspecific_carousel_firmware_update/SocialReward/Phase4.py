@@ -17,7 +17,6 @@
 #   rat   — reward volume scales incrementally (incremental_reward)
 #   mouse — fixed reward volume (deliver_reward)
 
-import random
 import threading
 import time
 import numpy as np
@@ -30,7 +29,6 @@ from hardware import (
     wait_for_door_state,
     wait_for_table_clear,
     SharedSensorState,
-    STOP_EVENT,
 )
 from .base_session import BaseSocialSession
 
@@ -93,11 +91,7 @@ class Phase4Session(BaseSocialSession):
         auto_dooropen       = False
         outcome             = "missed"
 
-        required_sm = (
-            self.sensory_minimum(self)
-            if callable(self.sensory_minimum)
-            else self.sensory_minimum
-        )
+        required_sm = self.sensory_minimum
         print(f"Sensory minimum this trial: {required_sm:.3f} s")
 
         # ── 1. Port A LED — wait for poke (200 s auto-open) ──────────────────
@@ -106,7 +100,7 @@ class Phase4Session(BaseSocialSession):
         ledA_onset = time.time()
         deadlineA  = ledA_onset + PORT_A_TIMEOUT
 
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if self.shared.get_port("A")[0] == "cleared":
                 break
             time.sleep(0.005)
@@ -135,7 +129,7 @@ class Phase4Session(BaseSocialSession):
         first_contact_time = None
 
         deadline = door_open_time + TABLE_SENSOR_TIMEOUT
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if time.time() >= deadline:
                 print(f"Sensory minimum not met within {TABLE_SENSOR_TIMEOUT} s → missed trial")
                 break
@@ -161,7 +155,7 @@ class Phase4Session(BaseSocialSession):
                              if first_contact_time is not None else np.nan)
 
         if not sm_met:
-            iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
+            iti = self._next_iti()
             threading.Thread(
                 target=close_door_safe, args=(self.ser, self.shared), daemon=True
             ).start()
@@ -182,7 +176,7 @@ class Phase4Session(BaseSocialSession):
         set_led(self.ser, self.port, True)
         print("LED C on — waiting for port C poke")
 
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if self.shared.get_port(self.port)[0] == "cleared":
                 break
             time.sleep(0.005)
@@ -206,7 +200,7 @@ class Phase4Session(BaseSocialSession):
             print(f"Reward delivered "
                   f"(reward #{self.reward_count}, valve={valve_time_used:.3f} s)")
 
-        iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
+        iti = self._next_iti()
 
         # ── 7. Close door (poke or miss); wait for fully closed before ITI ─────
         threading.Thread(
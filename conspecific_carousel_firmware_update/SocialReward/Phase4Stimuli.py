@@ -11,10 +11,13 @@
 #       2: {'freq':  5, 'rewarded': False},
 #       3: {'freq': 40, 'rewarded': True},
 #   }
-#   Frequencies are relative weights (need not sum to 100).
+#   Frequencies are relative weights (need not sum to 100). With a trial
+#   schedule every block of BLOCK_SIZE trials holds each box's share of the
+#   weights, with at most SEQUENCE.max_run of one box in a row; without one
+#   (replays of older sessions) boxes are drawn independently by weight.
 #
 # Trial sequence:
-#   1. Turntable → presentation box (weighted random from planned_sequence)
+#   1. Turntable → presentation box (from planned_sequence)
 #   2. LED A on → poke A (no deadline)
 #   3. Door opens → sensory minimum (indefinite, retry loop)
 #   4. Table sensor cleared
@@ -38,8 +41,9 @@ from hardware import (
     wait_for_table_stopped,
     turn_table_degrees,
     SharedSensorState,
-    STOP_EVENT,
 )
+from trial_schedule import TrialSchedule
+from trial_sequence import SequenceConstraints
 from .base_session import BaseSocialSession
 
 
@@ -48,6 +52,9 @@ class Phase4StimuliSession(BaseSocialSession):
     _session_name = "4-Stimuli Session"
     ITI_MIN = 1.0
     ITI_MAX = 3.0
+    BLOCK_SIZE = 20
+    SEQUENCE = SequenceConstraints(max_run=3)   # presentation order (trial_sequence)
+    RETURN_TURNS = [d * m for d in (1, -1) for m in (45, 90, 135, 180)]   # step 7
 
     def __init__(
         self,
@@ -94,13 +101,22 @@ class Phase4StimuliSession(BaseSocialSession):
 
     # ── Session start: pre-generate weighted sequence ─────────────────────────
 
+    def make_schedule(self, seed: int) -> TrialSchedule:
+        weights = {b * 90: self.box_config[b]["freq"] for b in sorted(self.box_config)}
+        return TrialSchedule(seed, angles=weights, block_size=self.BLOCK_SIZE,
+                             n_trials=self.max_trials, constraints=self.SEQUENCE,
+                             return_turns=self.RETURN_TURNS)
+
     def _run_session(self):
         n       = self.max_trials if self.max_trials is not None else 100
         boxes   = sorted(self.box_config.keys())
         weights = [self.box_config[b]["freq"] for b in boxes]
         angles  = [b * 90 for b in boxes]
 
-        self.planned_sequence = random.choices(angles, weights=weights, k=n)
+        if self.schedule is not None:
+            self.planned_sequence = self.schedule.angle_sequence(n)
+        else:
+            self.planned_sequence = random.choices(angles, weights=weights, k=n)
         freq_str = ", ".join(
             f"box{b}={self.box_config[b]['freq']}% "
             f"({'rewarded' if self.box_config[b]['rewarded'] else 'unrewarded'})"
@@ -126,7 +142,11 @@ class Phase4StimuliSession(BaseSocialSession):
 
         # ── 1. Read presentation angle from pre-generated sequence ────────────
         idx = self.trial_counter - 1
-        if idx >= len(self.planned_sequence):
+        if idx >= len(self.planned_sequence) and self.schedule is not None:
+            n = len(self.planned_sequence) + 10
+            self.planned_sequence.extend(
+                self.schedule.angle_sequence(n)[len(self.planned_sequence):])
+        elif idx >= len(self.planned_sequence):
             boxes   = sorted(self.box_config.keys())
             weights = [self.box_config[b]["freq"] for b in boxes]
             angles  = [b * 90 for b in boxes]
@@ -149,7 +169,7 @@ class Phase4StimuliSession(BaseSocialSession):
         print("Waiting for port A poke...")
         ledA_onset = time.time()
 
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if self.shared.get_port("A")[0] == "cleared":
                 break
             time.sleep(0.005)
@@ -172,7 +192,7 @@ class Phase4StimuliSession(BaseSocialSession):
         # ── 5. Sensory minimum (indefinite — loops until met) ─────────────────
         print(f"Waiting for sensory minimum ({self.sensory_minimum:.3f} s)...")
         first_contact_time = None
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             s_time, contact_start = self._wait_for_table_contact()
             if s_time is None:
                 return  # session stopped
@@ -190,7 +210,7 @@ class Phase4StimuliSession(BaseSocialSession):
 
             print(f"Sensory minimum too short ({s_time:.3f} s), retrying...")
 
-        if not self.running or STOP_EVENT.is_set():
+        if not self.running or self.stop_event.is_set():
             return
 
         # ── 6. Wait for table sensor clear ────────────────────────────────────
@@ -204,7 +224,7 @@ class Phase4StimuliSession(BaseSocialSession):
             target=self._turn_ccw_partial, args=(45,), daemon=True
         ).start()
 
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if self.shared.get_port(self.port)[0] == "cleared":
                 break
             time.sleep(0.005)
@@ -246,15 +266,18 @@ class Phase4StimuliSession(BaseSocialSession):
 
         # ── 10. Return to random position (45–180° from current, mult. of 45°) ─
         wait_for_table_stopped(self.shared)
-        magnitude    = random.choice([45, 90, 135, 180])
-        direction    = random.choice([1, -1])
-        return_angle = (self._current_angle + direction * magnitude) % 360
+        if self.schedule is not None:
+            turn = int(self.schedule.row(self.trial_counter)["return_turn"])
+        else:
+            turn = random.choice(self.RETURN_TURNS)
+        magnitude, direction = abs(turn), (1 if turn > 0 else -1)
+        return_angle = (self._current_angle + turn) % 360
         self._turn_to(return_angle)
         print(f"Table → {return_angle}° "
               f"(random {magnitude}° {'CW' if direction > 0 else 'CCW'})")
         wait_for_table_stopped(self.shared)
 
-        iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
+        iti = self._next_iti()
         self._log(
             trial_start, trial_end, trial_duration, rt, rt_dooropen, rt_tablehold,
             rt_to_first_table, sampling_time, total_sampling_time,
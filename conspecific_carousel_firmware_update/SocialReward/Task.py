@@ -1,7 +1,8 @@
 # Task.py — Social Reward Task (rat and mouse)
 #
 # Trial sequence:
-#   1. Turntable moves to presentation position (90° or 270°, balanced block)
+#   1. Turntable moves to presentation position (90° or 270°, balanced block;
+#      with a trial schedule at most SEQUENCE.max_run of one side in a row)
 #   2. LED A on → animal pokes A (no deadline) → rt_dooropen recorded
 #   3. Door opens → wait for fully open → sensory timer starts
 #   4. Animal holds table sensor >= sensory_minimum (indefinite — no timeout)
@@ -36,8 +37,9 @@ from hardware import (
     wait_for_table_stopped,
     turn_table_degrees,
     SharedSensorState,
-    STOP_EVENT,
 )
+from trial_schedule import TrialSchedule
+from trial_sequence import SequenceConstraints
 from .base_session import BaseSocialSession
 
 
@@ -46,6 +48,7 @@ class SocialTaskSession(BaseSocialSession):
     _session_name = "Social Task Session"
     ITI_MIN = 1.0
     ITI_MAX = 3.0
+    SEQUENCE = SequenceConstraints(max_run=3)   # presentation order (trial_sequence)
 
     def __init__(
         self,
@@ -96,21 +99,30 @@ class SocialTaskSession(BaseSocialSession):
         ])
 
     # ── Session start: pre-generate full trial sequence ──────────────────────
+    # (from the session's trial schedule when build_session() attached one)
+
+    def make_schedule(self, seed: int) -> TrialSchedule:
+        return TrialSchedule(seed, angles=(self.rewarded_angle, self.unrewarded_angle),
+                             block_size=self.block_size, return_angles=(0, 180),
+                             n_trials=self.max_trials, constraints=self.SEQUENCE)
 
     def _run_session(self):
         n    = self.max_trials if self.max_trials is not None else 100
-        half = self.block_size // 2
-        seq  = []
-        for _ in range(n // self.block_size):
-            block = [self.rewarded_angle] * half + [self.unrewarded_angle] * half
-            random.shuffle(block)
-            seq.extend(block)
-        rem = n % self.block_size
-        if rem:
-            partial = ([self.rewarded_angle]   * (rem // 2) +
-                       [self.unrewarded_angle] * (rem - rem // 2))
-            random.shuffle(partial)
-            seq.extend(partial)
+        if self.schedule is not None:
+            seq = self.schedule.angle_sequence(n)
+        else:
+            half = self.block_size // 2
+            seq  = []
+            for _ in range(n // self.block_size):
+                block = [self.rewarded_angle] * half + [self.unrewarded_angle] * half
+                random.shuffle(block)
+                seq.extend(block)
+            rem = n % self.block_size
+            if rem:
+                partial = ([self.rewarded_angle]   * (rem // 2) +
+                           [self.unrewarded_angle] * (rem - rem // 2))
+                random.shuffle(partial)
+                seq.extend(partial)
         self.planned_sequence = seq
         print(f"[INFO] Pre-assigned {len(seq)}-trial sequence "
               f"(rewarded=box {self.rewarded_angle // 90}, "
@@ -135,10 +147,15 @@ class SocialTaskSession(BaseSocialSession):
         # ── 1. Read presentation angle from pre-generated sequence ────────────
         idx = self.trial_counter - 1
         if idx >= len(self.planned_sequence):
-            block = ([self.rewarded_angle]   * (self.block_size // 2) +
-                     [self.unrewarded_angle] * (self.block_size // 2))
-            random.shuffle(block)
-            self.planned_sequence.extend(block)
+            if self.schedule is not None:
+                n = len(self.planned_sequence) + self.block_size
+                self.planned_sequence.extend(
+                    self.schedule.angle_sequence(n)[len(self.planned_sequence):])
+            else:
+                block = ([self.rewarded_angle]   * (self.block_size // 2) +
+                         [self.unrewarded_angle] * (self.block_size // 2))
+                random.shuffle(block)
+                self.planned_sequence.extend(block)
         presentation_angle = self.planned_sequence[idx]
         reward_available   = (presentation_angle == self.rewarded_angle)
         print(f"Presentation: {presentation_angle}° | reward_available={reward_available}")
@@ -154,7 +171,7 @@ class SocialTaskSession(BaseSocialSession):
         print("Waiting for port A poke...")
         ledA_onset = time.time()
 
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if self.shared.get_port("A")[0] == "cleared":
                 break
             time.sleep(0.005)
@@ -178,7 +195,7 @@ class SocialTaskSession(BaseSocialSession):
         # ── 5. Sensory minimum (indefinite — loops until met) ─────────────────
         print(f"Waiting for sensory minimum ({self.sensory_minimum:.3f} s)...")
         first_contact_time = None
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             s_time, contact_start = self._wait_for_table_contact()
             if s_time is None:
                 return  # session stopped
@@ -196,7 +213,7 @@ class SocialTaskSession(BaseSocialSession):
 
             print(f"Sensory minimum too short ({s_time:.3f} s), retrying...")
 
-        if not self.running or STOP_EVENT.is_set():
+        if not self.running or self.stop_event.is_set():
             return
 
         # ── 6. Wait for animal to clear table sensor ──────────────────────────
@@ -210,7 +227,7 @@ class SocialTaskSession(BaseSocialSession):
             target=self._turn_ccw_partial, args=(45,), daemon=True
         ).start()
 
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if self.shared.get_port(self.port)[0] == "cleared":
                 break
             time.sleep(0.005)
@@ -254,12 +271,15 @@ class SocialTaskSession(BaseSocialSession):
         # ── 11. Turntable returns to 0° or 180° (random) ──────────────────────
         # Ensure the 45° CCW partial turn motor has stopped before the return move.
         wait_for_table_stopped(self.shared)
-        return_angle = random.choice([0, 180])
+        if self.schedule is not None:
+            return_angle = int(self.schedule.row(self.trial_counter)["return_angle"])
+        else:
+            return_angle = random.choice([0, 180])
         self._turn_to(return_angle)
         print(f"Table returning to {return_angle}°")
         wait_for_table_stopped(self.shared)
 
-        iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
+        iti = self._next_iti()
         self._log(
             trial_start, trial_end, rt, rt_dooropen, rt_tablehold,
             rt_to_first_table, sampling_time, total_sampling_time,
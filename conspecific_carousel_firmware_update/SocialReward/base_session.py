@@ -5,21 +5,21 @@
 #   _session_name  (str)  — printed at session start/end
 #   ITI_MIN, ITI_MAX      — override for non-default ITI range (default 5–10 s)
 
-import random
 import threading
 import time
 
+import state_machine
+import tracing
 from hardware import (
     deliver_reward,
     incremental_reward,
-    sensor_held,
     shutdown_outputs,
     SharedSensorState,
-    STOP_EVENT,
 )
+from session_common import SessionCommon
 
 
-class BaseSocialSession:
+class BaseSocialSession(SessionCommon):
 
     _session_name = "Session"
     ITI_MIN = 5.0
@@ -35,6 +35,7 @@ class BaseSocialSession:
     ):
         self.ser = ser
         self.shared = shared
+        self.stop_event = shared.stop_event   # the rig's stop token (rig.py)
         self.species = species
         self.valve_time = valve_time
         self.session_duration = session_duration
@@ -45,6 +46,7 @@ class BaseSocialSession:
         self.max_trials = None
         self.running = False
         self.thread = None
+        self._init_common()   # schedule, adaptation, params (session_common.py)
         # Subclasses define self.results_df in their own __init__
 
     # ── Session control ───────────────────────────────────────────────────────
@@ -58,7 +60,7 @@ class BaseSocialSession:
 
     def stop(self):
         self.running = False
-        STOP_EVENT.set()
+        self.stop_event.set()
         if self.thread is not None:
             self.thread.join()
 
@@ -68,15 +70,20 @@ class BaseSocialSession:
         start_time = time.time()
         print(f"[INFO] {self._session_name} started")
 
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if self.session_duration is not None:
                 if time.time() - start_time >= self.session_duration:
                     print("[INFO] Session duration reached")
                     break
             self.trial_counter += 1
             print(f"\n=== Trial {self.trial_counter} ===")
+            self.params.apply_pending()
+            self.adaptation.before_trial()
             try:
-                self._run_trial()
+                with tracing.span(self.shared, "trial", cat="trial", trial=self.trial_counter):
+                    self._run_trial()
+                self._adapt_from_log()
+                self.params.annotate()
             except TimeoutError as e:
                 print(f"[ERROR] Trial {self.trial_counter} aborted — serial timeout: {e}")
                 try:
@@ -107,42 +114,39 @@ class BaseSocialSession:
     def _wait_for_table_contact(self, deadline: float = None):
         """Wait for table sensor to trigger and measure hold duration.
         Returns (seconds_held, contact_start), or (None, None) if stopped or deadline exceeded."""
-        while self.running and not STOP_EVENT.is_set():
-            if deadline is not None and time.time() >= deadline:
-                return None, None
-            state, _ = self.shared.get_port("table")
-            if state == "triggered":
-                start = time.time()
-                while self.running and not STOP_EVENT.is_set():
-                    if self.shared.get_port("table")[0] != "triggered":
-                        break
-                    time.sleep(0.001)
-                return time.time() - start, start
-            time.sleep(0.001)
-        return None, None
+        with tracing.span(self.shared, "table contact"):
+            while self.running and not self.stop_event.is_set():
+                if deadline is not None and time.time() >= deadline:
+                    return None, None
+                state, _ = self.shared.get_port("table")
+                if state == "triggered":
+                    start = time.time()
+                    while self.running and not self.stop_event.is_set():
+                        if self.shared.get_port("table")[0] != "triggered":
+                            break
+                        time.sleep(0.001)
+                    return time.time() - start, start
+                time.sleep(0.001)
+            return None, None
 
     def _wait_for_poke(self, port: str, deadline: float = None) -> bool:
         """Block until port sensor is triggered and held. Returns True/False."""
-        while True:
-            if not self.running or STOP_EVENT.is_set():
-                return False
-            if deadline is not None and time.time() >= deadline:
-                return False
-            state, _ = self.shared.get_port(port)
-            if state == "triggered" and sensor_held(self.shared, port):
-                return True
-            time.sleep(0.001)
+        with tracing.span(self.shared, "wait poke", port=port):
+            return state_machine.wait_for_poke(self.shared, port, deadline,
+                                               should_stop=lambda: not self.running)
 
     def _wait(self, duration: float) -> None:
-        """Block for duration seconds, honouring STOP_EVENT."""
-        start = time.time()
-        while self.running and not STOP_EVENT.is_set() and (time.time() - start < duration):
-            time.sleep(0.02)
+        """Block for duration seconds, honouring stop_event."""
+        with tracing.span(self.shared, "wait"):
+            start = time.time()
+            while self.running and not self.stop_event.is_set() and (time.time() - start < duration):
+                time.sleep(0.02)
 
     def _run_iti(self, iti: float = None) -> None:
         """Wait for ITI; draws a random value from [ITI_MIN, ITI_MAX] if not given."""
         if iti is None:
-            iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
-        start = time.time()
-        while self.running and not STOP_EVENT.is_set() and (time.time() - start < iti):
-            time.sleep(0.05)
+            iti = self._next_iti()
+        with tracing.span(self.shared, "iti", iti_s=round(iti, 3)):
+            start = time.time()
+            while self.running and not self.stop_event.is_set() and (time.time() - start < iti):
+                time.sleep(0.05)
@@ -7,7 +7,6 @@
 # Outcomes: hit / miss / error
 # Balanced block of angle_a / angle_b presentations (default block_size=10).
 
-import random
 import numpy as np
 import pandas as pd
 
@@ -66,7 +65,7 @@ class ForcedChoiceSession(TaskBase2AFC):
         if not data:
             return   # session stopped mid-trial
 
-        iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
+        iti = self._next_iti()
         self.results_df.loc[len(self.results_df)] = {
             "trial_num":          self.trial_counter,
             "trial_type":         "forced",
@@ -6,7 +6,6 @@
 # Outcomes: hit (correct port) / miss (deadline) / error (wrong port)
 # Balanced block of angle_a / angle_b (default block_size=10).
 
-import random
 import numpy as np
 import pandas as pd
 
@@ -65,7 +64,7 @@ class FreeChoiceSession(TaskBase2AFC):
         if not data:
             return
 
-        iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
+        iti = self._next_iti()
         self.results_df.loc[len(self.results_df)] = {
             "trial_num":          self.trial_counter,
             "trial_type":         "free",
@@ -13,12 +13,16 @@
 # Outcomes: hit / miss / error  (same as Forced/Free phases)
 # Recorded: trial_type (forced/free), forced_ratio (ratio active that block),
 #           block_num, free_hit_rate_prev_block (performance that triggered advance)
+#
+# The advance is an adaptation.BlockCriterion on forced_ratio, judged at each
+# block boundary; params["adaptation"] can replace its levels and criterion.
 
 import random
 import numpy as np
 import pandas as pd
 
-from hardware import SharedSensorState, STOP_EVENT
+from adaptation import BlockCriterion
+from hardware import SharedSensorState
 from .task_base import TaskBase2AFC
 
 ADVANCE_RATIOS  = [0.75, 0.50, 0.25, 0.00]
@@ -54,7 +58,10 @@ class MixedChoiceSession(TaskBase2AFC):
 
         self._block_num       = 0
         self._block_queue     = []   # list of trial_type strings for current block
-        self._block_results   = []   # outcome dicts for current block
+        self.adaptation.add(BlockCriterion(
+            "forced_ratio", "outcome", success="hit", where={"trial_type": "free"},
+            levels=ADVANCE_RATIOS, criterion=ADVANCE_CRIT, min_n=MIN_FREE_TRIALS,
+        ))
 
         self.results_df = pd.DataFrame(columns=[
             "trial_num",
@@ -82,8 +89,6 @@ class MixedChoiceSession(TaskBase2AFC):
             "free_hit_rate_prev_block",
         ])
 
-        self._free_hit_rate_prev = np.nan
-
     # ── Block management ──────────────────────────────────────────────────────
 
     def _refill_block(self):
@@ -92,6 +97,11 @@ class MixedChoiceSession(TaskBase2AFC):
         n_forced = round(n * self.forced_ratio)
         n_free   = n - n_forced
 
+        if self.schedule is not None:
+            self._fill_block_from_schedule(n_forced)
+            self._start_block(n_forced, n_free)
+            return
+
         # Balance stimulus angles within each trial type
         def _angle_list(count):
             half = count // 2
@@ -111,42 +121,44 @@ class MixedChoiceSession(TaskBase2AFC):
         # Restore parent's _position_block from the angle component
         self._position_block = [a for _, a in pairs]
         self._block_queue    = [t for t, _ in pairs]
+        self._start_block(n_forced, n_free)
+
+    def _fill_block_from_schedule(self, n_forced: int) -> None:
+        """Split the next block of the schedule by block_rank: the n_forced
+        lowest ranks are forced trials. Within each type, odd forced ranks and
+        even free ranks get angle_a — count // 2 of each type, the same
+        balance as the shuffled block."""
+        first = self.trial_counter             # the block's first trial
+        ranks = [int(self.schedule.row(first + i)["block_rank"])
+                 for i in range(self.block_size)]
+        self._block_queue = ["forced" if r < n_forced else "free" for r in ranks]
+        self._position_block = [
+            self.angle_a if (r % 2 == 1) == (r < n_forced) else self.angle_b
+            for r in ranks
+        ]
+
+    def _next_angle(self) -> int:
+        if self.schedule is None:
+            return super()._next_angle()
+        return self._position_block.pop(0)   # in step with _block_queue
 
+    def _start_block(self, n_forced: int, n_free: int) -> None:
         self._block_num   += 1
-        self._block_results = []
         print(f"[INFO] Block {self._block_num}: "
               f"forced_ratio={self.forced_ratio:.2f} "
               f"({n_forced} forced / {n_free} free)")
 
-    def _evaluate_block(self):
-        """Check free-trial performance; advance ratio if criterion met."""
-        free_outcomes = [
-            r["outcome"] for r in self._block_results if r["trial_type"] == "free"
-        ]
-        if len(free_outcomes) < MIN_FREE_TRIALS:
-            return
-
-        hit_rate = free_outcomes.count("hit") / len(free_outcomes)
-        self._free_hit_rate_prev = hit_rate
-        print(f"[INFO] Block {self._block_num} free-trial hit rate: {hit_rate:.2%}")
-
-        if hit_rate >= ADVANCE_CRIT:
-            try:
-                idx = ADVANCE_RATIOS.index(self.forced_ratio)
-                if idx < len(ADVANCE_RATIOS) - 1:
-                    self.forced_ratio = ADVANCE_RATIOS[idx + 1]
-                    print(f"[INFO] Criterion met — advancing forced_ratio "
-                          f"to {self.forced_ratio:.2f}")
-            except ValueError:
-                pass
+    def _free_hit_rate_prev(self) -> float:
+        """Free-trial hit rate of the last judged block (NaN before the first)."""
+        return getattr(self.adaptation.rule("forced_ratio"), "last_rate", np.nan)
 
     # ── Trial ─────────────────────────────────────────────────────────────────
 
     def _run_trial(self):
         # New block?
         if not self._block_queue:
-            if self._block_results:
-                self._evaluate_block()
+            if self._block_num:
+                self._adapt(block_end=True)   # may advance forced_ratio
             self._refill_block()
 
         trial_type = self._block_queue.pop(0)
@@ -154,12 +166,7 @@ class MixedChoiceSession(TaskBase2AFC):
         if not data:
             return
 
-        self._block_results.append({
-            "trial_type": trial_type,
-            "outcome":    data["outcome"],
-        })
-
-        iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
+        iti = self._next_iti()
         self.results_df.loc[len(self.results_df)] = {
             "trial_num":               self.trial_counter,
             "block_num":               self._block_num,
@@ -183,7 +190,7 @@ class MixedChoiceSession(TaskBase2AFC):
             "iti":                     iti,
             "trial_start":             data["trial_start"],
             "trial_end":               data["trial_end"],
-            "free_hit_rate_prev_block":self._free_hit_rate_prev,
+            "free_hit_rate_prev_block":self._free_hit_rate_prev(),
         }
         print(self.results_df.iloc[-1].to_dict())
         self._run_iti(iti)
@@ -11,12 +11,11 @@
 #   rat   — incremental_reward
 #   mouse — fixed deliver_reward
 
-import random
 import time
 import numpy as np
 import pandas as pd
 
-from hardware import set_led, STOP_EVENT
+from hardware import set_led
 from .base_session import Base2AFCSession
 
 
@@ -62,7 +61,7 @@ class Phase1Session2AFC(Base2AFCSession):
 
         # Ensure all reward ports are cleared before lighting up
         for p in ["A", "B"]:
-            while self.running and not STOP_EVENT.is_set():
+            while self.running and not self.stop_event.is_set():
                 if self.shared.get_port(p)[0] == "cleared":
                     break
                 time.sleep(0.005)
@@ -86,9 +85,9 @@ class Phase1Session2AFC(Base2AFCSession):
             print(f"Reward at port {poked_port} "
                   f"(#{self.reward_count}, valve={valve_time_used:.3f} s)")
 
-        self._update_anti_camping(poked_port)
+        self._adapt(poked_port=poked_port, rewarded=rewarded)
 
-        iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
+        iti = self._next_iti()
         self.results_df.loc[len(self.results_df)] = {
             "trial_num":       self.trial_counter,
             "active_ports":    str(active_ports),
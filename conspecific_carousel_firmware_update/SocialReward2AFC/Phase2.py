@@ -11,7 +11,6 @@
 #   rat   — incremental_reward
 #   mouse — fixed deliver_reward
 
-import random
 import threading
 import time
 import numpy as np
@@ -24,7 +23,6 @@ from hardware import (
     wait_for_door_state,
     wait_for_table_clear,
     SharedSensorState,
-    STOP_EVENT,
 )
 from .base_session import Base2AFCSession
 
@@ -92,7 +90,7 @@ class Phase2Session2AFC(Base2AFCSession):
         first_contact_time = None
         deadline           = door_open_time + TABLE_SENSOR_TIMEOUT
 
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if time.time() >= deadline:
                 print(f"Sensory minimum not met within {TABLE_SENSOR_TIMEOUT} s")
                 break
@@ -118,7 +116,7 @@ class Phase2Session2AFC(Base2AFCSession):
                              if first_contact_time is not None else np.nan)
 
         if not sm_met:
-            iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
+            iti = self._next_iti()
             threading.Thread(
                 target=close_door_safe, args=(self.ser, self.shared), daemon=True
             ).start()
@@ -142,7 +140,7 @@ class Phase2Session2AFC(Base2AFCSession):
 
         # Ensure ports cleared before recording poke
         for p in ["A", "B"]:
-            while self.running and not STOP_EVENT.is_set():
+            while self.running and not self.stop_event.is_set():
                 if self.shared.get_port(p)[0] == "cleared":
                     break
                 time.sleep(0.005)
@@ -169,9 +167,9 @@ class Phase2Session2AFC(Base2AFCSession):
                 outcome = "wrong_port"
                 print(f"Wrong port {poked_port} poked during forced trial")
 
-        self._update_anti_camping(poked_port)
+        self._adapt(poked_port=poked_port, outcome=outcome, rewarded=rewarded)
 
-        iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
+        iti = self._next_iti()
 
         threading.Thread(
             target=close_door_safe, args=(self.ser, self.shared), daemon=True
@@ -4,8 +4,8 @@
 # → door opens → animal holds table sensor >= sensory_minimum s
 # → animal clears table sensor → ports A and B LEDs on → poke A or B → reward
 #
-# Phase 3b: pass a callable as sensory_minimum that accepts the session and
-#           returns the required hold time for that trial.
+# Phase 3b: sensory_minimum steps up across trials — build_session adds an
+#           adaptation.TrialSteps rule on it (phase3b_thresholds / _holds).
 #
 # Anti-camping: if same reward port poked 3× → force other side next trial.
 #
@@ -13,7 +13,6 @@
 #   rat   — incremental_reward
 #   mouse — fixed deliver_reward
 
-import random
 import threading
 import time
 import numpy as np
@@ -26,7 +25,6 @@ from hardware import (
     wait_for_door_state,
     wait_for_table_clear,
     SharedSensorState,
-    STOP_EVENT,
 )
 from .base_session import Base2AFCSession
 
@@ -45,7 +43,7 @@ class Phase3Session2AFC(Base2AFCSession):
         ser,
         shared: SharedSensorState,
         species: str,
-        sensory_minimum,       # float, or callable(session) → float for 3b
+        sensory_minimum: float,   # 3b: first hold, then stepped by adaptation
         valve_time: float,
         session_duration: float = None,
     ):
@@ -89,11 +87,7 @@ class Phase3Session2AFC(Base2AFCSession):
         poked_port          = None
         outcome             = "missed"
 
-        required_sm = (
-            self.sensory_minimum(self)
-            if callable(self.sensory_minimum)
-            else self.sensory_minimum
-        )
+        required_sm = self.sensory_minimum
         print(f"Sensory minimum this trial: {required_sm:.3f} s")
 
         # 1. Port C LED — wait for poke (200 s auto-open)
@@ -102,7 +96,7 @@ class Phase3Session2AFC(Base2AFCSession):
         ledC_onset = time.time()
         deadlineC  = ledC_onset + PORT_C_TIMEOUT
 
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if self.shared.get_port("C")[0] == "cleared":
                 break
             time.sleep(0.005)
@@ -131,7 +125,7 @@ class Phase3Session2AFC(Base2AFCSession):
         first_contact_time = None
         deadline           = door_open_time + TABLE_SENSOR_TIMEOUT
 
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if time.time() >= deadline:
                 print(f"Sensory minimum not met within {TABLE_SENSOR_TIMEOUT} s")
                 break
@@ -157,7 +151,7 @@ class Phase3Session2AFC(Base2AFCSession):
                              if first_contact_time is not None else np.nan)
 
         if not sm_met:
-            iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
+            iti = self._next_iti()
             threading.Thread(
                 target=close_door_safe, args=(self.ser, self.shared), daemon=True
             ).start()
@@ -180,7 +174,7 @@ class Phase3Session2AFC(Base2AFCSession):
             set_led(self.ser, p, True)
         print(f"Ports {active_ports} lit (forced={was_forced})")
 
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if all(self.shared.get_port(p)[0] == "cleared" for p in ["A", "B"]):
                 break
             time.sleep(0.005)
@@ -207,9 +201,9 @@ class Phase3Session2AFC(Base2AFCSession):
                 outcome = "wrong_port"
                 print(f"Wrong port {poked_port} during forced trial")
 
-        self._update_anti_camping(poked_port)
+        self._adapt(poked_port=poked_port, outcome=outcome, rewarded=rewarded)
 
-        iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
+        iti = self._next_iti()
 
         threading.Thread(
             target=close_door_safe, args=(self.ser, self.shared), daemon=True
@@ -7,7 +7,6 @@
 # Port C LED → poke C (200 s auto-open) → door opens → sensory minimum (200 s)
 # → table clear → ports A/B LEDs on → poke within decision_window → reward / miss
 
-import random
 import threading
 import time
 import numpy as np
@@ -20,7 +19,6 @@ from hardware import (
     wait_for_door_state,
     wait_for_table_clear,
     SharedSensorState,
-    STOP_EVENT,
 )
 from .base_session import Base2AFCSession
 
@@ -91,7 +89,7 @@ class Phase4Session2AFC(Base2AFCSession):
         ledC_onset = time.time()
         deadlineC  = ledC_onset + PORT_C_TIMEOUT
 
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if self.shared.get_port("C")[0] == "cleared":
                 break
             time.sleep(0.005)
@@ -120,7 +118,7 @@ class Phase4Session2AFC(Base2AFCSession):
         first_contact_time = None
         deadline           = door_open_time + TABLE_SENSOR_TIMEOUT
 
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if time.time() >= deadline:
                 print(f"Sensory minimum not met within {TABLE_SENSOR_TIMEOUT} s")
                 break
@@ -146,7 +144,7 @@ class Phase4Session2AFC(Base2AFCSession):
                              if first_contact_time is not None else np.nan)
 
         if not sm_met:
-            iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
+            iti = self._next_iti()
             threading.Thread(
                 target=close_door_safe, args=(self.ser, self.shared), daemon=True
             ).start()
@@ -169,7 +167,7 @@ class Phase4Session2AFC(Base2AFCSession):
             set_led(self.ser, p, True)
         print(f"Ports {active_ports} lit (forced={was_forced})")
 
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if all(self.shared.get_port(p)[0] == "cleared" for p in ["A", "B"]):
                 break
             time.sleep(0.005)
@@ -199,9 +197,10 @@ class Phase4Session2AFC(Base2AFCSession):
         else:
             print("Decision window expired — missed")
 
-        self._update_anti_camping(poked_port if poked_port in active_ports else None)
+        self._adapt(poked_port=poked_port if poked_port in active_ports else None,
+                    outcome=outcome, rewarded=rewarded)
 
-        iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
+        iti = self._next_iti()
 
         threading.Thread(
             target=close_door_safe, args=(self.ser, self.shared), daemon=True
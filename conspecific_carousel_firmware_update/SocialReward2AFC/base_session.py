@@ -7,29 +7,32 @@
 #
 # Anti-camping (phases 1–4):
 #   _get_active_reward_ports() → ["A","B"] normally, or [forced_port] when camping
-#   _update_anti_camping(poked_port) → updates history, sets/clears forced_port
 #   Rule: if animal pokes same side 3× in a row → force the other side next trial
 #         forced mode clears once the forced side is rewarded
+#   The rule is an adaptation.SideStreak on _forced_port, fed the poked port
+#   through _adapt(poked_port=...) (ANTI_CAMPING = False turns it off).
 
-import random
 import threading
 import time
 
+import state_machine
+import tracing
+from adaptation import SideStreak
 from hardware import (
     deliver_reward,
     incremental_reward,
-    sensor_held,
     shutdown_outputs,
     SharedSensorState,
-    STOP_EVENT,
 )
+from session_common import SessionCommon
 
 
-class Base2AFCSession:
+class Base2AFCSession(SessionCommon):
 
     _session_name = "2AFC Session"
     ITI_MIN = 10.0
     ITI_MAX = 15.0
+    ANTI_CAMPING = True
 
     def __init__(
         self,
@@ -41,6 +44,7 @@ class Base2AFCSession:
     ):
         self.ser = ser
         self.shared = shared
+        self.stop_event = shared.stop_event   # the rig's stop token (rig.py)
         self.species = species
         self.valve_time = valve_time
         self.session_duration = session_duration
@@ -52,9 +56,13 @@ class Base2AFCSession:
         self.thread = None
 
         # Anti-camping state (phases 1–4)
-        self._poke_history = []   # last 3 reward-port choices (A or B)
         self._forced_port = None  # None = both active; "A"/"B" = camping correction
 
+        self._init_common()   # schedule, adaptation, params (session_common.py)
+        if self.ANTI_CAMPING:
+            self.adaptation.add(SideStreak("_forced_port", "poked_port", length=3,
+                                           release="visit", skip_missing=True))
+
     # ── Session control ───────────────────────────────────────────────────────
 
     def start(self):
@@ -66,7 +74,7 @@ class Base2AFCSession:
 
     def stop(self):
         self.running = False
-        STOP_EVENT.set()
+        self.stop_event.set()
         if self.thread is not None:
             self.thread.join()
 
@@ -76,15 +84,20 @@ class Base2AFCSession:
         start_time = time.time()
         print(f"[INFO] {self._session_name} started")
 
-        while self.running and not STOP_EVENT.is_set():
+        while self.running and not self.stop_event.is_set():
             if self.session_duration is not None:
                 if time.time() - start_time >= self.session_duration:
                     print("[INFO] Session duration reached")
                     break
             self.trial_counter += 1
             print(f"\n=== Trial {self.trial_counter} ===")
+            self.params.apply_pending()
+            self.adaptation.before_trial()
             try:
-                self._run_trial()
+                with tracing.span(self.shared, "trial", cat="trial", trial=self.trial_counter):
+                    self._run_trial()
+                self._adapt_from_log()
+                self.params.annotate()
             except TimeoutError as e:
                 print(f"[ERROR] Trial {self.trial_counter} aborted — serial timeout: {e}")
                 try:
@@ -120,83 +133,49 @@ class Base2AFCSession:
             return [self._forced_port]
         return ["A", "B"]
 
-    def _update_anti_camping(self, poked_port):
-        """Update side-bias history; set or clear forced_port."""
-        if poked_port is None:
-            return
-
-        if self._forced_port is not None:
-            if poked_port == self._forced_port:
-                # Animal visited the forced side — clear forced mode
-                self._forced_port = None
-                self._poke_history = []
-            # Wrong side poke during forced mode — forced_port stays
-            return
-
-        self._poke_history.append(poked_port)
-        if len(self._poke_history) > 3:
-            self._poke_history.pop(0)
-
-        # 3 in a row on same side → force the other
-        if len(self._poke_history) == 3 and len(set(self._poke_history)) == 1:
-            camped = self._poke_history[0]
-            self._forced_port = "B" if camped == "A" else "A"
-            self._poke_history = []
-            print(f"[INFO] Anti-camping: forcing port {self._forced_port}")
-
     # ── Sensor helpers ────────────────────────────────────────────────────────
 
     def _wait_for_poke(self, port: str, deadline: float = None) -> bool:
         """Block until port triggered+held. Returns True on poke, False on stop/deadline."""
-        while True:
-            if not self.running or STOP_EVENT.is_set():
-                return False
-            if deadline is not None and time.time() >= deadline:
-                return False
-            state, _ = self.shared.get_port(port)
-            if state == "triggered" and sensor_held(self.shared, port):
-                return True
-            time.sleep(0.001)
+        with tracing.span(self.shared, "wait poke", port=port):
+            return state_machine.wait_for_poke(self.shared, port, deadline,
+                                               should_stop=lambda: not self.running)
 
     def _wait_for_any_poke(self, ports, deadline: float = None):
         """Block until any listed port is triggered+held.
         Returns port name, or None on stop/deadline."""
-        while True:
-            if not self.running or STOP_EVENT.is_set():
-                return None
-            if deadline is not None and time.time() >= deadline:
-                return None
-            for port in ports:
-                state, _ = self.shared.get_port(port)
-                if state == "triggered" and sensor_held(self.shared, port):
-                    return port
-            time.sleep(0.001)
+        with tracing.span(self.shared, "wait poke", port="/".join(ports)):
+            return state_machine.wait_for_any_poke(self.shared, ports, deadline,
+                                                   should_stop=lambda: not self.running)
 
     def _wait_for_table_contact(self, deadline: float = None):
         """Wait for table sensor trigger; measure hold.
         Returns (seconds_held, contact_start), or (None, None) if stopped or deadline exceeded."""
-        while self.running and not STOP_EVENT.is_set():
-            if deadline is not None and time.time() >= deadline:
-                return None, None
-            state, _ = self.shared.get_port("table")
-            if state == "triggered":
-                start = time.time()
-                while self.running and not STOP_EVENT.is_set():
-                    if self.shared.get_port("table")[0] != "triggered":
-                        break
-                    time.sleep(0.001)
-                return time.time() - start, start
-            time.sleep(0.001)
-        return None, None
+        with tracing.span(self.shared, "table contact"):
+            while self.running and not self.stop_event.is_set():
+                if deadline is not None and time.time() >= deadline:
+                    return None, None
+                state, _ = self.shared.get_port("table")
+                if state == "triggered":
+                    start = time.time()
+                    while self.running and not self.stop_event.is_set():
+                        if self.shared.get_port("table")[0] != "triggered":
+                            break
+                        time.sleep(0.001)
+                    return time.time() - start, start
+                time.sleep(0.001)
+            return None, None
 
     def _wait(self, duration: float) -> None:
-        start = time.time()
-        while self.running and not STOP_EVENT.is_set() and (time.time() - start < duration):
-            time.sleep(0.02)
+        with tracing.span(self.shared, "wait"):
+            start = time.time()
+            while self.running and not self.stop_event.is_set() and (time.time() - start < duration):
+                time.sleep(0.02)
 
     def _run_iti(self, iti: float = None) -> None:
         if iti is None:
-            iti = random.uniform(self.ITI_MIN, self.ITI_MAX)
-        start = time.time()
-        while self.running and not STOP_EVENT.is_set() and (time.time() - start < iti):
-            time.sleep(0.05)
+            iti = self._next_iti()
+        with tracing.span(self.shared, "iti", iti_s=round(iti, 3)):
+            start = time.time()
+            while self.running and not self.stop_event.is_set() and (time.time() - start < iti):
+                time.sleep(0.05)
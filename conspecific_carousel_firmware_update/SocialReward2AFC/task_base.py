@@ -1,7 +1,9 @@
 # task_base.py — shared trial logic for Forced, Mixed, and Free 2AFC phases
 #
 # Trial sequence (common to all three):
-#   1. Turntable moves to presentation_angle (balanced block)
+#   1. Turntable moves to presentation_angle (balanced block, from the
+#      session's trial_schedule when build_session() attached one: at most
+#      SEQUENCE.max_run same-side trials in a row, transitions balanced)
 #   2. Port C LED on → poke C (no deadline) → rt_dooropen recorded
 #   3. Door opens → wait for fully open
 #   4. Animal holds table sensor >= sensory_minimum (indefinite, retry if short)
@@ -16,6 +18,9 @@
 #   8. LED(s) off → close_door_safe → turntable returns to 0° or 180° (random)
 #   9. Log → ITI (2–7 s)
 #
+# Steps 1–8 run as a state graph on state_machine.StateMachine (see
+# _task_trial_states); every transition is kept in self.state_log.
+#
 # Correct port assignment:
 #   angle_a_port = "A"  means 90° (or angle_a) → reward at port A
 #   angle_b_port = "B"  means 270° (or angle_b) → reward at port B
@@ -32,13 +37,12 @@ from hardware import (
     set_led,
     open_door,
     close_door_safe,
-    wait_for_door_state,
-    wait_for_table_clear,
-    wait_for_table_stopped,
     turn_table_degrees,
     SharedSensorState,
-    STOP_EVENT,
 )
+from state_machine import StateMachine, State, Trial, on, poke, poke_any, when, table_move
+from trial_schedule import TrialSchedule
+from trial_sequence import SequenceConstraints
 from .base_session import Base2AFCSession
 
 
@@ -47,6 +51,8 @@ class TaskBase2AFC(Base2AFCSession):
     _session_name = "2AFC Task"
     ITI_MIN = 2.0
     ITI_MAX = 7.0
+    SEQUENCE = SequenceConstraints(max_run=3)   # presentation order (trial_sequence)
+    ANTI_CAMPING = False                        # forced / free / mixed trials set the side
 
     def __init__(
         self,
@@ -70,17 +76,32 @@ class TaskBase2AFC(Base2AFCSession):
 
         self._current_angle = 0
         self._position_block = []
+        self.state_log = []   # state_machine transitions, all trials (state_transitions.csv)
 
         # Subclasses define self.results_df
 
     # ── Stimulus block ────────────────────────────────────────────────────────
 
+    def make_schedule(self, seed: int) -> TrialSchedule:
+        return TrialSchedule(seed, angles=(self.angle_a, self.angle_b),
+                             block_size=self.block_size, return_angles=(0, 180),
+                             n_trials=self.max_trials, constraints=self.SEQUENCE)
+
     def _refill_block(self):
         half  = self.block_size // 2
         block = [self.angle_a] * half + [self.angle_b] * (self.block_size - half)
         random.shuffle(block)
         self._position_block = block
 
+    def _next_angle(self) -> int:
+        """Presentation angle of this trial: the schedule's balanced blocks,
+        or a block shuffled now for sessions without a schedule."""
+        if self.schedule is not None:
+            return int(self.schedule.row(self.trial_counter)["angle"])
+        if not self._position_block:
+            self._refill_block()
+        return self._position_block.pop()
+
     def _correct_port(self, angle: int) -> str:
         return "A" if angle == self.angle_a else "B"
 
@@ -89,163 +110,217 @@ class TaskBase2AFC(Base2AFCSession):
     def _run_task_trial(self, trial_type: str) -> dict:
         """Execute one task trial.
         trial_type: 'forced' (only correct LED) or 'free' (both LEDs).
-        Returns dict of trial data.
+        Returns dict of trial data ({} if the session stopped mid-trial), which
+        is also fed to the adaptation rules.
         """
-        if not self._position_block:
-            self._refill_block()
-
-        presentation_angle = self._position_block.pop()
-        correct_port       = self._correct_port(presentation_angle)
-
-        rt                  = np.nan
-        rt_dooropen         = np.nan
-        rt_tablehold        = np.nan
-        rt_to_first_table   = np.nan
-        sampling_time       = np.nan
-        total_sampling_time = 0.0
-        trial_start         = np.nan
-        trial_end           = np.nan
-        valve_time_used     = np.nan
-        poked_port          = None
-        rewarded            = False
-
-        # 1. Turntable to presentation angle
-        start_angle    = self._current_angle
-        turn_direction = self._turn_to(presentation_angle)
-        print(f"Table: {turn_direction} → {presentation_angle}° "
-              f"(correct port: {correct_port})")
-        wait_for_table_stopped(self.shared)
-
-        # 2. Port C LED on → poke C (no deadline)
+        presentation_angle = self._next_angle()
+        trial = Trial(
+            trial_type          = trial_type,
+            presentation_angle  = presentation_angle,
+            correct_port        = self._correct_port(presentation_angle),
+            active_ports        = ([self._correct_port(presentation_angle)]
+                                   if trial_type == "forced" else ["A", "B"]),
+            start_angle         = self._current_angle,
+            turn_direction      = None,
+            rt                  = np.nan,
+            rt_dooropen         = np.nan,
+            rt_tablehold        = np.nan,
+            rt_to_first_table   = np.nan,
+            sampling_time       = np.nan,
+            total_sampling_time = 0.0,
+            trial_start         = np.nan,
+            trial_end           = np.nan,
+            valve_time_used     = np.nan,
+            poked_port          = None,
+            rewarded            = False,
+            outcome             = None,
+            first_contact_time  = None,
+            return_angle        = None,
+        )
+
+        run = StateMachine(self.shared, self._task_trial_states()).run(
+            trial,
+            should_stop=lambda: not self.running,
+            on_abort=self._abort_task_trial,
+        )
+        self.state_log.extend(dict(row, trial=self.trial_counter) for row in run.log)
+        if trial.outcome is None:
+            return {}   # session stopped mid-trial
+        if trial.return_angle is not None and not run.stopped:
+            print(f"Table returned to {trial.return_angle}°")
+
+        data = {
+            "presentation_angle": trial.presentation_angle,
+            "correct_port":       trial.correct_port,
+            "poked_port":         trial.poked_port,
+            "trial_type":         trial.trial_type,
+            "outcome":            trial.outcome,
+            "rt":                 trial.rt,
+            "rt_dooropen":        trial.rt_dooropen,
+            "rt_tablehold":       trial.rt_tablehold,
+            "rt_to_first_table":  trial.rt_to_first_table,
+            "sampling_time":      trial.sampling_time,
+            "total_sampling_time": trial.total_sampling_time,
+            "start_angle":        trial.start_angle,
+            "turn_direction":     trial.turn_direction,
+            "reward_triggered":   trial.rewarded,
+            "valve_time":         trial.valve_time_used,
+            "trial_start":        trial.trial_start,
+            "trial_end":          trial.trial_end,
+        }
+        self._adapt(**data)
+        return data
+
+    def _task_trial_states(self) -> list:
+        """The trial sequence in the header as a state graph (state_machine)."""
+        return [
+            # 1. Turntable to presentation angle
+            *table_move("turn", "led_c", start=self._present),
+
+            # 2. Port C LED on → poke C (no deadline)
+            State("led_c", enter=self._led_c_on, transitions=[
+                on("C", "cleared", "wait_c"),
+            ]),
+            State("wait_c", transitions=[
+                poke("C", "door_opening", action=self._poked_c),
+            ]),
+
+            # 3. Open door → wait for fully open
+            State("door_opening", enter=self._open_door_async, transitions=[
+                on("door", "door opened", "sample_wait", action=self._door_opened),
+            ]),
+
+            # 4. Sensory minimum (indefinite, retry if short)
+            State("sample_wait", transitions=[
+                on("table", "triggered", "sampling"),
+            ]),
+            State("sampling", enter=self._contact_start, exit=self._contact_end, transitions=[
+                on("table", "cleared", "clear_table",
+                   guard=lambda t: t.t - t.contact_start >= self.sensory_minimum,
+                   action=self._sensory_minimum_met),
+                on("table", "cleared", "sample_wait",
+                   action=lambda t: print(f"Sensory minimum too short ({t.s_time:.3f} s), "
+                                          f"retrying...")),
+            ]),
+
+            # 5. Wait for table clear
+            State("clear_table", transitions=[
+                on("table", "cleared", "choice_leds", hold=0.1),
+            ]),
+
+            # 6. 45° CCW (async) + reward port LED(s); ports clear before a poke counts
+            State("choice_leds", enter=self._choice_leds_on, transitions=[
+                when(lambda t: all(self.shared.get_port(p)[0] == "cleared" for p in ("A", "B")),
+                     "choice"),
+            ]),
+
+            # 7. Poke A or B within decision window
+            State("choice", enter=self._choice_start, transitions=poke_any(
+                self.shared, ("A", "B"), "outcome",
+                deadline=lambda t: t.trial_start + self.decision_window,
+                action=lambda t, p: setattr(t, "poked_port", p),
+            )),
+
+            # 8. Close door safely + return turntable
+            State("outcome", enter=self._outcome, transitions=[
+                on("door", "door closed", "settle"),
+            ]),
+            *table_move("settle", "return"),
+            *table_move("return", None, start=self._return_table),
+        ]
+
+    # ── Trial state actions ───────────────────────────────────────────────────
+
+    def _present(self, t) -> None:
+        t.turn_direction = self._turn_to(t.presentation_angle)
+        print(f"Table: {t.turn_direction} → {t.presentation_angle}° "
+              f"(correct port: {t.correct_port})")
+
+    def _led_c_on(self, t) -> None:
         set_led(self.ser, "C", True)
         print("Waiting for port C poke...")
-        ledC_onset = time.time()
-
-        while self.running and not STOP_EVENT.is_set():
-            if self.shared.get_port("C")[0] == "cleared":
-                break
-            time.sleep(0.005)
-
-        pokedC = self._wait_for_poke("C")
-        if not pokedC:
-            set_led(self.ser, "C", False)
-            return {}   # session stopped mid-trial
+        t.ledC_onset = time.time()
 
-        rt_dooropen = time.time() - ledC_onset
+    def _poked_c(self, t) -> None:
+        t.rt_dooropen = t.t - t.ledC_onset
         set_led(self.ser, "C", False)
-        print(f"Port C poked (rt_dooropen={rt_dooropen:.3f} s)")
+        print(f"Port C poked (rt_dooropen={t.rt_dooropen:.3f} s)")
 
-        # 3. Open door → wait for fully open
+    def _open_door_async(self, t) -> None:
         threading.Thread(target=open_door, args=(self.ser,), daemon=True).start()
-        wait_for_door_state(self.shared, "door opened", timeout=None)
-        door_open_time = time.time()
-        print("Door opened — sensory timer started")
 
-        # 4. Sensory minimum (indefinite, retry loop)
+    def _door_opened(self, t) -> None:
+        t.door_open_time = t.t
+        print("Door opened — sensory timer started")
         print(f"Waiting for sensory minimum ({self.sensory_minimum:.3f} s)...")
-        first_contact_time = None
-        while self.running and not STOP_EVENT.is_set():
-            s_time, contact_start = self._wait_for_table_contact()
-            if s_time is None:
-                return {}
-
-            if first_contact_time is None:
-                first_contact_time = contact_start
-            total_sampling_time += s_time
-
-            if s_time >= self.sensory_minimum:
-                rt_tablehold      = time.time() - door_open_time
-                rt_to_first_table = first_contact_time - door_open_time
-                sampling_time     = s_time
-                print(f"Sensory minimum met: {s_time:.3f} s")
-                break
 
-            print(f"Sensory minimum too short ({s_time:.3f} s), retrying...")
+    def _contact_start(self, t) -> None:
+        t.contact_start = t.t
+        if t.first_contact_time is None:
+            t.first_contact_time = t.t
 
-        if not self.running or STOP_EVENT.is_set():
-            return {}
+    def _contact_end(self, t) -> None:
+        t.s_time = t.t - t.contact_start
+        t.total_sampling_time += t.s_time
 
-        # 5. Wait for table clear
+    def _sensory_minimum_met(self, t) -> None:
+        t.rt_tablehold      = t.t - t.door_open_time
+        t.rt_to_first_table = t.first_contact_time - t.door_open_time
+        t.sampling_time     = t.s_time
+        print(f"Sensory minimum met: {t.s_time:.3f} s")
         print("Waiting for animal to clear table sensor...")
-        wait_for_table_clear(self.shared)
 
-        # 6. 45° CCW (async) + reward port LED(s)
-        if trial_type == "forced":
-            active_ports = [correct_port]
-        else:
-            active_ports = ["A", "B"]
-
-        for p in active_ports:
+    def _choice_leds_on(self, t) -> None:
+        for p in t.active_ports:
             set_led(self.ser, p, True)
-        print(f"LEDs on: {active_ports} | 45° CCW starting")
+        print(f"LEDs on: {t.active_ports} | 45° CCW starting")
         threading.Thread(
             target=self._turn_ccw_partial, args=(45,), daemon=True
         ).start()
 
-        # Ensure ports cleared before accepting poke
-        while self.running and not STOP_EVENT.is_set():
-            if all(self.shared.get_port(p)[0] == "cleared" for p in ["A", "B"]):
-                break
-            time.sleep(0.005)
-
-        trial_start = time.time()
-        deadline_ab = trial_start + self.decision_window
+    def _choice_start(self, t) -> None:
+        t.trial_start = time.time()
 
-        # 7. Wait for poke A or B within decision window
-        poked_port = self._wait_for_any_poke(["A", "B"], deadline=deadline_ab)
-        trial_end  = time.time()
-
-        for p in active_ports:
+    def _outcome(self, t) -> None:
+        t.trial_end = t.t
+        for p in t.active_ports:
             set_led(self.ser, p, False)
 
         # Classify outcome
-        if poked_port == correct_port:
-            rt       = trial_end - trial_start
-            rewarded = True
-            outcome  = "hit"
-            valve_time_used = self._deliver_reward(correct_port)
+        if t.poked_port == t.correct_port:
+            t.rt       = t.trial_end - t.trial_start
+            t.rewarded = True
+            t.outcome  = "hit"
+            t.valve_time_used = self._deliver_reward(t.correct_port)
             self.reward_count += 1
-            print(f"Hit! Reward at port {correct_port} "
-                  f"(#{self.reward_count}, valve={valve_time_used:.3f} s)")
-        elif poked_port is not None:
-            rt      = trial_end - trial_start
-            outcome = "error"
-            print(f"Error: poked port {poked_port}, correct was {correct_port}")
+            print(f"Hit! Reward at port {t.correct_port} "
+                  f"(#{self.reward_count}, valve={t.valve_time_used:.3f} s)")
+        elif t.poked_port is not None:
+            t.rt      = t.trial_end - t.trial_start
+            t.outcome = "error"
+            print(f"Error: poked port {t.poked_port}, correct was {t.correct_port}")
         else:
-            outcome = "miss"
+            t.outcome = "miss"
             print("Miss: decision window expired")
 
-        # 8. Close door safely + return turntable
         threading.Thread(
             target=close_door_safe, args=(self.ser, self.shared), daemon=True
         ).start()
-        wait_for_door_state(self.shared, "door closed")
-
-        wait_for_table_stopped(self.shared)
-        return_angle = random.choice([0, 180])
-        self._turn_to(return_angle)
-        wait_for_table_stopped(self.shared)
-        print(f"Table returned to {return_angle}°")
-
-        return {
-            "presentation_angle": presentation_angle,
-            "correct_port":       correct_port,
-            "poked_port":         poked_port,
-            "trial_type":         trial_type,
-            "outcome":            outcome,
-            "rt":                 rt,
-            "rt_dooropen":        rt_dooropen,
-            "rt_tablehold":       rt_tablehold,
-            "rt_to_first_table":  rt_to_first_table,
-            "sampling_time":      sampling_time,
-            "total_sampling_time": total_sampling_time,
-            "start_angle":        start_angle,
-            "turn_direction":     turn_direction,
-            "reward_triggered":   rewarded,
-            "valve_time":         valve_time_used,
-            "trial_start":        trial_start,
-            "trial_end":          trial_end,
-        }
+
+    def _return_table(self, t) -> None:
+        if self.schedule is not None:
+            t.return_angle = int(self.schedule.row(self.trial_counter)["return_angle"])
+        else:
+            t.return_angle = random.choice([0, 180])
+        self._turn_to(t.return_angle)
+
+    def _abort_task_trial(self, t, state: str) -> None:
+        """Session stopped mid-trial: leave no LED on."""
+        if state in ("led_c", "wait_c"):
+            set_led(self.ser, "C", False)
+        elif state in ("choice_leds", "choice"):
+            for p in t.active_ports:
+                set_led(self.ser, p, False)
 
     # ── Turntable helpers ─────────────────────────────────────────────────────
 
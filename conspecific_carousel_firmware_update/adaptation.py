@@ -0,0 +1,456 @@
+# adaptation.py — Adaptive session parameters: staircases and performance criteria
+#
+# An AdaptationEngine owns the rules that change a session's parameters as
+# the animal performs, instead of each session hard-coding them. Every rule
+# drives one session attribute (`param`) and is updated in O(1) per trial:
+#
+#   TrialSteps      value by trial number (phase 3b gradual hold)
+#   Staircase       n-down / m-up on a success field
+#   BlockCriterion  next level when a block's success rate reaches criterion
+#                   (MixedChoice forced_ratio)
+#   RollingCriterion  next level when the rolling success rate reaches
+#                   criterion over the last `window` trials
+#   SideStreak      force the other side after `length` same-side choices
+#                   (2AFC anti-camping, Social Choice anti-bias)
+#   SideBiasTest    force the other side when the recent choices are biased
+#                   at p < alpha (binomial test, trial_stats.SideBias)
+#   PortCamping     force a port the animal keeps missing while it keeps
+#                   hitting another (Social Memory training anti-camping)
+#
+# Rules see each trial's logged results row once the trial is over (any
+# column can drive a rule); sessions that need a decision before the row is
+# logged feed their own fields instead with self._adapt(field=value, ...)
+# (2AFC anti-camping, MixedChoice block ends). build_session() applies the
+# "adaptation" params on top of the session's default rules — a configured
+# rule replaces the default for the same param — so criteria and steps can be
+# tuned without code edits, in a rigs.json params file or under "adaptation"
+# in the setup dialog's *_last_settings.json:
+#
+#   "adaptation": [
+#     {"rule": "staircase", "param": "sensory_minimum", "field": "outcome",
+#      "success": "rewarded", "down": 3, "up": 1, "step": 0.1, "min": 0.5, "max": 3.0},
+#     {"rule": "block", "param": "forced_ratio", "field": "outcome", "success": "hit",
+#      "where": {"trial_type": "free"}, "levels": [0.75, 0.5, 0.25, 0.0],
+#      "criterion": 0.8, "min_n": 3},
+#     {"rule": "side_bias", "param": "_forced_port", "window": 20, "alpha": 0.01,
+#      "release": "next"}
+#   ]
+#
+# Every change is logged with the trial, old and new value, rule and trigger
+# (engine.log), printed as it happens and saved as adaptation_log.csv.
+
+import csv
+import math
+import os
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from trial_stats import SideBias
+
+Change = Optional[Tuple[object, str]]       # (new value, trigger) or None
+
+
+def _fmt(value) -> str:
+    return f"{value:g}" if isinstance(value, float) else str(value)
+
+
+def _missing(value) -> bool:
+    """None, or the NaN a results row holds for it."""
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+# ── Rules ─────────────────────────────────────────────────────────────────────
+
+class Rule:
+    """Drives session attribute `param`. Subclasses implement update() and /
+    or before_trial(); both return (new value, trigger) to change it."""
+
+    kind = "rule"
+
+    def __init__(self, param: str, field: Optional[str] = None, success=None,
+                 where: Optional[Dict[str, object]] = None):
+        self.param = param
+        self.field = field
+        self.success = success          # value(s) of field that count as 1
+        self.where = where or {}
+
+    def before_trial(self, trial_num: int, current) -> Change:
+        return None
+
+    def update(self, trial: dict, current) -> Change:
+        return None
+
+    def _score(self, trial: dict) -> Optional[float]:
+        """The trial's field as 0/1 (or a number), None when the trial is
+        filtered out or has no value."""
+        if self.field not in trial:
+            return None
+        if any(trial.get(k) != v for k, v in self.where.items()):
+            return None
+        value = trial[self.field]
+        if self.success is not None:
+            hits = self.success if isinstance(self.success, (list, tuple, set)) else (self.success,)
+            return float(value in hits)
+        try:
+            x = float(value)
+        except (TypeError, ValueError):
+            return None
+        return None if math.isnan(x) else x
+
+    def _describe_field(self) -> str:
+        return f"{self.field}={self.success}" if self.success is not None else str(self.field)
+
+
+class TrialSteps(Rule):
+    """values[i] until trial thresholds[i] (exclusive), then values[-1]."""
+
+    kind = "steps"
+
+    def __init__(self, param: str, thresholds: Sequence[int], values: Sequence):
+        super().__init__(param)
+        if not values:
+            raise ValueError("TrialSteps needs at least one value")
+        self.thresholds = list(thresholds)
+        self.values = list(values)
+
+    def value_for(self, trial_num: int):
+        for threshold, value in zip(self.thresholds, self.values[:-1]):
+            if trial_num < threshold:
+                return value
+        return self.values[-1]
+
+    def before_trial(self, trial_num: int, current) -> Change:
+        value = self.value_for(trial_num)
+        if value != current:
+            return value, f"trial {trial_num}"
+        return None
+
+
+class Staircase(Rule):
+    """Add `step` after `down` consecutive successes, subtract it after `up`
+    consecutive failures (a negative step makes success lower the value);
+    clamped to [min, max]."""
+
+    kind = "staircase"
+
+    def __init__(self, param: str, field: str, success=None, where=None,
+                 step: float = 0.1, down: int = 3, up: int = 1,
+                 min: float = -math.inf, max: float = math.inf):
+        super().__init__(param, field, success, where)
+        self.step, self.down, self.up = step, down, up
+        self.lo, self.hi = min, max
+        self._successes = 0
+        self._failures = 0
+
+    def update(self, trial: dict, current) -> Change:
+        score = self._score(trial)
+        if score is None:
+            return None
+        if score >= 0.5:
+            self._successes, self._failures = self._successes + 1, 0
+            if self._successes < self.down:
+                return None
+            self._successes, delta = 0, self.step
+            why = f"{self.down} × {self._describe_field()}"
+        else:
+            self._successes, self._failures = 0, self._failures + 1
+            if self._failures < self.up:
+                return None
+            self._failures, delta = 0, -self.step
+            why = f"{self.up} × not {self._describe_field()}"
+        value = min(self.hi, max(self.lo, current + delta))
+        return (value, why) if value != current else None
+
+
+class _LevelRule(Rule):
+    """Steps through `levels`, advancing when the success rate reaches
+    `criterion` on at least min_n scored trials. A current value that is not
+    one of the levels never advances."""
+
+    def __init__(self, param: str, field: str, levels: Sequence, criterion: float,
+                 success=None, where=None, min_n: int = 1):
+        super().__init__(param, field, success, where)
+        self.levels = list(levels)
+        self.criterion = criterion
+        self.min_n = min_n
+        self.last_rate = math.nan       # rate of the last evaluated window
+
+    def _judge(self, hits: float, n: int, current, scope: str) -> Change:
+        if n < self.min_n:
+            return None
+        self.last_rate = hits / n
+        print(f"[INFO] {scope} {self._describe_field()} rate: {self.last_rate:.2%}")
+        if self.last_rate < self.criterion or current not in self.levels:
+            return None
+        idx = self.levels.index(current)
+        if idx == len(self.levels) - 1:
+            return None
+        return (self.levels[idx + 1],
+                f"{scope} rate {self.last_rate:.0%} ≥ {self.criterion:.0%} over {n} trials")
+
+
+class BlockCriterion(_LevelRule):
+    """Judged once per block: every block_size scored-or-not trials, or when
+    a trial dict carries block_end=True (sessions that manage their own
+    blocks, so the verdict lands before the next block is built)."""
+
+    kind = "block"
+
+    def __init__(self, param: str, field: str, levels: Sequence, criterion: float,
+                 success=None, where=None, min_n: int = 1, block_size: Optional[int] = None):
+        super().__init__(param, field, levels, criterion, success, where, min_n)
+        self.block_size = block_size
+        self.block = 0
+        self._trials = 0
+        self._hits = 0.0
+        self._n = 0
+
+    def update(self, trial: dict, current) -> Change:
+        if trial.get("block_end"):
+            return self._end_block(current)
+        score = self._score(trial)
+        if score is not None:
+            self._hits += score
+            self._n += 1
+        if self.field in trial:
+            self._trials += 1
+            if self.block_size and self._trials % self.block_size == 0:
+                return self._end_block(current)
+        return None
+
+    def _end_block(self, current) -> Change:
+        self.block += 1
+        hits, n = self._hits, self._n
+        self._hits, self._n = 0.0, 0
+        return self._judge(hits, n, current, f"Block {self.block}")
+
+
+class RollingCriterion(_LevelRule):
+    """Judged after every scored trial over the last `window` of them; the
+    window restarts after each advance."""
+
+    kind = "rolling"
+
+    def __init__(self, param: str, field: str, levels: Sequence, criterion: float,
+                 success=None, where=None, window: int = 20):
+        super().__init__(param, field, levels, criterion, success, where, min_n=window)
+        self.window = window
+        self._scores: deque = deque()
+        self._sum = 0.0
+
+    def update(self, trial: dict, current) -> Change:
+        score = self._score(trial)
+        if score is None:
+            return None
+        self._scores.append(score)
+        self._sum += score
+        if len(self._scores) > self.window:
+            self._sum -= self._scores.popleft()
+        if len(self._scores) < self.window or self._sum / self.window < self.criterion:
+            return None
+        change = self._judge(self._sum, self.window, current, f"Last {self.window}")
+        if change is not None:
+            self._scores.clear()
+            self._sum = 0.0
+        return change
+
+
+class SideStreak(Rule):
+    """After `length` consecutive choices of the same side, set param to the
+    other side. release="visit": cleared once that side is chosen;
+    release="next": cleared after the next trial, whatever was chosen.
+    With skip_missing, trials without a choice (None) are ignored."""
+
+    kind = "side_streak"
+
+    def __init__(self, param: str = "_forced_port", field: str = "poked_port",
+                 length: int = 3, sides: Sequence[str] = ("A", "B"),
+                 release: str = "visit", skip_missing: bool = True):
+        super().__init__(param, field)
+        if release not in ("visit", "next"):
+            raise ValueError(f"release must be 'visit' or 'next', got '{release}'")
+        self.length = length
+        self.sides = list(sides)
+        self.release = release
+        self.skip_missing = skip_missing
+        self._side = None
+        self._count = 0
+
+    def update(self, trial: dict, current) -> Change:
+        if self.field not in trial:
+            return None
+        side = trial[self.field]
+        if _missing(side):
+            if self.skip_missing:
+                return None
+            side = None
+        if current is not None:
+            if self.release == "next" or side == current:
+                self._reset()
+                return None, f"{self.field}={side}"
+            return None
+        return self._detect(side)
+
+    def _other(self, side) -> str:
+        return self.sides[1] if side == self.sides[0] else self.sides[0]
+
+    def _reset(self) -> None:
+        self._side, self._count = None, 0
+
+    def _detect(self, side) -> Change:
+        if side == self._side:
+            self._count += 1
+        else:
+            self._side, self._count = side, 1
+        if self._count < self.length:
+            return None
+        self._reset()
+        return self._other(side), f"{self.length} consecutive {self.field}={side}"
+
+
+class SideBiasTest(SideStreak):
+    """Like SideStreak, but forces the other side when the last `window`
+    choices (at least min_n) depart from 50 / 50 at p < alpha (binomial
+    test, trial_stats.SideBias) rather than on a run. The window restarts
+    once the forced side is released."""
+
+    kind = "side_bias"
+
+    def __init__(self, param: str = "_forced_port", field: str = "poked_port",
+                 window: int = 20, alpha: float = 0.01, min_n: int = 10,
+                 sides: Sequence[str] = ("A", "B"), release: str = "visit"):
+        super().__init__(param, field, sides=sides, release=release, skip_missing=True)
+        self.alpha = alpha
+        self.min_n = min_n
+        self.bias = SideBias(sides, window)
+
+    def _reset(self) -> None:
+        super()._reset()
+        self.bias.reset()
+
+    def _detect(self, side) -> Change:
+        self.bias.push(side)
+        b = self.bias
+        if b.n < self.min_n or not b.p_value < self.alpha or b.preferred is None:
+            return None
+        preferred, index, n, p = b.preferred, b.index, b.n, b.p_value
+        b.reset()
+        return (self._other(preferred),
+                f"{self.field} bias {index:+.2f} toward {preferred} over the last {n} "
+                f"(p={p:.3g} < {self.alpha:g})")
+
+
+class PortCamping(Rule):
+    """Per port, the last `length` outcomes (`field` of the trials at
+    `port_field`). When one port was missed every time and another hit every
+    time, set param to the missed port; cleared once it is hit, which also
+    clears the histories."""
+
+    kind = "port_camping"
+
+    def __init__(self, param: str = "_forced_port", ports: Sequence[str] = ("A", "B"),
+                 length: int = 3, field: str = "reward_triggered", port_field: str = "port"):
+        super().__init__(param, field)
+        self.ports = list(ports)
+        self.length = length
+        self.port_field = port_field
+        self._history: Dict[str, List[bool]] = {p: [] for p in self.ports}
+
+    def update(self, trial: dict, current) -> Change:
+        if self.port_field not in trial or self.field not in trial:
+            return None
+        port, rewarded = trial[self.port_field], bool(trial[self.field])
+        history = self._history.setdefault(port, [])
+        history.append(rewarded)
+        if len(history) > self.length:
+            history.pop(0)
+
+        if rewarded and port == current:
+            for p in self._history:
+                self._history[p] = []
+            return None, f"port {port} rewarded"
+        if current is not None:
+            return None
+
+        full = [p for p in self.ports if len(self._history[p]) == self.length]
+        always_miss = [p for p in full if not any(self._history[p])]
+        always_hit = [p for p in full if all(self._history[p])]
+        if always_miss and always_hit:
+            return (always_miss[0],
+                    f"port {always_miss[0]} missed and port {always_hit[0]} "
+                    f"hit {self.length}× in a row")
+        return None
+
+
+RULES = {cls.kind: cls for cls in (TrialSteps, Staircase, BlockCriterion,
+                                   RollingCriterion, SideStreak, SideBiasTest,
+                                   PortCamping)}
+
+
+def rules_from_config(config: Iterable[dict]) -> List[Rule]:
+    """Rules from the "adaptation" params: [{"rule": kind, **arguments}]."""
+    rules = []
+    for entry in config:
+        entry = dict(entry)
+        kind = entry.pop("rule", None)
+        if kind not in RULES:
+            raise ValueError(f"Unknown adaptation rule '{kind}' (one of {', '.join(RULES)})")
+        try:
+            rules.append(RULES[kind](**entry))
+        except TypeError as e:
+            raise ValueError(f"Adaptation rule '{kind}': {e}") from None
+    return rules
+
+
+# ── Engine ────────────────────────────────────────────────────────────────────
+
+class AdaptationEngine:
+    """Applies its rules to `session` and logs every change."""
+
+    def __init__(self, session, rules: Iterable[Rule] = ()):
+        self.session = session
+        self.rules: List[Rule] = list(rules)
+        self.log: List[dict] = []
+
+    def rule(self, param: str) -> Optional[Rule]:
+        return next((r for r in self.rules if r.param == param), None)
+
+    def add(self, rule: Rule) -> None:
+        """Add `rule`, replacing any rule for the same param."""
+        self.rules = [r for r in self.rules if r.param != rule.param] + [rule]
+
+    def configure(self, config: Optional[Iterable[dict]]) -> None:
+        for rule in rules_from_config(config or ()):
+            self.add(rule)
+
+    def before_trial(self) -> None:
+        trial_num = self.session.trial_counter
+        for rule in self.rules:
+            self._apply(rule, rule.before_trial(trial_num, getattr(self.session, rule.param)))
+
+    def update(self, trial: dict) -> None:
+        for rule in self.rules:
+            self._apply(rule, rule.update(trial, getattr(self.session, rule.param)))
+
+    def _apply(self, rule: Rule, change: Change) -> None:
+        if change is None:
+            return
+        value, trigger = change
+        old = getattr(self.session, rule.param)
+        setattr(self.session, rule.param, value)
+        self.log.append({"trial_num": self.session.trial_counter, "param": rule.param,
+                         "old": old, "new": value, "rule": rule.kind, "trigger": trigger})
+        print(f"[INFO] Adaptation: {rule.param.lstrip('_')} {_fmt(old)} → {_fmt(value)} "
+              f"({rule.kind}: {trigger})")
+
+    def save(self, save_dir: str) -> Optional[str]:
+        """Write adaptation_log.csv (nothing when no parameter changed)."""
+        if not self.log:
+            return None
+        path = os.path.join(save_dir, "adaptation_log.csv")
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(self.log[0]))
+            writer.writeheader()
+            writer.writerows(self.log)
+        print(f"[INFO] Adaptation log saved: {path} ({len(self.log)} changes)")
+        return path
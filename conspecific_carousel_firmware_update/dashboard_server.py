@@ -0,0 +1,523 @@
+# dashboard_server.py — local web dashboard for watching several rigs at once
+#
+# One dashboard server runs on any PC on the lab network:
+#   python dashboard_server.py [--host 0.0.0.0] [--port 8765]
+# and a browser pointed at http://<that-pc>:8765/ shows one card per running
+# session: live sensor states, trial count and the latest trial rows.
+#
+# Each rig streams to it with a DashboardPublisher (enabled by the
+# "dashboard" option in the setup dialogs; the server address comes from
+# the CAROUSEL_DASHBOARD environment variable, default DASHBOARD_URL).
+# The publisher does all of its work on its own thread:
+#   • sensor transitions arrive via EventLogger.on_transition() and are only
+#     appended to a deque on the reader thread;
+#   • trial tables are polled every PUBLISH_INTERVAL_S and only rows added
+#     since the last successful post are sent.
+# Batches go to the server as HTTP POST /publish; the server merges them into
+# its per-rig state and pushes the same compact deltas to every browser over
+# a WebSocket (/ws). A browser that connects late gets the full state once.
+#
+# Stdlib only — no extra packages are needed on the rigs or the dashboard PC.
+
+import argparse
+import base64
+import collections
+import hashlib
+import http.client
+import json
+import math
+import os
+import socket
+import struct
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+DASHBOARD_URL = os.environ.get("CAROUSEL_DASHBOARD", "http://localhost:8765")
+PUBLISH_INTERVAL_S = 0.25
+HEARTBEAT_S = 2.0
+MAX_PENDING_TRANSITIONS = 2000
+SHOW_ROWS = 10                       # rows per table kept for late-joining browsers
+
+_WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def _jsonable(value):
+    """Cell value → JSON value (NaN/NaT → null, numpy scalars → Python)."""
+    if value is None:
+        return None
+    if hasattr(value, "item") and not isinstance(value, (list, tuple)):
+        try:
+            value = value.item()
+        except (ValueError, AttributeError):
+            pass
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    try:
+        import pandas as pd
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    return str(value)
+
+
+# ── Publisher (runs on the rig) ───────────────────────────────────────────────
+
+def rig_name(serial_port: str) -> str:
+    """Dashboard id of a rig: this PC's hostname plus the controller's port."""
+    return f"{socket.gethostname()}:{serial_port}"
+
+
+class DashboardPublisher:
+    """
+    Streams one session's sensor transitions and trial rows to the dashboard
+    server. Nothing here runs on the session or control-loop threads except
+    transition(), which only appends to a deque.
+
+    Usage in main script:
+        dashboard = DashboardPublisher(DASHBOARD_URL, rig=rig_name(port),
+                                       info={"session": ..., "animal": ...})
+        logger.on_transition(dashboard.transition)
+        ...
+        dashboard.watch("trials", lambda: session.results_df)
+        dashboard.start()
+        ...
+        dashboard.close()
+    """
+
+    def __init__(self, url: str, rig: str, info: Optional[dict] = None):
+        parsed = urllib.parse.urlsplit(url)
+        self._host = parsed.hostname or "localhost"
+        self._port = parsed.port or 80
+        self.rig = rig
+        self.info = dict(info or {})
+        self._transitions = collections.deque(maxlen=MAX_PENDING_TRANSITIONS)
+        self._transitions_lock = threading.Lock()
+        self._sources: Dict[str, Callable] = {}
+        self._sent_rows: Dict[str, int] = {}
+        self._sent_columns: Dict[str, list] = {}
+        self._conn: Optional[http.client.HTTPConnection] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_post = 0.0
+        self._warned = False
+
+    def transition(self, port: str, state: str, t: float) -> None:
+        """EventLogger.on_transition() callback (reader thread) — O(1)."""
+        with self._transitions_lock:
+            self._transitions.append((port, state, round(t, 3)))
+
+    def watch(self, table: str, source: Callable) -> None:
+        """Publish the rows of source() (a DataFrame) as they are added."""
+        self._sources[table] = source
+        self._sent_rows.setdefault(table, 0)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="dashboard", daemon=True)
+        self._thread.start()
+        print(f"[INFO] Streaming to dashboard at http://{self._host}:{self._port}/ as {self.rig}")
+
+    def close(self) -> None:
+        """Stop the thread and send the last rows with the session marked ended."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+        self._publish(final=True)
+        if self._conn is not None:
+            self._conn.close()
+
+    def _run(self) -> None:
+        while not self._stop.wait(PUBLISH_INTERVAL_S):
+            self._publish()
+
+    def _collect_rows(self) -> dict:
+        tables = {}
+        for name, source in self._sources.items():
+            try:
+                df = source()
+            except Exception:
+                continue                    # table being swapped out by the session thread
+            if df is None:
+                continue
+            start = self._sent_rows[name]
+            if len(df) <= start:
+                continue
+            new = df.iloc[start:]
+            delta = {"start": start,
+                     "rows": [[_jsonable(v) for v in row] for row in new.itertuples(index=False)]}
+            columns = [str(c) for c in df.columns]
+            if columns != self._sent_columns.get(name):
+                delta["columns"] = columns
+            tables[name] = delta
+        return tables
+
+    def _publish(self, final: bool = False) -> None:
+        # Take the pending transitions; the reader thread keeps appending to
+        # a fresh deque while this tick posts
+        with self._transitions_lock:
+            pending = self._transitions
+            self._transitions = collections.deque(maxlen=MAX_PENDING_TRANSITIONS)
+        transitions = list(pending)
+        tables = self._collect_rows()
+        now = time.monotonic()
+        if not transitions and not tables and not final and now - self._last_post < HEARTBEAT_S:
+            return
+        payload = {"rig": self.rig, "info": self.info, "sensors": transitions,
+                   "tables": tables, "end": final}
+        reply = self._post(payload)
+        if reply is None:
+            # Server unreachable — put them back ahead of the newer ones and
+            # retry next tick (the oldest go first past MAX_PENDING_TRANSITIONS)
+            with self._transitions_lock:
+                pending.extend(self._transitions)
+                self._transitions = pending
+            return
+        self._last_post = now
+        for name, delta in tables.items():
+            if name in reply.get("resync", {}):
+                continue
+            self._sent_rows[name] = delta["start"] + len(delta["rows"])
+            if "columns" in delta:
+                self._sent_columns[name] = delta["columns"]
+        # Server restarted mid-session: it tells us how many rows it has
+        for name, have in reply.get("resync", {}).items():
+            self._sent_rows[name] = int(have)
+            self._sent_columns.pop(name, None)
+
+    def _post(self, payload: dict) -> Optional[dict]:
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        for attempt in range(2):            # one retry on a stale keep-alive connection
+            try:
+                if self._conn is None:
+                    self._conn = http.client.HTTPConnection(self._host, self._port, timeout=2)
+                self._conn.request("POST", "/publish", body,
+                                   {"Content-Type": "application/json"})
+                resp = self._conn.getresponse()
+                data = resp.read()
+                if self._warned:
+                    print("[INFO] Dashboard connection restored")
+                    self._warned = False
+                return json.loads(data or b"{}")
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+                if attempt and not self._warned:
+                    print(f"[WARN] Dashboard unreachable ({e}) — will keep retrying")
+                    self._warned = True
+        return None
+
+
+# ── Server ────────────────────────────────────────────────────────────────────
+
+class _Rig:
+    def __init__(self, rig: str, info: dict):
+        self.rig = rig
+        self.info = info
+        self.sensors: Dict[str, list] = {}
+        self.tables: Dict[str, dict] = {}     # name → {"columns", "n", "tail"}
+        self.last_seen = time.time()
+        self.ended = False
+
+    def state(self) -> dict:
+        return {"type": "rig", "rig": self.rig, "info": self.info, "sensors": self.sensors,
+                "tables": {name: {"columns": t["columns"], "start": t["n"] - len(t["tail"]),
+                                  "rows": list(t["tail"])}
+                           for name, t in self.tables.items()},
+                "last_seen": self.last_seen, "ended": self.ended}
+
+
+class DashboardState:
+    """Per-rig state on the server and the set of connected browsers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rigs: Dict[str, _Rig] = {}
+        self._clients = set()
+
+    # ── Publishing side ───────────────────────────────────────────────────────
+
+    def apply(self, msg: dict) -> dict:
+        """Merge one publisher batch; returns the reply for the publisher."""
+        rig_id = msg["rig"]
+        info = msg.get("info", {})
+        resync = {}
+        with self._lock:
+            rig = self.rigs.get(rig_id)
+            new_session = rig is None or rig.info != info
+            if new_session:
+                rig = self.rigs[rig_id] = _Rig(rig_id, info)
+            rig.last_seen = time.time()
+            rig.ended = bool(msg.get("end"))
+            for port, state, t in msg.get("sensors", []):
+                rig.sensors[port] = [state, t]
+            table_deltas = {}
+            for name, delta in msg.get("tables", {}).items():
+                table = rig.tables.get(name)
+                if table is None:
+                    if "columns" not in delta:
+                        resync[name] = 0    # we restarted; publisher re-sends from row 0
+                        continue
+                    table = rig.tables[name] = {"columns": delta.get("columns", []), "n": 0,
+                                                "tail": collections.deque(maxlen=SHOW_ROWS)}
+                if delta["start"] != table["n"]:
+                    resync[name] = table["n"]
+                    continue
+                if "columns" in delta:
+                    table["columns"] = delta["columns"]
+                table["tail"].extend(delta["rows"])
+                table["n"] += len(delta["rows"])
+                table_deltas[name] = delta
+            if new_session:
+                out = rig.state()
+            else:
+                out = {"type": "delta", "rig": rig_id, "sensors": msg.get("sensors", []),
+                       "tables": table_deltas, "last_seen": rig.last_seen, "ended": rig.ended}
+        self.broadcast(out)
+        return {"ok": True, "resync": resync}
+
+    # ── Browser side ──────────────────────────────────────────────────────────
+
+    def add_client(self, client: "_WebSocket") -> None:
+        with self._lock:
+            snapshot = [rig.state() for rig in self.rigs.values()]
+            self._clients.add(client)
+        for state in snapshot:
+            client.send(json.dumps(state))
+
+    def remove_client(self, client: "_WebSocket") -> None:
+        with self._lock:
+            self._clients.discard(client)
+
+    def broadcast(self, msg: dict) -> None:
+        text = json.dumps(msg, separators=(",", ":"))
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            if not client.send(text):
+                self.remove_client(client)
+
+
+class _WebSocket:
+    """Minimal server side of RFC 6455: unfragmented text frames out, frames
+    in are read only to notice the browser closing the connection."""
+
+    def __init__(self, sock: socket.socket, rfile):
+        self._sock = sock
+        self._rfile = rfile
+        self._lock = threading.Lock()
+        sock.settimeout(2.0)                 # a stuck browser must not block publishers
+
+    def send(self, text: str) -> bool:
+        data = text.encode("utf-8")
+        n = len(data)
+        if n < 126:
+            header = struct.pack("!BB", 0x81, n)
+        elif n < 1 << 16:
+            header = struct.pack("!BBH", 0x81, 126, n)
+        else:
+            header = struct.pack("!BBQ", 0x81, 127, n)
+        try:
+            with self._lock:
+                self._sock.sendall(header + data)
+            return True
+        except OSError:
+            return False
+
+    def wait_closed(self) -> None:
+        self._sock.settimeout(None)
+        while True:
+            head = self._rfile.read(2)
+            if len(head) < 2:
+                return
+            opcode, length = head[0] & 0x0F, head[1] & 0x7F
+            if length == 126:
+                length = struct.unpack("!H", self._rfile.read(2))[0]
+            elif length == 127:
+                length = struct.unpack("!Q", self._rfile.read(8))[0]
+            if head[1] & 0x80:
+                self._rfile.read(4)          # masking key; payload is ignored
+            self._rfile.read(length)
+            if opcode == 0x8:                # close
+                return
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: DashboardState = None         # set by serve()
+
+    def log_message(self, fmt, *args):   # keep the console for [INFO]/[WARN] lines
+        pass
+
+    def _reply(self, code: int, body: bytes, content_type: str) -> None:
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/ws":
+            self._websocket()
+        elif self.path in ("/", "/index.html"):
+            self._reply(200, _PAGE.encode("utf-8"), "text/html; charset=utf-8")
+        elif self.path == "/state":
+            with self.state._lock:
+                states = [rig.state() for rig in self.state.rigs.values()]
+            self._reply(200, json.dumps(states).encode("utf-8"), "application/json")
+        else:
+            self._reply(404, b"not found", "text/plain")
+
+    def do_POST(self):
+        if self.path != "/publish":
+            self._reply(404, b"not found", "text/plain")
+            return
+        try:
+            msg = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            reply = self.state.apply(msg)
+        except (ValueError, KeyError, TypeError) as e:
+            self._reply(400, json.dumps({"error": str(e)}).encode("utf-8"), "application/json")
+            return
+        self._reply(200, json.dumps(reply).encode("utf-8"), "application/json")
+
+    def _websocket(self):
+        key = self.headers.get("Sec-WebSocket-Key")
+        if not key or self.headers.get("Upgrade", "").lower() != "websocket":
+            self._reply(400, b"expected a WebSocket upgrade", "text/plain")
+            return
+        accept = base64.b64encode(hashlib.sha1(key.encode("ascii") + _WS_GUID).digest())
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept.decode("ascii"))
+        self.end_headers()
+        self.wfile.flush()
+        client = _WebSocket(self.connection, self.rfile)
+        self.state.add_client(client)
+        try:
+            client.wait_closed()
+        except OSError:
+            pass
+        finally:
+            self.state.remove_client(client)
+            self.close_connection = True
+
+
+def serve(host: str = "0.0.0.0", port: int = 8765) -> None:
+    handler = type("Handler", (_Handler,), {"state": DashboardState()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    print(f"[INFO] Dashboard on http://{socket.gethostname()}:{port}/ — Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+# ── Page ──────────────────────────────────────────────────────────────────────
+
+_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Carousel rigs</title>
+<style>
+ body { font: 13px sans-serif; margin: 12px; background: #f4f4f4; }
+ #rigs { display: flex; flex-wrap: wrap; gap: 12px; }
+ .rig { background: #fff; border: 1px solid #ccc; border-radius: 6px; padding: 10px; width: 460px; }
+ .rig.stale { opacity: 0.55; }
+ .rig h2 { font-size: 15px; margin: 0 0 4px; }
+ .meta { color: #666; margin-bottom: 6px; }
+ .sensor { display: inline-block; padding: 2px 6px; margin: 2px; border-radius: 4px; background: #e57373; color: #fff; }
+ .sensor.on { background: #43a047; }
+ table { border-collapse: collapse; width: 100%; margin-top: 6px; font-size: 11px; }
+ th, td { border-bottom: 1px solid #eee; padding: 1px 4px; text-align: right; white-space: nowrap; }
+ .scroll { overflow-x: auto; }
+</style></head>
+<body><h1 style="font-size:18px">Carousel rigs</h1><div id="status">connecting…</div><div id="rigs"></div>
+<script>
+const SHOW_ROWS = __SHOW_ROWS__;
+const rigs = {};
+const ON = ["triggered", "door opened", "table moving"];
+function el(tag, cls, text) { const e = document.createElement(tag); if (cls) e.className = cls; if (text !== undefined) e.textContent = text; return e; }
+function render(id) {
+  const r = rigs[id];
+  let card = document.getElementById("rig-" + id);
+  if (!card) { card = el("div", "rig"); card.id = "rig-" + id; document.getElementById("rigs").appendChild(card); }
+  card.replaceChildren();
+  const info = r.info || {};
+  card.appendChild(el("h2", "", id));
+  const meta = Object.entries(info).map(([k, v]) => k + ": " + v).join(" · ");
+  card.appendChild(el("div", "meta", meta + (r.ended ? " · ended" : "")));
+  const sensors = el("div");
+  for (const [port, [state, t]] of Object.entries(r.sensors).sort()) {
+    const s = el("span", "sensor" + (ON.includes(state) ? " on" : ""), port + ": " + state);
+    s.title = "t = " + t + " s"; sensors.appendChild(s);
+  }
+  card.appendChild(sensors);
+  for (const [name, t] of Object.entries(r.tables)) {
+    card.appendChild(el("div", "meta", name + ": " + t.n + " rows"));
+    const wrap = el("div", "scroll"), tbl = el("table"), head = el("tr");
+    t.columns.forEach(c => head.appendChild(el("th", "", c)));
+    tbl.appendChild(head);
+    t.rows.slice(-SHOW_ROWS).reverse().forEach(row => {
+      const tr = el("tr");
+      row.forEach(v => tr.appendChild(el("td", "", v === null ? "" : (typeof v === "number" && !Number.isInteger(v)) ? v.toFixed(3) : String(v))));
+      tbl.appendChild(tr);
+    });
+    wrap.appendChild(tbl); card.appendChild(wrap);
+  }
+}
+function onMessage(msg) {
+  if (msg.type === "rig") {
+    const tables = {};
+    for (const [name, t] of Object.entries(msg.tables)) tables[name] = {columns: t.columns, rows: t.rows, n: t.start + t.rows.length};
+    rigs[msg.rig] = {info: msg.info, sensors: msg.sensors, tables: tables, last_seen: msg.last_seen, ended: msg.ended};
+  } else {
+    const r = rigs[msg.rig]; if (!r) return;
+    for (const [port, state, t] of msg.sensors) r.sensors[port] = [state, t];
+    for (const [name, d] of Object.entries(msg.tables)) {
+      const t = r.tables[name] || (r.tables[name] = {columns: [], rows: [], n: 0});
+      if (d.columns) t.columns = d.columns;
+      t.rows = t.rows.concat(d.rows).slice(-SHOW_ROWS); t.n = d.start + d.rows.length;
+    }
+    r.last_seen = msg.last_seen; r.ended = msg.ended;
+  }
+  render(msg.rig);
+}
+setInterval(() => {
+  const now = Date.now() / 1000;
+  for (const [id, r] of Object.entries(rigs)) {
+    const card = document.getElementById("rig-" + id);
+    if (card) card.classList.toggle("stale", r.ended || now - r.last_seen > 10);
+  }
+}, 1000);
+function connect() {
+  const ws = new WebSocket((location.protocol === "https:" ? "wss://" : "ws://") + location.host + "/ws");
+  ws.onopen = () => { document.getElementById("status").textContent = "live"; };
+  ws.onmessage = e => onMessage(JSON.parse(e.data));
+  ws.onclose = () => { document.getElementById("status").textContent = "disconnected — retrying…"; setTimeout(connect, 2000); };
+}
+connect();
+</script></body></html>
+""".replace("__SHOW_ROWS__", str(SHOW_ROWS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the live multi-rig dashboard.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    serve(args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+# event_raster.py — Long-session event raster (ethogram) with level-of-detail
+# downsampling, live or offline.
+#
+# One row per sensor / actuator channel, filled where the channel was "on":
+#   A / B / C, doorsensor, table — triggered → cleared
+#   door                          — door opened → door closed
+#   table_motor                   — table moving → table stopped
+#
+# Plotting one rectangle per interval makes a multi-hour session cost
+# O(events) artists per redraw. Instead each channel keeps its intervals in
+# an IntervalBuffer and the raster is drawn as a single image whose columns
+# are screen pixels: every pixel column shows the fraction of its time span
+# the channel was on (occupancy), and any column that contains an event is
+# drawn at least MIN_ALPHA opaque so a 5 ms beam break is never lost at a
+# 1-hour zoom (the min/max idea of waveform viewers). The draw cost is
+# O(width · channels · log n), independent of how many events were logged.
+#
+# IntervalBuffer holds two levels of detail:
+#   exact  — the most recent `capacity` intervals (ring buffer, sorted, with
+#            cumulative on-time so any bin is two binary searches)
+#   coarse — on-time and event count per COARSE_S-second bin for the whole
+#            session (one float per second per channel), used for spans the
+#            exact ring no longer covers
+#
+# Live:   enable "Event raster" in the setup dialog — the main script calls
+#         logger.on_transition(raster.on_transition) and raster.update() from
+#         its run loop; the figure is saved as event_raster.png at shutdown.
+#         With "gui_process" on, the window lives in the GUI process and the
+#         main script feeds it through gui_process.RemoteRasterGUI.
+# Offline:
+#   python event_raster.py <session_dir> [--save [PATH]] [--no-show]
+#                          [--from S] [--to S] [--width PX]
+# reads sensor_events.csv (rotated segments included) and, when present,
+# the doorsensor / table interval CSVs written by EventLogger.
+
+import argparse
+import math
+import os
+import sys
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from log_rotation import read_log_csv
+
+# channel → (on state, off state), in raster row order (top to bottom)
+CHANNELS: Dict[str, Tuple[str, str]] = {
+    "A":           ("triggered", "cleared"),
+    "B":           ("triggered", "cleared"),
+    "C":           ("triggered", "cleared"),
+    "doorsensor":  ("triggered", "cleared"),
+    "table":       ("triggered", "cleared"),
+    "door":        ("door opened", "door closed"),
+    "table_motor": ("table moving", "table stopped"),
+}
+CHANNEL_COLORS = {
+    "A": "#1f77b4", "B": "#ff7f0e", "C": "#2ca02c",
+    "doorsensor": "#9467bd", "table": "#8c564b",
+    "door": "#d62728", "table_motor": "#7f7f7f",
+}
+# Interval CSVs EventLogger writes when given doorsensor_csv_path / table_csv_path
+INTERVAL_CSVS = {"doorsensor": "doorsensor_events.csv", "table": "table_events.csv"}
+
+EXACT_CAPACITY = 200_000      # exact intervals kept per channel
+COARSE_S = 1.0                # coarse level bin width (s)
+MIN_ALPHA = 0.35              # floor for pixel columns that contain any event
+DETAIL_WINDOW_S = 120.0       # live detail panel: last N seconds
+REDRAW_S = 0.5                # live raster redraw interval
+
+
+# ── Interval buffer ───────────────────────────────────────────────────────────
+
+class IntervalBuffer:
+    """
+    On-intervals of one channel, appended in time order. Keeps the last
+    `capacity` intervals exactly and a per-COARSE_S summary of the whole
+    session; occupancy() picks the exact level where it covers the span.
+    Not thread-safe — feed it from one thread (EventRaster drains the serial
+    reader's transitions on the GUI thread).
+    """
+
+    def __init__(self, capacity: int = EXACT_CAPACITY, coarse_s: float = COARSE_S):
+        self.capacity = capacity
+        self.coarse_s = coarse_s
+        self._starts = np.empty(capacity)
+        self._ends = np.empty(capacity)
+        self._cum = np.empty(capacity)        # on-time of every interval up to and incl. i
+        self._n = 0
+        self._total = 0.0                     # on-time of every closed interval ever
+        self.n_dropped = 0
+        self.open_start: Optional[float] = None
+        self._coarse_on = np.zeros(64)
+        self._coarse_count = np.zeros(64)
+        self.t_max = 0.0
+
+    def __len__(self) -> int:
+        return self._n + self.n_dropped
+
+    # ── Feeding ───────────────────────────────────────────────────────────────
+
+    def on(self, t: float) -> None:
+        if self.open_start is None:
+            self.open_start = t
+        self.t_max = max(self.t_max, t)
+
+    def off(self, t: float) -> None:
+        if self.open_start is not None:
+            self.add(self.open_start, t)
+            self.open_start = None
+        self.t_max = max(self.t_max, t)
+
+    def add(self, start: float, end: float) -> None:
+        """Append a closed interval (start must not precede the last one's end)."""
+        end = max(end, start)
+        if self._n == self.capacity:
+            keep = self.capacity // 2
+            self.n_dropped += self._n - keep
+            for arr in (self._starts, self._ends, self._cum):
+                arr[:keep] = arr[self._n - keep:self._n]
+            self._n = keep
+        self._total += end - start
+        i = self._n
+        self._starts[i], self._ends[i], self._cum[i] = start, end, self._total
+        self._n += 1
+        self.t_max = max(self.t_max, end)
+        self._add_coarse(start, end)
+
+    def _add_coarse(self, start: float, end: float) -> None:
+        b0 = int(start // self.coarse_s)
+        b1 = int(end // self.coarse_s)
+        if b1 >= len(self._coarse_on):
+            size = max(b1 + 1, 2 * len(self._coarse_on))
+            self._coarse_on = np.concatenate([self._coarse_on, np.zeros(size - len(self._coarse_on))])
+            self._coarse_count = np.concatenate([self._coarse_count, np.zeros(size - len(self._coarse_count))])
+        self._coarse_count[b0:b1 + 1] += 1
+        if b0 == b1:
+            self._coarse_on[b0] += end - start
+            return
+        self._coarse_on[b0] += (b0 + 1) * self.coarse_s - start
+        self._coarse_on[b0 + 1:b1] += self.coarse_s
+        self._coarse_on[b1] += end - b1 * self.coarse_s
+
+    # ── Queries ───────────────────────────────────────────────────────────────
+
+    @property
+    def exact_from(self) -> float:
+        """Earliest time the exact level still covers."""
+        if not self.n_dropped:
+            return -math.inf
+        return self._starts[0] if self._n else self.t_max
+
+    def _on_time(self, t: np.ndarray) -> np.ndarray:
+        """Closed-interval on-time before each t (relative to the ring's start)."""
+        n = self._n
+        if not n:
+            return np.zeros_like(t)
+        starts, ends, cum = self._starts[:n], self._ends[:n], self._cum[:n]
+        k = np.searchsorted(starts, t, side="right") - 1
+        before = cum[0] - (ends[0] - starts[0])
+        kc = np.clip(k, 0, None)
+        full_before = cum[kc] - (ends[kc] - starts[kc])
+        partial = np.clip(t - starts[kc], 0, ends[kc] - starts[kc])
+        return np.where(k < 0, before, full_before + partial)
+
+    def occupancy(self, t0: float, t1: float, n_bins: int,
+                  now: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(fraction of each bin spent on, whether the bin holds any event)
+        for n_bins equal bins over [t0, t1]. An open interval runs to `now`."""
+        edges = np.linspace(t0, t1, n_bins + 1)
+        width = (t1 - t0) / n_bins
+        if t0 >= self.exact_from:
+            n = self._n
+            on = np.diff(self._on_time(edges))
+            starts_before = np.searchsorted(self._starts[:n], edges[1:], side="left")
+            ended_before = np.searchsorted(self._ends[:n], edges[:-1], side="left")
+            hit = starts_before > ended_before
+        else:
+            on, hit = self._coarse_occupancy(edges)
+        if self.open_start is not None:
+            end = self.t_max if now is None else max(now, self.open_start)
+            lo = np.clip(edges[:-1], self.open_start, end)
+            hi = np.clip(edges[1:], self.open_start, end)
+            on = on + (hi - lo)
+            hit = hit | ((edges[1:] >= self.open_start) & (edges[:-1] <= end))
+        return np.clip(on / width, 0.0, 1.0), hit
+
+    def _coarse_occupancy(self, edges: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Bin on-time / any-event from the coarse level, interpolating its
+        cumulative on-time at the bin edges."""
+        grid = np.arange(len(self._coarse_on) + 1) * self.coarse_s
+        cum_on = np.concatenate([[0.0], np.cumsum(self._coarse_on)])
+        cum_count = np.concatenate([[0.0], np.cumsum(self._coarse_count)])
+        on = np.diff(np.interp(edges, grid, cum_on))
+        lo = np.floor(edges[:-1] / self.coarse_s).astype(int)
+        hi = np.ceil(edges[1:] / self.coarse_s).astype(int)
+        lo = np.clip(lo, 0, len(cum_count) - 1)
+        hi = np.clip(hi, 0, len(cum_count) - 1)
+        return on, cum_count[hi] > cum_count[lo]
+
+
+# ── Raster model ──────────────────────────────────────────────────────────────
+
+class EventRaster:
+    """
+    IntervalBuffers for every channel in CHANNELS. on_transition() is safe to
+    register with EventLogger.on_transition (it only appends to a deque);
+    drain() moves the pending transitions into the buffers.
+    """
+
+    def __init__(self, capacity: int = EXACT_CAPACITY):
+        self.channels = {name: IntervalBuffer(capacity) for name in CHANNELS}
+        self._pending = deque()
+        self.t_last = 0.0
+
+    def on_transition(self, port: str, state: str, t: float) -> None:
+        self._pending.append((port, state, t))
+
+    def drain(self) -> int:
+        n = 0
+        while self._pending:
+            port, state, t = self._pending.popleft()
+            self.feed(port, state, t)
+            n += 1
+        return n
+
+    def feed(self, port: str, state: str, t: float) -> None:
+        if port not in CHANNELS:
+            return
+        on_state, off_state = CHANNELS[port]
+        if state == on_state:
+            self.channels[port].on(t)
+        elif state == off_state:
+            self.channels[port].off(t)
+        self.t_last = max(self.t_last, t)
+
+    def image(self, t0: float, t1: float, width: int, now: Optional[float] = None) -> np.ndarray:
+        """RGBA image (channels × width) of per-pixel occupancy over [t0, t1]."""
+        from matplotlib.colors import to_rgba
+        img = np.zeros((len(self.channels), max(width, 1), 4))
+        if t1 <= t0:
+            return img
+        for row, (name, buf) in enumerate(self.channels.items()):
+            occ, hit = buf.occupancy(t0, t1, img.shape[1], now=now)
+            img[row, :, :3] = to_rgba(CHANNEL_COLORS[name])[:3]
+            img[row, :, 3] = np.where(hit, np.maximum(occ, MIN_ALPHA), occ)
+        return img
+
+    @property
+    def n_events(self) -> int:
+        return sum(len(buf) for buf in self.channels.values())
+
+
+class RasterPanel:
+    """One axis showing EventRaster.image() for a time span, re-rendered at
+    the axis' current pixel width."""
+
+    def __init__(self, ax, raster: EventRaster, title: str = ""):
+        self.ax = ax
+        self.raster = raster
+        names = list(raster.channels)
+        self._im = ax.imshow(np.zeros((len(names), 1, 4)), aspect="auto",
+                             interpolation="nearest", extent=(0, 1, len(names) - 0.5, -0.5))
+        ax.set_yticks(range(len(names)))
+        ax.set_yticklabels(names, fontsize=8)
+        ax.set_xlabel("Time since session start (s)")
+        if title:
+            ax.set_title(title, fontsize=10)
+
+        self._drawing = False
+
+    def _pixel_width(self) -> int:
+        return max(int(self.ax.get_window_extent().width), 50)
+
+    def draw(self, t0: float, t1: float, now: Optional[float] = None,
+             width: Optional[int] = None) -> None:
+        if t1 <= t0:
+            t1 = t0 + 1.0
+        self._im.set_data(self.raster.image(t0, t1, width or self._pixel_width(), now=now))
+        n = len(self.raster.channels)
+        self._im.set_extent((t0, t1, n - 0.5, -0.5))
+        self._drawing = True
+        self.ax.set_xlim(t0, t1)
+        self._drawing = False
+
+    def follow_zoom(self) -> None:
+        """Re-render at full resolution whenever the x range is zoomed/panned."""
+        def _on_xlim(ax):
+            if not self._drawing:
+                self.draw(*ax.get_xlim())
+        self.ax.callbacks.connect("xlim_changed", _on_xlim)
+
+
+# ── Live window ───────────────────────────────────────────────────────────────
+
+class EventRasterGUI:
+    """Live raster window: the whole session on top, the last
+    DETAIL_WINDOW_S seconds below. update() is called from the run loop and
+    redraws at most every REDRAW_S."""
+
+    def __init__(self, session_start: float, detail_window_s: float = DETAIL_WINDOW_S,
+                 capacity: int = EXACT_CAPACITY):
+        import matplotlib.pyplot as plt
+        self._plt = plt
+        self.session_start = session_start
+        self.detail_window_s = detail_window_s
+        self.raster = EventRaster(capacity)
+        plt.ion()
+        self.fig, (ax_all, ax_recent) = plt.subplots(2, 1, figsize=(12, 5))
+        self.fig.canvas.manager.set_window_title("Event raster")
+        self.overview = RasterPanel(ax_all, self.raster, "Whole session")
+        self.detail = RasterPanel(ax_recent, self.raster, f"Last {detail_window_s:.0f} s")
+        self.fig.tight_layout()
+        self._last_draw = 0.0
+
+    def on_transition(self, port: str, state: str, t: float) -> None:
+        self.raster.on_transition(port, state, t)
+
+    def update(self, force: bool = False) -> None:
+        self.raster.drain()
+        wall = time.time()
+        if not force and wall - self._last_draw < REDRAW_S:
+            self.fig.canvas.flush_events()
+            return
+        self._last_draw = wall
+        now = wall - self.session_start
+        self.overview.draw(0.0, max(now, 1.0), now=now)
+        self.detail.draw(max(0.0, now - self.detail_window_s),
+                         max(now, self.detail_window_s), now=now)
+        self.fig.canvas.draw_idle()
+        self.fig.canvas.flush_events()
+
+    def close(self, save_path: Optional[str] = None) -> None:
+        self.update(force=True)
+        if save_path:
+            try:
+                self.fig.savefig(save_path, dpi=150)
+                print(f"[INFO] Event raster saved: {save_path}")
+            except Exception as e:
+                print(f"[WARN] Could not save event raster: {e}")
+        self._plt.close(self.fig)
+
+
+# ── Offline loading ───────────────────────────────────────────────────────────
+
+def _read_intervals(path: str):
+    """start,end rows of an EventLogger interval CSV (no header)."""
+    import pandas as pd
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    return pd.read_csv(path, header=None, names=["start", "end"])
+
+
+def load_session(session_dir: str, capacity: int = EXACT_CAPACITY) -> EventRaster:
+    """EventRaster of a saved session folder. Channels with an interval CSV
+    take their intervals from it; the rest are rebuilt from sensor_events.csv."""
+    raster = EventRaster(capacity)
+    from_csv = set()
+    for channel, filename in INTERVAL_CSVS.items():
+        intervals = _read_intervals(os.path.join(session_dir, filename))
+        if intervals is None:
+            continue
+        buf = raster.channels[channel]
+        for start, end in intervals.sort_values("start").itertuples(index=False):
+            buf.add(float(start), float(end))
+        raster.t_last = max(raster.t_last, buf.t_max)
+        from_csv.add(channel)
+
+    events = read_log_csv(os.path.join(session_dir, "sensor_events.csv"),
+                          header=None, names=["time_str", "t", "port", "state"])
+    if events is None and not from_csv:
+        raise FileNotFoundError(f"sensor_events.csv not found in {session_dir}")
+    if events is not None:
+        events = events[~events["port"].isin(from_csv)].sort_values("t", kind="stable")
+        for port, state, t in zip(events["port"], events["state"], events["t"]):
+            raster.feed(port, state, float(t))
+    return raster
+
+
+# ── CLI ───────────────────────────────────────────────────────────────────────
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Event raster of a saved session.")
+    ap.add_argument("session_dir")
+    ap.add_argument("--save", nargs="?", const="", default=None,
+                    help="Save the figure (default: <session_dir>/event_raster.png)")
+    ap.add_argument("--no-show", action="store_true", help="Don't open a window")
+    ap.add_argument("--from", dest="t0", type=float, default=0.0, help="Start time (s)")
+    ap.add_argument("--to", dest="t1", type=float, default=None, help="End time (s)")
+    ap.add_argument("--width", type=int, default=None,
+                    help="Pixel columns (default: the axis width)")
+    args = ap.parse_args(argv)
+
+    if args.no_show:
+        import matplotlib
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    try:
+        raster = load_session(args.session_dir)
+    except FileNotFoundError as e:
+        print(f"[ERROR] {e}")
+        return 1
+    t1 = raster.t_last if args.t1 is None else args.t1
+    print(f"[INFO] {raster.n_events} intervals, {raster.t_last:.1f} s")
+
+    fig, ax = plt.subplots(figsize=(12, 3.5))
+    panel = RasterPanel(ax, raster, os.path.basename(os.path.normpath(args.session_dir)))
+    fig.tight_layout()
+    panel.draw(args.t0, t1, width=args.width)
+    if args.width is None:
+        panel.follow_zoom()
+
+    if args.save is not None:
+        path = args.save or os.path.join(args.session_dir, "event_raster.png")
+        fig.savefig(path, dpi=150)
+        print(f"[INFO] Saved: {path}")
+    if not args.no_show:
+        plt.show()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
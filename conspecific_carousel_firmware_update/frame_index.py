@@ -0,0 +1,257 @@
+# frame_index.py — Frame-number ↔ session-time index from camera sync pulses
+#
+# cameracontrol fires a TTL pulse after every PULSE_EVERY_N_FRAMES-th frame
+# it writes to the video (frame_count % N == 0, frame_count 1-based), so
+# pulse j of a recording marks the end of 0-based video frame j*N - 1.
+# CameraTriggerLogger timestamps those pulses on the session clock.
+#
+# FrameTimeIndex fits a piecewise-linear mapping through the pulse knots
+# (video frame, session time) and flags intervals that drift from the
+# expected N / FRAME_RATE seconds:
+#   dropped   — interval longer than N frames' worth (camera skipped frames)
+#   short     — interval shorter than expected (frames written too fast / clock jitter)
+#   duplicate — two pulses closer than half a period (edge counted twice); the later one is dropped
+#   gap       — whole pulses missing (logger not listening, e.g. between armed windows)
+#
+# Queries are binary searches over the knot arrays — O(log n):
+#   index.frame_to_time(frame)   → session time (s)
+#   index.time_to_frame(t)       → nearest video frame
+#   index.clip_bounds(t0, t1)    → (first_frame, last_frame) covering [t0, t1]
+#
+# The index is stored as a small .npz (knots + flags) next to the session data:
+#   python frame_index.py <session_dir>     # print presentation frame ranges
+
+import argparse
+import os
+import sys
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Must match cameracontrol's settings
+FRAME_RATE = 30.0
+PULSE_EVERY_N_FRAMES = 30
+
+# An interval is flagged when it differs from the expected pulse period by
+# more than this many frame periods
+DRIFT_TOLERANCE_FRAMES = 0.5
+
+
+class IntervalFlag(NamedTuple):
+    pulse: int        # index (into the kept pulses) of the pulse ending the interval
+    kind: str         # "dropped" / "short" / "duplicate" / "gap"
+    frames: float     # frames gained (+) or lost (−), or pulses missing for "gap"
+
+
+_FLAG_KINDS = ("dropped", "short", "duplicate", "gap")
+
+
+class FrameTimeIndex:
+    """
+    Piecewise-linear video-frame ↔ session-time mapping.
+
+    Build with from_pulses() / from_camera_sync_csv() or load(); frame numbers
+    are 0-based video frame indices, times are seconds relative to session
+    start (the same clock as camera_sync.csv's t_rel_s). Outside the knot
+    range the mapping extrapolates with the measured pulse period.
+    """
+
+    def __init__(
+        self,
+        frames: np.ndarray,
+        times: np.ndarray,
+        frame_period: float,
+        flags: Sequence[IntervalFlag] = (),
+        session_start: Optional[float] = None,
+    ):
+        if len(frames) != len(times) or len(frames) < 1:
+            raise ValueError("FrameTimeIndex needs at least one (frame, time) knot")
+        self.frames = np.asarray(frames, dtype=np.int64)
+        self.times = np.asarray(times, dtype=np.float64)
+        self.frame_period = float(frame_period)
+        self.flags = list(flags)
+        self.session_start = session_start
+
+    # ── Construction ──────────────────────────────────────────────────────────
+
+    @classmethod
+    def from_pulses(
+        cls,
+        pulse_times: Sequence[float],
+        pulse_every_n_frames: int = PULSE_EVERY_N_FRAMES,
+        frame_rate: float = FRAME_RATE,
+        first_pulse_frame: Optional[int] = None,
+        tolerance_frames: float = DRIFT_TOLERANCE_FRAMES,
+        session_start: Optional[float] = None,
+    ) -> "FrameTimeIndex":
+        """Fit the index from sync-pulse times (session-relative seconds).
+
+        first_pulse_frame is the video frame the first pulse belongs to; the
+        default (N - 1) assumes it is the recording's first pulse, i.e. the
+        camera was started with the session. Pass the real value when the
+        camera was already running."""
+        times = np.sort(np.asarray(pulse_times, dtype=np.float64))
+        if len(times) == 0:
+            raise ValueError("No sync pulses to index")
+        n = int(pulse_every_n_frames)
+        nominal = n / frame_rate
+        if first_pulse_frame is None:
+            first_pulse_frame = n - 1
+
+        # Measured pulse period: median of the plausible single intervals
+        dt = np.diff(times)
+        single = dt[(dt > 0.5 * nominal) & (dt < 1.5 * nominal)]
+        period = float(np.median(single)) if len(single) else nominal
+        frame_period = period / n
+
+        kept = [times[0]]
+        pulse_idx = [0]
+        flags: List[IntervalFlag] = []
+        for t in times[1:]:
+            step = t - kept[-1]
+            k = int(round(step / period))
+            if k == 0:
+                flags.append(IntervalFlag(len(kept) - 1, "duplicate", 0.0))
+                continue
+            residual = (step - k * period) / frame_period
+            kept.append(t)
+            pulse_idx.append(pulse_idx[-1] + k)
+            if k > 1:
+                flags.append(IntervalFlag(len(kept) - 1, "gap", float(k - 1)))
+            if residual > tolerance_frames:
+                flags.append(IntervalFlag(len(kept) - 1, "dropped", round(float(residual), 2)))
+            elif residual < -tolerance_frames:
+                flags.append(IntervalFlag(len(kept) - 1, "short", round(float(residual), 2)))
+
+        frames = first_pulse_frame + np.asarray(pulse_idx, dtype=np.int64) * n
+        return cls(frames, np.asarray(kept), frame_period, flags, session_start)
+
+    @classmethod
+    def from_camera_sync_csv(cls, path: str, **kwargs) -> "FrameTimeIndex":
+        """Build from a SocialMemory camera_sync.csv (pulses inside armed
+        presentation windows only — the gaps between windows are bridged with
+        the measured period and flagged as "gap")."""
+        import pandas as pd
+        df = pd.read_csv(path)
+        return cls.from_pulses(df["t_rel_s"].to_numpy(), **kwargs)
+
+    # ── Queries ───────────────────────────────────────────────────────────────
+
+    def frame_to_time(self, frame: float) -> float:
+        """Session time (s) at which video frame `frame` was written."""
+        frames, times = self.frames, self.times
+        i = int(np.searchsorted(frames, frame, side="right"))
+        if i <= 0:
+            return float(times[0] + (frame - frames[0]) * self.frame_period)
+        if i >= len(frames):
+            return float(times[-1] + (frame - frames[-1]) * self.frame_period)
+        f0, f1 = frames[i - 1], frames[i]
+        t0, t1 = times[i - 1], times[i]
+        return float(t0 + (frame - f0) * (t1 - t0) / (f1 - f0))
+
+    def time_to_frame_exact(self, t: float) -> float:
+        """Fractional video frame at session time t."""
+        frames, times = self.frames, self.times
+        i = int(np.searchsorted(times, t, side="right"))
+        if i <= 0:
+            return float(frames[0] + (t - times[0]) / self.frame_period)
+        if i >= len(times):
+            return float(frames[-1] + (t - times[-1]) / self.frame_period)
+        f0, f1 = frames[i - 1], frames[i]
+        t0, t1 = times[i - 1], times[i]
+        return float(f0 + (t - t0) * (f1 - f0) / (t1 - t0))
+
+    def time_to_frame(self, t: float) -> int:
+        """Nearest video frame at session time t."""
+        return int(round(self.time_to_frame_exact(t)))
+
+    def clip_bounds(self, t_start: float, t_end: float, pad: float = 0.0) -> Tuple[int, int]:
+        """(first_frame, last_frame) covering session times [t_start − pad, t_end + pad]."""
+        first = int(np.floor(self.time_to_frame_exact(t_start - pad)))
+        last = int(np.ceil(self.time_to_frame_exact(t_end + pad)))
+        return max(first, 0), max(last, 0)
+
+    # ── Reporting ─────────────────────────────────────────────────────────────
+
+    def summary(self) -> str:
+        counts = {k: sum(1 for f in self.flags if f.kind == k) for k in _FLAG_KINDS}
+        lost = sum(f.frames for f in self.flags if f.kind == "dropped")
+        span = self.times[-1] - self.times[0]
+        return (f"{len(self.times)} sync pulses over {span:.1f} s, frames "
+                f"{self.frames[0]}–{self.frames[-1]}, "
+                f"{1.0 / self.frame_period:.3f} fps measured; "
+                f"{counts['dropped']} dropped-frame intervals (~{lost:.0f} frames), "
+                f"{counts['short']} short, {counts['duplicate']} duplicate pulses, "
+                f"{counts['gap']} gaps")
+
+    # ── Storage ───────────────────────────────────────────────────────────────
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(
+            path,
+            frames=self.frames,
+            times=self.times,
+            frame_period=self.frame_period,
+            session_start=np.nan if self.session_start is None else self.session_start,
+            flag_pulse=np.array([f.pulse for f in self.flags], dtype=np.int64),
+            flag_kind=np.array([_FLAG_KINDS.index(f.kind) for f in self.flags], dtype=np.int8),
+            flag_frames=np.array([f.frames for f in self.flags], dtype=np.float64),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "FrameTimeIndex":
+        with np.load(path) as z:
+            flags = [IntervalFlag(int(p), _FLAG_KINDS[int(k)], float(f))
+                     for p, k, f in zip(z["flag_pulse"], z["flag_kind"], z["flag_frames"])]
+            session_start = float(z["session_start"])
+            return cls(
+                z["frames"], z["times"], float(z["frame_period"]), flags,
+                None if np.isnan(session_start) else session_start,
+            )
+
+
+# ── CLI ───────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Show the frame index of a session and the video frame range "
+                    "of each stimulus presentation."
+    )
+    parser.add_argument("session_dir")
+    parser.add_argument("--pad", type=float, default=0.0,
+                        help="Seconds of video to add before/after each presentation")
+    parser.add_argument("--first-pulse-frame", type=int, default=None,
+                        help="Video frame of the first recorded pulse (rebuilds the "
+                             "index from camera_sync.csv)")
+    args = parser.parse_args()
+
+    npz_path = os.path.join(args.session_dir, "frame_index.npz")
+    csv_path = os.path.join(args.session_dir, "camera_sync.csv")
+    if args.first_pulse_frame is None and os.path.exists(npz_path):
+        index = FrameTimeIndex.load(npz_path)
+    elif os.path.exists(csv_path):
+        index = FrameTimeIndex.from_camera_sync_csv(
+            csv_path, first_pulse_frame=args.first_pulse_frame)
+    else:
+        sys.exit(f"[ERROR] No frame_index.npz or camera_sync.csv in {args.session_dir}")
+
+    print(f"[INFO] {index.summary()}")
+    for flag in index.flags:
+        t = index.times[flag.pulse]
+        print(f"  {flag.kind:<9} at {t:9.3f} s (frame {index.frames[flag.pulse]}): {flag.frames:g}")
+
+    pres_path = os.path.join(args.session_dir, "presentations.csv")
+    if index.session_start is None or not os.path.exists(pres_path):
+        return
+    import pandas as pd
+    pres = pd.read_csv(pres_path)
+    print("\npresentation  period   first_frame  last_frame")
+    for _, row in pres.iterrows():
+        first, last = index.clip_bounds(row["door_open_time"] - index.session_start,
+                                        row["presentation_end"] - index.session_start,
+                                        pad=args.pad)
+        print(f"{int(row['presentation_num']):>12}  {row['period']:<7}  {first:>11}  {last:>10}")
+
+
+if __name__ == "__main__":
+    main()
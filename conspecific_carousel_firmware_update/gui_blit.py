@@ -0,0 +1,59 @@
+# gui_blit.py — blitting helper for the live matplotlib status windows
+#
+# A full fig.canvas.draw() re-renders every artist (axes, static labels,
+# patches) and costs tens of milliseconds on the main thread. BlitManager
+# caches the static background once, marks the frequently changing artists
+# as animated, and on update() restores the background, redraws only those
+# artists and blits the result — a few hundred microseconds per frame.
+#
+# The background is re-cached automatically whenever the canvas does a full
+# draw (window resize, first show), via the canvas' draw_event.
+#
+# Usage:
+#   self._blit = BlitManager(self.fig, [self.circle_a, self.text_a, ...])
+#   ...
+#   if nothing changed: self._blit.idle()      # keep the window responsive
+#   else:               self._blit.update()    # after setting artist properties
+
+from typing import Iterable
+
+
+class BlitManager:
+
+    def __init__(self, fig, artists: Iterable):
+        self.fig = fig
+        self.canvas = fig.canvas
+        self._artists = list(artists)
+        self._background = None
+        for artist in self._artists:
+            artist.set_animated(True)
+        self._cid = self.canvas.mpl_connect("draw_event", self._on_draw)
+
+    def _on_draw(self, _event) -> None:
+        """Full redraw happened: re-cache the background and put the animated
+        artists back on top of it."""
+        self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self) -> None:
+        for artist in self._artists:
+            self.fig.draw_artist(artist)
+
+    def update(self) -> None:
+        """Redraw the animated artists on the cached background."""
+        if not getattr(self.canvas, "supports_blit", False):
+            self.canvas.draw_idle()
+        elif self._background is None:
+            self.canvas.draw()          # triggers _on_draw
+        else:
+            self.canvas.restore_region(self._background)
+            self._draw_animated()
+            self.canvas.blit(self.fig.bbox)
+        self.canvas.flush_events()
+
+    def idle(self) -> None:
+        """Nothing to redraw — just service pending window events."""
+        self.canvas.flush_events()
+
+    def close(self) -> None:
+        self.canvas.mpl_disconnect(self._cid)
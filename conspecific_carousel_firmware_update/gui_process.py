@@ -0,0 +1,338 @@
+# gui_process.py — run the live SensorGUI / PerformanceGUI in a separate process
+#
+# In the default setup the matplotlib windows render on the control process's
+# main thread, next to the session thread and the DeviceConnection reader, so
+# every redraw (and every window drag or resize) competes for the GIL with
+# trial logic. With the "gui_process" option the control process does no
+# rendering at all:
+#
+#   control process                          GUI process
+#   ───────────────                          ───────────
+#   sensor_gui.update(snap) ──► shared memory block ──► SensorGUI.update()
+#   perf_gui.update(df)     ──► queue (new rows only) ─► PerformanceGUI.update()
+#   raster_gui.update()     ──► queue (new events) ────► EventRasterGUI.update()
+#
+# Both writes are non-blocking: the sensor block is a fixed-size record
+# guarded by a sequence counter (the reader retries on a torn read), and the
+# queue is unbounded, so a stalled GUI can never hold up a valve or door
+# command.
+#
+# Usage in a main_* script (drop-in for the GUI constructors):
+#   sensor_gui, perf_gui, raster_gui = start_gui_process(
+#       "gui_socialreward2AFC", raster_start=logger.session_start,   # or None
+#       animal_name=animal, phase_selection=phase)
+#   logger.on_transition(raster_gui.on_transition)
+#   ...
+#   perf_gui.update(session.results_df)     # same calls as the in-process GUIs
+#   raster_gui.close(save_path=raster_png)  # before perf_gui.close()
+#   perf_gui.close(save_path=perf_fig)      # saves the figure, stops the process
+
+import multiprocessing as mp
+import queue
+import signal
+import time
+from collections import deque
+from datetime import datetime
+from multiprocessing import shared_memory
+from typing import Optional
+
+import numpy as np
+
+from hardware import SensorSnapshot
+
+GUI_REFRESH_S = 0.05          # same 20 Hz as the in-process run loops
+CLOSE_TIMEOUT_S = 30.0
+
+# SensorSnapshot fields carried through shared memory: (state field, time field)
+_SENSOR_FIELDS = [
+    ("A", "tA"),
+    ("B", "tB"),
+    ("C", "tC"),
+    ("doorsensor", "tDoorsensor"),
+    ("table", "tTable"),
+    ("door", "tDoor"),
+    ("table_motor", "tTableMotor"),
+]
+_STATE_BYTES = 32
+
+_BLOCK_DTYPE = np.dtype([
+    ("seq",     np.uint64),                              # odd while a write is in progress
+    ("version", np.int64),                               # SensorSnapshot.version
+    ("state",   f"S{_STATE_BYTES}", (len(_SENSOR_FIELDS),)),
+    ("t",       np.float64, (len(_SENSOR_FIELDS),)),     # POSIX time, NaN = never changed
+])
+
+
+# ── Shared sensor block ───────────────────────────────────────────────────────
+
+class SharedSensorBlock:
+    """
+    Latest SensorSnapshot in a shared-memory record. One writer (the control
+    process) and any number of readers; a reader that races a write simply
+    retries, so neither side ever takes a lock.
+    """
+
+    def __init__(self, name: Optional[str] = None):
+        self._owner = name is None
+        if self._owner:
+            self._shm = shared_memory.SharedMemory(create=True, size=_BLOCK_DTYPE.itemsize)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+        self._rec = np.ndarray((), dtype=_BLOCK_DTYPE, buffer=self._shm.buf)
+        if self._owner:
+            self._rec["seq"] = 0
+            self._rec["version"] = -1
+            self._rec["t"] = np.nan
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def write(self, snap: SensorSnapshot) -> None:
+        rec = self._rec
+        seq = int(rec["seq"])
+        rec["seq"] = seq + 1
+        for i, (state_field, t_field) in enumerate(_SENSOR_FIELDS):
+            state = getattr(snap, state_field) or ""
+            ts = getattr(snap, t_field)
+            rec["state"][i] = state.encode("utf-8")[:_STATE_BYTES]
+            rec["t"][i] = ts.timestamp() if ts is not None else np.nan
+        rec["version"] = snap.version
+        rec["seq"] = seq + 2
+
+    def read(self) -> Optional[SensorSnapshot]:
+        """Current snapshot, or None before the first write."""
+        rec = self._rec
+        while True:
+            seq = int(rec["seq"])
+            if seq % 2:
+                time.sleep(0)
+                continue
+            version = int(rec["version"])
+            states = rec["state"].copy()
+            times = rec["t"].copy()
+            if int(rec["seq"]) == seq:
+                break
+        if version < 0:
+            return None
+        fields = {"version": version}
+        for i, (state_field, t_field) in enumerate(_SENSOR_FIELDS):
+            fields[state_field] = states[i].decode("utf-8")
+            fields[t_field] = None if np.isnan(times[i]) else datetime.fromtimestamp(times[i])
+        return SensorSnapshot(**fields)
+
+    def close(self) -> None:
+        self._rec = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+# ── GUI process ───────────────────────────────────────────────────────────────
+
+def _gui_main(module_name: str, perf_kwargs: dict, block_name: str, inbox,
+              raster_start: Optional[float] = None) -> None:
+    """Entry point of the GUI process: owns the windows and redraws them at
+    GUI_REFRESH_S from the shared block and the queue."""
+    # Ctrl+C goes to the whole process group — let the control process decide
+    # when the GUIs close, so the final figure is still saved.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import importlib
+    import pandas as pd
+
+    gui = importlib.import_module(module_name)
+    block = SharedSensorBlock(block_name)
+    sensor_gui = gui.SensorGUI()
+    perf_gui = gui.PerformanceGUI(**perf_kwargs)
+    raster_gui = None
+    if raster_start is not None:
+        from event_raster import EventRasterGUI
+        raster_gui = EventRasterGUI(session_start=raster_start)
+
+    chunks = []               # per positional frame: list of row chunks received
+    frames = []               # per positional frame: concatenated DataFrame
+    update_kwargs = {}
+    parent = mp.parent_process()
+
+    def _handle(msg) -> None:
+        nonlocal raster_gui
+        kind = msg[0]
+        if kind == "events":
+            if raster_gui is not None:
+                for event in msg[1]:
+                    raster_gui.on_transition(*event)
+        elif kind == "raster_close":
+            if raster_gui is not None:
+                raster_gui.close(save_path=msg[1])
+                raster_gui = None
+        elif kind == "rows":
+            _, i, rows = msg
+            while len(chunks) <= i:
+                chunks.append([])
+                frames.append(None)
+            chunks[i].append(rows)
+            frames[i] = None
+        elif kind == "kwargs":
+            update_kwargs.clear()
+            update_kwargs.update(msg[1])
+        elif kind == "call":
+            _, method, args, kwargs = msg
+            getattr(perf_gui, method)(*args, **kwargs)
+
+    save_path = None
+    closing = False
+    while not closing:
+        try:
+            while not closing:
+                msg = inbox.get_nowait()
+                if msg[0] == "close":
+                    closing, save_path = True, msg[1]
+                else:
+                    _handle(msg)
+        except queue.Empty:
+            pass
+
+        snap = block.read()
+        if snap is not None:
+            sensor_gui.update(snap)
+        for i, frame in enumerate(frames):
+            if frame is None:
+                nonempty = [c for c in chunks[i] if len(c)] or chunks[i][:1]
+                frames[i] = pd.concat(nonempty, ignore_index=True)
+                chunks[i] = [frames[i]]
+        if frames:
+            perf_gui.update(*frames, **update_kwargs)
+        if raster_gui is not None:
+            raster_gui.update()
+        if not closing and parent is not None and not parent.is_alive():
+            print("[WARN] Control process exited — closing GUI process")
+            break
+        time.sleep(GUI_REFRESH_S)
+
+    perf_gui.close(save_path=save_path)
+    sensor_gui.close()
+    if raster_gui is not None:
+        raster_gui.close()
+    block.close()
+
+
+class GUIProcess:
+    """Handle on the GUI process; the proxies below forward to it."""
+
+    def __init__(self, module_name: str, raster_start: Optional[float] = None,
+                 **perf_kwargs):
+        ctx = mp.get_context("spawn")      # never fork a process with live serial threads
+        self.block = SharedSensorBlock()
+        self.inbox = ctx.Queue()
+        self._sent_rows = []               # rows already queued per positional frame (None = none yet)
+        self._sent_kwargs = None
+        self._closed = False
+        self.process = ctx.Process(
+            target=_gui_main,
+            args=(module_name, perf_kwargs, self.block.name, self.inbox, raster_start),
+            name="gui",
+            daemon=True,
+        )
+        self.process.start()
+        print(f"[INFO] Live GUIs running in process {self.process.pid}")
+
+    def send_frames(self, frames, kwargs: dict) -> None:
+        """Queue the rows of each frame added since the previous call. The
+        first call sends every frame, even empty, so the GUI process has the
+        columns before any rows arrive."""
+        for i, df in enumerate(frames):
+            if i == len(self._sent_rows):
+                self._sent_rows.append(None)
+            sent = self._sent_rows[i]
+            if sent is None or len(df) > sent:
+                self.inbox.put(("rows", i, df.iloc[sent or 0:].copy()))
+                self._sent_rows[i] = len(df)
+        if kwargs != self._sent_kwargs:
+            self.inbox.put(("kwargs", dict(kwargs)))
+            self._sent_kwargs = dict(kwargs)
+
+    def call(self, method: str, *args, **kwargs) -> None:
+        self.inbox.put(("call", method, args, kwargs))
+
+    def close(self, save_path: Optional[str] = None) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self.inbox.put(("close", save_path))
+        self.process.join(timeout=CLOSE_TIMEOUT_S)
+        if self.process.is_alive():
+            print("[WARN] GUI process did not exit — terminating")
+            self.process.terminate()
+            self.process.join(timeout=5)
+        self.inbox.close()
+        self.block.close()
+
+
+class RemoteSensorGUI:
+    """Stands in for SensorGUI: update() publishes to shared memory."""
+
+    def __init__(self, proc: GUIProcess):
+        self._proc = proc
+        self._version = None
+
+    def update(self, snapshot: SensorSnapshot) -> None:
+        if snapshot.version == self._version or self._proc._closed:
+            return
+        self._version = snapshot.version
+        self._proc.block.write(snapshot)
+
+    def close(self) -> None:
+        pass                               # the GUI process closes both windows
+
+
+class RemotePerformanceGUI:
+    """Stands in for PerformanceGUI: update() queues only the new rows."""
+
+    def __init__(self, proc: GUIProcess):
+        self._proc = proc
+
+    def update(self, *frames, **kwargs) -> None:
+        if not self._proc._closed:
+            self._proc.send_frames(frames, kwargs)
+
+    def draw_plan(self, *args, **kwargs) -> None:
+        self._proc.call("draw_plan", *args, **kwargs)
+
+    def close(self, save_path: Optional[str] = None) -> None:
+        self._proc.close(save_path=save_path)
+
+
+class RemoteRasterGUI:
+    """Stands in for EventRasterGUI: on_transition() (serial reader thread)
+    only buffers; update() (run loop) queues what arrived since the last call."""
+
+    def __init__(self, proc: GUIProcess):
+        self._proc = proc
+        self._events = deque()
+
+    def on_transition(self, port: str, state: str, t: float) -> None:
+        self._events.append((port, state, t))
+
+    def update(self, force: bool = False) -> None:
+        events = []
+        while self._events:
+            events.append(self._events.popleft())
+        if events and not self._proc._closed:
+            self._proc.inbox.put(("events", events))
+
+    def close(self, save_path: Optional[str] = None) -> None:
+        """Save and close the raster window; call before perf_gui.close()."""
+        self.update()
+        if not self._proc._closed:
+            self._proc.inbox.put(("raster_close", save_path))
+
+
+def start_gui_process(module_name: str, raster_start: Optional[float] = None,
+                      **perf_kwargs):
+    """Start the GUI process for gui_<task>.py and return (sensor_gui,
+    perf_gui, raster_gui) proxies with the same interface as the in-process
+    GUIs. raster_gui is None unless raster_start (the EventLogger's
+    session_start) is given."""
+    proc = GUIProcess(module_name, raster_start=raster_start, **perf_kwargs)
+    raster_gui = RemoteRasterGUI(proc) if raster_start is not None else None
+    return RemoteSensorGUI(proc), RemotePerformanceGUI(proc), raster_gui
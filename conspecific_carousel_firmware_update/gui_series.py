@@ -0,0 +1,206 @@
+# gui_series.py — persistent, append-only plot artists for the live PerformanceGUIs
+#
+# Re-plotting the whole session on every refresh (ax.clear() + one scatter
+# per trial) makes each refresh cost O(trials) artists late in a session.
+# These wrappers own a fixed set of artists and only push the rows added
+# since the last refresh:
+#   ScatterSeries  — one PathCollection; per-point colors/sizes
+#   LineSeries     — one Line2D
+#   BarSeries      — one PolyCollection; per-bar colors
+#   BlockRateBars  — per-block hit-rate bars (trial_stats.BlockRates); only the
+#                    open block is re-heighted
+#
+# Data limits are extended with the new points only (Axes.update_datalim),
+# so autoscaling is O(new rows) as well — call autoscale(*axes) after
+# appending.
+
+import contextlib
+from typing import Optional, Sequence
+
+import numpy as np
+from matplotlib.collections import PolyCollection
+from matplotlib.colors import to_rgba_array
+from matplotlib.path import Path
+
+from trial_stats import BlockRates
+
+
+def _xy(x, y) -> np.ndarray:
+    return np.column_stack([np.asarray(x, dtype=float), np.asarray(y, dtype=float)])
+
+
+@contextlib.contextmanager
+def _keep_view(ax):
+    """Add an (empty) artist without scheduling an autoscale, so a panel that
+    never gets data keeps its default limits."""
+    xlim, ylim = ax.get_xlim(), ax.get_ylim()
+    yield
+    ax.set_xlim(xlim, auto=None)
+    ax.set_ylim(ylim, auto=None)
+
+
+def autoscale(*axes) -> None:
+    """autoscale_view() every axis that has data; empty panels keep their
+    default limits instead of collapsing around zero."""
+    for ax in axes:
+        if not ax.ignore_existing_data_limits:
+            ax.autoscale_view()
+
+
+class ScatterSeries:
+    """Scatter plot that grows with append(). Colors/sizes may be given per
+    point or left at the series defaults."""
+
+    def __init__(self, ax, color="C0", s=25, marker="o", **scatter_kwargs):
+        self.ax = ax
+        self._color = color
+        self._size = s
+        with _keep_view(ax):
+            self.collection = ax.scatter([], [], color=color, s=s, marker=marker,
+                                         **scatter_kwargs)
+        self._offsets = np.empty((0, 2))
+        self._colors = np.empty((0, 4))
+        self._sizes = np.empty(0)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def append(self, x, y, colors=None, sizes=None) -> None:
+        xy = _xy(x, y)
+        if not len(xy):
+            return
+        rgba = to_rgba_array(self._color if colors is None else colors)
+        if len(rgba) == 1:
+            rgba = np.repeat(rgba, len(xy), axis=0)
+        sizes = np.full(len(xy), float(self._size)) if sizes is None else np.asarray(sizes, float)
+
+        self._offsets = np.concatenate([self._offsets, xy])
+        self._colors = np.concatenate([self._colors, rgba])
+        self._sizes = np.concatenate([self._sizes, sizes])
+        self.collection.set_offsets(self._offsets)
+        self.collection.set_facecolors(self._colors)
+        self.collection.set_edgecolors(self._colors)
+        self.collection.set_sizes(self._sizes)
+        finite = xy[np.isfinite(xy).all(axis=1)]
+        if len(finite):
+            self.ax.update_datalim(finite)
+
+
+class LineSeries:
+    """Line that grows with append(), or is replaced wholesale with set()."""
+
+    def __init__(self, ax, **plot_kwargs):
+        self.ax = ax
+        with _keep_view(ax):
+            (self.line,) = ax.plot([], [], **plot_kwargs)
+        self._x = np.empty(0)
+        self._y = np.empty(0)
+
+    def __len__(self) -> int:
+        return len(self._x)
+
+    def append(self, x, y) -> None:
+        x = np.asarray(x, dtype=float)
+        if not len(x):
+            return
+        y = np.asarray(y, dtype=float)
+        self._x = np.concatenate([self._x, x])
+        self._y = np.concatenate([self._y, y])
+        self.line.set_data(self._x, self._y)
+        finite = _xy(x, y)
+        finite = finite[np.isfinite(finite).all(axis=1)]
+        if len(finite):
+            self.ax.update_datalim(finite)
+
+    def set(self, x, y) -> None:
+        self._x = np.empty(0)
+        self._y = np.empty(0)
+        self.append(x, y)
+
+
+class BarSeries:
+    """Bars that grow with append(): one PolyCollection holds every bar, so
+    a refresh draws one artist however many rows there are. append() adds
+    the new rows' paths only; recolor() changes colors in place."""
+
+    def __init__(self, ax, width=0.8, offset=0.0, label=None, color="C0",
+                 edgecolor="none", **collection_kwargs):
+        self.ax = ax
+        self._width = width
+        self._offset = offset
+        self._color = color
+        with _keep_view(ax):
+            self.collection = PolyCollection([], edgecolors=edgecolor, label=label,
+                                             **collection_kwargs)
+            ax.add_collection(self.collection, autolim=False)
+        self.collection.sticky_edges.y.append(0)      # as ax.bar: no margin below 0
+        self._paths = self.collection.get_paths()
+        self._colors = np.empty((0, 4))
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def append(self, x, heights, colors=None) -> None:
+        x = np.asarray(x, dtype=float) + self._offset
+        if not len(x):
+            return
+        h = np.asarray(heights, dtype=float)
+        left, right, base = x - self._width / 2, x + self._width / 2, np.zeros_like(h)
+        verts = np.stack([np.column_stack(c) for c in
+                          ((left, base), (left, h), (right, h), (right, base),
+                           (left, base))], axis=1)          # last vertex: CLOSEPOLY
+        self._paths.extend(Path(v, closed=True) for v in verts)
+        rgba = to_rgba_array(self._color if colors is None else colors)
+        if len(rgba) == 1:
+            rgba = np.repeat(rgba, len(x), axis=0)
+        self._colors = np.concatenate([self._colors, rgba])
+        self.collection.set_facecolors(self._colors)
+        self.collection.stale = True
+        corners = verts.reshape(-1, 2)
+        corners = corners[np.isfinite(corners).all(axis=1)]
+        if len(corners):
+            self.ax.update_datalim(corners)
+
+    def recolor(self, colors: Sequence) -> None:
+        rgba = to_rgba_array(colors)
+        self._colors[:len(rgba)] = rgba[:len(self._colors)]
+        self.collection.set_facecolors(self._colors)
+
+
+class BlockRateBars:
+    """Hit rate (%) per block of block_size rows, with 75 % / 50 % guides.
+
+    The rates come from a trial_stats.BlockRates fed by extend() with the
+    new rows' 0/1 (or NaN) outcomes; only the blocks those rows touch are
+    re-heighted or created."""
+
+    def __init__(self, ax, block_size: int = 10, width: float = 0.6,
+                 label_fontsize: int = 7, guides: bool = True):
+        self.ax = ax
+        self.blocks = BlockRates(block_size)
+        self._width = width
+        self._fontsize = label_fontsize
+        self._bars = []
+        if guides:
+            ax.axhline(75, color="red", linewidth=1, linestyle="--", alpha=0.6)
+            ax.axhline(50, color="gray", linewidth=1, linestyle=":", alpha=0.5)
+        ax.set_ylim(0, 100)
+
+    def extend(self, hits, labels: Optional[Sequence] = None) -> None:
+        """Add the outcomes of the new rows (labels: their trial numbers)."""
+        blocks = self.blocks
+        n_before = blocks.n
+        blocks.extend(hits, labels)
+        if blocks.n == n_before:
+            return
+        first = n_before // blocks.block_size
+        for b in range(first, len(blocks)):
+            if b < len(self._bars):
+                self._bars[b].set_height(blocks.percent(b))
+            else:
+                self._bars.extend(self.ax.bar([b], [blocks.percent(b)], width=self._width,
+                                              color="C0").patches)
+        self.ax.set_xticks(np.arange(len(self._bars)))
+        self.ax.set_xticklabels([blocks.label(b) for b in range(len(blocks))],
+                                rotation=0, fontsize=self._fontsize)
+        self.ax.set_ylim(0, 100)
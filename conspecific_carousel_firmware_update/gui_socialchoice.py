@@ -4,6 +4,8 @@
 #   no "outcome" col                  → learning
 #   "outcome" + "rt_a" col            → one-choice
 #   "choice_type" col                 → two-choice
+#   Two-choice also shows side bias, win-stay / lose-shift and RT quantiles
+#   under the panels (trial_stats.ChoiceMetrics).
 #
 # SensorGUI: live sensor state (ports A, B, C, door proximity, table)
 
@@ -12,6 +14,10 @@ from matplotlib.patches import Circle
 import numpy as np
 import pandas as pd
 
+from gui_blit import BlitManager
+from gui_series import BarSeries, BlockRateBars, LineSeries, ScatterSeries, autoscale as _autoscale
+from trial_stats import ChoiceMetrics, RollingRate
+
 
 PORT_COLORS = {"A": "#2196F3", "B": "#4CAF50", "C": "#FF9800"}
 
@@ -24,9 +30,19 @@ def _outcome_color(outcome):
     }.get(str(outcome), "gray")
 
 
+def _as_hits(col: pd.Series) -> np.ndarray:
+    """Boolean-ish column (True/False/1/0/NaN) → float array for BlockRateBars."""
+    return pd.to_numeric(col, errors="coerce").to_numpy(dtype=float)
+
+
 # ── Performance GUI ───────────────────────────────────────────────────────────
 
 class PerformanceGUI:
+    """
+    Live performance figure. Panels hold persistent artists (gui_series.py)
+    that are extended with the rows added since the last refresh; update()
+    does nothing but service window events while the row count is unchanged.
+    """
 
     def __init__(self, animal_name="Animal", phase_selection=""):
         plt.ion()
@@ -61,126 +77,133 @@ class PerformanceGUI:
         self.ax_block.set_ylim(0, 100)
         self.ax_prop.set_ylim(-5, 105)
 
-        plt.tight_layout(rect=[0, 0, 1, 0.96])
+        self._layout  = None   # "learning" / "one_choice" / "two_choice", fixed by the first rows
+        self._n_drawn = 0      # rows of df already on the figure
+        self._metrics = None   # two-choice only
+        self._metrics_text = self.fig.text(0.5, 0.01, "", ha="center", fontsize=9)
+
+        plt.tight_layout(rect=[0, 0.03, 1, 0.96])
         plt.show(block=False)
 
     # ── Update ────────────────────────────────────────────────────────────────
 
     def update(self, df: pd.DataFrame):
-        if df is None or df.empty:
-            self.fig.canvas.draw()
+        n = 0 if df is None else len(df)
+        if n == self._n_drawn:
             self.fig.canvas.flush_events()
             return
 
+        if "choice_type" in df.columns:
+            layout = "two_choice"
+        elif "rt_a" in df.columns:
+            layout = "one_choice"
+        else:
+            layout = "learning"
+        if layout != self._layout or n < self._n_drawn:
+            self._reset(layout)
+
         if "trial_num" in df.columns and not df["trial_num"].isna().all():
             trial = int(df["trial_num"].max()) + 1
             self.fig.suptitle(f"{self._base_title}  |  Trial: {trial}", fontsize=13)
 
-        if "choice_type" in df.columns:
-            self._update_two_choice(df)
-        elif "rt_a" in df.columns:
-            self._update_one_choice(df)
+        new = df.iloc[self._n_drawn:]
+        if layout == "two_choice":
+            self._update_two_choice(df, new)
+        elif layout == "one_choice":
+            self._update_one_choice(df, new)
         else:
-            self._update_learning(df)
+            self._update_learning(df, new)
+        self._n_drawn = n
+        if self._metrics is not None:
+            self._metrics.sync(df)
+            self._metrics_text.set_text(self._metrics.describe())
 
+        _autoscale(self.ax_rt, self.ax_choice, self.ax_block, self.ax_prop, self.ax_social)
         self.fig.canvas.draw()
         self.fig.canvas.flush_events()
 
-    # ── Learning ──────────────────────────────────────────────────────────────
-
-    def _update_learning(self, df):
-        valid = df["rt"].notna()
-
-        self.ax_rt.clear()
-        if valid.any():
-            self.ax_rt.scatter(
-                df.loc[valid, "trial_num"], df.loc[valid, "rt"],
-                c=PORT_COLORS["C"], s=25, zorder=3)
-        self.ax_rt.set_title("Reaction time (port C)", fontsize=10)
+    def _reset(self, layout):
+        """Clear every panel and create the persistent artists for layout."""
+        for ax in (self.ax_rt, self.ax_choice, self.ax_block, self.ax_prop, self.ax_social):
+            ax.clear()
+        self._layout = layout
+        self._n_drawn = 0
+        self._block = None
+        self._metrics = None
+        self._metrics_text.set_text("")
+        getattr(self, f"_setup_{layout}")()
+
+    def _setup_rt_axis(self, title):
+        self.ax_rt.set_title(title, fontsize=10)
         self.ax_rt.set_ylabel("RT (s)")
         self.ax_rt.set_xlabel("Trial")
         self.ax_rt.grid(True)
 
+    # ── Learning ──────────────────────────────────────────────────────────────
+
+    def _setup_learning(self):
+        self._setup_rt_axis("Reaction time (port C)")
+        self._rt = ScatterSeries(self.ax_rt, color=PORT_COLORS["C"], s=25, zorder=3)
+
         # Cumulative rewards
-        self.ax_choice.clear()
-        if "reward_count" in df.columns:
-            self.ax_choice.plot(df["trial_num"], df["reward_count"],
-                                color="green", linewidth=1.5)
-            self.ax_choice.set_title("Cumulative rewards", fontsize=10)
-            self.ax_choice.set_ylabel("Reward count")
-            self.ax_choice.set_xlabel("Trial")
-            self.ax_choice.grid(True)
-
-        self._draw_block_reward_rate(self.ax_block, df, "reward_triggered")
-        self.ax_prop.clear()
-        self.ax_social.clear()
+        self._rewards = LineSeries(self.ax_choice, color="green", linewidth=1.5)
+
+        self._block = self._setup_block_axis(self.ax_block)
+
+    def _update_learning(self, df, new):
+        valid = new["rt"].notna()
+        self._rt.append(new.loc[valid, "trial_num"], new.loc[valid, "rt"])
+
+        if "reward_count" in new.columns:
+            if not len(self._rewards):
+                self.ax_choice.set_title("Cumulative rewards", fontsize=10)
+                self.ax_choice.set_ylabel("Reward count")
+                self.ax_choice.set_xlabel("Trial")
+                self.ax_choice.grid(True)
+            self._rewards.append(new["trial_num"], new["reward_count"])
+
+        self._block.extend(_as_hits(new["reward_triggered"]), new["trial_num"])
 
     # ── One-choice ────────────────────────────────────────────────────────────
 
-    def _update_one_choice(self, df):
-        valid_a = df["rt_a"].notna()
-        valid_c = df["rt_c"].notna()
-
-        self.ax_rt.clear()
-        if valid_a.any():
-            self.ax_rt.scatter(
-                df.loc[valid_a, "trial_num"], df.loc[valid_a, "rt_a"],
-                c=PORT_COLORS["A"], s=25, label="RT port A", zorder=3)
-        if valid_c.any():
-            self.ax_rt.scatter(
-                df.loc[valid_c, "trial_num"], df.loc[valid_c, "rt_c"],
-                c=PORT_COLORS["C"], s=25, label="RT port C", zorder=3, marker="^")
-        self.ax_rt.set_title("Reaction time (blue=port A, orange=port C)", fontsize=10)
-        self.ax_rt.set_ylabel("RT (s)")
-        self.ax_rt.set_xlabel("Trial")
-        self.ax_rt.legend(fontsize=8)
-        self.ax_rt.grid(True)
+    def _setup_one_choice(self):
+        self._setup_rt_axis("Reaction time (blue=port A, orange=port C)")
+        self._rt_a = ScatterSeries(self.ax_rt, color=PORT_COLORS["A"], s=25,
+                                   label="RT port A", zorder=3)
+        self._rt_c = ScatterSeries(self.ax_rt, color=PORT_COLORS["C"], s=25,
+                                   label="RT port C", zorder=3, marker="^")
 
         # Outcome dots
-        self.ax_choice.clear()
-        for _, row in df.iterrows():
-            color = _outcome_color(row.get("outcome", ""))
-            self.ax_choice.scatter(row["trial_num"], 0.5, c=color, s=30)
         self.ax_choice.set_title("Outcome  (green=hit, orange=miss)", fontsize=10)
         self.ax_choice.set_yticks([])
         self.ax_choice.set_xlabel("Trial")
         self.ax_choice.grid(True, axis="x")
+        self._outcomes = ScatterSeries(self.ax_choice, s=30)
+
+        self._block = self._setup_block_axis(self.ax_block)
 
-        self._draw_block_reward_rate(self.ax_block, df, None,
-                                     col_outcome="outcome")
-        self.ax_prop.clear()
-        self.ax_social.clear()
+    def _update_one_choice(self, df, new):
+        valid_a = new["rt_a"].notna()
+        valid_c = new["rt_c"].notna()
+        self._rt_a.append(new.loc[valid_a, "trial_num"], new.loc[valid_a, "rt_a"])
+        self._rt_c.append(new.loc[valid_c, "trial_num"], new.loc[valid_c, "rt_c"])
+        handles = [s.collection for s in (self._rt_a, self._rt_c) if len(s)]
+        if handles:
+            self.ax_rt.legend(handles=handles, fontsize=8)
+
+        self._outcomes.append(new["trial_num"], np.full(len(new), 0.5),
+                              colors=[_outcome_color(o) for o in new.get("outcome", [""] * len(new))])
+
+        self._block.extend((new["outcome"] == "hit").to_numpy(dtype=float), new["trial_num"])
 
     # ── Two-choice ────────────────────────────────────────────────────────────
 
-    def _update_two_choice(self, df):
+    def _setup_two_choice(self):
         # RT for sucrose (A) trials
-        a_trials = df[df["choice_type"] == "sucrose"].copy()
-        valid_rt  = a_trials["rt_ab"].notna()
-
-        self.ax_rt.clear()
-        if valid_rt.any():
-            colors = [_outcome_color(o) for o in a_trials.loc[valid_rt, "outcome"]]
-            self.ax_rt.scatter(
-                a_trials.loc[valid_rt, "trial_num"],
-                a_trials.loc[valid_rt, "rt_ab"],
-                c=colors, s=25, zorder=3)
-        self.ax_rt.set_title(
-            "RT port A/B  (green=hit, orange=miss, purple=social)", fontsize=10)
-        self.ax_rt.set_ylabel("RT (s)")
-        self.ax_rt.set_xlabel("Trial")
-        self.ax_rt.grid(True)
+        self._setup_rt_axis("RT port A/B  (green=hit, orange=miss, purple=social)")
+        self._rt = ScatterSeries(self.ax_rt, s=25, zorder=3)
 
         # Choice plot: y=0 for A, y=1 for B; forced = star
-        self.ax_choice.clear()
-        port_to_y = {"A": 0, "B": 1}
-        for _, row in df.iterrows():
-            y      = port_to_y.get(row.get("poked_port"), 0.5)
-            color  = _outcome_color(row.get("outcome", ""))
-            marker = "*" if row.get("forced") else "o"
-            size   = 80 if row.get("forced") else 30
-            self.ax_choice.scatter(
-                row["trial_num"], y, c=color, s=size, marker=marker)
         self.ax_choice.set_yticks([0, 1])
         self.ax_choice.set_yticklabels(["A (sucrose)", "B (social)"])
         self.ax_choice.set_title("Choice  (★=forced | green=hit, purple=social)",
@@ -189,78 +212,67 @@ class PerformanceGUI:
         self.ax_choice.set_xlabel("Trial")
         self.ax_choice.set_ylim(-0.5, 1.5)
         self.ax_choice.grid(True, axis="x")
+        self._choice_forced = ScatterSeries(self.ax_choice, s=80, marker="*")
+        self._choice_free   = ScatterSeries(self.ax_choice, s=30, marker="o")
 
-        # Hit rate for A-choice trials per block
-        if not a_trials.empty:
-            self._draw_block_reward_rate(
-                self.ax_block, a_trials, None,
-                col_outcome="outcome",
-                title="A-choice hit rate (10 trials)")
-        else:
-            self.ax_block.clear()
+        # Hit rate for A-choice trials per block — created with the first A-choice trial
 
         # Running A-choice proportion
-        self.ax_prop.clear()
-        if not df.empty:
-            a_choices = (df["poked_port"] == "A").astype(float)
-            window = min(10, len(a_choices))
-            running = a_choices.rolling(window, min_periods=1).mean() * 100
-            self.ax_prop.plot(df["trial_num"], running,
-                              color=PORT_COLORS["A"], linewidth=1.5)
-            self.ax_prop.axhline(50, color="gray", linewidth=1,
-                                  linestyle="--", alpha=0.6)
-            self.ax_prop.set_ylim(-5, 105)
+        self.ax_prop.axhline(50, color="gray", linewidth=1, linestyle="--", alpha=0.6)
+        self.ax_prop.set_ylim(-5, 105)
         self.ax_prop.set_title(f"Running A-choice % (last 10)", fontsize=10)
         self.ax_prop.set_ylabel("A choices (%)")
         self.ax_prop.set_xlabel("Trial")
         self.ax_prop.grid(True)
+        self._prop = LineSeries(self.ax_prop, color=PORT_COLORS["A"], linewidth=1.5)
+        self._a_rolling = RollingRate(10)
+
+        self._metrics = ChoiceMetrics(choice="poked_port", reward="reward_triggered", rt="rt_ab")
 
         # Social duration for B-choice trials
-        self.ax_social.clear()
-        b_trials = df[df["choice_type"] == "social"].copy()
-        if not b_trials.empty and "social_duration" in b_trials.columns:
-            dur = b_trials["social_duration"].fillna(0)
-            self.ax_social.bar(b_trials["trial_num"], dur,
-                               color=PORT_COLORS["B"], edgecolor="black")
         self.ax_social.set_title("Social presentation duration", fontsize=10)
         self.ax_social.set_ylabel("Duration (s)")
         self.ax_social.set_xlabel("Trial")
         self.ax_social.grid(True, axis="y")
+        self._social = BarSeries(self.ax_social, color=PORT_COLORS["B"], edgecolor="black")
+
+    def _update_two_choice(self, df, new):
+        new_a = new[new["choice_type"] == "sucrose"]
+        valid_rt = new_a["rt_ab"].notna()
+        self._rt.append(new_a.loc[valid_rt, "trial_num"], new_a.loc[valid_rt, "rt_ab"],
+                        colors=[_outcome_color(o) for o in new_a.loc[valid_rt, "outcome"]])
+
+        forced = new["forced"].fillna(False).astype(bool).to_numpy()
+        y = np.array([{"A": 0, "B": 1}.get(p, 0.5) for p in new["poked_port"]], dtype=float)
+        colors = np.array([_outcome_color(o) for o in new.get("outcome", [""] * len(new))],
+                          dtype=object)
+        trial_nums = new["trial_num"].to_numpy()
+        self._choice_forced.append(trial_nums[forced], y[forced], colors=list(colors[forced]))
+        self._choice_free.append(trial_nums[~forced], y[~forced], colors=list(colors[~forced]))
+
+        if not new_a.empty:
+            if self._block is None:
+                self._block = self._setup_block_axis(
+                    self.ax_block, title="A-choice hit rate (10 trials)")
+            self._block.extend((new_a["outcome"] == "hit").to_numpy(dtype=float),
+                               new_a["trial_num"])
+
+        running = self._a_rolling.extend((new["poked_port"] == "A").astype(float)) * 100
+        self._prop.append(new["trial_num"], running)
+
+        if "social_duration" in new.columns:
+            b_new = new[new["choice_type"] == "social"]
+            self._social.append(b_new["trial_num"], b_new["social_duration"].fillna(0))
 
     # ── Helpers ───────────────────────────────────────────────────────────────
 
     @staticmethod
-    def _draw_block_reward_rate(ax, df: pd.DataFrame, col: str,
-                                 col_outcome: str = None,
-                                 title: str = "Block hit rate (10 trials)"):
-        ax.clear()
-        block_size = 10
-        blocks, labels = [], []
-        for start in range(0, len(df), block_size):
-            block = df.iloc[start : start + block_size]
-            if block.empty:
-                continue
-            if col:
-                pct = block[col].mean() * 100
-            elif col_outcome:
-                pct = (block[col_outcome] == "hit").mean() * 100
-            else:
-                pct = 0.0
-            t_s = block["trial_num"].iloc[0]
-            t_e = block["trial_num"].iloc[-1]
-            blocks.append(pct)
-            labels.append(f"{t_s}–{t_e}")
-        x = np.arange(len(blocks))
-        ax.bar(x, blocks, width=0.6)
-        ax.set_xticks(x)
-        ax.set_xticklabels(labels, rotation=0, fontsize=7)
-        ax.set_ylim(0, 100)
-        ax.axhline(75, color="red", linewidth=1, linestyle="--", alpha=0.6)
-        ax.axhline(50, color="gray", linewidth=1, linestyle=":", alpha=0.5)
+    def _setup_block_axis(ax, title: str = "Block hit rate (10 trials)"):
         ax.set_title(title, fontsize=9)
         ax.set_ylabel("Rate (%)")
         ax.set_xlabel("Block")
         ax.grid(True, axis="y")
+        return BlockRateBars(ax)
 
     # ── Close ─────────────────────────────────────────────────────────────────
 
@@ -307,9 +319,22 @@ class SensorGUI:
         self.text_tbl  = self.ax.text(0.70, 0.02, "", ha="center",
                                       fontsize=7, transform=self.ax.transAxes)
 
+        self._blit = BlitManager(self.fig, [
+            self.circle_a, self.circle_b, self.circle_c, self.circle_door, self.circle_tbl,
+            self.text_a, self.text_b, self.text_c, self.text_door, self.text_tbl,
+        ])
+        self._version = None
+
         plt.show(block=False)
 
     def update(self, snapshot):
+        # Sensor timestamps only change with the state, so an unchanged
+        # version means there is nothing to redraw
+        if snapshot.version == self._version:
+            self._blit.idle()
+            return
+        self._version = snapshot.version
+
         def _ts(t):
             return t.strftime("%H:%M:%S") if t else "–"
 
@@ -334,9 +359,9 @@ class SensorGUI:
         self.text_door.set_text(_ts(snapshot.tDoorsensor))
         self.text_tbl.set_text(_ts(snapshot.tTable))
 
-        self.fig.canvas.draw()
-        self.fig.canvas.flush_events()
+        self._blit.update()
 
     def close(self):
+        self._blit.close()
         plt.ioff()
         plt.close(self.fig)
@@ -14,6 +14,9 @@ from matplotlib.patches import Circle
 import numpy as np
 import pandas as pd
 
+from gui_blit import BlitManager
+from gui_series import BarSeries, BlockRateBars, LineSeries, ScatterSeries, autoscale as _autoscale
+
 # Cosmetic-only matplotlib warnings (e.g. tight_layout/legend edge cases) —
 # the real fixes are applied where possible; this is a backstop for the rest.
 warnings.filterwarnings("ignore", category=UserWarning, module=r"matplotlib\..*")
@@ -39,6 +42,11 @@ def _port_color(port):
     return PORT_COLORS.get(port, "gray")
 
 
+def _as_hits(col: pd.Series) -> np.ndarray:
+    """Boolean-ish column (True/False/1/0/NaN) → float array for BlockRateBars."""
+    return pd.to_numeric(col, errors="coerce").to_numpy(dtype=float)
+
+
 def _fit_figure_to_screen(fig):
     """Cap a matplotlib figure's Tk window to MAX_SCREEN_FRACTION of the screen
     and center it, without disabling the window's native resize/drag behavior.
@@ -112,6 +120,9 @@ class PerformanceGUI:
             self._build_task_axes()
             self.fig.subplots_adjust(top=0.93, bottom=0.05, hspace=0.9)
 
+        self._n_drawn    = 0      # rows of df already on the figure
+        self._n_cc_drawn = None   # rows of conditioning_df (None until the first task update)
+
         plt.show(block=False)
         _fit_figure_to_screen(self.fig)
 
@@ -198,8 +209,14 @@ class PerformanceGUI:
     # ── Update ────────────────────────────────────────────────────────────────
 
     def update(self, df: pd.DataFrame, conditioning_df: pd.DataFrame = None):
+        """Refresh with the session's rows so far. Only rows added since the
+        previous call are drawn; nothing is redrawn while the row counts are
+        unchanged."""
         if df is None:
-            self.fig.canvas.draw()
+            self.fig.canvas.flush_events()
+            return
+        n, n_cc = len(df), (None if conditioning_df is None else len(conditioning_df))
+        if (n, n_cc) == (self._n_drawn, self._n_cc_drawn):
             self.fig.canvas.flush_events()
             return
 
@@ -212,122 +229,161 @@ class PerformanceGUI:
             self._update_training(df)
         else:
             self._update_task(df, conditioning_df)
+        self._n_drawn, self._n_cc_drawn = n, n_cc
 
         self.fig.canvas.draw()
         self.fig.canvas.flush_events()
 
     # ── Training mode ─────────────────────────────────────────────────────────
 
-    def _update_training(self, df: pd.DataFrame):
-        ports_present = df["port"].unique().tolist()
-        port_to_y = {p: i for i, p in enumerate(sorted(ports_present))}
+    def _reset_training(self, ports):
+        self.ax_rt.clear()
+        self.ax_ports.clear()
+        self.ax_block.clear()
+        self._n_drawn = 0
+        self._port_to_y = {p: i for i, p in enumerate(sorted(ports))}
 
         # RT scatter
-        self.ax_rt.clear()
-        valid = df["rt"].notna()
-        if valid.any():
-            for port in ports_present:
-                mask = valid & (df["port"] == port)
-                self.ax_rt.scatter(
-                    df.loc[mask, "trial_num"], df.loc[mask, "rt"],
-                    color=_port_color(port), label=f"Port {port}", s=25, zorder=3
-                )
-            self.ax_rt.plot(
-                df.loc[valid, "trial_num"], df.loc[valid, "rt"],
-                color="black", linewidth=0.8, alpha=0.4
-            )
         self.ax_rt.set_ylabel("RT (s)")
         self.ax_rt.set_xlabel("Trial")
         self.ax_rt.set_title("Reaction time (poke latency)", fontsize=10)
-        if valid.any():
-            self.ax_rt.legend(fontsize=8, loc="upper right")
         self.ax_rt.grid(True)
+        self._rt_by_port = {
+            port: ScatterSeries(self.ax_rt, color=_port_color(port), label=f"Port {port}",
+                                s=25, zorder=3)
+            for port in ports
+        }
+        self._rt_line = LineSeries(self.ax_rt, color="black", linewidth=0.8, alpha=0.4)
 
         # Port choice sequence
-        self.ax_ports.clear()
-        for _, row in df.iterrows():
-            y = port_to_y.get(row["port"], 0)
-            color = "green" if row["reward_triggered"] else "red"
-            self.ax_ports.scatter(row["trial_num"], y, c=color, s=30, zorder=3)
-        self.ax_ports.set_yticks(list(port_to_y.values()))
-        self.ax_ports.set_yticklabels(list(port_to_y.keys()))
+        self.ax_ports.set_yticks(list(self._port_to_y.values()))
+        self.ax_ports.set_yticklabels(list(self._port_to_y.keys()))
         self.ax_ports.set_ylabel("Port")
         self.ax_ports.set_xlabel("Trial")
         self.ax_ports.set_title("Port choice  (green = rewarded, red = not rewarded)", fontsize=10)
-        self.ax_ports.set_ylim(-0.5, (max(port_to_y.values()) if port_to_y else 0) + 0.5)
+        self.ax_ports.set_ylim(-0.5, (max(self._port_to_y.values()) if self._port_to_y else 0) + 0.5)
         self.ax_ports.grid(True, axis="x")
+        self._port_dots = ScatterSeries(self.ax_ports, s=30, zorder=3)
 
         # Block hit rate
-        self._draw_block_bars(self.ax_block, df, "reward_triggered")
+        self._block = self._setup_block_axis(self.ax_block)
 
-    # ── Task mode ─────────────────────────────────────────────────────────────
+    def _update_training(self, df: pd.DataFrame):
+        # A port not seen before changes the port-choice rows — start over
+        ports_present = df["port"].unique().tolist()
+        if self._n_drawn == 0 or len(df) < self._n_drawn or \
+                not set(ports_present) <= self._port_to_y.keys():
+            self._reset_training(ports_present)
+        new = df.iloc[self._n_drawn:]
+
+        valid = new["rt"].notna()
+        for port, series in self._rt_by_port.items():
+            mask = valid & (new["port"] == port)
+            series.append(new.loc[mask, "trial_num"], new.loc[mask, "rt"])
+        self._rt_line.append(new.loc[valid, "trial_num"], new.loc[valid, "rt"])
+        if valid.any():
+            self.ax_rt.legend(handles=[s.collection for s in self._rt_by_port.values()],
+                              fontsize=8, loc="upper right")
 
-    def _update_task(self, presentations: pd.DataFrame, conditioning: pd.DataFrame):
-        self._draw_presentation_bar(
-            self.ax_engage, presentations, "time_to_engage",
-            "Time (s)",
-            f"Time to engage stimulus  (door open → table sensor triggered; "
-            f"{self._color_legend_text})")
-        self._draw_presentation_bar(
-            self.ax_sampling, presentations, "sampling_time",
-            "Sampling time (s)",
-            f"Stimulus sampling time  ({self._color_legend_text})",
-            show_labels=True)
-        self._draw_presentation_bar(
-            self.ax_bouts, presentations, "bout_count",
-            "Bouts",
-            f"Number of sampling bouts  ({self._color_legend_text})")
-
-        if conditioning is None or conditioning.empty:
-            self.fig.canvas.draw()
-            self.fig.canvas.flush_events()
-            return
+        self._port_dots.append(
+            new["trial_num"], [self._port_to_y.get(p, 0) for p in new["port"]],
+            colors=["green" if r else "red" for r in new["reward_triggered"]])
+
+        self._block.extend(_as_hits(new["reward_triggered"]))
+        _autoscale(self.ax_rt, self.ax_ports, self.ax_block)
 
-        valid = conditioning["rt"].notna()
-        ports_present = sorted(conditioning["port"].dropna().unique().tolist())
-
-        # CC RT scatter, colored by port
-        self.ax_cc_rt.clear()
-        plotted_any = False
-        for port in ports_present:
-            mask = valid & (conditioning["port"] == port)
-            if mask.any():
-                x = [i + 1 for i, v in enumerate(mask) if v]
-                self.ax_cc_rt.scatter(
-                    x, conditioning.loc[mask, "rt"],
-                    color=_port_color(port), label=f"Port {port}", s=25, zorder=3
-                )
-                plotted_any = True
+    # ── Task mode ─────────────────────────────────────────────────────────────
+
+    def _reset_task(self):
+        self._n_drawn = 0
+        self._n_cc_drawn = 0
+        self._presentation_bars = {}
+        for ax, col, ylabel, title, show_labels in self._presentation_panels():
+            ax.clear()
+            self._setup_presentation_axis(ax, ylabel, title)
+            self._presentation_bars[col] = BarSeries(ax, edgecolor="black", zorder=3)
+
+        for ax in (self.ax_cc_rt, self.ax_cc_miss, self.ax_cc_block):
+            ax.clear()
         self.ax_cc_rt.set_ylabel("RT (s)")
         self.ax_cc_rt.set_title("Conditioning RT", fontsize=10)
         self.ax_cc_rt.grid(True)
         self.ax_cc_rt.tick_params(labelbottom=False)
-        if plotted_any:
-            self.ax_cc_rt.legend(fontsize=8, loc="upper right")
-
-        # CC misses — narrow row, same x-axis as the RT plot above
-        self.ax_cc_miss.clear()
-        miss = ~valid
-        for port in ports_present:
-            mask = miss & (conditioning["port"] == port)
-            if mask.any():
-                x = [i + 1 for i, v in enumerate(mask) if v]
-                self.ax_cc_miss.scatter(
-                    x, [0] * len(x), color=_port_color(port), marker="x", s=30, zorder=3
-                )
         self.ax_cc_miss.set_yticks([])
         self.ax_cc_miss.set_ylabel("Miss", fontsize=8)
         self.ax_cc_miss.set_xlabel("CC trial #")
         self.ax_cc_miss.grid(True, axis="x")
+        self._cc_rt_by_port = {}
+        self._cc_miss_by_port = {}
+        self._cc_legend_ports = []
+        self._cc_block = self._setup_block_axis(self.ax_cc_block,
+                                                title="Conditioning block performance",
+                                                xlabel="CC block (10 trials)")
+
+    def _presentation_panels(self):
+        return [
+            (self.ax_engage, "time_to_engage", "Time (s)",
+             f"Time to engage stimulus  (door open → table sensor triggered; "
+             f"{self._color_legend_text})", False),
+            (self.ax_sampling, "sampling_time", "Sampling time (s)",
+             f"Stimulus sampling time  ({self._color_legend_text})", True),
+            (self.ax_bouts, "bout_count", "Bouts",
+             f"Number of sampling bouts  ({self._color_legend_text})", False),
+        ]
+
+    def _update_task(self, presentations: pd.DataFrame, conditioning: pd.DataFrame):
+        if self._n_cc_drawn is None or len(presentations) < self._n_drawn \
+                or len(conditioning) < self._n_cc_drawn:
+            self._reset_task()
+
+        new = presentations.iloc[self._n_drawn:]
+        if len(new):
+            colors = [self._color_of_period(p) for p in new["period"]]
+            for ax, col, _ylabel, _title, show_labels in self._presentation_panels():
+                self._presentation_bars[col].append(new["presentation_num"], new[col],
+                                                    colors=colors)
+                if show_labels and not self._expected_periods:
+                    for _, row in new.iterrows():
+                        ax.text(
+                            row["presentation_num"], row[col] + 0.05,
+                            row["period"], ha="center", fontsize=7, rotation=45
+                        )
+                _autoscale(ax)
+
+        if conditioning.empty:
+            return
+
+        new_cc = conditioning.iloc[self._n_cc_drawn:]
+        x = np.arange(self._n_cc_drawn + 1, len(conditioning) + 1)
+        valid = new_cc["rt"].notna().to_numpy()
+        ports = new_cc["port"].to_numpy()
+        for port in sorted(new_cc["port"].dropna().unique().tolist()):
+            at_port = ports == port
+            if port not in self._cc_rt_by_port:
+                self._cc_rt_by_port[port] = ScatterSeries(
+                    self.ax_cc_rt, color=_port_color(port), label=f"Port {port}",
+                    s=25, zorder=3)
+                self._cc_miss_by_port[port] = ScatterSeries(
+                    self.ax_cc_miss, color=_port_color(port), marker="x", s=30, zorder=3)
+            # CC RT scatter, colored by port
+            mask = valid & at_port
+            self._cc_rt_by_port[port].append(x[mask], new_cc["rt"].to_numpy()[mask])
+            # CC misses — narrow row, same x-axis as the RT plot above
+            mask = ~valid & at_port
+            self._cc_miss_by_port[port].append(x[mask], np.zeros(mask.sum()))
+        legend_ports = [p for p in sorted(self._cc_rt_by_port) if len(self._cc_rt_by_port[p])]
+        if legend_ports and legend_ports != self._cc_legend_ports:
+            self.ax_cc_rt.legend(handles=[self._cc_rt_by_port[p].collection for p in legend_ports],
+                                 fontsize=8, loc="upper right")
+            self._cc_legend_ports = legend_ports
 
         # CC block hit rate
-        self._draw_block_bars(self.ax_cc_block, conditioning, "reward_triggered")
+        self._cc_block.extend(_as_hits(new_cc["reward_triggered"]))
+        _autoscale(self.ax_cc_rt, self.ax_cc_miss, self.ax_cc_block)
 
     # ── Shared helpers ────────────────────────────────────────────────────────
 
-    def _draw_presentation_bar(self, ax, presentations: pd.DataFrame, col: str,
-                                ylabel: str, title: str, show_labels: bool = False):
-        ax.clear()
+    def _setup_presentation_axis(self, ax, ylabel: str, title: str):
         n_expected = len(self._expected_periods)
         if n_expected:
             # Preload the full planned sequence: light color-coded backdrop per
@@ -339,42 +395,20 @@ class PerformanceGUI:
             ax.set_xticks(range(1, n_expected + 1))
             ax.set_xticklabels(self._expected_periods, rotation=90, fontsize=6)
             ax.set_xlim(0.5, n_expected + 0.5)
-
-        if not presentations.empty:
-            colors = [self._color_of_period(p) for p in presentations["period"]]
-            ax.bar(presentations["presentation_num"], presentations[col],
-                   color=colors, edgecolor="black", zorder=3)
-            if show_labels and not n_expected:
-                for _, row in presentations.iterrows():
-                    ax.text(
-                        row["presentation_num"], row[col] + 0.05,
-                        row["period"], ha="center", fontsize=7, rotation=45
-                    )
         ax.set_ylabel(ylabel)
         ax.set_xlabel("Presentation #")
         ax.set_title(title, fontsize=10)
         ax.grid(True, axis="y")
 
     @staticmethod
-    def _draw_block_bars(ax, df: pd.DataFrame, col: str):
-        ax.clear()
-        block_size = 10
-        blocks, labels = [], []
-        for start in range(0, len(df), block_size):
-            block = df.iloc[start : start + block_size]
-            if block.empty:
-                continue
-            pct = block[col].mean() * 100
-            blocks.append(pct)
-            labels.append(f"{start + 1}–{min(start + block_size, len(df))}")
-        x = np.arange(len(blocks))
-        ax.bar(x, blocks, width=0.6)
-        ax.set_xticks(x)
-        ax.set_xticklabels(labels, rotation=0, fontsize=8)
-        ax.set_ylim(0, 100)
+    def _setup_block_axis(ax, title: str = "Block performance",
+                          xlabel: str = "Block (10 trials)"):
         ax.set_ylabel("Hit rate (%)")
-        ax.set_xlabel("Block (10 trials)")
+        ax.set_xlabel(xlabel)
+        ax.set_title(title, fontsize=10)
         ax.grid(True, axis="y")
+        return BlockRateBars(ax, label_fontsize=8, guides=False)
+
 
     # ── Close ─────────────────────────────────────────────────────────────────
 
@@ -421,10 +455,23 @@ class SensorGUI:
         self.text_tbl  = self.ax.text(0.7, 0.02, "", ha="center",
                                       fontsize=7, transform=self.ax.transAxes)
 
+        self._blit = BlitManager(self.fig, [
+            self.circle_a, self.circle_b, self.circle_c, self.circle_door, self.circle_tbl,
+            self.text_a, self.text_b, self.text_c, self.text_door, self.text_tbl,
+        ])
+        self._version = None
+
         plt.show(block=False)
         _fit_figure_to_screen(self.fig)
 
     def update(self, snapshot):
+        # Sensor timestamps only change with the state, so an unchanged
+        # version means there is nothing to redraw
+        if snapshot.version == self._version:
+            self._blit.idle()
+            return
+        self._version = snapshot.version
+
         def _ts(t):
             return t.strftime("%H:%M:%S") if t else "–"
 
@@ -449,9 +496,9 @@ class SensorGUI:
         self.text_door.set_text(_ts(snapshot.tDoorsensor))
         self.text_tbl.set_text(_ts(snapshot.tTable))
 
-        self.fig.canvas.draw()
-        self.fig.canvas.flush_events()
+        self._blit.update()
 
     def close(self):
+        self._blit.close()
         plt.ioff()
         plt.close(self.fig)
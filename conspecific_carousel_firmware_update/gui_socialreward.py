@@ -6,8 +6,30 @@ from matplotlib.patches import Circle
 import numpy as np
 import pandas as pd
 
+from gui_blit import BlitManager
+from gui_series import BarSeries, LineSeries, ScatterSeries
+
+
+_CORRECT_OUTCOMES = ("hit", "correct_rejection", "rewarded")
+
+# (results_df column, axis attribute, title, ylabel, color) for the
+# line + scatter panels; color None = colored by outcome
+_SERIES_PANELS = [
+    ("rt_dooropen",       "ax_rt_dooropen",       "RT: LED A ON → Port A poke",            "RT (s)",   "steelblue"),
+    ("rt_to_first_table", "ax_rt_to_first_table", "RT: door open → first table contact",   "RT (s)",   "darkorange"),
+    ("rt",                "ax_rt",                "Decision time: LED C ON → Port C poke", "RT (s)",   None),
+    ("trial_duration",    "ax_trial_duration",    "Overall trial time: LED A ON → Port C poke", "Time (s)", "purple"),
+]
+
 
 class PerformanceGUI:
+    """
+    Live performance figure. Panels hold persistent artists (gui_series.py)
+    that are extended with the rows added since the last refresh; update()
+    does nothing but service window events while the row count (and the
+    planned sequence) is unchanged.
+    """
+
     def __init__(self, animal_name="Animal", phase_selection=""):
         plt.ion()
 
@@ -23,91 +45,81 @@ class PerformanceGUI:
 
         # Row 0: RT LED A on → Port A poke
         self.ax_rt_dooropen = self.fig.add_subplot(gs[0])
-        self.ax_rt_dooropen.set_title("RT: LED A ON → Port A poke", fontsize=9)
-        self.ax_rt_dooropen.set_ylabel("RT (s)")
-        self.ax_rt_dooropen.set_xlabel("Trial")
-        self.ax_rt_dooropen.grid(True)
-
         # Row 1: RT door open → first table contact
         self.ax_rt_to_first_table = self.fig.add_subplot(gs[1])
-        self.ax_rt_to_first_table.set_title("RT: door open → first table contact", fontsize=9)
-        self.ax_rt_to_first_table.set_ylabel("RT (s)")
-        self.ax_rt_to_first_table.set_xlabel("Trial")
-        self.ax_rt_to_first_table.grid(True)
-
         # Row 2: Decision time LED C on → Port C poke
         self.ax_rt = self.fig.add_subplot(gs[2])
-        self.ax_rt.set_title("Decision time: LED C ON → Port C poke", fontsize=9)
-        self.ax_rt.set_ylabel("RT (s)")
-        self.ax_rt.set_xlabel("Trial")
-        self.ax_rt.grid(True)
-
         # Row 3: Sensory sampling (grouped bars: total + last bout)
         self.ax_sampling = self.fig.add_subplot(gs[3])
-        self.ax_sampling.set_title(
-            "Sensory sampling time  [gold = total, orange = last bout]", fontsize=9)
-        self.ax_sampling.set_ylabel("Time (s)")
-        self.ax_sampling.set_xlabel("Trial")
-        self.ax_sampling.grid(True, axis="y")
-
         # Row 4: Overall trial time LED A on → Port C poke
         self.ax_trial_duration = self.fig.add_subplot(gs[4])
-        self.ax_trial_duration.set_title("Overall trial time: LED A ON → Port C poke", fontsize=9)
-        self.ax_trial_duration.set_ylabel("Time (s)")
-        self.ax_trial_duration.set_xlabel("Trial")
-        self.ax_trial_duration.grid(True)
-
         # Row 5: Per-trial outcome, split by box when task data is present
         self.ax_block = self.fig.add_subplot(gs[5])
-        self.ax_block.set_title(
-            "Trial outcome by box  [green = correct, red = incorrect]", fontsize=9)
-        self.ax_block.set_ylabel("Box")
-        self.ax_block.set_xlabel("Trial")
-        self.ax_block.set_yticks([])
-        self.ax_block.grid(True, axis="x")
+
+        self._plan      = None   # planned_sequence as a list (None = no plan)
+        self._plan_src  = None   # the object it came from, to spot a new plan cheaply
+        self._last_df   = None   # rows currently on the figure
+        self._reset()
 
         self.fig.suptitle(self._base_title, fontsize=12)
         plt.show(block=False)
 
+    def _reset(self):
+        """Clear every panel and create its persistent artists."""
+        self._n_drawn = 0
+        self._series = {}
+        for col, attr, title, ylabel, color in _SERIES_PANELS:
+            ax = getattr(self, attr)
+            ax.clear()
+            ax.set_title(title, fontsize=9)
+            ax.set_ylabel(ylabel)
+            ax.set_xlabel("Trial")
+            ax.grid(True)
+            if color is None:
+                line = LineSeries(ax, c="black", linewidth=1, alpha=0.4)
+                dots = ScatterSeries(ax, s=30)
+            else:
+                line = LineSeries(ax, c=color, linewidth=1, alpha=0.6)
+                dots = ScatterSeries(ax, color=color, s=20)
+            self._series[col] = (line, dots)
+
+        self.ax_sampling.clear()
+        self.ax_sampling.set_title(
+            "Sensory sampling time  [gold = total, orange = last bout]", fontsize=9)
+        self.ax_sampling.set_ylabel("Time (s)")
+        self.ax_sampling.set_xlabel("Trial")
+        self.ax_sampling.grid(True, axis="y")
+        self._sampling = {}
+
+        self._rebuild_block(None)
+
     def draw_plan(self, planned_sequence, rewarded_angle=None):
         """Draw gray placeholder dots for all planned trials at session start."""
         self._rewarded_angle = rewarded_angle
         if not planned_sequence:
             return
-        angles = sorted(set(planned_sequence))
-        y_map  = {a: i for i, a in enumerate(angles)}
-
-        self.ax_block.clear()
-        self.ax_block.set_title(
-            "Trial outcome by box  [green = correct, red = incorrect]", fontsize=9)
-        self.ax_block.set_xlabel("Trial")
-        self.ax_block.grid(True, axis="x")
-        self.ax_block.set_yticks(list(range(len(angles))))
-        self.ax_block.set_yticklabels(
-            [_box_label(a, rewarded_angle) for a in angles], fontsize=8)
-        self.ax_block.set_ylabel("Box")
-        self.ax_block.set_ylim(-0.5, len(angles) - 0.5)
-
-        for t, angle in enumerate(planned_sequence, start=1):
-            if angle in y_map:
-                self.ax_block.scatter(t, y_map[angle], c="lightgray", s=50, zorder=2)
-
-        self.ax_block.set_xlim(0.5, len(planned_sequence) + 0.5)
+        self._plan_src = planned_sequence
+        self._plan = list(planned_sequence)
+        self._rebuild_block(self._last_df)
         self.fig.canvas.draw()
         self.fig.canvas.flush_events()
 
     def update(self, results_df: pd.DataFrame, current_trial_port=None,
                planned_sequence=None):
-        if results_df.empty:
+        n = len(results_df)
+        plan_changed = planned_sequence is not self._plan_src and (planned_sequence or self._plan)
+        if n == 0 or (n == self._n_drawn and not plan_changed):
+            self.fig.canvas.flush_events()
             return
+        if n < self._n_drawn:
+            self._reset()
+        new = results_df.iloc[self._n_drawn:]
 
         # ── Header: current trial + accuracy (refreshes every 10 trials) ─────
         current_trial = int(results_df["trial_num"].max()) + 1
-        n = len(results_df)
         if n >= 10 and (n // 10) > (self._acc_at_n // 10):
             if "outcome" in results_df.columns:
-                correct = results_df["outcome"].isin(
-                    ["hit", "correct_rejection", "rewarded"]).sum()
+                correct = results_df["outcome"].isin(_CORRECT_OUTCOMES).sum()
             elif "reward_triggered" in results_df.columns:
                 correct = results_df["reward_triggered"].sum()
             else:
@@ -127,168 +139,140 @@ class PerformanceGUI:
         xmin = results_df["trial_num"].min() - 0.5
         xmax = results_df["trial_num"].max() + 0.5
 
-        # ── RT: LED A on → Port A poke ────────────────────────────────────────
-        self.ax_rt_dooropen.clear()
-        self.ax_rt_dooropen.set_title("RT: LED A ON → Port A poke", fontsize=9)
-        self.ax_rt_dooropen.grid(True)
-        self.ax_rt_dooropen.set_ylabel("RT (s)")
-        self.ax_rt_dooropen.set_xlabel("Trial")
-        if "rt_dooropen" in results_df.columns:
-            valid  = results_df["rt_dooropen"].notna()
-            trials = results_df.loc[valid, "trial_num"]
-            rts    = results_df.loc[valid, "rt_dooropen"]
-            if not trials.empty:
-                self.ax_rt_dooropen.plot(trials, rts, c="steelblue", linewidth=1, alpha=0.6)
-                self.ax_rt_dooropen.scatter(trials, rts, c="steelblue", s=20)
-                self.ax_rt_dooropen.set_xlim(xmin, xmax)
-
-        # ── RT: door open → first table contact ──────────────────────────────
-        self.ax_rt_to_first_table.clear()
-        self.ax_rt_to_first_table.set_title(
-            "RT: door open → first table contact", fontsize=9)
-        self.ax_rt_to_first_table.grid(True)
-        self.ax_rt_to_first_table.set_ylabel("RT (s)")
-        self.ax_rt_to_first_table.set_xlabel("Trial")
-        if "rt_to_first_table" in results_df.columns:
-            valid  = results_df["rt_to_first_table"].notna()
-            trials = results_df.loc[valid, "trial_num"]
-            rts    = results_df.loc[valid, "rt_to_first_table"]
-            if not trials.empty:
-                self.ax_rt_to_first_table.plot(
-                    trials, rts, c="darkorange", linewidth=1, alpha=0.6)
-                self.ax_rt_to_first_table.scatter(trials, rts, c="darkorange", s=20)
-                self.ax_rt_to_first_table.set_xlim(xmin, xmax)
-
-        # ── Decision time: LED C on → Port C poke ────────────────────────────
-        self.ax_rt.clear()
-        self.ax_rt.set_title("Decision time: LED C ON → Port C poke", fontsize=9)
-        self.ax_rt.grid(True)
-        self.ax_rt.set_ylabel("RT (s)")
-        self.ax_rt.set_xlabel("Trial")
-        if "rt" in results_df.columns:
-            valid  = results_df["rt"].notna()
-            trials = results_df.loc[valid, "trial_num"]
-            rts    = results_df.loc[valid, "rt"]
-            if not trials.empty:
-                colors = (
-                    [_outcome_color(o) for o in results_df.loc[valid, "outcome"]]
-                    if "outcome" in results_df.columns
-                    else ["green"] * len(trials)
-                )
-                self.ax_rt.plot(trials, rts, c="black", linewidth=1, alpha=0.4)
-                self.ax_rt.scatter(trials, rts, c=colors, s=30)
-                self.ax_rt.set_xlim(xmin, xmax)
+        # ── Line + scatter panels (RTs, overall trial time) ──────────────────
+        for col, attr, _title, _ylabel, color in _SERIES_PANELS:
+            if col not in new.columns:
+                continue
+            line, dots = self._series[col]
+            valid = new[col].notna()
+            trials = new.loc[valid, "trial_num"]
+            values = new.loc[valid, col]
+            colors = None
+            if color is None:
+                colors = ([_outcome_color(o) for o in new.loc[valid, "outcome"]]
+                          if "outcome" in new.columns else "green")
+            line.append(trials, values)
+            dots.append(trials, values, colors=colors)
+            if len(dots):
+                ax = getattr(self, attr)
+                ax.autoscale_view()
+                ax.set_xlim(xmin, xmax)
 
         # ── Sensory sampling: grouped bars (total + last bout) ────────────────
-        self.ax_sampling.clear()
-        self.ax_sampling.set_title(
-            "Sensory sampling time  [gold = total, orange = last bout]", fontsize=9)
-        self.ax_sampling.set_ylabel("Time (s)")
-        self.ax_sampling.set_xlabel("Trial")
-        self.ax_sampling.grid(True, axis="y")
-        has_total  = "total_sampling_time" in results_df.columns
-        has_last   = "sampling_time" in results_df.columns
-        if has_total or has_last:
-            all_trials = results_df["trial_num"].values
+        has_total = "total_sampling_time" in new.columns
+        has_last  = "sampling_time" in new.columns
+        if (has_total or has_last) and not self._sampling:
             bw = 0.35
-            x  = np.array(all_trials, dtype=float)
             if has_total:
-                total_y = results_df["total_sampling_time"].fillna(0).values
-                self.ax_sampling.bar(x - bw / 2, total_y, width=bw,
-                                     color="gold", edgecolor="black", label="Total")
+                self._sampling["total_sampling_time"] = BarSeries(
+                    self.ax_sampling, width=bw, offset=-bw / 2,
+                    color="gold", edgecolor="black", label="Total")
             if has_last:
-                last_y = results_df["sampling_time"].fillna(0).values
-                offset = bw / 2 if has_total else 0
-                self.ax_sampling.bar(x + offset, last_y, width=bw,
-                                     color="darkorange", edgecolor="black", label="Last bout")
+                self._sampling["sampling_time"] = BarSeries(
+                    self.ax_sampling, width=bw, offset=bw / 2 if has_total else 0,
+                    color="darkorange", edgecolor="black", label="Last bout")
+        for col, bars in self._sampling.items():
+            bars.append(new["trial_num"], new[col].fillna(0))
+        if self._sampling:
+            self.ax_sampling.autoscale_view()
             self.ax_sampling.set_xlim(xmin, xmax)
-            self.ax_sampling.legend(fontsize=7, loc="upper left")
-
-        # ── Overall trial time ────────────────────────────────────────────────
-        self.ax_trial_duration.clear()
-        self.ax_trial_duration.set_title(
-            "Overall trial time: LED A ON → Port C poke", fontsize=9)
-        self.ax_trial_duration.grid(True)
-        self.ax_trial_duration.set_ylabel("Time (s)")
-        self.ax_trial_duration.set_xlabel("Trial")
-        if "trial_duration" in results_df.columns:
-            valid  = results_df["trial_duration"].notna()
-            trials = results_df.loc[valid, "trial_num"]
-            durs   = results_df.loc[valid, "trial_duration"]
-            if not trials.empty:
-                self.ax_trial_duration.plot(trials, durs, c="purple", linewidth=1, alpha=0.6)
-                self.ax_trial_duration.scatter(trials, durs, c="purple", s=20)
-                self.ax_trial_duration.set_xlim(xmin, xmax)
-
-        # ── Per-trial outcome dots (two rows by box for task, one row for training) ─
-        self.ax_block.clear()
-        self.ax_block.set_title(
+            if self._n_drawn == 0:
+                self.ax_sampling.legend(fontsize=7, loc="upper left")
+
+        # ── Per-trial outcome dots (one row per box for task, one row for training) ─
+        if plan_changed:
+            self._plan_src = planned_sequence
+            self._plan = list(planned_sequence) if planned_sequence else None
+        new_angles = set()
+        if "presentation_angle" in new.columns:
+            new_angles = set(new["presentation_angle"].dropna().unique())
+        if (plan_changed or (self._y_map is None and "presentation_angle" in new.columns)
+                or (self._y_map is not None and not new_angles <= self._y_map.keys())):
+            self._rebuild_block(results_df)
+        else:
+            self._append_outcomes(new)
+            self._set_block_xlim(results_df)
+
+        self._n_drawn = n
+        self._last_df = results_df
+        self.fig.canvas.draw()
+        self.fig.canvas.flush_events()
+
+    # ── Outcome-by-box panel ──────────────────────────────────────────────────
+
+    def _rebuild_block(self, results_df):
+        """Redraw the outcome panel from scratch — only needed when the set of
+        boxes (rows of the panel) or the plan changes."""
+        ax = self.ax_block
+        ax.clear()
+        ax.set_title(
             "Trial outcome by box  [green = correct, red = incorrect]", fontsize=9)
-        self.ax_block.set_xlabel("Trial")
-        self.ax_block.grid(True, axis="x")
+        ax.set_xlabel("Trial")
+        ax.grid(True, axis="x")
 
-        has_angles = "presentation_angle" in results_df.columns or planned_sequence
-        if has_angles:
+        plan = self._plan
+        has_data_angles = results_df is not None and "presentation_angle" in results_df.columns
+        if has_data_angles or plan:
             # Collect all known angles from plan + data
-            angle_set = set()
-            if planned_sequence:
-                angle_set.update(planned_sequence)
-            if "presentation_angle" in results_df.columns:
+            angle_set = set(plan or ())
+            if has_data_angles:
                 angle_set.update(results_df["presentation_angle"].dropna().unique())
             angles = sorted(angle_set)
-            y_map  = {a: i for i, a in enumerate(angles)}
+            self._y_map = {a: i for i, a in enumerate(angles)}
 
-            self.ax_block.set_yticks(list(range(len(angles))))
-            self.ax_block.set_yticklabels(
+            ax.set_yticks(list(range(len(angles))))
+            ax.set_yticklabels(
                 [_box_label(a, self._rewarded_angle) for a in angles], fontsize=8)
-            self.ax_block.set_ylabel("Box")
-            self.ax_block.set_ylim(-0.5, len(angles) - 0.5)
+            ax.set_ylabel("Box")
+            ax.set_ylim(-0.5, len(angles) - 0.5)
 
             # Gray dots for all planned trials
-            if planned_sequence:
-                for t, angle in enumerate(planned_sequence, start=1):
-                    if angle in y_map:
-                        self.ax_block.scatter(
-                            t, y_map[angle], c="lightgray", s=50, zorder=2)
-
-            # Colored overlay for completed trials
-            if "presentation_angle" in results_df.columns:
-                for _, row in results_df.iterrows():
-                    angle = row.get("presentation_angle")
-                    if pd.isna(angle) or angle not in y_map:
-                        continue
-                    outcome = row.get("outcome")
-                    correct = outcome in ("hit", "correct_rejection", "rewarded")
-                    self.ax_block.scatter(
-                        row["trial_num"], y_map[angle],
-                        c="green" if correct else "red", s=50, zorder=3)
+            planned = ScatterSeries(ax, color="lightgray", s=50, zorder=2)
+            if plan:
+                points = [(t, self._y_map[a]) for t, a in enumerate(plan, start=1)
+                          if a in self._y_map]
+                planned.append([t for t, _ in points], [y for _, y in points])
         else:
             # Training phases: single row
-            self.ax_block.set_yticks([])
-            self.ax_block.set_ylabel("Outcome")
-            self.ax_block.set_ylim(0, 1)
-
-            for _, row in results_df.iterrows():
-                outcome = row.get("outcome") if "outcome" in results_df.columns else None
-                reward_triggered = (row.get("reward_triggered")
-                                    if "reward_triggered" in results_df.columns else None)
-                if outcome is not None:
-                    correct = outcome in ("hit", "correct_rejection", "rewarded")
-                elif reward_triggered is not None:
-                    correct = bool(reward_triggered)
-                else:
-                    continue
-                self.ax_block.scatter(
-                    row["trial_num"], 0.5,
-                    c="green" if correct else "red", s=50, zorder=3)
+            self._y_map = None
+            ax.set_yticks([])
+            ax.set_ylabel("Outcome")
+            ax.set_ylim(0, 1)
+
+        # Colored overlay for completed trials
+        self._outcome_dots = ScatterSeries(ax, s=50, zorder=3)
+        if results_df is not None:
+            self._append_outcomes(results_df)
+        self._set_block_xlim(results_df)
+
+    def _append_outcomes(self, rows):
+        if self._y_map is not None:
+            if "presentation_angle" not in rows.columns:
+                return
+            rows = rows[rows["presentation_angle"].isin(self._y_map.keys())]
+            y = [self._y_map[a] for a in rows["presentation_angle"]]
+            correct = rows.get("outcome", pd.Series(index=rows.index, dtype=object)).isin(
+                _CORRECT_OUTCOMES)
+        elif "outcome" in rows.columns:
+            correct = rows["outcome"].isin(_CORRECT_OUTCOMES)
+            y = np.full(len(rows), 0.5)
+        elif "reward_triggered" in rows.columns:
+            correct = rows["reward_triggered"].fillna(False).astype(bool)
+            y = np.full(len(rows), 0.5)
+        else:
+            return
+        self._outcome_dots.append(rows["trial_num"], y,
+                                  colors=["green" if c else "red" for c in correct])
 
+    def _set_block_xlim(self, results_df):
         # x-axis always spans the full planned range (or completed range)
-        plan_xmax = len(planned_sequence) + 0.5 if planned_sequence else xmax
+        has_rows = results_df is not None and len(results_df) > 0
+        if not has_rows and not self._plan:
+            return
+        xmax = results_df["trial_num"].max() + 0.5 if has_rows else 0.5
+        plan_xmax = len(self._plan) + 0.5 if self._plan else xmax
         self.ax_block.set_xlim(0.5, max(xmax, plan_xmax))
 
-        self.fig.canvas.draw()
-        self.fig.canvas.flush_events()
-
     def close(self, save_path=None):
         if save_path is not None:
             self.fig.savefig(save_path, dpi=300, bbox_inches="tight")
@@ -330,9 +314,22 @@ class SensorGUI:
         self.text_door  = self.ax.text(0.3, 0.01, "", ha="center", fontsize=7, transform=self.ax.transAxes)
         self.text_table = self.ax.text(0.7, 0.01, "", ha="center", fontsize=7, transform=self.ax.transAxes)
 
+        self._blit = BlitManager(self.fig, [
+            self.circle_a, self.circle_b, self.circle_c, self.circle_door, self.circle_table,
+            self.text_a, self.text_b, self.text_c, self.text_door, self.text_table,
+        ])
+        self._version = None
+
         plt.show(block=False)
 
     def update(self, snapshot):
+        # Sensor timestamps only change with the state, so an unchanged
+        # version means there is nothing to redraw
+        if snapshot.version == self._version:
+            self._blit.idle()
+            return
+        self._version = snapshot.version
+
         self.circle_a.set_facecolor("green" if snapshot.A == "triggered" else "red")
         self.circle_b.set_facecolor("green" if snapshot.B == "triggered" else "red")
         self.circle_c.set_facecolor("green" if snapshot.C == "triggered" else "red")
@@ -350,10 +347,10 @@ class SensorGUI:
         self.text_door.set_text( snapshot.tDoorsensor.strftime("%H:%M:%S.%f")[:-3] if snapshot.tDoorsensor else "-")
         self.text_table.set_text(snapshot.tTable.strftime("%H:%M:%S.%f")[:-3]      if snapshot.tTable      else "-")
 
-        self.fig.canvas.draw()
-        self.fig.canvas.flush_events()
+        self._blit.update()
 
     def close(self):
+        self._blit.close()
         plt.ioff()
         plt.close(self.fig)
 
@@ -5,6 +5,8 @@
 #     "poked_port" only (Phase 1)      → autoshaping mode
 #     "rt_dooropen" + "poked_port"     → training mode (phases 2–4)
 #     "trial_type" in columns          → task mode (forced/mixed/free)
+#   The line under the panels shows side bias, win-stay / lose-shift, d′
+#   (task mode) and RT quantiles (trial_stats.ChoiceMetrics).
 #
 # SensorGUI: live sensor state (ports A, B, C, door proximity, table)
 
@@ -13,6 +15,10 @@ from matplotlib.patches import Circle
 import numpy as np
 import pandas as pd
 
+from gui_blit import BlitManager
+from gui_series import BarSeries, BlockRateBars, LineSeries, ScatterSeries, autoscale as _autoscale
+from trial_stats import ChoiceMetrics
+
 
 PORT_COLORS = {"A": "#2196F3", "B": "#4CAF50", "C": "#FF9800"}
 
@@ -33,9 +39,24 @@ def _port_color(port):
     return PORT_COLORS.get(str(port), "gray")
 
 
+def _port_y(ports) -> np.ndarray:
+    """A → 0, B → 1, anything else (no poke) → 0.5."""
+    return np.array([{"A": 0, "B": 1}.get(p, 0.5) for p in ports], dtype=float)
+
+
+def _as_hits(col: pd.Series) -> np.ndarray:
+    """Boolean-ish column (True/False/1/0/NaN) → float array for BlockRateBars."""
+    return pd.to_numeric(col, errors="coerce").to_numpy(dtype=float)
+
+
 # ── Performance GUI ───────────────────────────────────────────────────────────
 
 class PerformanceGUI:
+    """
+    Live performance figure. Panels hold persistent artists (gui_series.py)
+    that are extended with the rows added since the last refresh; update()
+    does nothing but service window events while the row count is unchanged.
+    """
 
     def __init__(self, animal_name="Animal", phase_selection=""):
         plt.ion()
@@ -70,196 +91,219 @@ class PerformanceGUI:
         self.ax_block.set_ylim(0, 100)
         self.ax_ratio.set_ylim(-0.05, 1.05)
 
-        plt.tight_layout(rect=[0, 0, 1, 0.96])
+        self._layout  = None   # "autoshaping" / "training" / "task", fixed by the first rows
+        self._n_drawn = 0      # rows of df already on the figure
+        self._metrics = None
+        self._metrics_text = self.fig.text(0.5, 0.01, "", ha="center", fontsize=9)
+
+        plt.tight_layout(rect=[0, 0.03, 1, 0.96])
         plt.show(block=False)
 
     # ── Update ────────────────────────────────────────────────────────────────
 
     def update(self, df: pd.DataFrame, current_trial_port=None):
-        if df is None or df.empty:
-            self.fig.canvas.draw()
+        n = 0 if df is None else len(df)
+        if n == self._n_drawn:
             self.fig.canvas.flush_events()
             return
 
+        if "trial_type" in df.columns:
+            layout = "task"
+        elif "rt_dooropen" in df.columns:
+            layout = "training"
+        else:
+            layout = "autoshaping"
+        if layout != self._layout or n < self._n_drawn:
+            self._reset(layout)
+
         if "trial_num" in df.columns and not df["trial_num"].isna().all():
             trial = int(df["trial_num"].max()) + 1
             self.fig.suptitle(f"{self._base_title}  |  Trial: {trial}", fontsize=13)
 
-        if "trial_type" in df.columns:
-            self._update_task(df)
-        elif "rt_dooropen" in df.columns:
-            self._update_training(df)
+        new = df.iloc[self._n_drawn:]
+        if layout == "task":
+            self._update_task(df, new)
+        elif layout == "training":
+            self._update_training(df, new)
         else:
-            self._update_autoshaping(df)
+            self._update_autoshaping(df, new)
+        self._n_drawn = n
+        self._metrics.sync(df)
+        self._metrics_text.set_text(self._metrics.describe())
 
+        _autoscale(self.ax_rt, self.ax_choice, self.ax_block, self.ax_sampling, self.ax_ratio)
         self.fig.canvas.draw()
         self.fig.canvas.flush_events()
 
+    def _reset(self, layout):
+        """Clear every panel and create the persistent artists for layout."""
+        for ax in (self.ax_rt, self.ax_choice, self.ax_block, self.ax_sampling, self.ax_ratio):
+            ax.clear()
+        self._layout = layout
+        self._n_drawn = 0
+        self._metrics = ChoiceMetrics(correct="correct_port" if layout == "task" else None)
+        getattr(self, f"_setup_{layout}")()
+
+    def _setup_choice_axis(self, title, fontsize, yticklabels, ylabel):
+        ax = self.ax_choice
+        ax.set_yticks([0, 1])
+        ax.set_yticklabels(yticklabels)
+        ax.set_title(title, fontsize=fontsize)
+        ax.set_ylabel(ylabel)
+        ax.set_xlabel("Trial")
+        ax.set_ylim(-0.5, 1.5)
+        ax.grid(True, axis="x")
+
     # ── Autoshaping (Phase 1) ─────────────────────────────────────────────────
 
-    def _update_autoshaping(self, df):
-        valid = df["rt"].notna()
-
-        self.ax_rt.clear()
-        if valid.any():
-            for port in ("A", "B"):
-                mask = valid & (df["poked_port"] == port)
-                if mask.any():
-                    self.ax_rt.scatter(
-                        df.loc[mask, "trial_num"], df.loc[mask, "rt"],
-                        color=_port_color(port), label=f"Port {port}", s=25, zorder=3)
+    def _setup_autoshaping(self):
         self.ax_rt.set_title("Reaction time", fontsize=10)
         self.ax_rt.set_ylabel("RT (s)")
         self.ax_rt.set_xlabel("Trial")
-        self.ax_rt.legend(fontsize=8)
         self.ax_rt.grid(True)
+        self._rt_by_port = {
+            port: ScatterSeries(self.ax_rt, color=_port_color(port), s=25, zorder=3,
+                                label=f"Port {port}")
+            for port in ("A", "B")
+        }
 
-        # Port choice
-        self.ax_choice.clear()
-        port_to_y = {"A": 0, "B": 1}
-        for _, row in df.iterrows():
-            y = port_to_y.get(row.get("poked_port"), 0.5)
-            color = "green" if row.get("reward_triggered") else "red"
-            self.ax_choice.scatter(row["trial_num"], y, c=color, s=30)
-        self.ax_choice.set_yticks([0, 1])
-        self.ax_choice.set_yticklabels(["A", "B"])
-        self.ax_choice.set_title("Port choice (green=rewarded)", fontsize=10)
-        self.ax_choice.set_ylabel("Port")
-        self.ax_choice.set_xlabel("Trial")
-        self.ax_choice.set_ylim(-0.5, 1.5)
-        self.ax_choice.grid(True, axis="x")
-
-        self._draw_block_bars(self.ax_block, df, "reward_triggered")
-        self.ax_sampling.clear()
-        self.ax_ratio.clear()
+        self._setup_choice_axis("Port choice (green=rewarded)", 10, ["A", "B"], "Port")
+        self._choice = ScatterSeries(self.ax_choice, s=30)
 
-    # ── Training (Phases 2–4) ─────────────────────────────────────────────────
+        self._block = self._setup_block_axis(self.ax_block)
 
-    def _update_training(self, df):
-        valid = df["rt"].notna()
+    def _update_autoshaping(self, df, new):
+        valid = new["rt"].notna()
+        for port, series in self._rt_by_port.items():
+            mask = valid & (new["poked_port"] == port)
+            series.append(new.loc[mask, "trial_num"], new.loc[mask, "rt"])
+        handles = [s.collection for s in self._rt_by_port.values() if len(s)]
+        if handles:
+            self.ax_rt.legend(handles=handles, fontsize=8)
+
+        self._choice.append(
+            new["trial_num"], _port_y(new["poked_port"]),
+            colors=["green" if r else "red" for r in new["reward_triggered"]])
+
+        self._block.extend(_as_hits(new["reward_triggered"]), new["trial_num"])
+
+    # ── Training (Phases 2–4) ─────────────────────────────────────────────────
 
-        self.ax_rt.clear()
-        if valid.any():
-            colors = [_port_color(p) for p in df.loc[valid, "poked_port"]]
-            self.ax_rt.scatter(
-                df.loc[valid, "trial_num"], df.loc[valid, "rt"],
-                c=colors, s=25, zorder=3)
+    def _setup_training(self):
         self.ax_rt.set_title("Reaction time (coloured by port poked)", fontsize=10)
         self.ax_rt.set_ylabel("RT (s)")
         self.ax_rt.set_xlabel("Trial")
         self.ax_rt.grid(True)
+        self._rt = ScatterSeries(self.ax_rt, s=25, zorder=3)
 
         # Choice dots: y=port, colour=outcome
-        self.ax_choice.clear()
-        port_to_y = {"A": 0, "B": 1}
-        for _, row in df.iterrows():
-            y = port_to_y.get(row.get("poked_port"), 0.5)
-            self.ax_choice.scatter(
-                row["trial_num"], y,
-                c=_outcome_color(row.get("outcome", "")), s=30)
-        self.ax_choice.set_yticks([0, 1])
-        self.ax_choice.set_yticklabels(["A", "B"])
-        self.ax_choice.set_title("Port choice  (green=reward, red=wrong, orange=miss)",
-                                  fontsize=9)
-        self.ax_choice.set_ylabel("Port")
-        self.ax_choice.set_xlabel("Trial")
-        self.ax_choice.set_ylim(-0.5, 1.5)
-        self.ax_choice.grid(True, axis="x")
-
-        self._draw_block_bars(self.ax_block, df, "reward_triggered")
-
-        # Sampling time
-        self.ax_sampling.clear()
-        if "sampling_time" in df.columns and df["sampling_time"].notna().any():
-            self.ax_sampling.bar(
-                df["trial_num"], df["sampling_time"].fillna(0),
-                color="gold", edgecolor="black")
+        self._setup_choice_axis("Port choice  (green=reward, red=wrong, orange=miss)", 9,
+                                ["A", "B"], "Port")
+        self._choice = ScatterSeries(self.ax_choice, s=30)
+
+        self._block = self._setup_block_axis(self.ax_block)
+
         self.ax_sampling.set_title("Sampling time", fontsize=10)
         self.ax_sampling.set_ylabel("Sampling (s)")
         self.ax_sampling.set_xlabel("Trial")
         self.ax_sampling.grid(True, axis="y")
+        self._sampling = BarSeries(self.ax_sampling, color="gold", edgecolor="black")
 
-        self.ax_ratio.clear()
+    def _update_training(self, df, new):
+        valid = new["rt"].notna()
+        self._rt.append(new.loc[valid, "trial_num"], new.loc[valid, "rt"],
+                        colors=[_port_color(p) for p in new.loc[valid, "poked_port"]])
 
-    # ── Task (Forced / Mixed / Free) ──────────────────────────────────────────
+        self._choice.append(
+            new["trial_num"], _port_y(new["poked_port"]),
+            colors=[_outcome_color(o) for o in new.get("outcome", [""] * len(new))])
 
-    def _update_task(self, df):
-        valid = df["rt"].notna()
+        self._block.extend(_as_hits(new["reward_triggered"]), new["trial_num"])
 
+        if "sampling_time" in new.columns:
+            self._sampling.append(new["trial_num"], new["sampling_time"].fillna(0))
+
+    # ── Task (Forced / Mixed / Free) ──────────────────────────────────────────
+
+    def _setup_task(self):
         # RT coloured by outcome
-        self.ax_rt.clear()
-        if valid.any():
-            colors = [_outcome_color(o) for o in df.loc[valid, "outcome"]]
-            self.ax_rt.scatter(
-                df.loc[valid, "trial_num"], df.loc[valid, "rt"],
-                c=colors, s=25, zorder=3)
-            self.ax_rt.plot(
-                df.loc[valid, "trial_num"], df.loc[valid, "rt"],
-                color="black", linewidth=0.6, alpha=0.4)
         self.ax_rt.set_title("RT  (green=hit, red=error, orange=miss)", fontsize=10)
         self.ax_rt.set_ylabel("RT (s)")
         self.ax_rt.set_xlabel("Trial")
         self.ax_rt.grid(True)
+        self._rt = ScatterSeries(self.ax_rt, s=25, zorder=3)
+        self._rt_line = LineSeries(self.ax_rt, color="black", linewidth=0.6, alpha=0.4)
 
         # Choice: y = correct_port (A=0, B=1), colour = outcome
         # Triangle shape = forced, circle = free
-        self.ax_choice.clear()
-        port_to_y = {"A": 0, "B": 1}
-        for _, row in df.iterrows():
-            y      = port_to_y.get(row.get("correct_port"), 0.5)
-            color  = _outcome_color(row.get("outcome", ""))
-            marker = "^" if row.get("trial_type") == "forced" else "o"
-            self.ax_choice.scatter(
-                row["trial_num"], y, c=color, s=35, marker=marker)
-        self.ax_choice.set_yticks([0, 1])
-        self.ax_choice.set_yticklabels(["Stim→A", "Stim→B"])
-        self.ax_choice.set_title(
-            "Stimulus  (▲=forced, ●=free | green=hit, red=error)", fontsize=9)
-        self.ax_choice.set_ylabel("Correct port")
-        self.ax_choice.set_xlabel("Trial")
-        self.ax_choice.set_ylim(-0.5, 1.5)
-        self.ax_choice.grid(True, axis="x")
-
-        # Block hit rate (free trials only if mixed, all otherwise)
-        self.ax_block.clear()
-        if "trial_type" in df.columns and (df["trial_type"] == "free").any():
-            free_df = df[df["trial_type"] == "free"]
-            self._draw_block_bars(self.ax_block, free_df, None,
-                                  title="Free-trial hit rate (10 trials)")
-        else:
-            self._draw_block_bars(self.ax_block, df, None)
-
-        # Sampling time
-        self.ax_sampling.clear()
-        if "sampling_time" in df.columns and df["sampling_time"].notna().any():
-            # Colour by stimulus (A angle vs B angle)
-            colors = [
-                PORT_COLORS["A"] if a == self._angle_a(df) else PORT_COLORS["B"]
-                for a in df["presentation_angle"]
-            ]
-            self.ax_sampling.bar(
-                df["trial_num"], df["sampling_time"].fillna(0),
-                color=colors, edgecolor="black")
+        self._setup_choice_axis("Stimulus  (▲=forced, ●=free | green=hit, red=error)", 9,
+                                ["Stim→A", "Stim→B"], "Correct port")
+        self._choice_forced = ScatterSeries(self.ax_choice, s=35, marker="^")
+        self._choice_free   = ScatterSeries(self.ax_choice, s=35, marker="o")
+
+        # Block hit rate (free trials only if mixed, all otherwise) — the
+        # source switches to free trials when the first one arrives
+        self._block_free = False
+        self._block = self._setup_block_axis(self.ax_block)
+
         self.ax_sampling.set_title(
             "Sampling time (blue=Stim-A, green=Stim-B)", fontsize=9)
         self.ax_sampling.set_ylabel("Sampling (s)")
         self.ax_sampling.set_xlabel("Trial")
         self.ax_sampling.grid(True, axis="y")
+        self._sampling = BarSeries(self.ax_sampling, edgecolor="black")
+        self._sampling_angle_a = None
 
         # Forced ratio progression (mixed only)
-        self.ax_ratio.clear()
-        if "forced_ratio" in df.columns and "block_num" in df.columns:
-            ratio_per_block = (
-                df.groupby("block_num")["forced_ratio"].first().reset_index()
-            )
-            self.ax_ratio.step(
-                ratio_per_block["block_num"], ratio_per_block["forced_ratio"],
-                where="post", color="purple", linewidth=2)
-            self.ax_ratio.set_ylim(-0.05, 1.05)
         self.ax_ratio.set_title("Forced ratio per block", fontsize=10)
         self.ax_ratio.set_ylabel("Forced ratio")
         self.ax_ratio.set_xlabel("Block")
         self.ax_ratio.grid(True)
+        self.ax_ratio.set_ylim(-0.05, 1.05)
+        self._ratio = LineSeries(self.ax_ratio, drawstyle="steps-post",
+                                 color="purple", linewidth=2)
+
+    def _update_task(self, df, new):
+        valid = new["rt"].notna()
+        self._rt.append(new.loc[valid, "trial_num"], new.loc[valid, "rt"],
+                        colors=[_outcome_color(o) for o in new.loc[valid, "outcome"]])
+        self._rt_line.append(new.loc[valid, "trial_num"], new.loc[valid, "rt"])
+
+        forced = (new["trial_type"] == "forced").to_numpy()
+        y = _port_y(new["correct_port"])
+        colors = np.array([_outcome_color(o) for o in new.get("outcome", [""] * len(new))],
+                          dtype=object)
+        trial_nums = new["trial_num"].to_numpy()
+        self._choice_forced.append(trial_nums[forced], y[forced], colors=list(colors[forced]))
+        self._choice_free.append(trial_nums[~forced], y[~forced], colors=list(colors[~forced]))
+
+        free = new["trial_type"] == "free"
+        if free.any() and not self._block_free:
+            # First free trial — earlier rows were all forced, so the free-trial
+            # block source starts with this batch
+            self._block_free = True
+            self.ax_block.clear()
+            self._block = self._setup_block_axis(
+                self.ax_block, title="Free-trial hit rate (10 trials)")
+        block_rows = new[free] if self._block_free else new
+        self._block.extend((block_rows["outcome"] == "hit").to_numpy(dtype=float),
+                           block_rows["trial_num"])
+
+        if "sampling_time" in df.columns:
+            # Colour by stimulus (A angle vs B angle); angle A is inferred from
+            # the data, so recolor the existing bars if the inference changes
+            angle_a = self._angle_a(df)
+            color_of = lambda a: PORT_COLORS["A"] if a == angle_a else PORT_COLORS["B"]
+            if angle_a != self._sampling_angle_a and len(self._sampling):
+                self._sampling.recolor(
+                    [color_of(a) for a in df["presentation_angle"].iloc[:self._n_drawn]])
+            self._sampling_angle_a = angle_a
+            self._sampling.append(new["trial_num"], new["sampling_time"].fillna(0),
+                                  colors=[color_of(a) for a in new["presentation_angle"]])
+
+        if "forced_ratio" in df.columns and "block_num" in df.columns:
+            ratio_per_block = df.groupby("block_num")["forced_ratio"].first()
+            self._ratio.set(ratio_per_block.index, ratio_per_block.to_numpy())
 
     # ── Helpers ───────────────────────────────────────────────────────────────
 
@@ -273,33 +317,12 @@ class PerformanceGUI:
         return 90
 
     @staticmethod
-    def _draw_block_bars(ax, df: pd.DataFrame, col=None, title="Block hit rate"):
-        ax.clear()
-        block_size = 10
-        blocks, labels = [], []
-        for start in range(0, len(df), block_size):
-            block = df.iloc[start : start + block_size]
-            if block.empty:
-                continue
-            if col:
-                pct = block[col].mean() * 100
-            else:
-                pct = (block["outcome"] == "hit").mean() * 100
-            t_s = block["trial_num"].iloc[0]
-            t_e = block["trial_num"].iloc[-1]
-            blocks.append(pct)
-            labels.append(f"{t_s}–{t_e}")
-        x = np.arange(len(blocks))
-        ax.bar(x, blocks, width=0.6)
-        ax.set_xticks(x)
-        ax.set_xticklabels(labels, rotation=0, fontsize=7)
-        ax.set_ylim(0, 100)
-        ax.axhline(75, color="red", linewidth=1, linestyle="--", alpha=0.6)
-        ax.axhline(50, color="gray", linewidth=1, linestyle=":", alpha=0.5)
+    def _setup_block_axis(ax, title="Block hit rate"):
         ax.set_title(title, fontsize=9)
         ax.set_ylabel("Hit rate (%)")
         ax.set_xlabel("Block")
         ax.grid(True, axis="y")
+        return BlockRateBars(ax)
 
     # ── Close ─────────────────────────────────────────────────────────────────
 
@@ -346,9 +369,22 @@ class SensorGUI:
         self.text_tbl  = self.ax.text(0.70, 0.02, "", ha="center",
                                       fontsize=7, transform=self.ax.transAxes)
 
+        self._blit = BlitManager(self.fig, [
+            self.circle_a, self.circle_b, self.circle_c, self.circle_door, self.circle_tbl,
+            self.text_a, self.text_b, self.text_c, self.text_door, self.text_tbl,
+        ])
+        self._version = None
+
         plt.show(block=False)
 
     def update(self, snapshot):
+        # Sensor timestamps only change with the state, so an unchanged
+        # version means there is nothing to redraw
+        if snapshot.version == self._version:
+            self._blit.idle()
+            return
+        self._version = snapshot.version
+
         def _ts(t):
             return t.strftime("%H:%M:%S") if t else "–"
 
@@ -373,9 +409,9 @@ class SensorGUI:
         self.text_door.set_text(_ts(snapshot.tDoorsensor))
         self.text_tbl.set_text(_ts(snapshot.tTable))
 
-        self.fig.canvas.draw()
-        self.fig.canvas.flush_events()
+        self._blit.update()
 
     def close(self):
+        self._blit.close()
         plt.ioff()
         plt.close(self.fig)
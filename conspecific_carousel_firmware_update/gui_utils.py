@@ -82,3 +82,111 @@ def fit_window_to_screen(scroll_frame: tk.Frame, max_fraction: float = 0.85) ->
     x = max(0, (screen_w - win_w) // 2)
     y = max(0, (screen_h - win_h) // 2)
     root.geometry(f"{win_w}x{win_h}+{x}+{y}")
+
+
+# ── Recording / diagnostics options ───────────────────────────────────────────
+# Opt-in checkboxes shared by all setup dialogs: (params key, label, default).
+# The BooleanVars live in the dialog's self._vars so they persist with the
+# rest of the settings, and recording_options() copies them into the result.
+
+RECORDING_OPTIONS = [
+    ("packet_capture", "Record raw serial packets (packets.bin)", False),
+    ("gui_process", "Draw live plots in a separate process", False),
+    ("dashboard", "Stream to the lab dashboard (dashboard_server.py)", False),
+    ("event_raster", "Show the event raster window (event_raster.png)", False),
+    ("stage_trace", "Trace trial stage latencies (trace.json)", False),
+    ("cpu_profile", "Profile CPU use per thread (profile_stacks.txt)", False),
+    ("param_control", "Accept live parameter changes (param_store.py)", False),
+]
+
+
+def make_recording_options(parent: tk.Widget, vars_dict: dict, row: int) -> tk.LabelFrame:
+    """Grid a 'Recording' frame of opt-in checkboxes at `row` of `parent`,
+    adding one BooleanVar per RECORDING_OPTIONS entry to `vars_dict`."""
+    frame = tk.LabelFrame(parent, text="Recording", padx=8, pady=4)
+    frame.grid(row=row, column=0, columnspan=4, sticky="ew", padx=8, pady=4)
+    for i, (key, label, default) in enumerate(RECORDING_OPTIONS):
+        vars_dict[key] = tk.BooleanVar(value=default)
+        tk.Checkbutton(frame, text=label, variable=vars_dict[key]).grid(
+            row=i, column=0, sticky="w")
+    return frame
+
+
+def recording_options(vars_dict: dict) -> dict:
+    """Return {key: bool} for every recording option, for the params dict."""
+    return {key: bool(vars_dict[key].get()) for key, _, _ in RECORDING_OPTIONS}
+
+
+# ── Serial port picker ────────────────────────────────────────────────────────
+
+def make_port_picker(parent: tk.Widget, var: tk.StringVar, row: int,
+                     label: str = "Serial Port:") -> ttk.Combobox:
+    """Grid a serial-port row at `row` of `parent`: an editable combobox
+    listing the ports with carousels first (rig_discovery), a Scan button and
+    a status label. Fresh cached results fill it immediately; otherwise a
+    scan runs on a background thread and fills it when done. `var` is only
+    changed if it doesn't name a carousel and a carousel was found.
+    combo.scanning is True while a scan holds the ports open
+    (disable_while_scanning)."""
+    import threading
+    import rig_discovery
+
+    pad = {"padx": 8, "pady": 2}
+    tk.Label(parent, text=label, anchor="w").grid(row=row, column=0, sticky="w", **pad)
+    combo = ttk.Combobox(parent, textvariable=var, width=16)
+    combo.grid(row=row, column=1, sticky="w", **pad)
+    combo.scanning = tk.BooleanVar(parent, value=False)
+    status = tk.Label(parent, text="", anchor="w", fg="gray", font=("Arial", 8))
+    status.grid(row=row, column=3, sticky="w", **pad)
+
+    def _show(rigs) -> None:
+        carousels = [r for r in rigs if r.is_carousel]
+        combo["values"] = [r.port for r in rigs]
+        if carousels and var.get().strip() not in {r.port for r in carousels}:
+            var.set(carousels[0].port)
+        current = next((r for r in rigs if r.port == var.get().strip()), None)
+        text = current.summary() if current else f"{len(carousels)} carousel(s) found"
+        status.config(text=text, fg="green" if current and current.is_carousel else "gray")
+
+    def _scan(refresh: bool) -> None:
+        result = []
+        status.config(text="Scanning ports…", fg="gray")
+        scan_btn.config(state="disabled")
+        combo.scanning.set(True)
+        worker = threading.Thread(
+            target=lambda: result.append(rig_discovery.discover(refresh=refresh)),
+            name="rig-discovery", daemon=True)
+        worker.start()
+
+        def _poll() -> None:
+            if worker.is_alive():
+                combo.after(100, _poll)
+                return
+            scan_btn.config(state="normal")
+            combo.scanning.set(False)
+            if result:
+                _show(result[0])
+            else:
+                status.config(text="Scan failed", fg="red")
+        combo.after(100, _poll)
+
+    scan_btn = tk.Button(parent, text="Scan", command=lambda: _scan(True))
+    scan_btn.grid(row=row, column=2, sticky="w", **pad)
+    combo.bind("<<ComboboxSelected>>", lambda _e: _show(rig_discovery.cached() or []))
+
+    rigs = rig_discovery.cached()
+    if rigs is not None:
+        _show(rigs)
+    else:
+        _scan(False)
+    return combo
+
+
+def disable_while_scanning(button: tk.Button, combo: ttk.Combobox) -> None:
+    """Keep `button` (the dialog's Start) disabled while the port picker
+    `combo` scans — the probes hold every serial port open, so connecting to
+    one before the scan ends fails with the port busy."""
+    def _sync(*_args) -> None:
+        button.config(state="disabled" if combo.scanning.get() else "normal")
+    combo.scanning.trace_add("write", _sync)
+    _sync()
@@ -13,7 +13,7 @@ import threading
 import time
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 
 from protocol import (
     REG_PA_LED, REG_PA_VALVE, REG_PA_IR,
@@ -24,9 +24,12 @@ from protocol import (
     REG_DOOR_OPN_SPD, REG_DOOR_CLS_SPD,
     REG_TABLE_STATUS, REG_TABLE_CMD, REG_TABLE_SPD,
     REG_CAM_A, REG_CAM_B,
+    READABLE_REGISTERS,
     build_table_command,
 )
+from log_rotation import RotatingLogWriter
 from serial_comm import DeviceConnection
+from tracing import span, traced
 from utils import now
 
 # ── Port register map ─────────────────────────────────────────────────────────
@@ -48,6 +51,22 @@ DOOR_STATUS_STR = {
     3: "door paused",
 }
 
+
+def _decode_register(register: int, value: int) -> Optional[Tuple[str, str]]:
+    """(port, state string) for a sensor/status register value, else None."""
+    if register in _IR_PORT_MAP:
+        return _IR_PORT_MAP[register], "triggered" if value else "cleared"
+    if register == REG_DOOR_SENSOR:
+        return "doorsensor", "triggered" if value else "cleared"
+    if register == REG_TABLE_SENSOR:
+        return "table", "triggered" if value else "cleared"
+    if register == REG_DOOR_STATUS:
+        return "door", DOOR_STATUS_STR.get(value, f"door unknown(0x{value:02X})")
+    if register == REG_TABLE_STATUS:
+        return "table_motor", "table moving" if value else "table stopped"
+    return None
+
+
 # ── Table positioning ─────────────────────────────────────────────────────────
 
 DEFAULT_TABLE_POSITION = 0
@@ -67,6 +86,11 @@ current_table_position = DEFAULT_TABLE_POSITION
 SENSOR_HOLD_TIME = 0.1   # seconds a sensor must stay triggered to count as a poke
 STOP_EVENT = threading.Event()
 
+# sensor_events.csv rotation for long sessions: a new segment is started at
+# whichever limit is hit first; finished segments are gzipped (log_rotation.py)
+SENSOR_LOG_ROTATE_BYTES = 4 * 1024 * 1024
+SENSOR_LOG_ROTATE_SECONDS = 30 * 60
+
 # ── Thread-safe sensor state ──────────────────────────────────────────────────
 
 @dataclass
@@ -85,6 +109,7 @@ class SensorSnapshot:
     tTable: Optional[datetime] = None
     table_motor: Optional[str] = None
     tTableMotor: Optional[datetime] = None
+    version: int = 0     # SharedSensorState.version when the snapshot was taken
 
 
 class SharedSensorState:
@@ -97,8 +122,14 @@ class SharedSensorState:
     working without modification.
     """
 
-    def __init__(self):
+    def __init__(self, stop_event: Optional[threading.Event] = None):
         self._lock = threading.Lock()
+        # Per-rig scope (rig.py): the stop token every wait helper and session
+        # checks, and the table position for move_table_to_position(). A
+        # single-rig main uses the module-wide STOP_EVENT.
+        self.stop_event = STOP_EVENT if stop_event is None else stop_event
+        self.table_position = DEFAULT_TABLE_POSITION
+        self.tracer = None             # tracing.Tracer, set by Tracer.attach()
         self.state = {
             "A": "cleared",
             "B": "cleared",
@@ -109,11 +140,55 @@ class SharedSensorState:
             "table_motor": "table stopped",
         }
         self.last_change: dict[str, Optional[datetime]] = {k: None for k in self.state}
+        self._version = 0
+        self._listeners = []           # replaced, never mutated: update() iterates a snapshot
+
+    @property
+    def version(self) -> int:
+        """Incremented on every update(); lets GUIs skip redraws when nothing changed."""
+        return self._version
 
     def update(self, port: str, state: str, ts: datetime) -> None:
         with self._lock:
             self.state[port] = state
             self.last_change[port] = ts
+            self._version += 1
+            listeners = self._listeners
+        for cb in listeners:
+            cb(port, state, ts)
+
+    def add_listener(self, cb) -> None:
+        """Call cb(port, state, ts) after every update() (on the serial
+        reader thread — hand the event off, don't block)."""
+        with self._lock:
+            self._listeners = self._listeners + [cb]
+
+    def remove_listener(self, cb) -> None:
+        with self._lock:
+            self._listeners = [c for c in self._listeners if c is not cb]
+
+    def seed(self, registers: dict) -> List[str]:
+        """
+        Set the initial state from a register read-back ({register: value},
+        e.g. DeviceConnection.read_registers(READABLE_REGISTERS)) instead of
+        the hard-coded defaults. Ports already updated by an event are left
+        alone, and last_change stays None (the time of the change is unknown).
+        Returns the ports whose state differed from the default.
+        """
+        changed = []
+        with self._lock:
+            for register, value in registers.items():
+                decoded = _decode_register(register, value)
+                if decoded is None:
+                    continue
+                port, state = decoded
+                if self.last_change[port] is not None:
+                    continue
+                if self.state[port] != state:
+                    changed.append(port)
+                self.state[port] = state
+            self._version += 1
+        return changed
 
     def get(self) -> SensorSnapshot:
         with self._lock:
@@ -132,6 +207,7 @@ class SharedSensorState:
                 tDoor=self.last_change["door"],
                 table_motor=self.state["table_motor"],
                 tTableMotor=self.last_change["table_motor"],
+                version=self._version,
             )
 
     def get_port(self, port: str) -> Tuple[str, Optional[datetime]]:
@@ -150,6 +226,14 @@ class EventLogger:
       • write timestamped CSV event lines to event_log_path
       • optionally write per-interval CSVs for doorsensor and table sensor
 
+    With rotate_bytes / rotate_seconds set, the event log is written as
+    rotated, gzip-compressed segments (see log_rotation.py) instead of one
+    growing file; call close() at shutdown to finish the last segment.
+
+    on_transition(cb) registers cb(port, state, t) for every logged state
+    change (t = seconds since session start). Callbacks run on the serial
+    reader thread, so they must only hand the event off (e.g. to a deque).
+
     Usage in main script:
         device = DeviceConnection(port, baudrate=115200)
         shared = SharedSensorState()
@@ -167,15 +251,24 @@ class EventLogger:
         doorsensor_csv_path: Optional[str] = None,
         table_csv_path: Optional[str] = None,
         door_csv_path: Optional[str] = None,
+        rotate_bytes: Optional[int] = None,
+        rotate_seconds: Optional[float] = None,
     ):
         self.shared = shared
         self.event_log_path = event_log_path
+        self._writer: Optional[RotatingLogWriter] = None
+        if rotate_bytes or rotate_seconds:
+            self._writer = RotatingLogWriter(event_log_path, rotate_bytes, rotate_seconds)
         self.session_start = session_start
         self.doorsensor_csv_path = doorsensor_csv_path
         self.table_csv_path = table_csv_path
         self.door_csv_path = door_csv_path
         self._doorsensor_event_start: Optional[float] = None
         self._table_event_start: Optional[float] = None
+        self._transition_callbacks = []
+
+    def on_transition(self, cb) -> None:
+        self._transition_callbacks.append(cb)
 
     # Called by DeviceConnection reader thread for every MSG_EVENT packet
     def __call__(self, register: int, value: int) -> None:
@@ -232,8 +325,20 @@ class EventLogger:
     # ── Internal helpers ──────────────────────────────────────────────────────
 
     def _log(self, ts: datetime, t: float, port: str, state: str) -> None:
-        with open(self.event_log_path, "a", encoding="utf-8") as f:
-            f.write(f"{ts.strftime('%H:%M:%S.%f')[:-3]},{t:.3f},{port},{state}\n")
+        line = f"{ts.strftime('%H:%M:%S.%f')[:-3]},{t:.3f},{port},{state}\n"
+        if self._writer is not None:
+            self._writer.write(line, t)
+        else:
+            with open(self.event_log_path, "a", encoding="utf-8") as f:
+                f.write(line)
+        for cb in self._transition_callbacks:
+            cb(port, state, t)
+
+    def close(self) -> None:
+        """Finish the current log segment and wait for its compression
+        (no-op without rotation)."""
+        if self._writer is not None:
+            self._writer.close()
 
     def _interval_csv(self, key: str, path: str, state: str, t: float) -> None:
         attr = f"_{key}_event_start"
@@ -268,7 +373,9 @@ class CameraTriggerLogger:
 
     Recording is gated by arm()/disarm() so only a bounded window (e.g. one
     stimulus presentation) is kept; call sites elsewhere just call disarm()
-    and get back the sync-pulse timestamps for that window.
+    and get back the sync-pulse timestamps for that window. Every pulse is
+    also kept regardless of arming (one float per second) so the whole train
+    can be turned into a frame index at the end of the session (all_pulses()).
 
     Usage:
         camera_logger = CameraTriggerLogger(session_start=session_start)
@@ -294,6 +401,7 @@ class CameraTriggerLogger:
         self._armed = False
         self._prev_value: Optional[int] = None
         self._timestamps: List[float] = []
+        self._all_timestamps: List[float] = []
 
     def arm(self) -> None:
         """Start keeping sync-pulse timestamps from this point on."""
@@ -308,6 +416,11 @@ class CameraTriggerLogger:
             timestamps, self._timestamps = self._timestamps, []
         return timestamps
 
+    def all_pulses(self) -> List[float]:
+        """Every sync-pulse timestamp seen so far, armed or not."""
+        with self._lock:
+            return list(self._all_timestamps)
+
     # Called by DeviceConnection's reader thread for every MSG_EVENT packet
     def __call__(self, register: int, value: int) -> None:
         if register != self._register:
@@ -318,6 +431,7 @@ class CameraTriggerLogger:
             return
         t = time.time() - self._session_start
         with self._lock:
+            self._all_timestamps.append(t)
             if self._armed:
                 self._timestamps.append(t)
 
@@ -327,13 +441,16 @@ class CameraTriggerLogger:
 # All functions accept a DeviceConnection as their first argument.
 # Call sites that previously passed a serial.Serial object just need to pass
 # the DeviceConnection instead — the rest of the call signature is unchanged.
+# Rewards and the blocking waits below are traced as stages when a
+# tracing.Tracer is attached to the device / shared state.
 
 def deliver_reward(device: DeviceConnection, port: str, valve_time: float = 0.15) -> None:
     """Open valve for valve_time seconds then close."""
     reg = PORT_REGS[port]["valve"]
-    device.write_register(reg, 1)
-    time.sleep(valve_time)
-    device.write_register(reg, 0)
+    with span(device, "reward", port=port, valve_s=valve_time):
+        device.write_register(reg, 1)
+        time.sleep(valve_time)
+        device.write_register(reg, 0)
 
 
 def incremental_reward(
@@ -346,9 +463,10 @@ def incremental_reward(
     """Open valve for an incrementally longer time on each reward. Returns actual valve time."""
     valve_time = valve_start + (reward_count * increment)
     reg = PORT_REGS[port]["valve"]
-    device.write_register(reg, 1)
-    time.sleep(valve_time)
-    device.write_register(reg, 0)
+    with span(device, "reward", port=port, valve_s=valve_time):
+        device.write_register(reg, 1)
+        time.sleep(valve_time)
+        device.write_register(reg, 0)
     return valve_time
 
 
@@ -360,7 +478,7 @@ def sensor_held(shared: SharedSensorState, port: str) -> bool:
     """Return True if port sensor stays triggered for SENSOR_HOLD_TIME seconds."""
     start = time.time()
     while time.time() - start < SENSOR_HOLD_TIME:
-        if STOP_EVENT.is_set():
+        if shared.stop_event.is_set():
             return False
         st, _ = shared.get_port(port)
         if st != "triggered":
@@ -369,6 +487,7 @@ def sensor_held(shared: SharedSensorState, port: str) -> bool:
     return True
 
 
+@traced("shutdown outputs")
 def shutdown_outputs(device: DeviceConnection) -> None:
     """Turn off all LEDs and valves on ports A, B, C."""
     for p in ("A", "B", "C"):
@@ -409,6 +528,21 @@ def apply_motor_speeds(
         set_table_speed(device, table_speed)
 
 
+def read_initial_state(device: DeviceConnection, shared: SharedSensorState) -> None:
+    """Seed shared from one pipelined read of READABLE_REGISTERS, so the
+    first trial sees the real sensor / door / table state. Keeps the
+    defaults (with a warning) if the read times out."""
+    try:
+        values = device.read_registers(READABLE_REGISTERS)
+    except TimeoutError as e:
+        print(f"[WARN] Initial state read failed — using defaults: {e}")
+        return
+    changed = shared.seed(values)
+    if changed:
+        states = ", ".join(f"{port}={shared.get_port(port)[0]}" for port in changed)
+        print(f"[INFO] Initial device state: {states}")
+
+
 # ── Table movement ────────────────────────────────────────────────────────────
 
 def turn_table_degrees(device: DeviceConnection, delta_degrees: int) -> None:
@@ -436,23 +570,31 @@ def turn_table_degrees(device: DeviceConnection, delta_degrees: int) -> None:
     device.write_register(REG_TABLE_CMD, build_table_command(direction, eighths))
 
 
-def move_table_to_position(device: DeviceConnection, target_position: int) -> None:
+def move_table_to_position(device: DeviceConnection, target_position: int,
+                           shared: Optional[SharedSensorState] = None) -> None:
+    """Turn to a TABLE_POSITIONS index. The current position is tracked on
+    `shared` (per rig), or module-wide when no shared state is given."""
     global current_table_position
 
     if target_position not in TABLE_POSITIONS:
         raise ValueError(f"Unknown table position {target_position}")
 
-    if target_position == current_table_position:
+    current = current_table_position if shared is None else shared.table_position
+    if target_position == current:
         print(f"Table already at position {target_position}")
         return
 
-    delta = TABLE_POSITIONS[target_position] - TABLE_POSITIONS[current_table_position]
+    delta = TABLE_POSITIONS[target_position] - TABLE_POSITIONS[current]
     turn_table_degrees(device, delta)
-    current_table_position = target_position
+    if shared is None:
+        current_table_position = target_position
+    else:
+        shared.table_position = target_position
 
 
-def reset_table_to_default(device: DeviceConnection) -> None:
-    move_table_to_position(device, DEFAULT_TABLE_POSITION)
+def reset_table_to_default(device: DeviceConnection,
+                           shared: Optional[SharedSensorState] = None) -> None:
+    move_table_to_position(device, DEFAULT_TABLE_POSITION, shared)
 
 
 # ── Door control ──────────────────────────────────────────────────────────────
@@ -490,6 +632,7 @@ def disable_door_interlock(device: DeviceConnection) -> None:
     device.write_register(REG_DOOR_CMD, 0x02)
 
 
+@traced("door close (safe)")
 def close_door_safe(
     device: DeviceConnection,
     shared: SharedSensorState,
@@ -501,7 +644,7 @@ def close_door_safe(
     sensor and the table sensor.  If either triggers during closing the door
     is stopped immediately.  Once both sensors are clear again closing
     resumes automatically.  Blocks until the door reaches 'door closed' or
-    STOP_EVENT is set.
+    the rig's stop_event is set.
 
     Intended to be called inside a daemon thread so the trial loop is not
     blocked:
@@ -510,7 +653,7 @@ def close_door_safe(
     paused = False
     device.write_register(REG_DOOR_CMD, 0x01)  # initial close command
 
-    while not STOP_EVENT.is_set():
+    while not shared.stop_event.is_set():
         door_state, _ = shared.get_port("door")
         if door_state == "door closed":
             return
@@ -540,24 +683,26 @@ def wait_for_door_state(
     timeout: Optional[float] = None,
 ) -> bool:
     """Block until mechanical door reaches target_state ('door opened', 'door closed', …)."""
-    start_time = time.time()
-    while True:
-        if STOP_EVENT.is_set():
-            return False
-        state, _ = shared.get_port("door")
-        if state == target_state:
-            return True
-        if timeout and (time.time() - start_time) > timeout:
-            print(f"[WARNING] Door did not reach '{target_state}' within {timeout}s")
-            return False
-        time.sleep(0.01)
+    with span(shared, f"wait {target_state}"):
+        start_time = time.time()
+        while True:
+            if shared.stop_event.is_set():
+                return False
+            state, _ = shared.get_port("door")
+            if state == target_state:
+                return True
+            if timeout and (time.time() - start_time) > timeout:
+                print(f"[WARNING] Door did not reach '{target_state}' within {timeout}s")
+                return False
+            time.sleep(0.01)
 
 
+@traced("wait door clear")
 def wait_for_door_clear(shared: SharedSensorState) -> bool:
     """Block until the door proximity sensor is clear for at least 100 ms."""
     clear_start = None
     while True:
-        if STOP_EVENT.is_set():
+        if shared.stop_event.is_set():
             return False
         state, _ = shared.get_port("doorsensor")
         if state == "cleared":
@@ -570,11 +715,12 @@ def wait_for_door_clear(shared: SharedSensorState) -> bool:
         time.sleep(0.01)
 
 
+@traced("wait table clear")
 def wait_for_table_clear(shared: SharedSensorState) -> bool:
     """Block until the table proximity sensor is clear for at least 100 ms."""
     clear_start = None
     while True:
-        if STOP_EVENT.is_set():
+        if shared.stop_event.is_set():
             return False
         state, _ = shared.get_port("table")
         if state == "cleared":
@@ -587,6 +733,7 @@ def wait_for_table_clear(shared: SharedSensorState) -> bool:
         time.sleep(0.01)
 
 
+@traced("wait table stopped")
 def wait_for_table_stopped(
     shared: SharedSensorState,
     timeout: float = 30.0,
@@ -595,14 +742,14 @@ def wait_for_table_stopped(
 
     Waits up to 0.5 s for the motor to start (firmware latency grace period),
     then blocks until 'table stopped' is reported.  Returns True when stopped,
-    False on STOP_EVENT or overall timeout.
+    False on stop_event or overall timeout.
     """
     deadline = time.time() + timeout
 
     # Wait briefly for the motor to start (covers firmware event latency)
     move_seen = False
     grace_end = time.time() + 0.5
-    while time.time() < grace_end and not STOP_EVENT.is_set():
+    while time.time() < grace_end and not shared.stop_event.is_set():
         state, _ = shared.get_port("table_motor")
         if state == "table moving":
             move_seen = True
@@ -613,7 +760,7 @@ def wait_for_table_stopped(
         # Motor never started — zero-distance move or already complete
         return True
 
-    while not STOP_EVENT.is_set():
+    while not shared.stop_event.is_set():
         if time.time() > deadline:
             print("[WARNING] Table did not stop within timeout")
             return False
@@ -625,11 +772,12 @@ def wait_for_table_stopped(
     return False
 
 
+@traced("wait door+table clear")
 def wait_for_door_and_table_clear(shared: SharedSensorState) -> bool:
     """Block until BOTH door and table proximity sensors are clear for at least 100 ms."""
     clear_start = None
     while True:
-        if STOP_EVENT.is_set():
+        if shared.stop_event.is_set():
             return False
         door_state, _ = shared.get_port("doorsensor")
         table_state, _ = shared.get_port("table")
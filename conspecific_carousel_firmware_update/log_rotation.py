@@ -0,0 +1,216 @@
+# log_rotation.py — size/time-rotated, gzip-compressed CSV logs with a manifest
+#
+# A log configured as  <dir>/sensor_events.csv  is written as numbered segments
+#   sensor_events.0001.csv, sensor_events.0002.csv, ...
+# and each finished segment is gzipped in a background thread
+# (sensor_events.0001.csv.gz). sensor_events.manifest.json lists the segments
+# in order with their line count, byte size and first/last session time.
+#
+# Readers never need to know whether a log was rotated:
+#   for line in iter_log_lines(".../sensor_events.csv"): ...
+#   df = read_log_csv(".../sensor_events.csv", header=None, names=[...])
+# both fall back to the plain file when no segments exist, and pick up a
+# segment whether or not it has been compressed yet (e.g. after a crash).
+
+import glob
+import gzip
+import json
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+from typing import Iterator, List, Optional
+
+
+def _split(path: str):
+    root, ext = os.path.splitext(path)
+    return root, ext
+
+
+def manifest_path(path: str) -> str:
+    root, _ = _split(path)
+    return f"{root}.manifest.json"
+
+
+class RotatingLogWriter:
+    """
+    Line-oriented append-only writer that starts a new segment once the
+    current one reaches rotate_bytes or has been open rotate_seconds.
+
+    write() keeps the segment file open and flushes after every line, so a
+    crash loses nothing already written. Compression of finished segments
+    runs on a daemon thread and never blocks write().
+    """
+
+    def __init__(
+        self,
+        path: str,
+        rotate_bytes: Optional[int] = None,
+        rotate_seconds: Optional[float] = None,
+        compress: bool = True,
+    ):
+        self.path = path
+        self._root, self._ext = _split(path)
+        self._rotate_bytes = rotate_bytes
+        self._rotate_seconds = rotate_seconds
+        self._compress = compress
+        self._lock = threading.Lock()
+
+        self._segments: List[dict] = []
+        self._index = 0
+        self._file = None
+        self._current: Optional[dict] = None
+        self._opened_at = 0.0
+
+        self._queue: "queue.Queue[Optional[dict]]" = queue.Queue()
+        self._compressor = None
+
+    def _segment_name(self, index: int) -> str:
+        return f"{os.path.basename(self._root)}.{index:04d}{self._ext}"
+
+    # ── Writing ───────────────────────────────────────────────────────────────
+
+    def write(self, line: str, t: Optional[float] = None) -> None:
+        """Append one line (newline included by the caller); t is the
+        session time of the line, recorded in the manifest."""
+        with self._lock:
+            if self._file is None:
+                self._open_segment()
+            self._file.write(line)
+            self._file.flush()
+            seg = self._current
+            seg["lines"] += 1
+            seg["bytes"] += len(line.encode("utf-8"))
+            if t is not None:
+                if seg["first_t"] is None:
+                    seg["first_t"] = t
+                seg["last_t"] = t
+            if ((self._rotate_bytes and seg["bytes"] >= self._rotate_bytes)
+                    or (self._rotate_seconds
+                        and time.monotonic() - self._opened_at >= self._rotate_seconds)):
+                self._close_segment()
+
+    def _open_segment(self) -> None:
+        self._index += 1
+        name = self._segment_name(self._index)
+        self._file = open(os.path.join(os.path.dirname(self.path), name),
+                          "a", encoding="utf-8")
+        self._opened_at = time.monotonic()
+        self._current = {"file": name, "lines": 0, "bytes": 0,
+                         "first_t": None, "last_t": None}
+        self._segments.append(self._current)
+        self._write_manifest(complete=False)
+
+    def _close_segment(self) -> None:
+        self._file.close()
+        self._file = None
+        seg, self._current = self._current, None
+        self._write_manifest(complete=False)
+        if self._compress:
+            if self._compressor is None:
+                self._compressor = threading.Thread(target=self._compress_loop, daemon=True)
+                self._compressor.start()
+            self._queue.put(seg)
+
+    def close(self, timeout: float = 30.0) -> None:
+        """Close the open segment, wait for pending compression and mark the
+        manifest complete."""
+        with self._lock:
+            if self._file is not None:
+                self._close_segment()
+        if self._compressor is not None:
+            self._queue.put(None)
+            self._compressor.join(timeout=timeout)
+            self._compressor = None
+        with self._lock:
+            self._write_manifest(complete=True)
+
+    # ── Compression ───────────────────────────────────────────────────────────
+
+    def _compress_loop(self) -> None:
+        directory = os.path.dirname(self.path)
+        while True:
+            seg = self._queue.get()
+            if seg is None:
+                return
+            src = os.path.join(directory, seg["file"])
+            dst = src + ".gz"
+            try:
+                with open(src, "rb") as fi, gzip.open(dst + ".tmp", "wb") as fo:
+                    shutil.copyfileobj(fi, fo)
+                os.replace(dst + ".tmp", dst)
+                os.remove(src)
+            except OSError as e:
+                print(f"[WARN] Could not compress {src}: {e}")
+                continue
+            with self._lock:
+                seg["file"] = os.path.basename(dst)
+                self._write_manifest(complete=False)
+
+    # ── Manifest ──────────────────────────────────────────────────────────────
+
+    def _write_manifest(self, complete: bool) -> None:
+        path = manifest_path(self.path)
+        data = {
+            "log": os.path.basename(self.path),
+            "rotate_bytes": self._rotate_bytes,
+            "rotate_seconds": self._rotate_seconds,
+            "complete": complete,
+            "segments": [dict(s) for s in self._segments],
+        }
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, path)
+
+
+# ── Reading ───────────────────────────────────────────────────────────────────
+
+def segment_paths(path: str) -> List[str]:
+    """Segment files of a rotated log in order, or [path] if it was not
+    rotated (or [] if neither exists)."""
+    root, ext = _split(path)
+    pattern = re.compile(re.escape(os.path.basename(root)) + r"\.(\d{4,})"
+                         + re.escape(ext) + r"(\.gz)?$")
+    by_index = {}
+    for candidate in glob.glob(f"{glob.escape(root)}.*{ext}*"):
+        m = pattern.match(os.path.basename(candidate))
+        if m is None:
+            continue
+        idx = int(m.group(1))
+        # Both present only if we crashed between gzip and delete — either
+        # is complete; prefer the compressed copy.
+        if idx not in by_index or candidate.endswith(".gz"):
+            by_index[idx] = candidate
+    if by_index:
+        return [by_index[i] for i in sorted(by_index)]
+    return [path] if os.path.exists(path) else []
+
+
+def _open_text(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def iter_log_lines(path: str) -> Iterator[str]:
+    """Stream the lines of a (possibly rotated) log across all segments."""
+    for seg in segment_paths(path):
+        with _open_text(seg) as f:
+            yield from f
+
+
+def read_log_csv(path: str, **read_csv_kwargs):
+    """pandas.read_csv over every segment of a (possibly rotated) log.
+    Returns None if the log does not exist or is empty."""
+    import pandas as pd
+    segments = segment_paths(path)
+    if not segments:
+        return None
+    frames = [pd.read_csv(seg, **read_csv_kwargs) for seg in segments
+              if os.path.getsize(seg) > 0]
+    if not frames:
+        return None
+    return pd.concat(frames, ignore_index=True)
@@ -7,19 +7,31 @@
 #   one_choice — port A LED → port C LED → poke C within window → reward
 #   two_choice — port A (sucrose) or port B (social stimulus 10s); anti-bias
 
+import startup   # first: starts the startup clock
 import time
+import random
 import signal
 import os
 import json
 from datetime import datetime
 
 from serial_comm import DeviceConnection
+from packet_capture import PacketCapture, MARK_SESSION_START, MARK_SESSION_STOP
+from session_catalog import record_session
 from hardware import (
     SharedSensorState, EventLogger, STOP_EVENT, shutdown_outputs,
-    turn_table_degrees, apply_motor_speeds,
+    turn_table_degrees, apply_motor_speeds, read_initial_state,
+    SENSOR_LOG_ROTATE_BYTES, SENSOR_LOG_ROTATE_SECONDS,
 )
 from sc_setup_gui import SCSetupDialog
 
+# Imported in the background while the setup dialog is open (startup.py)
+_PREWARM = (
+    "SocialChoice.learning",
+    "SocialChoice.one_choice",
+    "SocialChoice.two_choice",
+)
+
 
 def handle_sigint(_sig, _frame):
     STOP_EVENT.set()
@@ -38,17 +50,81 @@ def _save_metadata(save_dir, params):
     print(f"[INFO] Metadata saved: {path}")
 
 
-def _run_loop(session, shared, sensor_gui, perf_gui):
+def _run_loop(session, shared, sensor_gui, perf_gui, raster_gui=None):
     while session.running and not STOP_EVENT.is_set():
         snap = shared.get()
         sensor_gui.update(snap)
+        if raster_gui is not None:
+            raster_gui.update()
         perf_gui.update(session.results_df)
         time.sleep(0.05)
 
 
+def build_session(params, device, shared):
+    """Construct (but do not start) the session for params["phase"].
+
+    Shared by main() and session_replay.py so a replayed session is built
+    exactly as the recorded one was. Returns None for an unknown phase."""
+    from SocialChoice.learning   import LearningSession
+    from SocialChoice.one_choice import OneChoiceSession
+    from SocialChoice.two_choice import TwoChoiceSession
+
+    if params.get("random_seed") is not None:
+        random.seed(params["random_seed"])
+
+    phase      = params["phase"]
+    species    = params["species"]
+    valve_time = params["valve_time"]
+    iti_min    = params["iti_min"]
+    iti_max    = params["iti_max"]
+    dur_s      = params["session_duration_s"]
+    dur_t      = params["session_duration_t"]
+
+    if phase == "learning":
+        session = LearningSession(
+            device, shared, species=species,
+            valve_time=valve_time,
+            iti_min=iti_min, iti_max=iti_max,
+            session_duration=dur_s,
+        )
+
+    elif phase == "one_choice":
+        session = OneChoiceSession(
+            device, shared, species=species,
+            valve_time=valve_time,
+            decision_window=params["decision_window"],
+            iti_min=iti_min, iti_max=iti_max,
+            session_duration=dur_s,
+        )
+
+    elif phase == "two_choice":
+        session = TwoChoiceSession(
+            device, shared, species=species,
+            valve_time=valve_time,
+            decision_window=params["decision_window"],
+            social_angle=params["social_angle"],
+            social_duration=params["social_duration"],
+            iti_min=iti_min, iti_max=iti_max,
+            session_duration=dur_s,
+        )
+
+    else:
+        print(f"[ERROR] Unknown phase: {phase}")
+        return None
+
+    session.adaptation.configure(params.get("adaptation"))
+    session.max_trials = dur_t
+    if params.get("random_seed") is not None:
+        session.schedule = session.make_schedule(params["random_seed"])
+    return session
+
+
 def main():
+    startup.prewarm(*startup.HEAVY_MODULES, "gui_series", *_PREWARM)
     dialog = SCSetupDialog()
+    startup.mark("dialog")
     params = dialog.run()
+    startup.mark("setup_done")
 
     if params is None:
         print("[INFO] Setup cancelled.")
@@ -61,10 +137,6 @@ def main():
     port      = params["port"]
     baud      = params["baud"]
 
-    from SocialChoice.learning   import LearningSession
-    from SocialChoice.one_choice import OneChoiceSession
-    from SocialChoice.two_choice import TwoChoiceSession
-    from gui_socialchoice        import SensorGUI, PerformanceGUI
 
     # Output directory
     date_str      = datetime.now().strftime("%Y-%m-%d")
@@ -76,6 +148,7 @@ def main():
     print(f"[INFO] Saving to: {BASE_SAVE_DIR}")
 
     params["date"]     = date_str
+    params["random_seed"] = random.randrange(2**32)
     params["save_dir"] = BASE_SAVE_DIR
     _save_metadata(BASE_SAVE_DIR, params)
 
@@ -84,12 +157,24 @@ def main():
     perf_fig   = os.path.join(BASE_SAVE_DIR, "performance.png")
 
     # Connect
+    capture = None
+    if params.get("packet_capture"):
+        capture = PacketCapture(os.path.join(BASE_SAVE_DIR, "packets.bin"))
+
+    device = None
     try:
         device = DeviceConnection(port, baudrate=baud)
+        if capture is not None:
+            capture.attach(device)
         device.connect()
-        time.sleep(2)
+        ready_s = device.wait_ready()
+        print(f"[INFO] Device ready after {ready_s:.2f} s")
     except Exception as e:
         print(f"[ERROR] Cannot open serial port: {e}")
+        if device is not None:
+            device.disconnect()
+        if capture is not None:
+            capture.close()
         return
 
     apply_motor_speeds(
@@ -104,65 +189,95 @@ def main():
         shared,
         event_log_path=sensor_log,
         session_start=time.time(),
+        rotate_bytes=SENSOR_LOG_ROTATE_BYTES,
+        rotate_seconds=SENSOR_LOG_ROTATE_SECONDS,
     )
     device.on_event(logger)
-
-    sensor_gui = SensorGUI()
-    perf_gui   = PerformanceGUI(animal_name=animal, phase_selection=phase)
-
-    session    = None
-    valve_time = params["valve_time"]
-    iti_min    = params["iti_min"]
-    iti_max    = params["iti_max"]
-    dur_s      = params["session_duration_s"]
-    dur_t      = params["session_duration_t"]
+    read_initial_state(device, shared)
+
+    tracer = None
+    if params.get("stage_trace"):
+        from tracing import Tracer
+        tracer = Tracer()
+        tracer.attach(device, shared)
+
+    profiler = None
+    if params.get("cpu_profile"):
+        from thread_profiler import ThreadProfiler
+        profiler = ThreadProfiler()
+        profiler.start()
+
+    dashboard = None
+    if params.get("dashboard"):
+        from dashboard_server import DashboardPublisher, DASHBOARD_URL, rig_name
+        dashboard = DashboardPublisher(
+            DASHBOARD_URL, rig=rig_name(port),
+            info={"task": "SocialChoice", "animal": animal, "session": session_n,
+                  "phase": phase, "species": species},
+        )
+        logger.on_transition(dashboard.transition)
+
+    raster_start = logger.session_start if params.get("event_raster") else None
+    if params.get("gui_process"):
+        from gui_process import start_gui_process
+        sensor_gui, perf_gui, raster_gui = start_gui_process(
+            "gui_socialchoice", raster_start=raster_start,
+            animal_name=animal, phase_selection=phase)
+    else:
+        from gui_socialchoice import SensorGUI, PerformanceGUI
+        sensor_gui = SensorGUI()
+        perf_gui    = PerformanceGUI(animal_name=animal, phase_selection=phase)
+        raster_gui = None
+        if raster_start is not None:
+            from event_raster import EventRasterGUI
+            raster_gui = EventRasterGUI(session_start=raster_start)
+    if raster_gui is not None:
+        logger.on_transition(raster_gui.on_transition)
+
+    session = None
+    control = None
 
     try:
-        if phase == "learning":
-            session = LearningSession(
-                device, shared, species=species,
-                valve_time=valve_time,
-                iti_min=iti_min, iti_max=iti_max,
-                session_duration=dur_s,
-            )
-
-        elif phase == "one_choice":
-            session = OneChoiceSession(
-                device, shared, species=species,
-                valve_time=valve_time,
-                decision_window=params["decision_window"],
-                iti_min=iti_min, iti_max=iti_max,
-                session_duration=dur_s,
-            )
-
-        elif phase == "two_choice":
-            session = TwoChoiceSession(
-                device, shared, species=species,
-                valve_time=valve_time,
-                decision_window=params["decision_window"],
-                social_angle=params["social_angle"],
-                social_duration=params["social_duration"],
-                iti_min=iti_min, iti_max=iti_max,
-                session_duration=dur_s,
-            )
-
-        else:
-            print(f"[ERROR] Unknown phase: {phase}")
+        session = build_session(params, device, shared)
+        if session is None:
             return
 
-        session.max_trials = dur_t
+        if params.get("param_control"):
+            from param_store import ControlServer
+            control = ControlServer(session.params).start()
+        if capture is not None:
+            capture.mark(MARK_SESSION_START)
         session.start()
+        startup.mark("first_trial")
+        startup.save_timings(BASE_SAVE_DIR)
+        if dashboard is not None:
+            dashboard.watch("trials", lambda: session.results_df)
+            dashboard.start()
         print(f"[INFO] Phase {phase} running — press Ctrl+C to stop")
-        _run_loop(session, shared, sensor_gui, perf_gui)
+        _run_loop(session, shared, sensor_gui, perf_gui, raster_gui)
 
     finally:
         print("[INFO] Shutting down...")
         STOP_EVENT.set()
+        if capture is not None:
+            capture.mark(MARK_SESSION_STOP)
+        if control is not None:
+            control.close()
 
         if session is not None:
             session.stop()
             session.results_df.to_csv(trial_csv, index=False)
             print(f"[INFO] Trials saved: {trial_csv}")
+            # Trial data is written first; a failure below must not cost it
+            for what, part in (("Trial schedule", session.schedule),
+                               ("Adaptation log", session.adaptation),
+                               ("Parameter changes", session.params)):
+                if part is None:
+                    continue
+                try:
+                    part.save(BASE_SAVE_DIR)
+                except Exception as e:
+                    print(f"[WARN] {what} not saved: {e}")
             perf_gui.update(session.results_df)
 
         # Return turntable to home for two_choice (has turntable)
@@ -194,8 +309,21 @@ def main():
         sensor_gui.update(shared.get())
         shutdown_outputs(device)
         device.disconnect()
+        logger.close()
+        if dashboard is not None:
+            dashboard.close()
+        if capture is not None:
+            capture.close()
+        if raster_gui is not None:
+            raster_gui.close(save_path=os.path.join(BASE_SAVE_DIR, "event_raster.png"))
         perf_gui.close(save_path=perf_fig)
         sensor_gui.close()
+        if tracer is not None:
+            tracer.save(BASE_SAVE_DIR)
+        if profiler is not None:
+            profiler.stop()
+            profiler.save(BASE_SAVE_DIR)
+        record_session(BASE_SAVE_DIR)
         print("[INFO] Clean shutdown complete")
 
 
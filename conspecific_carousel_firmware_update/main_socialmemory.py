@@ -10,19 +10,32 @@
 #   task        — stimulus presentations (S1 + S2) with CC during each ITI
 #   passivetest — pseudorandom presentations of all 4 boxes with CC during each ITI
 
+import startup   # first: starts the startup clock
 import time
+import random
 import signal
 import os
 import json
 from datetime import datetime
 
 from serial_comm import DeviceConnection
+from packet_capture import PacketCapture, MARK_SESSION_START, MARK_SESSION_STOP
+from session_catalog import record_session
 from hardware import (
     SharedSensorState, EventLogger, CameraTriggerLogger, STOP_EVENT, shutdown_outputs,
-    turn_table_degrees, apply_motor_speeds,
+    turn_table_degrees, apply_motor_speeds, read_initial_state,
+    SENSOR_LOG_ROTATE_BYTES, SENSOR_LOG_ROTATE_SECONDS,
 )
 from sm_setup_gui import SMSetupDialog
 
+# Imported in the background while the setup dialog is open (startup.py)
+_PREWARM = (
+    "SocialMemory.training",
+    "SocialMemory.task",
+    "SocialMemory.passive_test",
+    "frame_index",
+)
+
 
 def handle_sigint(_sig, _frame):
     STOP_EVENT.set()
@@ -41,7 +54,7 @@ def _save_metadata(save_dir, params):
     print(f"[INFO] Metadata saved: {path}")
 
 
-def _run_loop_training(session, shared, sensor_gui, perf_gui,
+def _run_loop_training(session, shared, sensor_gui, perf_gui, raster_gui=None,
                        session_duration_s=None):
     """Update GUIs every 50 ms while training session runs."""
     start = time.time()
@@ -52,24 +65,121 @@ def _run_loop_training(session, shared, sensor_gui, perf_gui,
             break
         snap = shared.get()
         sensor_gui.update(snap)
+        if raster_gui is not None:
+            raster_gui.update()
         perf_gui.update(session.snapshot(session.results_df))
         time.sleep(0.05)
 
 
-def _run_loop_task(session, shared, sensor_gui, perf_gui):
+def _run_loop_task(session, shared, sensor_gui, perf_gui, raster_gui=None):
     """Update GUIs every 50 ms while task session runs."""
     while session.running and not STOP_EVENT.is_set():
         snap = shared.get()
         sensor_gui.update(snap)
+        if raster_gui is not None:
+            raster_gui.update()
         perf_gui.update(session.snapshot(session.presentations_df),
                          session.snapshot(session.conditioning_df))
         time.sleep(0.05)
 
 
+def build_session(params, device, shared, camera_logger=None, sequence=None):
+    """Construct (but do not start) the session for params["mode"].
+
+    Shared by main() and session_replay.py so a replayed session is built
+    exactly as the recorded one was. For passivetest, `sequence` is the box
+    order already drawn for the GUI; when None it is drawn here from the
+    same seed. Returns None for an unknown mode."""
+    from SocialMemory.training     import ClassicalConditioningSession
+    from SocialMemory.task         import SocialMemoryTaskSession
+    from SocialMemory.passive_test import PassiveTestSession, generate_box_sequence
+
+    mode    = params["mode"]
+    species = params["species"]
+
+    # main() seeds before drawing the passivetest sequence for the GUI, so
+    # only seed here when the sequence hasn't been drawn yet.
+    if sequence is None and params.get("random_seed") is not None:
+        random.seed(params["random_seed"])
+    if mode == "passivetest" and sequence is None:
+        sequence = generate_box_sequence({i: params["box_n"][i] for i in range(4)})
+
+    if mode == "training":
+        session = ClassicalConditioningSession(
+            ser=device,
+            shared=shared,
+            species=species,
+            valve_times=params["valve_times"],
+            ports=params["ports"],
+            led_on_time=params["led_on_time"],
+            iti_min=params["iti_min"],
+            iti_max=params["iti_max"],
+            reward_prob=params["reward_prob"],
+            session_duration=params.get("session_duration"),
+        )
+
+    elif mode == "task":
+        session = SocialMemoryTaskSession(
+            ser=device,
+            shared=shared,
+            species=species,
+            valve_times=params["valve_times"],
+            n_s1=params["s1_n"],
+            s1_duration=params["s1_duration"],
+            s1_angle=params["s1_angle"],
+            s1_iti_min=params["s1_iti_min"],
+            s1_iti_max=params["s1_iti_max"],
+            n_s2=params["s2_n"],
+            s2_duration=params["s2_duration"],
+            s2_angle=params["s2_angle"],
+            s2_iti_min=params["s2_iti_min"],
+            s2_iti_max=params["s2_iti_max"],
+            cc_ports=params["cc_ports"],
+            cc_led_on_time=params["cc_led_on_time"],
+            cc_iti_min=params["cc_iti_min"],
+            cc_iti_max=params["cc_iti_max"],
+            cc_reward_prob=params["cc_reward_prob"],
+            cc_delay=params.get("cc_delay", 0.0),
+            camera_logger=camera_logger,
+        )
+
+    elif mode == "passivetest":
+        session = PassiveTestSession(
+            ser=device,
+            shared=shared,
+            species=species,
+            valve_times=params["valve_times"],
+            box_ids=params["box_ids"],
+            box_n=params["box_n"],
+            presentation_duration=params["presentation_duration"],
+            iti_min=params["iti_min"],
+            iti_max=params["iti_max"],
+            cc_ports=params["cc_ports"],
+            cc_led_on_time=params["cc_led_on_time"],
+            cc_iti_min=params["cc_iti_min"],
+            cc_iti_max=params["cc_iti_max"],
+            cc_reward_prob=params["cc_reward_prob"],
+            cc_delay=params.get("cc_delay", 0.0),
+            sequence=sequence,
+        )
+
+    else:
+        print(f"[ERROR] Unknown mode: {mode}")
+        return None
+
+    session.adaptation.configure(params.get("adaptation"))
+    if params.get("random_seed") is not None:
+        session.schedule = session.make_schedule(params["random_seed"])
+    return session
+
+
 def main():
     # ── Setup GUI ─────────────────────────────────────────────────────────────
+    startup.prewarm(*startup.HEAVY_MODULES, "gui_series", *_PREWARM)
     dialog = SMSetupDialog()
+    startup.mark("dialog")
     params = dialog.run()
+    startup.mark("setup_done")
 
     if params is None:
         print("[INFO] Setup cancelled.")
@@ -82,10 +192,7 @@ def main():
     port      = params["port"]
     baud      = params["baud"]
 
-    from SocialMemory.training     import ClassicalConditioningSession
-    from SocialMemory.task         import SocialMemoryTaskSession
-    from SocialMemory.passive_test import PassiveTestSession, generate_box_sequence, label_sequence
-    from gui_socialmemory           import SensorGUI, PerformanceGUI
+    from SocialMemory.passive_test import generate_box_sequence, label_sequence
 
     # ── Output directory + metadata ───────────────────────────────────────────
     date_str = datetime.now().strftime("%Y-%m-%d")
@@ -97,6 +204,7 @@ def main():
     print(f"[INFO] Saving to: {BASE_SAVE_DIR}")
 
     params["date"]     = date_str
+    params["random_seed"] = random.randrange(2**32)
     params["save_dir"] = BASE_SAVE_DIR
     _save_metadata(BASE_SAVE_DIR, params)
 
@@ -104,12 +212,24 @@ def main():
     perf_fig     = os.path.join(BASE_SAVE_DIR, "performance.png")
 
     # ── Connect to device ─────────────────────────────────────────────────────
+    capture = None
+    if params.get("packet_capture"):
+        capture = PacketCapture(os.path.join(BASE_SAVE_DIR, "packets.bin"))
+
+    device = None
     try:
         device = DeviceConnection(port, baudrate=baud)
+        if capture is not None:
+            capture.attach(device)
         device.connect()
-        time.sleep(2)
+        ready_s = device.wait_ready()
+        print(f"[INFO] Device ready after {ready_s:.2f} s")
     except Exception as e:
         print(f"[ERROR] Cannot open serial port: {e}")
+        if device is not None:
+            device.disconnect()
+        if capture is not None:
+            capture.close()
         return
 
     apply_motor_speeds(
@@ -126,8 +246,33 @@ def main():
         shared,
         event_log_path=sensor_log,
         session_start=session_start,
+        rotate_bytes=SENSOR_LOG_ROTATE_BYTES,
+        rotate_seconds=SENSOR_LOG_ROTATE_SECONDS,
     )
     device.on_event(logger)
+    read_initial_state(device, shared)
+
+    tracer = None
+    if params.get("stage_trace"):
+        from tracing import Tracer
+        tracer = Tracer()
+        tracer.attach(device, shared)
+
+    profiler = None
+    if params.get("cpu_profile"):
+        from thread_profiler import ThreadProfiler
+        profiler = ThreadProfiler()
+        profiler.start()
+
+    dashboard = None
+    if params.get("dashboard"):
+        from dashboard_server import DashboardPublisher, DASHBOARD_URL, rig_name
+        dashboard = DashboardPublisher(
+            DASHBOARD_URL, rig=rig_name(port),
+            info={"task": "SocialMemory", "animal": animal, "session": session_n,
+                  "mode": mode, "species": species},
+        )
+        logger.on_transition(dashboard.transition)
 
     # Camera sync-pulse timestamps (~1 Hz heartbeat from cameracontrol, not a
     # per-frame strobe) — only armed during task-mode passive stimulus
@@ -136,7 +281,6 @@ def main():
     device.on_event(camera_logger)
 
     # ── GUIs ──────────────────────────────────────────────────────────────────
-    sensor_gui = SensorGUI()
     box_labels = None
     expected_periods = None
     passive_sequence = None
@@ -145,101 +289,81 @@ def main():
                              + [f"S2_{i + 1}" for i in range(params["s2_n"])])
     elif mode == "passivetest":
         box_labels = {i: params["box_ids"][i] for i in range(4)}
+        random.seed(params["random_seed"])
         passive_sequence = generate_box_sequence(
             {i: params["box_n"][i] for i in range(4)}
         )
         expected_periods = label_sequence(passive_sequence)
 
-    perf_gui = PerformanceGUI(animal_name=animal, mode=mode,
-                               stim1_id=params.get("s1_id"), stim2_id=params.get("s2_id"),
-                               box_labels=box_labels, expected_periods=expected_periods)
+    perf_kwargs = dict(animal_name=animal, mode=mode,
+                       stim1_id=params.get("s1_id"), stim2_id=params.get("s2_id"),
+                       box_labels=box_labels, expected_periods=expected_periods)
+    raster_start = logger.session_start if params.get("event_raster") else None
+    if params.get("gui_process"):
+        from gui_process import start_gui_process
+        sensor_gui, perf_gui, raster_gui = start_gui_process(
+            "gui_socialmemory", raster_start=raster_start, **perf_kwargs)
+    else:
+        from gui_socialmemory import SensorGUI, PerformanceGUI
+        sensor_gui = SensorGUI()
+        perf_gui = PerformanceGUI(**perf_kwargs)
+        raster_gui = None
+        if raster_start is not None:
+            from event_raster import EventRasterGUI
+            raster_gui = EventRasterGUI(session_start=raster_start)
+    if raster_gui is not None:
+        logger.on_transition(raster_gui.on_transition)
 
     session = None
+    control = None
 
     # ── Run session ───────────────────────────────────────────────────────────
     try:
+        session = build_session(params, device, shared,
+                                camera_logger=camera_logger,
+                                sequence=passive_sequence)
+        if session is None:
+            return
+
+        if params.get("param_control"):
+            from param_store import ControlServer
+            control = ControlServer(session.params).start()
+        if capture is not None:
+            capture.mark(MARK_SESSION_START)
+        session.start()
+        startup.mark("first_trial")
+        startup.save_timings(BASE_SAVE_DIR)
+        if dashboard is not None:
+            if mode == "training":
+                dashboard.watch("trials", lambda: session.snapshot(session.results_df))
+            else:
+                dashboard.watch("presentations",
+                                lambda: session.snapshot(session.presentations_df))
+                dashboard.watch("conditioning",
+                                lambda: session.snapshot(session.conditioning_df))
+            dashboard.start()
         if mode == "training":
-            session = ClassicalConditioningSession(
-                ser=device,
-                shared=shared,
-                species=species,
-                valve_times=params["valve_times"],
-                ports=params["ports"],
-                led_on_time=params["led_on_time"],
-                iti_min=params["iti_min"],
-                iti_max=params["iti_max"],
-                reward_prob=params["reward_prob"],
-                session_duration=params.get("session_duration"),
-            )
-            session.start()
             print(f"[INFO] Training started on ports {params['ports']} — "
                   f"Ctrl+C to stop")
             _run_loop_training(
-                session, shared, sensor_gui, perf_gui,
+                session, shared, sensor_gui, perf_gui, raster_gui,
                 session_duration_s=params.get("session_duration"),
             )
-
-        elif mode == "task":
-            session = SocialMemoryTaskSession(
-                ser=device,
-                shared=shared,
-                species=species,
-                valve_times=params["valve_times"],
-                n_s1=params["s1_n"],
-                s1_duration=params["s1_duration"],
-                s1_angle=params["s1_angle"],
-                s1_iti_min=params["s1_iti_min"],
-                s1_iti_max=params["s1_iti_max"],
-                n_s2=params["s2_n"],
-                s2_duration=params["s2_duration"],
-                s2_angle=params["s2_angle"],
-                s2_iti_min=params["s2_iti_min"],
-                s2_iti_max=params["s2_iti_max"],
-                cc_ports=params["cc_ports"],
-                cc_led_on_time=params["cc_led_on_time"],
-                cc_iti_min=params["cc_iti_min"],
-                cc_iti_max=params["cc_iti_max"],
-                cc_reward_prob=params["cc_reward_prob"],
-                cc_delay=params.get("cc_delay", 0.0),
-                camera_logger=camera_logger,
-            )
-            session.start()
-            print("[INFO] Task started — Ctrl+C to stop")
-            _run_loop_task(session, shared, sensor_gui, perf_gui)
-
-        elif mode == "passivetest":
-            session = PassiveTestSession(
-                ser=device,
-                shared=shared,
-                species=species,
-                valve_times=params["valve_times"],
-                box_ids=params["box_ids"],
-                box_n=params["box_n"],
-                presentation_duration=params["presentation_duration"],
-                iti_min=params["iti_min"],
-                iti_max=params["iti_max"],
-                cc_ports=params["cc_ports"],
-                cc_led_on_time=params["cc_led_on_time"],
-                cc_iti_min=params["cc_iti_min"],
-                cc_iti_max=params["cc_iti_max"],
-                cc_reward_prob=params["cc_reward_prob"],
-                cc_delay=params.get("cc_delay", 0.0),
-                sequence=passive_sequence,
-            )
-            session.start()
-            print("[INFO] Passive test started — Ctrl+C to stop")
-            _run_loop_task(session, shared, sensor_gui, perf_gui)
-
         else:
-            print(f"[ERROR] Unknown mode: {mode}")
+            print(f"[INFO] {'Task' if mode == 'task' else 'Passive test'} started "
+                  f"— Ctrl+C to stop")
+            _run_loop_task(session, shared, sensor_gui, perf_gui, raster_gui)
 
     finally:
         print("[INFO] Shutting down...")
         STOP_EVENT.set()
+        if capture is not None:
+            capture.mark(MARK_SESSION_STOP)
+        if control is not None:
+            control.close()
 
         if session is not None:
             session.stop_internal()
-
             if mode == "training":
                 csv_path = os.path.join(BASE_SAVE_DIR, "trials.csv")
                 session.results_df.to_csv(csv_path, index=False)
@@ -250,19 +374,40 @@ def main():
             elif mode in ("task", "passivetest"):
                 pres_path = os.path.join(BASE_SAVE_DIR, "presentations.csv")
                 cc_path   = os.path.join(BASE_SAVE_DIR, "conditioning_trials.csv")
-            elif mode == "task":
-                pres_path   = os.path.join(BASE_SAVE_DIR, "presentations.csv")
-                cc_path     = os.path.join(BASE_SAVE_DIR, "conditioning_trials.csv")
-                camera_path = os.path.join(BASE_SAVE_DIR, "camera_sync.csv")
                 session.presentations_df.to_csv(pres_path, index=False)
                 session.conditioning_df.to_csv(cc_path, index=False)
-                session.camera_sync_df.to_csv(camera_path, index=False)
                 print(f"[INFO] Presentations saved: {pres_path}")
                 print(f"[INFO] Conditioning trials saved: {cc_path}")
-                print(f"[INFO] Camera sync-pulse timestamps saved: {camera_path}")
+                if mode == "task":
+                    camera_path = os.path.join(BASE_SAVE_DIR, "camera_sync.csv")
+                    session.camera_sync_df.to_csv(camera_path, index=False)
+                    print(f"[INFO] Camera sync-pulse timestamps saved: {camera_path}")
                 perf_gui.update(session.snapshot(session.presentations_df),
                                  session.snapshot(session.conditioning_df))
 
+            # Session data is written first; a failure below must not cost it
+            for what, part in (("Trial schedule", session.schedule),
+                               ("Adaptation log", session.adaptation),
+                               ("Parameter changes", session.params)):
+                if part is None:
+                    continue
+                try:
+                    part.save(BASE_SAVE_DIR)
+                except Exception as e:
+                    print(f"[WARN] {what} not saved: {e}")
+
+        # Frame ↔ time index from the full camera sync-pulse train
+        pulses = camera_logger.all_pulses()
+        if len(pulses) >= 2:
+            try:
+                from frame_index import FrameTimeIndex
+                index = FrameTimeIndex.from_pulses(pulses, session_start=session_start)
+                index_path = os.path.join(BASE_SAVE_DIR, "frame_index.npz")
+                index.save(index_path)
+                print(f"[INFO] Frame index saved: {index_path} — {index.summary()}")
+            except Exception as e:
+                print(f"[WARN] Frame index failed: {e}")
+
         # Return turntable to home after task/passivetest (both use the turntable)
         if mode in ("task", "passivetest") and session is not None:
             try:
@@ -292,8 +437,21 @@ def main():
         sensor_gui.update(shared.get())
         shutdown_outputs(device)
         device.disconnect()
+        logger.close()
+        if dashboard is not None:
+            dashboard.close()
+        if capture is not None:
+            capture.close()
+        if raster_gui is not None:
+            raster_gui.close(save_path=os.path.join(BASE_SAVE_DIR, "event_raster.png"))
         perf_gui.close(save_path=perf_fig)
         sensor_gui.close()
+        if tracer is not None:
+            tracer.save(BASE_SAVE_DIR)
+        if profiler is not None:
+            profiler.stop()
+            profiler.save(BASE_SAVE_DIR)
+        record_session(BASE_SAVE_DIR)
         print("[INFO] Clean shutdown complete")
 
 
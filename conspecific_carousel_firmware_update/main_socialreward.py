@@ -13,19 +13,34 @@
 #   4    — port A LED → poke → door opens → sensory minimum → port C within decision window
 #   task — full social-reward task (rewarded / unrewarded table positions)
 
+import startup   # first: starts the startup clock
 import time
+import random
 import signal
 import os
 import json
 from datetime import datetime
 
 from serial_comm import DeviceConnection
+from packet_capture import PacketCapture, MARK_SESSION_START, MARK_SESSION_STOP
+from session_catalog import record_session
 from hardware import (
     SharedSensorState, EventLogger, STOP_EVENT, shutdown_outputs,
-    turn_table_degrees, apply_motor_speeds,
+    turn_table_degrees, apply_motor_speeds, read_initial_state,
+    SENSOR_LOG_ROTATE_BYTES, SENSOR_LOG_ROTATE_SECONDS,
 )
 from setup_gui import SetupDialog
 
+# Imported in the background while the setup dialog is open (startup.py)
+_PREWARM = (
+    "SocialReward.Phase1",
+    "SocialReward.Phase2",
+    "SocialReward.Phase3",
+    "SocialReward.Phase4",
+    "SocialReward.Task",
+    "SocialReward.Phase4Stimuli",
+)
+
 
 def handle_sigint(_sig, _frame):
     STOP_EVENT.set()
@@ -35,17 +50,6 @@ def handle_sigint(_sig, _frame):
 signal.signal(signal.SIGINT, handle_sigint)
 
 
-def _build_gradual_hold(thresholds, holds):
-    """Return a callable that maps trial count → sensory minimum for phase 3b."""
-    def gradual_hold(session):
-        trial = session.trial_counter
-        for threshold, hold in zip(thresholds, holds[:-1]):
-            if trial < threshold:
-                return hold
-        return holds[-1]
-    return gradual_hold
-
-
 def _save_metadata(save_dir, params):
     meta = dict(params)
     meta["timestamp"] = datetime.now().isoformat()
@@ -55,21 +59,135 @@ def _save_metadata(save_dir, params):
     print(f"[INFO] Metadata saved: {path}")
 
 
-def _run_loop(session, shared, sensor_gui, perf_gui):
+def _run_loop(session, shared, sensor_gui, perf_gui, raster_gui=None):
     """Poll GUIs while the session runs. Trial/time limits are enforced inside the session."""
     while session.running and not STOP_EVENT.is_set():
         snap = shared.get()
         sensor_gui.update(snap)
+        if raster_gui is not None:
+            raster_gui.update()
         planned = getattr(session, "planned_sequence", None)
         perf_gui.update(session.results_df, current_trial_port="C",
                         planned_sequence=planned)
         time.sleep(0.05)
 
 
+def build_session(params, device, shared):
+    """Construct (but do not start) the session for params["phase"].
+
+    Shared by main() and session_replay.py so a replayed session is built
+    exactly as the recorded one was. Returns None for an unknown phase or
+    a missing 4stimuli config."""
+    from SocialReward.Phase1 import Phase1Session
+    from SocialReward.Phase2 import Phase2Session
+    from SocialReward.Phase3 import Phase3Session
+    from SocialReward.Phase4 import Phase4Session
+    from SocialReward.Task import SocialTaskSession
+    from adaptation import TrialSteps
+
+    if params.get("random_seed") is not None:
+        random.seed(params["random_seed"])
+
+    species = params["species"]
+    phase = params["phase"]
+    valve_time = params["valve_time"]
+    session_duration_s = params["session_duration_s"]        # may be None
+    session_duration_trials = params["session_duration_trials"]  # may be None
+    sensory_minimum_simple = params.get("sensory_minimum", 0.100)  # phases 2 and 3a
+
+    if phase == "1":
+        session = Phase1Session(
+            device,
+            shared,
+            species=species,
+            valve_time=valve_time,
+            session_duration=session_duration_s,
+        )
+
+    elif phase == "2":
+        session = Phase2Session(
+            device,
+            shared,
+            species=species,
+            sensory_minimum=sensory_minimum_simple,
+            valve_time=valve_time,
+            session_duration=session_duration_s,
+        )
+
+    elif phase in ("3a", "3b"):
+        session = Phase3Session(
+            device,
+            shared,
+            species=species,
+            sensory_minimum=(params["phase3b_holds"][0] if phase == "3b"
+                             else sensory_minimum_simple),
+            valve_time=valve_time,
+            session_duration=session_duration_s,
+        )
+        if phase == "3b":
+            # Hold steps up with the trial count
+            session.adaptation.add(TrialSteps(
+                "sensory_minimum", params["phase3b_thresholds"], params["phase3b_holds"]))
+
+    elif phase == "4":
+        session = Phase4Session(
+            device,
+            shared,
+            species=species,
+            sensory_minimum=params["phase4_sensory_min"],
+            decision_window=params["phase4_decision_window"],
+            valve_time=valve_time,
+            session_duration=session_duration_s,
+        )
+
+    elif phase == "task":
+        session = SocialTaskSession(
+            device,
+            shared,
+            species=species,
+            valve_time=valve_time,
+            sensory_minimum=params["task_sensory_min"],
+            decision_window=params["task_decision_window"],
+            rewarded_angle=params["task_rewarded_angle"],
+            unrewarded_angle=params["task_unrewarded_angle"],
+            session_duration=session_duration_s,
+        )
+
+    elif phase == "4stimuli":
+        stim4_config = params.get("stim4_config")
+        if stim4_config is None:
+            print("[ERROR] 4stimuli config missing — check setup GUI.")
+            return None
+        from SocialReward.Phase4Stimuli import Phase4StimuliSession
+        session = Phase4StimuliSession(
+            device,
+            shared,
+            species=species,
+            valve_time=valve_time,
+            box_config=stim4_config["box_config"],
+            sensory_minimum=stim4_config["sensory_min"],
+            decision_window=stim4_config["decision_win"],
+            session_duration=session_duration_s,
+        )
+
+    else:
+        print(f"[ERROR] Unknown phase: {phase}")
+        return None
+
+    session.adaptation.configure(params.get("adaptation"))
+    session.max_trials = session_duration_trials
+    if params.get("random_seed") is not None:
+        session.schedule = session.make_schedule(params["random_seed"])
+    return session
+
+
 def main():
     # ── Setup GUI ─────────────────────────────────────────────────────────────
+    startup.prewarm(*startup.HEAVY_MODULES, "gui_series", *_PREWARM)
     dialog = SetupDialog()
+    startup.mark("dialog")
     params = dialog.run()
+    startup.mark("setup_done")
 
     if params is None:
         print("[INFO] Setup cancelled.")
@@ -81,19 +199,8 @@ def main():
     phase = params["phase"]
     port = params["port"]
     baud = params["baud"]
-    valve_time = params["valve_time"]
-    session_duration_s = params["session_duration_s"]        # may be None
-    session_duration_trials = params["session_duration_trials"]  # may be None
-    sensory_minimum_simple = params.get("sensory_minimum", 0.100)  # phases 2 and 3a
-    phase4_sensory_min = params["phase4_sensory_min"]
-    phase4_decision_window = params["phase4_decision_window"]
-    task_sensory_min      = params["task_sensory_min"]
-    task_decision_window  = params["task_decision_window"]
-    task_rewarded_angle   = params["task_rewarded_angle"]
-    task_unrewarded_angle = params["task_unrewarded_angle"]
-    stim4_config          = params.get("stim4_config")
-    phase3b_thresholds = params["phase3b_thresholds"]
-    phase3b_holds = params["phase3b_holds"]
+    task_rewarded_angle = params["task_rewarded_angle"]
+    stim4_config = params.get("stim4_config")
 
     # ── Output directory + metadata ───────────────────────────────────────────
     date_str = datetime.now().strftime("%Y-%m-%d")
@@ -105,6 +212,7 @@ def main():
     print(f"[INFO] Saving all files to: {BASE_SAVE_DIR}")
 
     params["date"] = date_str
+    params["random_seed"] = random.randrange(2**32)
     params["save_dir"] = BASE_SAVE_DIR
     _save_metadata(BASE_SAVE_DIR, params)
 
@@ -112,21 +220,23 @@ def main():
     sensor_log = os.path.join(BASE_SAVE_DIR, "sensor_events.csv")
     perf_fig_path = os.path.join(BASE_SAVE_DIR, "performance.png")
 
-    # ── Imports ───────────────────────────────────────────────────────────────
-    from SocialReward.Phase1 import Phase1Session
-    from SocialReward.Phase2 import Phase2Session
-    from SocialReward.Phase3 import Phase3Session
-    from SocialReward.Phase4 import Phase4Session
-    from SocialReward.Task import SocialTaskSession
-    from gui_socialreward import SensorGUI, PerformanceGUI
-
     # ── Connect to device ─────────────────────────────────────────────────────
+    capture = None
+    if params.get("packet_capture"):
+        capture = PacketCapture(os.path.join(BASE_SAVE_DIR, "packets.bin"))
+
+    device = None
     try:
         device = DeviceConnection(port, baudrate=baud)
+        if capture is not None:
+            capture.attach(device)
         device.connect()
-        time.sleep(2)
+        ready_s = device.wait_ready()
+        print(f"[INFO] Device ready after {ready_s:.2f} s")
     except Exception as e:
         print(f"Cannot open serial port: {e}")
+        if capture is not None:
+            capture.close()
         return
 
     apply_motor_speeds(
@@ -144,134 +254,108 @@ def main():
         shared,
         event_log_path=sensor_log,
         session_start=session_start,
+        rotate_bytes=SENSOR_LOG_ROTATE_BYTES,
+        rotate_seconds=SENSOR_LOG_ROTATE_SECONDS,
     )
     device.on_event(logger)
+    read_initial_state(device, shared)
+
+    tracer = None
+    if params.get("stage_trace"):
+        from tracing import Tracer
+        tracer = Tracer()
+        tracer.attach(device, shared)
+
+    profiler = None
+    if params.get("cpu_profile"):
+        from thread_profiler import ThreadProfiler
+        profiler = ThreadProfiler()
+        profiler.start()
+
+    dashboard = None
+    if params.get("dashboard"):
+        from dashboard_server import DashboardPublisher, DASHBOARD_URL, rig_name
+        dashboard = DashboardPublisher(
+            DASHBOARD_URL, rig=rig_name(port),
+            info={"task": "SocialReward", "animal": animal, "session": session_n,
+                  "phase": phase, "species": species},
+        )
+        logger.on_transition(dashboard.transition)
 
     # ── GUIs ──────────────────────────────────────────────────────────────────
-    sensor_gui = SensorGUI()
-    perf_gui = PerformanceGUI(animal_name=animal, phase_selection=phase)
+    raster_start = logger.session_start if params.get("event_raster") else None
+    if params.get("gui_process"):
+        from gui_process import start_gui_process
+        sensor_gui, perf_gui, raster_gui = start_gui_process(
+            "gui_socialreward", raster_start=raster_start,
+            animal_name=animal, phase_selection=phase)
+    else:
+        from gui_socialreward import SensorGUI, PerformanceGUI
+        sensor_gui = SensorGUI()
+        perf_gui = PerformanceGUI(animal_name=animal, phase_selection=phase)
+        raster_gui = None
+        if raster_start is not None:
+            from event_raster import EventRasterGUI
+            raster_gui = EventRasterGUI(session_start=raster_start)
+    if raster_gui is not None:
+        logger.on_transition(raster_gui.on_transition)
 
     session = None
+    control = None
 
     # ── Run trials ────────────────────────────────────────────────────────────
     try:
-        if phase == "1":
-            session = Phase1Session(
-                device,
-                shared,
-                species=species,
-                valve_time=valve_time,
-                session_duration=session_duration_s,
-            )
-            session.max_trials = session_duration_trials
-            session.start()
-            print("[INFO] Phase 1 running — press Ctrl+C to stop")
-            _run_loop(session, shared, sensor_gui, perf_gui)
-            print("[INFO] Phase 1 session finished")
-
-        elif phase == "2":
-            session = Phase2Session(
-                device,
-                shared,
-                species=species,
-                sensory_minimum=sensory_minimum_simple,
-                valve_time=valve_time,
-                session_duration=session_duration_s,
-            )
-            session.max_trials = session_duration_trials
-            print("[INFO] Phase 2 running — press Ctrl+C to stop")
-            session.start()
-            _run_loop(session, shared, sensor_gui, perf_gui)
-
-        elif phase in ("3a", "3b"):
-            sensory_minimum = (
-                _build_gradual_hold(phase3b_thresholds, phase3b_holds)
-                if phase == "3b"
-                else sensory_minimum_simple
-            )
-            session = Phase3Session(
-                device,
-                shared,
-                species=species,
-                sensory_minimum=sensory_minimum,
-                valve_time=valve_time,
-                session_duration=session_duration_s,
-            )
-            session.max_trials = session_duration_trials
-            print(f"[INFO] Phase {phase} running — press Ctrl+C to stop")
-            session.start()
-            _run_loop(session, shared, sensor_gui, perf_gui)
-
-        elif phase == "4":
-            session = Phase4Session(
-                device,
-                shared,
-                species=species,
-                sensory_minimum=phase4_sensory_min,
-                decision_window=phase4_decision_window,
-                valve_time=valve_time,
-                session_duration=session_duration_s,
-            )
-            session.max_trials = session_duration_trials
-            print("[INFO] Phase 4 running — press Ctrl+C to stop")
-            session.start()
-            _run_loop(session, shared, sensor_gui, perf_gui)
-
-        elif phase == "task":
-            session = SocialTaskSession(
-                device,
-                shared,
-                species=species,
-                valve_time=valve_time,
-                sensory_minimum=task_sensory_min,
-                decision_window=task_decision_window,
-                rewarded_angle=task_rewarded_angle,
-                unrewarded_angle=task_unrewarded_angle,
-                session_duration=session_duration_s,
-            )
-            session.max_trials = session_duration_trials
-            session.start()
+        session = build_session(params, device, shared)
+        if session is None:
+            return
+
+        if params.get("param_control"):
+            from param_store import ControlServer
+            control = ControlServer(session.params).start()
+        if capture is not None:
+            capture.mark(MARK_SESSION_START)
+        session.start()
+        startup.mark("first_trial")
+        startup.save_timings(BASE_SAVE_DIR)
+        if dashboard is not None:
+            dashboard.watch("trials", lambda: session.results_df)
+            dashboard.start()
+        print(f"[INFO] Phase {phase} running — press Ctrl+C to stop")
+        if phase == "task":
             # Wait briefly for _run_session to pre-generate planned_sequence
             time.sleep(0.1)
             perf_gui.draw_plan(session.planned_sequence,
                                rewarded_angle=task_rewarded_angle)
-            _run_loop(session, shared, sensor_gui, perf_gui)
-
         elif phase == "4stimuli":
-            if stim4_config is None:
-                print("[ERROR] 4stimuli config missing — check setup GUI.")
-                return
-            from SocialReward.Phase4Stimuli import Phase4StimuliSession
-            session = Phase4StimuliSession(
-                device,
-                shared,
-                species=species,
-                valve_time=valve_time,
-                box_config=stim4_config["box_config"],
-                sensory_minimum=stim4_config["sensory_min"],
-                decision_window=stim4_config["decision_win"],
-                session_duration=session_duration_s,
-            )
-            session.max_trials = session_duration_trials
-            session.start()
             time.sleep(0.1)
             # Build rewarded_angle from the first rewarded box for label colouring
             rewarded_boxes = [b for b, cfg in stim4_config["box_config"].items()
                               if cfg["rewarded"]]
             rewarded_angle = rewarded_boxes[0] * 90 if rewarded_boxes else None
             perf_gui.draw_plan(session.planned_sequence, rewarded_angle=rewarded_angle)
-            _run_loop(session, shared, sensor_gui, perf_gui)
-
-        else:
-            print(f"[ERROR] Unknown phase: {phase}")
+        _run_loop(session, shared, sensor_gui, perf_gui, raster_gui)
 
     finally:
         print("Shutting down...")
         STOP_EVENT.set()
+        if capture is not None:
+            capture.mark(MARK_SESSION_STOP)
+        if control is not None:
+            control.close()
         if session is not None:
             session.stop()
             session.results_df.to_csv(trial_csv, index=False)
             print(f"[INFO] Trials saved: {trial_csv}")
+            # Trial data is written first; a failure below must not cost it
+            for what, part in (("Trial schedule", session.schedule),
+                               ("Adaptation log", session.adaptation),
+                               ("Parameter changes", session.params)):
+                if part is None:
+                    continue
+                try:
+                    part.save(BASE_SAVE_DIR)
+                except Exception as e:
+                    print(f"[WARN] {what} not saved: {e}")
 
         # Return turntable to box 0 (home) before powering down.
         # Raw polling loops are used throughout so STOP_EVENT doesn't abort the moves.
@@ -305,8 +389,21 @@ def main():
 
         shutdown_outputs(device)
         device.disconnect()
+        logger.close()
+        if dashboard is not None:
+            dashboard.close()
+        if capture is not None:
+            capture.close()
+        if raster_gui is not None:
+            raster_gui.close(save_path=os.path.join(BASE_SAVE_DIR, "event_raster.png"))
         perf_gui.close(save_path=perf_fig_path)
         sensor_gui.close()
+        if tracer is not None:
+            tracer.save(BASE_SAVE_DIR)
+        if profiler is not None:
+            profiler.stop()
+            profiler.save(BASE_SAVE_DIR)
+        record_session(BASE_SAVE_DIR)
         print("[INFO] Clean shutdown complete")
 
 
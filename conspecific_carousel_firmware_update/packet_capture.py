@@ -0,0 +1,177 @@
+# packet_capture.py — raw TX/RX packet capture for a DeviceConnection
+#
+# Records every packet that crosses the serial link — commands we transmit,
+# ACKs and unsolicited events the firmware sends back — with a capture
+# timestamp and direction, into a compact binary file in the session folder.
+#
+# File layout (little-endian):
+#   header  : MAGIC (8 bytes) + wall-clock anchor (float64, time.time())
+#   records : RECORD_FORMAT, one per packet
+#               t          float64  seconds since the anchor (perf_counter based)
+#               direction  uint8    DIR_TX / DIR_ACK / DIR_EVENT / DIR_MARK
+#               register   uint8    (for DIR_MARK: MARK_SESSION_START / MARK_SESSION_STOP)
+#               msg_type   uint8    as on the wire (MSG_WRITE / MSG_READ / MSG_ACK / MSG_EVENT)
+#               value      uint8
+#
+# Absolute time of a record is anchor + t, on the same clock as the
+# time.time() stamps in sensor_events.csv and the trial CSVs.
+#
+# Usage in main script:
+#   capture = PacketCapture(os.path.join(BASE_SAVE_DIR, "packets.bin"))
+#   capture.attach(device)       # before device.connect()
+#   ...
+#   device.disconnect()
+#   capture.close()
+#
+# Reading back:
+#   for rec in read_capture(path):
+#       print(rec.t_wall, rec.direction, rec.register, rec.value)
+
+import collections
+import struct
+import threading
+import time
+from typing import Iterator, NamedTuple
+
+from protocol import MSG_ACK, MSG_EVENT
+
+MAGIC = b"CCPKT01\0"
+HEADER_FORMAT = "<8sd"
+RECORD_FORMAT = "<dBBBB"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+
+DIR_TX = 0
+DIR_ACK = 1
+DIR_EVENT = 2
+DIR_MARK = 3      # not a packet — a session milestone written by the main script
+
+DIRECTION_NAMES = {DIR_TX: "tx", DIR_ACK: "ack", DIR_EVENT: "event", DIR_MARK: "mark"}
+
+MARK_SESSION_START = 1   # immediately before session.start()
+MARK_SESSION_STOP = 2    # when STOP_EVENT is set at shutdown
+
+
+class PacketRecord(NamedTuple):
+    t: float          # seconds since capture start
+    t_wall: float     # absolute time.time() equivalent
+    direction: int
+    register: int
+    msg_type: int
+    value: int
+
+
+class PacketCapture:
+    """
+    Opt-in recorder for DeviceConnection traffic.
+
+    The TX/ACK/event callbacks only append a tuple to a deque (no lock, no
+    disk I/O), so the cost on DeviceConnection's reader thread is a
+    perf_counter() call and an append. A background writer thread packs the
+    buffered records and flushes them to disk every flush_interval seconds.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 0.5):
+        self.path = path
+        self._flush_interval = flush_interval
+        self._buf = collections.deque()
+        self._pack = struct.Struct(RECORD_FORMAT).pack
+        self._t0 = time.perf_counter()
+        self._wall0 = time.time()
+        self._count = 0
+
+        self._file = open(path, "wb")
+        self._file.write(struct.pack(HEADER_FORMAT, MAGIC, self._wall0))
+        self._file.flush()
+
+        self._stop = threading.Event()
+        self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer.start()
+
+    @property
+    def count(self) -> int:
+        """Number of records written to disk so far."""
+        return self._count
+
+    # ── Registration ──────────────────────────────────────────────────────────
+
+    def attach(self, device) -> None:
+        """Register TX/ACK/event hooks on a DeviceConnection.
+
+        Call before any other on_event() registration (and before connect())
+        so the capture timestamp is taken as early as possible in the
+        reader thread's dispatch."""
+        device.on_tx(self.on_tx)
+        device.on_ack(self.on_ack)
+        device.on_event(self.on_event)
+
+    # ── Callbacks (called from the session / reader threads) ─────────────────
+
+    def on_tx(self, register: int, msg_type: int, value: int) -> None:
+        self._buf.append((time.perf_counter(), DIR_TX, register, msg_type, value))
+
+    def on_ack(self, register: int, value: int) -> None:
+        self._buf.append((time.perf_counter(), DIR_ACK, register, MSG_ACK, value))
+
+    def on_event(self, register: int, value: int) -> None:
+        self._buf.append((time.perf_counter(), DIR_EVENT, register, MSG_EVENT, value))
+
+    def mark(self, code: int) -> None:
+        """Record a session milestone (MARK_SESSION_START / MARK_SESSION_STOP)
+        on the same clock as the packets, so session_replay.py knows exactly
+        where the recorded session started and stopped."""
+        self._buf.append((time.perf_counter(), DIR_MARK, code, 0, 0))
+
+    # ── Writer ────────────────────────────────────────────────────────────────
+
+    def _drain(self) -> None:
+        buf = self._buf
+        pack = self._pack
+        t0 = self._t0
+        chunks = []
+        while buf:
+            t, direction, register, msg_type, value = buf.popleft()
+            chunks.append(pack(t - t0, direction, register & 0xFF,
+                               msg_type & 0xFF, value & 0xFF))
+        if chunks:
+            self._file.write(b"".join(chunks))
+            self._file.flush()
+            self._count += len(chunks)
+
+    def _writer_loop(self) -> None:
+        while not self._stop.wait(self._flush_interval):
+            try:
+                self._drain()
+            except (OSError, ValueError) as e:
+                print(f"[WARN] Packet capture write failed: {e}")
+                return
+
+    def close(self) -> None:
+        """Stop the writer thread, flush any buffered records and close the file."""
+        if self._file.closed:
+            return
+        self._stop.set()
+        self._writer.join(timeout=2.0)
+        self._drain()
+        self._file.close()
+        print(f"[INFO] Packet capture saved: {self.path} ({self._count} packets)")
+
+
+def read_capture(path: str) -> Iterator[PacketRecord]:
+    """Yield PacketRecords from a capture file written by PacketCapture.
+
+    A truncated trailing record (e.g. from a crash mid-write) is ignored."""
+    unpack = struct.Struct(RECORD_FORMAT).unpack
+    with open(path, "rb") as f:
+        header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            raise ValueError(f"{path} is not a packet capture (file too short)")
+        magic, wall0 = struct.unpack(HEADER_FORMAT, header)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a packet capture (bad header)")
+        while True:
+            raw = f.read(RECORD_SIZE)
+            if len(raw) < RECORD_SIZE:
+                return
+            t, direction, register, msg_type, value = unpack(raw)
+            yield PacketRecord(t, wall0 + t, direction, register, msg_type, value)
@@ -0,0 +1,277 @@
+# param_store.py — Hot parameter updates for a running session
+#
+# Each session owns a ParamStore (session.params). Changes requested from any
+# thread are queued under a lock and applied by the session thread at the next
+# trial boundary, so a trial never runs with half-updated settings:
+#
+#   session.params.request({"valve_time": 0.12, "iti_max": 12}, source="cli")
+#   ...                                  # session thread, before trial N:
+#   session.params.apply_pending()       # valve_time 0.1 → 0.12, iti_max ...
+#
+# Applied changes are printed, written into the results row of the first
+# trial that ran with them (column "param_changes", e.g.
+# "valve_time 0.1→0.12; iti_max 15→12") and saved as param_changes.csv.
+#
+# Tunable names map to session attributes (TUNABLE); only the ones the
+# session has are offered. Dict attributes take one key at a time
+# ("valve_times.A" for Social Memory). A parameter an adaptation rule drives
+# can still be set, but the rule keeps driving it.
+#
+# Control channel — opt in with the "param_control" option; the session then
+# listens on 127.0.0.1 (PARAM_PORT, or the next free port) for one-line
+# commands:
+#   get                          → {"valve_time": 0.1, "iti_min": 5.0, ...}
+#   set valve_time=0.12 iti_max=12
+#   log                          → changes applied so far
+# From another terminal on the rig PC:
+#   python param_store.py set valve_time=0.12 [--port 8770]
+
+import argparse
+import csv
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+PARAM_PORT = int(os.environ.get("CAROUSEL_PARAM_PORT", "8770"))
+PORT_TRIES = 20              # PARAM_PORT … PARAM_PORT + 19 (several rigs on one PC)
+
+# control name → session attribute
+TUNABLE = {
+    "valve_time":      "valve_time",
+    "valve_times":     "valve_times",
+    "iti_min":         "ITI_MIN",
+    "iti_max":         "ITI_MAX",
+    "decision_window": "decision_window",
+    "sensory_minimum": "sensory_minimum",
+    "reward_prob":     "reward_prob",
+    "led_on_time":     "led_on_time",
+}
+
+
+def _fmt(value) -> str:
+    return f"{value:g}" if isinstance(value, float) else str(value)
+
+
+class ParamStore:
+    """Thread-safe queue of parameter changes for one session."""
+
+    def __init__(self, session):
+        self.session = session
+        self.log: List[dict] = []
+        self._pending: Dict[str, Tuple[float, str]] = {}   # name → (value, source)
+        self._unlogged: List[str] = []                      # changes not yet in a row
+        self._lock = threading.Lock()
+
+    # ── Names ─────────────────────────────────────────────────────────────────
+
+    def _resolve(self, name: str) -> Tuple[str, Optional[str]]:
+        """name → (attribute, dict key or None); KeyError if not tunable here."""
+        base, _, key = name.partition(".")
+        attr = TUNABLE.get(base)
+        if attr is None or not hasattr(self.session, attr):
+            raise KeyError(f"'{name}' is not tunable in this session "
+                           f"(tunable: {', '.join(self.names())})")
+        current = getattr(self.session, attr)
+        if isinstance(current, dict):
+            if key not in current:
+                raise KeyError(f"'{name}': use {base}.<key>, key one of {', '.join(map(str, current))}")
+            return attr, key
+        if key:
+            raise KeyError(f"'{name}': {base} has no keys")
+        return attr, None
+
+    def names(self) -> List[str]:
+        out = []
+        for name, attr in TUNABLE.items():
+            current = getattr(self.session, attr, None)
+            if isinstance(current, dict):
+                out.extend(f"{name}.{key}" for key in current)
+            elif isinstance(current, (int, float)) and not isinstance(current, bool):
+                out.append(name)
+        return out
+
+    def _get(self, name: str):
+        attr, key = self._resolve(name)
+        value = getattr(self.session, attr)
+        return value[key] if key is not None else value
+
+    def values(self) -> Dict[str, float]:
+        return {name: self._get(name) for name in self.names()}
+
+    # ── Requests (any thread) ─────────────────────────────────────────────────
+
+    def request(self, changes: Dict[str, object], source: str = "control") -> str:
+        """Queue changes for the next trial boundary. Raises ValueError /
+        KeyError (nothing queued) if any change is invalid."""
+        parsed = {}
+        for name, value in changes.items():
+            current = self._get(name)
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{name}: '{value}' is not a number") from None
+            if value < 0:
+                raise ValueError(f"{name}: must be ≥ 0")
+            if name == "reward_prob" and value > 1:
+                raise ValueError("reward_prob: must be ≤ 1")
+            parsed[name] = int(value) if isinstance(current, int) and value.is_integer() else value
+        with self._lock:
+            if "iti_min" in parsed or "iti_max" in parsed:
+                # Check the range the next trial will actually run with
+                lo, hi = (parsed.get(n, self._pending.get(n, (self._get(n),))[0])
+                          for n in ("iti_min", "iti_max"))
+                if lo > hi:
+                    raise ValueError(f"iti_min ({_fmt(lo)}) > iti_max ({_fmt(hi)})")
+            for name, value in parsed.items():
+                self._pending[name] = (value, source)
+        driven = [n for n in parsed if self._driven(n)]
+        note = f" ({', '.join(driven)} also driven by an adaptation rule)" if driven else ""
+        return f"queued for trial {self.session.trial_counter + 1}{note}"
+
+    def _driven(self, name: str) -> bool:
+        adaptation = getattr(self.session, "adaptation", None)
+        attr, _ = self._resolve(name)
+        return adaptation is not None and adaptation.rule(attr) is not None
+
+    # ── Trial boundary (session thread) ───────────────────────────────────────
+
+    def apply_pending(self) -> None:
+        """Apply queued changes; called before each trial."""
+        if not self._pending:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        trial = self.session.trial_counter
+        for name, (value, source) in pending.items():
+            attr, key = self._resolve(name)
+            old = self._get(name)
+            if key is not None:
+                getattr(self.session, attr)[key] = value
+            else:
+                setattr(self.session, attr, value)
+            self.log.append({"trial_num": trial, "param": name, "old": old, "new": value,
+                             "source": source, "time": time.time()})
+            self._unlogged.append(f"{name} {_fmt(old)}→{_fmt(value)}")
+            print(f"[INFO] Trial {trial}: {name} {_fmt(old)} → {_fmt(value)} ({source})")
+
+    def annotate(self) -> None:
+        """Write changes applied since the last annotation into the newest
+        results row (column param_changes); called after each trial."""
+        if not self._unlogged:
+            return
+        df = getattr(self.session, "results_df", None)
+        if df is None:
+            return
+        lock = getattr(self.session, "_df_lock", None) or threading.Lock()
+        with lock:
+            if df.empty or df["trial_num"].iloc[-1] < self.log[-1]["trial_num"]:
+                return          # trial aborted before its row: next row gets them
+            if "param_changes" not in df.columns:
+                df["param_changes"] = ""
+            df.at[df.index[-1], "param_changes"] = "; ".join(self._unlogged)
+        self._unlogged = []
+
+    def save(self, save_dir: str) -> Optional[str]:
+        """Write param_changes.csv (nothing when no parameter changed)."""
+        if not self.log:
+            return None
+        path = os.path.join(save_dir, "param_changes.csv")
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(self.log[0]))
+            writer.writeheader()
+            writer.writerows(self.log)
+        print(f"[INFO] Parameter changes saved: {path} ({len(self.log)} changes)")
+        return path
+
+
+# ── Control channel ───────────────────────────────────────────────────────────
+
+def handle_command(store: ParamStore, line: str) -> str:
+    """One command line → one reply line."""
+    words = line.split()
+    if not words:
+        return "error: empty command"
+    cmd, args = words[0].lower(), words[1:]
+    try:
+        if cmd == "get":
+            return json.dumps(store.values())
+        if cmd == "log":
+            return json.dumps(store.log)
+        if cmd == "set":
+            changes = dict(arg.split("=", 1) for arg in args if "=" in arg)
+            if not changes or len(changes) != len(args):
+                return "error: usage: set name=value [name=value ...]"
+            return "ok: " + store.request(changes, source="control")
+    except (KeyError, ValueError) as e:
+        return f"error: {e.args[0] if e.args else e}"
+    return f"error: unknown command '{cmd}' (get, set, log)"
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for raw in self.rfile:
+            line = raw.decode("utf-8", "replace").strip()
+            if line:
+                reply = handle_command(self.server.store, line)
+                self.wfile.write((reply + "\n").encode())
+
+
+class ControlServer:
+    """Serves one ParamStore on 127.0.0.1 from a daemon thread."""
+
+    def __init__(self, store: ParamStore, port: int = PARAM_PORT):
+        self.store = store
+        self.port = port
+        self._server = None
+
+    def start(self) -> "ControlServer":
+        for port in range(self.port, self.port + PORT_TRIES):
+            try:
+                server = socketserver.ThreadingTCPServer(("127.0.0.1", port), _Handler)
+            except OSError:
+                continue
+            server.daemon_threads = True
+            server.store = self.store
+            self._server, self.port = server, port
+            threading.Thread(target=server.serve_forever, name="param-control",
+                             daemon=True).start()
+            print(f"[INFO] Parameter control on 127.0.0.1:{port} "
+                  f"(python param_store.py --port {port} set name=value)")
+            return self
+        print(f"[WARN] Parameter control: no free port in "
+              f"{self.port}–{self.port + PORT_TRIES - 1}, live changes disabled")
+        return self
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def send_command(line: str, port: int = PARAM_PORT, timeout: float = 2.0) -> str:
+    with socket.create_connection(("127.0.0.1", port), timeout=timeout) as sock:
+        sock.sendall((line + "\n").encode())
+        return sock.makefile("r", encoding="utf-8").readline().strip()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Change a running session's parameters")
+    parser.add_argument("command", nargs="+", help="get | log | set name=value ...")
+    parser.add_argument("--port", type=int, default=PARAM_PORT)
+    args = parser.parse_args(argv)
+    try:
+        reply = send_command(" ".join(args.command), args.port)
+    except OSError as e:
+        print(f"[ERROR] No session listening on 127.0.0.1:{args.port}: {e}")
+        return 1
+    print(reply)
+    return 1 if reply.startswith("error") else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -11,33 +11,32 @@
 # The task family (SocialMemory / SocialReward / SocialChoice / SocialReward2AFC)
 # is auto-detected from the session folder's parent directory name. Use
 # --family to override when a folder has been moved/renamed.
+#
+# Batch mode regenerates the figures of every session under a data root
+# (the folder holding the *Data folders, or one *Data folder), headless:
+#   python replay_performance.py --batch <root> [--jobs N] [--force] [--dpi 300]
+# Sessions are rendered with the Agg backend in a pool of N worker processes
+# (default: one per CPU), so matplotlib is imported once per worker rather
+# than once per session. A session is skipped when its figure is newer than
+# its CSVs and metadata.json (--force re-renders everything). Results go to
+# <root>/replay_report.csv.
 
 import argparse
+import csv
+import glob
 import json
 import os
 import sys
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import pandas as pd
 import matplotlib.pyplot as plt
 
+from log_rotation import read_log_csv
+from session_family import detect_family
 
-_FAMILY_BY_FOLDER = {
-    "SocialMemoryData":       "socialmemory",
-    "SocialRewardData":       "socialreward",
-    "SocialChoiceData":       "socialchoice",
-    "SocialReward2AFCData":   "socialreward2afc",
-}
-
-
-def _detect_family(session_dir: str) -> str:
-    parent = os.path.basename(os.path.dirname(os.path.abspath(session_dir)))
-    family = _FAMILY_BY_FOLDER.get(parent)
-    if family is None:
-        raise ValueError(
-            f"Could not detect task family from parent folder '{parent}'. "
-            f"Pass --family explicitly (one of: {', '.join(sorted(set(_FAMILY_BY_FOLDER.values())))})."
-        )
-    return family
 
 
 def _load_metadata(session_dir: str) -> dict:
@@ -66,11 +65,11 @@ def _fill_missing_columns(df: pd.DataFrame, columns) -> pd.DataFrame:
 
 
 def _read_sensor_events(session_dir: str):
-    """sensor_events.csv has no header: HH:MM:SS.mmm, elapsed_seconds, port, state."""
+    """sensor_events.csv has no header: HH:MM:SS.mmm, elapsed_seconds, port, state.
+
+    Rotated logs (sensor_events.NNNN.csv[.gz]) are read across all segments."""
     path = os.path.join(session_dir, "sensor_events.csv")
-    if not os.path.exists(path):
-        return None
-    return pd.read_csv(path, header=None, names=["time_str", "t", "port", "state"])
+    return read_log_csv(path, header=None, names=["time_str", "t", "port", "state"])
 
 
 def _door_open_segments(events: pd.DataFrame):
@@ -218,10 +217,117 @@ _REPLAYERS = {
 }
 
 
+# ── Batch mode ─────────────────────────────────────────────────────────────────
+
+BATCH_REPORT = "replay_report.csv"
+_REPORT_FIELDS = ["session_dir", "family", "status", "seconds", "figure", "error"]
+
+
+def _input_mtime(session_dir: str) -> float:
+    """Newest mtime of the files a replay reads (CSVs, incl. rotated sensor
+    log segments, and metadata.json)."""
+    paths = glob.glob(os.path.join(session_dir, "*.csv")) \
+        + glob.glob(os.path.join(session_dir, "*.csv.gz")) \
+        + [os.path.join(session_dir, "metadata.json")]
+    return max((os.path.getmtime(p) for p in paths if os.path.exists(p)), default=0.0)
+
+
+def _is_stale(session_dir: str, figure: str) -> bool:
+    fig_path = os.path.join(session_dir, figure)
+    return not os.path.exists(fig_path) or os.path.getmtime(fig_path) < _input_mtime(session_dir)
+
+
+def _init_worker() -> None:
+    plt.switch_backend("Agg")
+    # tight_layout notices are the same for every session of a family
+    warnings.filterwarnings("ignore", category=UserWarning)
+
+
+def _render_session(session_dir: str, family: str, figure: str, dpi: int) -> dict:
+    """Render one session's figure headless (runs in a worker process)."""
+    result = {"session_dir": session_dir, "family": family, "figure": figure,
+              "status": "rendered", "error": ""}
+    t0 = time.perf_counter()
+    try:
+        meta = _load_metadata(session_dir)
+        perf_gui = _REPLAYERS[family](meta, session_dir)
+        perf_gui.fig.savefig(os.path.join(session_dir, figure), dpi=dpi, bbox_inches="tight")
+        plt.close(perf_gui.fig)
+    except Exception as e:                  # one bad session must not stop the batch
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+        plt.close("all")
+    result["seconds"] = round(time.perf_counter() - t0, 3)
+    return result
+
+
+def run_batch(root: str, jobs: int = None, figure: str = "performance_replay.png",
+              dpi: int = 300, force: bool = False, family: str = None) -> list:
+    """Regenerate every stale session figure under root; returns the report rows."""
+    from session_catalog import _session_dirs
+
+    report, todo = [], []
+    for session_dir in _session_dirs(root):
+        try:
+            fam = family or detect_family(session_dir)
+        except ValueError as e:
+            report.append({"session_dir": session_dir, "family": "", "figure": figure,
+                           "status": "failed", "seconds": 0, "error": str(e)})
+            continue
+        if not force and not _is_stale(session_dir, figure):
+            report.append({"session_dir": session_dir, "family": fam, "figure": figure,
+                           "status": "skipped", "seconds": 0, "error": ""})
+            continue
+        todo.append((session_dir, fam))
+
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(todo) or 1))
+    print(f"[INFO] {len(todo)} session(s) to render, {len(report)} up to date or unreadable "
+          f"— {jobs} worker(s)")
+    t0 = time.perf_counter()
+    if jobs == 1:
+        _init_worker()
+        for i, (session_dir, fam) in enumerate(todo, start=1):
+            report.append(_render_session(session_dir, fam, figure, dpi))
+            _print_progress(i, len(todo), report[-1])
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as pool:
+            futures = [pool.submit(_render_session, d, fam, figure, dpi) for d, fam in todo]
+            for i, future in enumerate(as_completed(futures), start=1):
+                report.append(future.result())
+                _print_progress(i, len(todo), report[-1])
+
+    report.sort(key=lambda r: r["session_dir"])
+    report_path = os.path.join(os.path.abspath(root), BATCH_REPORT)
+    with open(report_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=_REPORT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(report)
+
+    counts = {s: sum(r["status"] == s for r in report) for s in ("rendered", "skipped", "failed")}
+    print(f"[INFO] Batch done in {time.perf_counter() - t0:.1f} s: {counts['rendered']} rendered, "
+          f"{counts['skipped']} skipped, {counts['failed']} failed — report: {report_path}")
+    return report
+
+
+def _print_progress(i: int, n: int, result: dict) -> None:
+    if result["status"] == "failed":
+        print(f"[WARN] [{i}/{n}] {result['session_dir']}: {result['error']}")
+    else:
+        print(f"[INFO] [{i}/{n}] {os.path.basename(result['session_dir'])} "
+              f"({result['seconds']:.1f} s)")
+
+
 def main():
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument("session_dir", nargs="?", default=".",
                          help="Path to the session's output folder (default: current directory)")
+    parser.add_argument("--batch", metavar="ROOT", default=None,
+                         help="Regenerate the figures of every session under ROOT, headless")
+    parser.add_argument("--jobs", type=int, default=None,
+                         help="Batch worker processes (default: number of CPUs)")
+    parser.add_argument("--force", action="store_true",
+                         help="Batch: re-render sessions whose figure is already up to date")
+    parser.add_argument("--dpi", type=int, default=300, help="Resolution of saved figures")
     parser.add_argument("--family", choices=sorted(_REPLAYERS), default=None,
                          help="Override task-family auto-detection")
     parser.add_argument("--save", nargs="?", const="performance_replay.png", default=None,
@@ -232,12 +338,19 @@ def main():
                          help="Don't open an interactive window (e.g. for batch regeneration)")
     args = parser.parse_args()
 
+    if args.batch is not None:
+        if not os.path.isdir(args.batch):
+            sys.exit(f"[ERROR] Not a directory: {args.batch}")
+        report = run_batch(args.batch, jobs=args.jobs, figure=args.save or "performance_replay.png",
+                           dpi=args.dpi, force=args.force, family=args.family)
+        sys.exit(1 if any(r["status"] == "failed" for r in report) else 0)
+
     session_dir = os.path.abspath(args.session_dir)
     if not os.path.isdir(session_dir):
         sys.exit(f"[ERROR] Not a directory: {session_dir}")
 
     try:
-        family = args.family or _detect_family(session_dir)
+        family = args.family or detect_family(session_dir)
         meta = _load_metadata(session_dir)
         print(f"[INFO] Replaying {family} session: {session_dir}")
         perf_gui = _REPLAYERS[family](meta, session_dir)
@@ -248,7 +361,7 @@ def main():
         save_path = args.save
         if not os.path.isabs(save_path):
             save_path = os.path.join(session_dir, save_path)
-        perf_gui.fig.savefig(save_path, dpi=300, bbox_inches="tight")
+        perf_gui.fig.savefig(save_path, dpi=args.dpi, bbox_inches="tight")
         print(f"[INFO] Saved: {save_path}")
 
     if not args.no_show:
@@ -0,0 +1,468 @@
+# rig.py — One carousel as an object, and a launcher for several at once
+#
+# A Rig owns everything that used to be process-wide for a carousel: its
+# DeviceConnection, SharedSensorState, stop token (shared.stop_event, checked
+# by every session loop and hardware wait helper instead of the global
+# STOP_EVENT), table position (shared.table_position) and EventLogger.
+# Sessions are built on rig.device / rig.shared, so stopping one rig never
+# touches another.
+#
+#   rig = Rig("COM3", name="rig1")
+#   save_dir = rig.run("socialreward2afc", params)   # headless, blocks until done
+#
+# run() is the headless equivalent of a main_*.py session (same
+# build_session(), same output files, metadata.json and session catalog
+# entry) without the setup dialog and GUIs; set "dashboard": true in the
+# params to watch the rigs on the dashboard server instead, and
+# "param_control": true to change parameters mid-session (each rig takes the
+# next free port; param_store.py).
+#
+# Launcher — one PC, N carousels:
+#   python rig.py rigs.json [--mode process|thread] [--rig NAME]
+#
+#   rigs.json: {"rigs": [
+#       {"name": "rig1", "port": "COM3", "family": "socialreward2afc",
+#        "params": {...setup-dialog params...}},
+#       {"name": "rig2", "port": "COM4", "family": "socialchoice",
+#        "params": "SocialChoiceData/m1_3_two_choice_2026-01-05_mouse/metadata.json"},
+#   ]}
+#   (params may be the path of an earlier session's metadata.json; a fresh
+#   random_seed, date and session folder are used either way)
+#
+#   --mode process (default) runs each rig in its own Python process (own
+#   GIL, a crash or hang stays on its rig, and the global random seed each
+#   build_session() sets stays per rig, so sessions replay) and prefixes
+#   their output with the rig name. --mode thread runs every rig on a thread
+#   of this process; only draws from each session's trial schedule
+#   (trial_schedule.py) stay reproducible then. Ctrl+C stops all rigs.
+
+import json
+import os
+import random
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from hardware import (
+    SharedSensorState, EventLogger, CameraTriggerLogger, shutdown_outputs,
+    turn_table_degrees, apply_motor_speeds, read_initial_state,
+    SENSOR_LOG_ROTATE_BYTES, SENSOR_LOG_ROTATE_SECONDS,
+)
+from serial_comm import DeviceConnection
+
+BAUDRATE = 115200
+POLL_S = 0.2                 # run() loop period (no GUIs to refresh)
+
+# family → entry point whose build_session() constructs its sessions
+MAIN_MODULES = {
+    "socialmemory":     "main_socialmemory",
+    "socialreward":     "main_socialreward",
+    "socialchoice":     "main_socialchoice",
+    "socialreward2afc": "main_socialreward2AFC",
+}
+
+# family → (data folder, params key naming the phase / mode in the folder name)
+DATA_FOLDERS = {
+    "socialmemory":     ("SocialMemoryData", "mode"),
+    "socialreward":     ("SocialRewardData", "phase"),
+    "socialchoice":     ("SocialChoiceData", "phase"),
+    "socialreward2afc": ("SocialReward2AFCData", "phase"),
+}
+
+
+def result_files(family: str, params: dict):
+    """[(session attribute, CSV filename), ...] saved by the main script."""
+    if family == "socialmemory":
+        mode = params.get("mode")
+        if mode == "training":
+            return [("results_df", "trials.csv")]
+        files = [("presentations_df", "presentations.csv"),
+                 ("conditioning_df", "conditioning_trials.csv")]
+        if mode == "task":
+            files.append(("camera_sync_df", "camera_sync.csv"))
+        return files
+    return [("results_df", "trials.csv")]
+
+
+# ── Rig ───────────────────────────────────────────────────────────────────────
+
+class Rig:
+    """One carousel: connection, sensor state, stop token, table position
+    and event log."""
+
+    def __init__(self, port: str, name: Optional[str] = None, baudrate: int = BAUDRATE):
+        self.port = port
+        self.name = name or port
+        self.baudrate = baudrate
+        self.stop_event = threading.Event()
+        self.shared = SharedSensorState(stop_event=self.stop_event)
+        self.device: Optional[DeviceConnection] = None
+        self.logger: Optional[EventLogger] = None
+        self.camera_logger: Optional[CameraTriggerLogger] = None
+        self.session = None
+
+    @property
+    def table_position(self) -> int:
+        return self.shared.table_position
+
+    def __repr__(self) -> str:
+        return f"Rig({self.name!r}, {self.port!r})"
+
+    # ── Lifecycle ─────────────────────────────────────────────────────────────
+
+    def connect(self, capture=None) -> float:
+        """Open the port and wait for the firmware; returns the seconds waited."""
+        self.device = DeviceConnection(self.port, baudrate=self.baudrate)
+        if capture is not None:
+            capture.attach(self.device)
+        try:
+            self.device.connect()
+            return self.device.wait_ready()
+        except Exception:
+            self.device.disconnect()
+            self.device = None
+            raise
+
+    def start_logging(self, save_dir: str, session_start: float,
+                      camera: bool = False) -> None:
+        """sensor_events.csv for this rig, then the current sensor state."""
+        self.logger = EventLogger(
+            self.shared,
+            event_log_path=os.path.join(save_dir, "sensor_events.csv"),
+            session_start=session_start,
+            rotate_bytes=SENSOR_LOG_ROTATE_BYTES,
+            rotate_seconds=SENSOR_LOG_ROTATE_SECONDS,
+        )
+        self.device.on_event(self.logger)
+        if camera:
+            self.camera_logger = CameraTriggerLogger(session_start=session_start)
+            self.device.on_event(self.camera_logger)
+        read_initial_state(self.device, self.shared)
+
+    def stop(self) -> None:
+        """Stop this rig's session (any thread; returns immediately)."""
+        self.stop_event.set()
+        if self.session is not None:
+            self.session.running = False
+
+    def close(self) -> None:
+        if self.device is not None:
+            try:
+                shutdown_outputs(self.device)
+            except Exception as e:
+                print(f"[WARN] {self.name}: could not switch outputs off: {e}")
+            self.device.disconnect()
+            self.device = None
+        if self.logger is not None:
+            self.logger.close()
+            self.logger = None
+
+    # ── Headless session ──────────────────────────────────────────────────────
+
+    def save_dir_for(self, family: str, params: dict) -> str:
+        folder, key = DATA_FOLDERS[family]
+        return os.path.join(folder, f"{params['animal']}_{params['session_n']}_"
+                                    f"{params[key]}_{params['date']}_{params['species']}")
+
+    def run(self, family: str, params: dict) -> Optional[str]:
+        """Run one session to completion (or stop()); returns its save dir,
+        or None if the rig could not be started."""
+        import importlib
+        from packet_capture import PacketCapture, MARK_SESSION_START, MARK_SESSION_STOP
+        from session_catalog import record_session
+
+        main_module = importlib.import_module(MAIN_MODULES[family])
+        params = dict(params)
+        params["port"] = self.port
+        params["date"] = datetime.now().strftime("%Y-%m-%d")
+        params["random_seed"] = random.randrange(2**32)
+        save_dir = self.save_dir_for(family, params)
+        params["save_dir"] = save_dir
+        os.makedirs(save_dir, exist_ok=True)
+        print(f"[INFO] {self.name}: saving to {save_dir}")
+
+        meta = dict(params, timestamp=datetime.now().isoformat(), rig=self.name)
+        with open(os.path.join(save_dir, "metadata.json"), "w") as f:
+            json.dump(meta, f, indent=2, default=str)
+
+        capture = None
+        if params.get("packet_capture"):
+            capture = PacketCapture(os.path.join(save_dir, "packets.bin"))
+        try:
+            ready_s = self.connect(capture)
+        except Exception as e:
+            print(f"[ERROR] {self.name}: cannot open {self.port}: {e}")
+            if capture is not None:
+                capture.close()
+            return None
+        print(f"[INFO] {self.name}: device ready after {ready_s:.2f} s")
+
+        apply_motor_speeds(
+            self.device,
+            door_open_speed=params.get("door_open_speed"),
+            door_close_speed=params.get("door_close_speed"),
+            table_speed=params.get("table_speed"),
+        )
+        session_start = time.time()
+        self.start_logging(save_dir, session_start, camera=(family == "socialmemory"))
+
+        tracer = None
+        if params.get("stage_trace"):
+            from tracing import Tracer
+            tracer = Tracer()
+            tracer.attach(self.device, self.shared)
+
+        profiler = None
+        if params.get("cpu_profile"):
+            # Samples the whole process: in --mode thread that is every rig
+            from thread_profiler import ThreadProfiler
+            profiler = ThreadProfiler()
+            profiler.start()
+
+        dashboard = None
+        if params.get("dashboard"):
+            from dashboard_server import DashboardPublisher, DASHBOARD_URL, rig_name
+            _, key = DATA_FOLDERS[family]
+            dashboard = DashboardPublisher(
+                DASHBOARD_URL, rig=rig_name(self.port),
+                info={"task": family, "animal": params["animal"],
+                      "session": params["session_n"], key: params[key],
+                      "species": params["species"], "rig": self.name},
+            )
+            self.logger.on_transition(dashboard.transition)
+
+        kwargs = {"camera_logger": self.camera_logger} if family == "socialmemory" else {}
+        files = result_files(family, params)
+        control = None
+        try:
+            self.session = main_module.build_session(params, self.device, self.shared, **kwargs)
+            if self.session is None:
+                return None
+            if params.get("param_control"):
+                from param_store import ControlServer
+                control = ControlServer(self.session.params).start()
+            if capture is not None:
+                capture.mark(MARK_SESSION_START)
+            self.session.start()
+            if dashboard is not None:
+                dashboard.watch("trials", lambda: getattr(self.session, files[0][0]))
+                dashboard.start()
+
+            limit = params.get("session_duration_s")
+            while self.session.running and not self.stop_event.is_set():
+                if limit and time.time() - session_start >= limit:
+                    print(f"[INFO] {self.name}: session duration ({limit} s) reached")
+                    break
+                time.sleep(POLL_S)
+        finally:
+            print(f"[INFO] {self.name}: shutting down...")
+            self.stop_event.set()
+            if capture is not None:
+                capture.mark(MARK_SESSION_STOP)
+            if control is not None:
+                control.close()
+            if self.session is not None:
+                if hasattr(self.session, "stop_internal"):
+                    self.session.stop_internal()
+                else:
+                    self.session.stop()
+                self._save_results(save_dir, files)
+                for what, part in (("trial schedule", self.session.schedule),
+                                   ("adaptation log", self.session.adaptation),
+                                   ("parameter changes", self.session.params)):
+                    if part is not None:
+                        try:
+                            part.save(save_dir)
+                        except Exception as e:
+                            print(f"[WARN] {self.name}: {what} not saved: {e}")
+                self._home_table()
+            self._save_frame_index(save_dir, session_start)
+            self.close()
+            if dashboard is not None:
+                dashboard.close()
+            if capture is not None:
+                capture.close()
+            if tracer is not None:
+                tracer.save(save_dir)
+            if profiler is not None:
+                profiler.stop()
+                profiler.save(save_dir)
+            if self.session is not None:      # no catalog entry for a session never built
+                record_session(save_dir)
+            print(f"[INFO] {self.name}: done")
+        return save_dir
+
+    def _save_results(self, save_dir: str, files) -> None:
+        for attr, filename in files:
+            df = getattr(self.session, attr, None)
+            if df is not None:
+                df.to_csv(os.path.join(save_dir, filename), index=False)
+                print(f"[INFO] {self.name}: {filename} saved ({len(df)} rows)")
+        state_log = getattr(self.session, "state_log", None)
+        if state_log:
+            from state_machine import save_log
+            save_log(state_log, os.path.join(save_dir, "state_transitions.csv"))
+
+    def _save_frame_index(self, save_dir: str, session_start: float) -> None:
+        if self.camera_logger is None:
+            return
+        pulses = self.camera_logger.all_pulses()
+        if len(pulses) < 2:
+            return
+        try:
+            from frame_index import FrameTimeIndex
+            index = FrameTimeIndex.from_pulses(pulses, session_start=session_start)
+            index.save(os.path.join(save_dir, "frame_index.npz"))
+        except Exception as e:
+            print(f"[WARN] {self.name}: frame index failed: {e}")
+
+    def _home_table(self, timeout: float = 20.0) -> None:
+        """Turn the table back to 0° if the session left it elsewhere (as the
+        main scripts do after turntable phases)."""
+        current = getattr(self.session, "_current_angle", 0)
+        delta = (0 - current) % 360
+        if delta > 180:
+            delta -= 360
+        if delta == 0:
+            return
+
+        def _wait_stopped():
+            time.sleep(1.0)
+            deadline = time.time() + timeout
+            while time.time() < deadline and self.shared.get_port("table_motor")[0] == "table moving":
+                time.sleep(0.05)
+
+        try:
+            _wait_stopped()
+            print(f"[INFO] {self.name}: returning turntable to home from {current}°")
+            turn_table_degrees(self.device, -delta)
+            _wait_stopped()
+        except Exception as e:
+            print(f"[WARN] {self.name}: home return failed: {e}")
+
+
+# ── Launcher ──────────────────────────────────────────────────────────────────
+
+def load_config(path: str) -> List[dict]:
+    """The "rigs" list of a launcher config, with params files loaded."""
+    with open(path) as f:
+        rigs = json.load(f)["rigs"]
+    base = os.path.dirname(os.path.abspath(path))
+    names = set()
+    for cfg in rigs:
+        cfg.setdefault("name", cfg["port"])
+        if cfg["name"] in names:
+            raise ValueError(f"Duplicate rig name '{cfg['name']}' in {path}")
+        names.add(cfg["name"])
+        family = cfg["family"].lower()
+        if family not in MAIN_MODULES:
+            raise ValueError(f"{cfg['name']}: unknown family '{cfg['family']}' "
+                             f"(one of: {', '.join(MAIN_MODULES)})")
+        cfg["family"] = family
+        if isinstance(cfg.get("params"), str):
+            with open(os.path.join(base, cfg["params"])) as f:
+                cfg["params"] = json.load(f)
+    ports = [cfg["port"] for cfg in rigs]
+    if len(set(ports)) != len(ports):
+        raise ValueError(f"Two rigs share a serial port in {path}")
+    return rigs
+
+
+def run_threads(configs: List[dict]) -> int:
+    """Every rig on its own thread of this process."""
+    import importlib
+    # The main_* modules install a SIGINT handler on import, which only
+    # works on the main thread; import them here, then take SIGINT over
+    for family in {cfg["family"] for cfg in configs}:
+        importlib.import_module(MAIN_MODULES[family])
+    rigs = [Rig(cfg["port"], name=cfg["name"]) for cfg in configs]
+    results = {}
+
+    def _run(rig, cfg):
+        try:
+            results[rig.name] = rig.run(cfg["family"], cfg["params"])
+        except Exception as e:
+            print(f"[ERROR] {rig.name}: {e}")
+            results[rig.name] = None
+
+    def _stop_all(_sig, _frame):
+        print("[INFO] Stopping all rigs...")
+        for rig in rigs:
+            rig.stop()
+
+    signal.signal(signal.SIGINT, _stop_all)
+    threads = [threading.Thread(target=_run, args=(rig, cfg), name=rig.name)
+               for rig, cfg in zip(rigs, configs)]
+    for t in threads:
+        t.start()
+    while any(t.is_alive() for t in threads):
+        time.sleep(POLL_S)          # keep the main thread free for Ctrl+C
+    failed = [name for name, d in results.items() if d is None]
+    if failed:
+        print(f"[WARN] Rig(s) failed: {', '.join(failed)}")
+    return 1 if failed else 0
+
+
+def run_processes(config_path: str, configs: List[dict]) -> int:
+    """Every rig in its own Python process (`rig.py CONFIG --rig NAME`),
+    output prefixed with the rig name."""
+    import subprocess
+    here = os.path.abspath(__file__)
+    procs = {}
+    for cfg in configs:
+        procs[cfg["name"]] = subprocess.Popen(
+            [sys.executable, "-u", here, config_path, "--rig", cfg["name"]],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1,
+        )
+
+    def _pump(name, proc):
+        for line in proc.stdout:
+            print(f"[{name}] {line}", end="", flush=True)
+
+    pumps = [threading.Thread(target=_pump, args=item, daemon=True) for item in procs.items()]
+    for t in pumps:
+        t.start()
+
+    # Ctrl+C reaches the children through the console; just keep waiting
+    signal.signal(signal.SIGINT, lambda _s, _f: print("[INFO] Stopping all rigs..."))
+    while any(p.poll() is None for p in procs.values()):
+        time.sleep(POLL_S)
+    for t in pumps:
+        t.join(timeout=1.0)
+    failed = [name for name, p in procs.items() if p.returncode != 0]
+    if failed:
+        print(f"[WARN] Rig(s) failed: {', '.join(failed)}")
+    return 1 if failed else 0
+
+
+def main(argv=None) -> int:
+    import argparse
+    ap = argparse.ArgumentParser(description="Run several carousels from one PC.")
+    ap.add_argument("config", help="JSON file with a \"rigs\" list")
+    ap.add_argument("--mode", choices=("process", "thread"), default="process")
+    ap.add_argument("--rig", help="Run only the rig with this name (in this process)")
+    args = ap.parse_args(argv)
+
+    try:
+        configs = load_config(args.config)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[ERROR] {args.config}: {e}")
+        return 2
+    if args.rig is not None:
+        configs = [cfg for cfg in configs if cfg["name"] == args.rig]
+        if not configs:
+            print(f"[ERROR] No rig named '{args.rig}' in {args.config}")
+            return 2
+        return run_threads(configs)
+    print(f"[INFO] {len(configs)} rig(s): "
+          + ", ".join(f"{c['name']} ({c['port']}, {c['family']})" for c in configs))
+    if args.mode == "thread":
+        return run_threads(configs)
+    return run_processes(args.config, configs)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
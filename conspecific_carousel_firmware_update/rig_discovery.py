@@ -0,0 +1,188 @@
+# rig_discovery.py — Find which serial ports have a carousel controller on them
+#
+# discover() opens every candidate port at once (one thread per port, so the
+# ~1-2 s board reset on open is paid once, not once per port), waits for the
+# firmware to answer a READ, then reads the registers to find out what that
+# firmware build supports:
+#   speed_registers — door/table speed registers ACK (older builds don't,
+#                     which is what utils.SPEED_OFF_TOKENS works around)
+#   registers       — how many of READABLE_REGISTERS answered
+# Each carousel gets a rig_id from the USB adapter's serial number (stable
+# across reboots and COM renumbering), falling back to the port name.
+#
+# Results are cached in rig_cache.json for CACHE_TTL_S so a setup dialog can
+# show them instantly; the cache is also invalidated when the set of ports
+# changes. Ports are opened exclusively, so a rig in use by a running session
+# is reported as busy instead of being reset.
+#
+# Usage:
+#   rigs = discover()                    # cached if fresh, else probes
+#   [r.port for r in rigs if r.is_carousel]
+#   python rig_discovery.py [--refresh]  # print the table
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+from protocol import (
+    READABLE_REGISTERS, REG_DOOR_OPN_SPD, REG_DOOR_CLS_SPD, REG_TABLE_SPD,
+    REG_DOOR_STATUS, REG_TABLE_STATUS, DOOR_STATUS_MAP, TABLE_STATUS_MAP,
+)
+
+CACHE_TTL_S = 60.0
+PROBE_TIMEOUT_S = 3.0        # per port, covers the board reset on open
+PROBE_ACK_TIMEOUT_S = 0.3
+BAUDRATE = 115200
+
+_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rig_cache.json")
+_SPEED_REGISTERS = [REG_DOOR_OPN_SPD, REG_DOOR_CLS_SPD, REG_TABLE_SPD]
+
+
+@dataclass
+class RigInfo:
+    port: str
+    is_carousel: bool = False
+    rig_id: str = ""
+    description: str = ""
+    ready_s: Optional[float] = None
+    capabilities: Dict[str, object] = field(default_factory=dict)
+    error: str = ""
+
+    def summary(self) -> str:
+        if not self.is_carousel:
+            return f"{self.port}: {self.error or 'no carousel'}"
+        speed = "speed regs" if self.capabilities.get("speed_registers") else "no speed regs"
+        return (f"{self.port}: carousel {self.rig_id} ({speed}, "
+                f"door {self.capabilities.get('door', '?')}, ready {self.ready_s:.1f} s)")
+
+
+# ── Probing ───────────────────────────────────────────────────────────────────
+
+def _port_infos() -> Dict[str, object]:
+    import serial.tools.list_ports
+    return {p.device: p for p in serial.tools.list_ports.comports()}
+
+
+def _rig_id(port: str, info) -> str:
+    serial_number = getattr(info, "serial_number", None)
+    if serial_number:
+        return serial_number
+    vid, pid = getattr(info, "vid", None), getattr(info, "pid", None)
+    if vid is not None and pid is not None:
+        return f"{vid:04X}:{pid:04X}@{getattr(info, 'location', None) or port}"
+    return port
+
+
+def probe(port: str, info=None, timeout: float = PROBE_TIMEOUT_S) -> RigInfo:
+    """Open `port`, wait for the firmware and read its registers."""
+    from serial_comm import DeviceConnection
+
+    rig = RigInfo(port=port, description=getattr(info, "description", "") or "")
+    device = DeviceConnection(port, baudrate=BAUDRATE, timeout=PROBE_ACK_TIMEOUT_S,
+                              retries=1)
+    try:
+        device.connect()
+    except Exception as e:
+        msg = str(e).lower()
+        rig.error = "busy" if any(k in msg for k in ("busy", "denied", "lock")) else str(e)
+        return rig
+    try:
+        try:
+            rig.ready_s = round(device.wait_ready(timeout=timeout), 2)
+        except TimeoutError:
+            rig.error = "no response"
+            return rig
+        rig.is_carousel = True
+        rig.rig_id = _rig_id(port, info)
+
+        values = device.read_registers(READABLE_REGISTERS, strict=False)
+        rig.capabilities = {
+            "speed_registers": all(r in values for r in _SPEED_REGISTERS),
+            "registers": len(values),
+            "door": DOOR_STATUS_MAP.get(values.get(REG_DOOR_STATUS), "?"),
+            "table": TABLE_STATUS_MAP.get(values.get(REG_TABLE_STATUS), "?"),
+        }
+        return rig
+    finally:
+        device.disconnect()
+
+
+def probe_all(ports: Optional[List[str]] = None, timeout: float = PROBE_TIMEOUT_S) -> List[RigInfo]:
+    """Probe every USB serial port concurrently (the controllers are all
+    USB boards; built-in UARTs are listed but not written to). Carousels
+    first, then by port name."""
+    infos = _port_infos()
+    ports = sorted(infos) if ports is None else list(ports)
+    usb = [p for p in ports if getattr(infos.get(p), "vid", None) is not None]
+    rigs = [RigInfo(port=p, error="not a USB serial port") for p in ports if p not in usb]
+    if usb:
+        with ThreadPoolExecutor(max_workers=len(usb), thread_name_prefix="probe") as pool:
+            rigs += pool.map(lambda p: probe(p, infos.get(p), timeout), usb)
+    return sorted(rigs, key=lambda r: (not r.is_carousel, r.port))
+
+
+# ── Cache ─────────────────────────────────────────────────────────────────────
+
+def _load_cache(ports: List[str]) -> Optional[List[RigInfo]]:
+    try:
+        with open(_CACHE_FILE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if time.time() - cache.get("time", 0) > CACHE_TTL_S or cache.get("ports") != ports:
+        return None
+    try:
+        return [RigInfo(**r) for r in cache["rigs"]]
+    except (KeyError, TypeError):
+        return None
+
+
+def _save_cache(ports: List[str], rigs: List[RigInfo]) -> None:
+    try:
+        with open(_CACHE_FILE, "w") as f:
+            json.dump({"time": time.time(), "ports": ports,
+                       "rigs": [asdict(r) for r in rigs]}, f, indent=2)
+    except OSError as e:
+        print(f"[WARN] Could not write {_CACHE_FILE}: {e}")
+
+
+def cached() -> Optional[List[RigInfo]]:
+    """Fresh cached results for the current set of ports, or None."""
+    return _load_cache(sorted(_port_infos()))
+
+
+def discover(refresh: bool = False, timeout: float = PROBE_TIMEOUT_S) -> List[RigInfo]:
+    """Carousel / non-carousel status of every serial port, from the cache
+    when it is fresh (and refresh is False), otherwise by probing."""
+    ports = sorted(_port_infos())
+    if not refresh:
+        rigs = _load_cache(ports)
+        if rigs is not None:
+            return rigs
+    rigs = probe_all(ports, timeout)
+    _save_cache(ports, rigs)
+    return rigs
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Find carousel controllers on the serial ports.")
+    ap.add_argument("--refresh", action="store_true", help="Ignore the cache and probe")
+    ap.add_argument("--timeout", type=float, default=PROBE_TIMEOUT_S)
+    args = ap.parse_args(argv)
+
+    t0 = time.perf_counter()
+    rigs = discover(refresh=args.refresh, timeout=args.timeout)
+    for rig in rigs:
+        print(rig.summary())
+    n = sum(r.is_carousel for r in rigs)
+    print(f"[INFO] {n} carousel(s) on {len(rigs)} port(s) in {time.perf_counter() - t0:.2f} s")
+    return 0 if n else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
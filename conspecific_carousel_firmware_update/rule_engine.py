@@ -0,0 +1,295 @@
+# rule_engine.py — Host-side trigger → action rules, evaluated in the packet
+# dispatch path
+#
+# A rule pairs one of protocol.TRIGGER_OPTIONS with one of ACTION_OPTIONS:
+#   "Port A IR = Detected" → "Port A Valve: On" for 50 ms
+# RuleEngine is an on_event() callback of DeviceConnection, so rules run on
+# the serial reader thread as soon as the event packet is parsed, and the
+# action goes out with send_register() (no ACK wait). A reflex response
+# never waits for a session thread to wake up and poll.
+#
+# Per rule:
+#   mode      "every" — fires on every matching event
+#             "once"  — one-shot: fires once, then stays disarmed until rearm()
+#             "latch" — fires, then re-arms only once the trigger register
+#                       has left the trigger value (one response per detection)
+#   guard     a second TRIGGER_OPTIONS name that must currently hold (last
+#             value seen for that register; unknown = guard fails), e.g.
+#             "Door Status = Opened"
+#   pulse_ms  for ": On" actions, the matching ": Off" is sent pulse_ms later
+#
+# Usage:
+#   engine = RuleEngine()
+#   engine.add(Rule("Port A IR = Detected", "Port A Valve: On", pulse_ms=50, mode="latch"))
+#   engine.attach(device)                 # registers device.on_event(engine)
+#
+# Benchmark (event → command latency over a loop:// port, no hardware needed;
+# compared with a session-style 1 ms polling loop):
+#   python rule_engine.py [--n 500]
+
+import json
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from protocol import ACTION_OPTIONS, TRIGGER_OPTIONS, MSG_EVENT, MSG_WRITE, build_packet
+
+MODES = ("every", "once", "latch")
+LATENCY_HISTORY = 1000
+
+TRIGGERS: Dict[str, tuple] = {name: (reg, val) for name, reg, val in TRIGGER_OPTIONS}
+ACTIONS: Dict[str, tuple] = {name: (reg, val) for name, reg, val in ACTION_OPTIONS}
+
+
+@dataclass
+class Rule:
+    trigger: str
+    action: str
+    pulse_ms: int = 0
+    mode: str = "every"
+    guard: Optional[str] = None
+    enabled: bool = True
+    armed: bool = field(default=True, compare=False)
+    fired: int = field(default=0, compare=False)
+
+    def __post_init__(self):
+        if self.trigger not in TRIGGERS:
+            raise ValueError(f"Unknown trigger '{self.trigger}'")
+        if self.action not in ACTIONS:
+            raise ValueError(f"Unknown action '{self.action}'")
+        if self.guard is not None and self.guard not in TRIGGERS:
+            raise ValueError(f"Unknown guard '{self.guard}'")
+        if self.mode not in MODES:
+            raise ValueError(f"Mode must be one of {MODES}, got '{self.mode}'")
+        if self.pulse_ms and self.off_action is None:
+            raise ValueError(f"'{self.action}' has no Off action to end a pulse")
+
+    @property
+    def off_action(self) -> Optional[str]:
+        off = self.action.replace(": On", ": Off")
+        return off if off != self.action and off in ACTIONS else None
+
+    def describe(self) -> str:
+        text = f"{self.trigger} → {self.action}"
+        if self.pulse_ms:
+            text += f" {self.pulse_ms} ms"
+        if self.guard:
+            text += f" if {self.guard}"
+        if self.mode != "every":
+            text += f" [{self.mode}{'' if self.armed else ', disarmed'}]"
+        return text
+
+    def to_dict(self) -> dict:
+        d = asdict(self)
+        del d["armed"], d["fired"]
+        return d
+
+
+class RuleEngine:
+    """Evaluates Rules against firmware events; call attach(device) once per
+    connection. on_fire(rule, latency_s) is called on the reader thread after
+    each action is sent — keep it short."""
+
+    def __init__(self, on_fire: Optional[Callable[[Rule, float], None]] = None):
+        self.on_fire = on_fire
+        self.latencies = deque(maxlen=LATENCY_HISTORY)   # dispatch → sent, seconds
+        self._lock = threading.Lock()
+        self._rules: List[Rule] = []
+        self._by_register: Dict[int, List[Rule]] = {}    # replaced, never mutated
+        self._levels: Dict[int, int] = {}
+        self._device = None
+
+    # ── Connection ────────────────────────────────────────────────────────────
+
+    def attach(self, device) -> None:
+        self._device = device
+        self._levels = {}
+        device.on_event(self)
+
+    def detach(self) -> None:
+        self._device = None
+
+    def seed(self, values: Dict[int, int]) -> None:
+        """Register values read at connect time (device.read_registers), so
+        guards hold before the first event of their register."""
+        self._levels.update(values)
+
+    # ── Rules ─────────────────────────────────────────────────────────────────
+
+    def add(self, rule: Rule) -> None:
+        with self._lock:
+            self._rules.append(rule)
+            self._reindex()
+
+    def remove(self, rule: Rule) -> None:
+        with self._lock:
+            self._rules = [r for r in self._rules if r is not rule]
+            self._reindex()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._rules = []
+            self._reindex()
+
+    @property
+    def rules(self) -> List[Rule]:
+        return list(self._rules)
+
+    def rearm(self) -> None:
+        for rule in self._rules:
+            rule.armed = True
+
+    def _reindex(self) -> None:
+        by_register: Dict[int, List[Rule]] = {}
+        for rule in self._rules:
+            by_register.setdefault(TRIGGERS[rule.trigger][0], []).append(rule)
+        self._by_register = by_register
+
+    # ── Dispatch (reader thread) ──────────────────────────────────────────────
+
+    def __call__(self, register: int, value: int) -> None:
+        t0 = time.perf_counter()
+        self._levels[register] = value
+        device = self._device
+        for rule in self._by_register.get(register, ()):
+            if not rule.enabled:
+                continue
+            if value != TRIGGERS[rule.trigger][1]:
+                if rule.mode == "latch":
+                    rule.armed = True
+                continue
+            if not rule.armed or device is None:
+                continue
+            if rule.guard is not None:
+                guard_reg, guard_val = TRIGGERS[rule.guard]
+                if self._levels.get(guard_reg) != guard_val:
+                    continue
+            self._fire(device, rule, t0)
+
+    def _fire(self, device, rule: Rule, t0: float) -> None:
+        reg, val = ACTIONS[rule.action]
+        try:
+            device.send_register(reg, val)
+        except Exception as e:
+            print(f"[ERROR] Rule '{rule.describe()}': {e}")
+            return
+        latency = time.perf_counter() - t0
+        rule.fired += 1
+        if rule.mode != "every":
+            rule.armed = False
+        if rule.pulse_ms:
+            off_reg, off_val = ACTIONS[rule.off_action]
+            timer = threading.Timer(rule.pulse_ms / 1000, self._send_off,
+                                    args=(device, rule, off_reg, off_val))
+            timer.daemon = True
+            timer.start()
+        self.latencies.append(latency)
+        if self.on_fire is not None:
+            self.on_fire(rule, latency)
+
+    @staticmethod
+    def _send_off(device, rule: Rule, register: int, value: int) -> None:
+        try:
+            device.send_register(register, value)
+        except Exception as e:
+            print(f"[ERROR] Rule '{rule.describe()}' pulse end: {e}")
+
+
+# ── Persistence ───────────────────────────────────────────────────────────────
+
+def save_rules(rules: List[Rule], path: str) -> None:
+    with open(path, "w") as f:
+        json.dump([r.to_dict() for r in rules], f, indent=2)
+
+
+def load_rules(path: str) -> List[Rule]:
+    with open(path) as f:
+        return [Rule(**d) for d in json.load(f)]
+
+
+# ── Latency benchmark ─────────────────────────────────────────────────────────
+
+def _percentiles(samples: List[float]) -> str:
+    s = sorted(samples)
+    pick = lambda q: s[min(len(s) - 1, int(q * len(s)))] * 1000
+    return f"median {pick(0.5):6.3f} ms   p95 {pick(0.95):6.3f} ms   max {s[-1] * 1000:6.3f} ms"
+
+
+def benchmark(n: int = 500, interval: float = 0.005) -> Dict[str, List[float]]:
+    """Event → command latency through a real DeviceConnection on a loop://
+    port: the time from an event packet being written into the port to the
+    rule's command being written out, for the rule engine and for a
+    session-style thread polling the latest value every 1 ms."""
+    from serial_comm import DeviceConnection
+
+    trigger, action = "Port A IR = Detected", "Port A LED: On"
+    trig_reg, trig_val = TRIGGERS[trigger]
+    act_reg, act_val = ACTIONS[action]
+    results = {}
+
+    for path in ("rule engine", "session poll"):
+        device = DeviceConnection("loop://", exclusive=False)
+        sent_at = {}
+        done = threading.Event()
+
+        def _on_tx(register, msg_type, value, sent_at=sent_at, done=done):
+            if msg_type == MSG_WRITE and register == act_reg:
+                sent_at["t"] = time.perf_counter()
+                done.set()
+
+        device.on_tx(_on_tx)
+        stop = threading.Event()
+        if path == "rule engine":
+            engine = RuleEngine()
+            engine.add(Rule(trigger, action))
+            engine.attach(device)
+        else:
+            latest = {}
+            device.on_event(lambda reg, val: latest.__setitem__(reg, val))
+
+            def _poll():
+                while not stop.is_set():
+                    if latest.pop(trig_reg, None) == trig_val:
+                        device.send_register(act_reg, act_val)
+                    time.sleep(0.001)
+
+            threading.Thread(target=_poll, daemon=True).start()
+
+        device.connect()
+        samples = []
+        event = build_packet(trig_reg, MSG_EVENT, trig_val)
+        try:
+            for _ in range(n):
+                done.clear()
+                t0 = time.perf_counter()
+                device._serial.write(event)          # the "firmware" side of loop://
+                if done.wait(1.0):
+                    samples.append(sent_at["t"] - t0)
+                time.sleep(interval)
+        finally:
+            stop.set()
+            device.disconnect()
+        results[path] = samples
+    return results
+
+
+def main(argv=None) -> int:
+    import argparse
+    ap = argparse.ArgumentParser(description="Event → command latency of the rule engine.")
+    ap.add_argument("--n", type=int, default=500, help="Events per path")
+    args = ap.parse_args(argv)
+
+    results = benchmark(args.n)
+    for path, samples in results.items():
+        if not samples:
+            print(f"[ERROR] {path}: no command seen")
+            continue
+        print(f"{path:<13} n={len(samples):<5} {_percentiles(samples)}")
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
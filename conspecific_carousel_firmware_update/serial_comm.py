@@ -6,9 +6,12 @@ import time
 
 from protocol import (
     HEADER, MSG_WRITE, MSG_READ, MSG_ACK, MSG_EVENT,
-    PACKET_SIZE, build_packet, parse_packet,
+    PACKET_SIZE, REG_DOOR_STATUS, build_packet, parse_packet,
 )
 
+READY_TIMEOUT_S = 5.0        # upper bound for the board to boot after the port opens
+READY_PROBE_S = 0.1          # wait per readiness probe
+
 
 def list_serial_ports():
     return [p.device for p in serial.tools.list_ports.comports()]
@@ -16,8 +19,9 @@ def list_serial_ports():
 
 class DeviceConnection:
 
-    def __init__(self, port, baudrate=115200, timeout=1.0, retries=3):
+    def __init__(self, port, baudrate=115200, timeout=1.0, retries=3, exclusive=True):
         self._port = port
+        self._exclusive = exclusive
         self._baudrate = baudrate
         self._timeout = timeout
         self._retries = retries
@@ -25,17 +29,23 @@ class DeviceConnection:
         self._reader_thread = None
         self._running = False
         self._ack_queue = queue.Queue()
-        self._lock = threading.Lock()
+        self._lock = threading.Lock()        # one request/ACK exchange at a time
+        self._tx_lock = threading.Lock()     # one packet on the wire at a time
 
         self._event_callbacks = []
         self._ack_callbacks = []
         self._tx_callbacks = []
         self._error_callbacks = []
+        self.tracer = None                   # tracing.Tracer: times request → ACK exchanges
 
     # ---- lifecycle ----
 
     def connect(self):
-        self._serial = serial.Serial(self._port, self._baudrate, timeout=0.1)
+        # exclusive: a second process opening the port would reset the board
+        # mid-session (rig discovery, a second main_* on the same port).
+        # serial_for_url also accepts pyserial URLs (loop://, socket://...)
+        self._serial = serial.serial_for_url(self._port, self._baudrate, timeout=0.1,
+                                             exclusive=self._exclusive or None)
         self._running = True
         self._reader_thread = threading.Thread(target=self._reader_loop, daemon=True)
         self._reader_thread.start()
@@ -73,29 +83,109 @@ class DeviceConnection:
         packet = build_packet(register, MSG_WRITE, value)
         return self._send_with_retry(packet, register)
 
+    def send_register(self, register, value):
+        """Write without waiting for the ACK. Safe to call from an on_event()
+        callback (the reader thread, which is what delivers ACKs) — used by
+        rule_engine for reflex responses. The ACK is ignored."""
+        self._write(build_packet(register, MSG_WRITE, value))
+
     def read_register(self, register):
         packet = build_packet(register, MSG_READ)
         return self._send_with_retry(packet, register)
 
+    def read_registers(self, registers, strict=True):
+        """Read several registers in one round trip: every READ is sent
+        back-to-back and the ACKs are matched by register as they arrive.
+        Registers still unanswered after the timeout are re-sent, up to
+        `retries` times. Returns {register: value}; with strict=False the
+        registers that never answered are just left out instead of raising."""
+        pending = list(dict.fromkeys(registers))
+        values = {}
+        with self._lock:
+            self._drain_acks()
+            for attempt in range(self._retries):
+                for register in pending:
+                    self._write(build_packet(register, MSG_READ))
+                deadline = time.monotonic() + self._timeout
+                while pending:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        register, value = self._ack_queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if register in pending:
+                        pending.remove(register)
+                        values[register] = value
+                if not pending:
+                    return values
+                err = (f"Timeout (attempt {attempt + 1}/{self._retries}) for "
+                       + ", ".join(f"0x{r:02X}" for r in pending))
+                for cb in self._error_callbacks:
+                    cb(err)
+
+        if not strict:
+            return values
+        raise TimeoutError(
+            "No ACK received after "
+            f"{self._retries} attempts for registers {', '.join(f'0x{r:02X}' for r in pending)}"
+        )
+
+    def wait_ready(self, timeout=READY_TIMEOUT_S, probe_register=REG_DOOR_STATUS):
+        """Block until the firmware answers a READ (the board resets when the
+        port opens), probing every READY_PROBE_S. Returns the seconds waited;
+        raises TimeoutError if the board never answers."""
+        start = time.monotonic()
+        packet = build_packet(probe_register, MSG_READ)
+        with self._lock:
+            while True:
+                self._drain_acks()
+                self._write(packet)
+                try:
+                    while True:
+                        register, _ = self._ack_queue.get(timeout=READY_PROBE_S)
+                        if register == probe_register:
+                            return time.monotonic() - start
+                except queue.Empty:
+                    pass
+                if time.monotonic() - start >= timeout:
+                    raise TimeoutError(f"Device on {self._port} not ready after {timeout:.1f} s")
+
     # ---- internals ----
 
+    def _drain_acks(self):
+        while not self._ack_queue.empty():
+            try:
+                self._ack_queue.get_nowait()
+            except queue.Empty:
+                break
+
+    def _write(self, packet):
+        with self._tx_lock:
+            self._serial.write(packet)
+        for cb in self._tx_callbacks:
+            cb(packet[1], packet[2], packet[3])
+
     def _send_with_retry(self, packet, register):
         with self._lock:
             # drain stale ACKs
-            while not self._ack_queue.empty():
-                try:
-                    self._ack_queue.get_nowait()
-                except queue.Empty:
-                    break
+            self._drain_acks()
 
+            tracer = self.tracer
+            start = tracer.now() if tracer is not None else None
             last_err = None
             for attempt in range(self._retries):
                 try:
-                    self._serial.write(packet)
-                    for cb in self._tx_callbacks:
-                        cb(packet[1], packet[2], packet[3])
-                    ack = self._ack_queue.get(timeout=self._timeout)
-                    return ack
+                    self._write(packet)
+                    deadline = time.monotonic() + self._timeout
+                    while True:
+                        # ACKs of send_register() writes may arrive in between
+                        ack = self._ack_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                        if ack[0] == register:
+                            if tracer is not None:
+                                tracer.command(register, start, tracer.now(), attempt + 1)
+                            return ack
                 except queue.Empty:
                     last_err = f"Timeout (attempt {attempt + 1}/{self._retries}) for 0x{register:02X}"
                     for cb in self._error_callbacks:
@@ -109,8 +199,12 @@ class DeviceConnection:
         buf = bytearray()
         while self._running:
             try:
-                if self._serial and self._serial.in_waiting:
-                    buf.extend(self._serial.read(self._serial.in_waiting))
+                if not self._serial:
+                    time.sleep(0.01)
+                    continue
+                # Blocks until the first byte arrives (or the 0.1 s port
+                # timeout), so an event is dispatched as soon as it lands
+                buf.extend(self._serial.read(max(1, self._serial.in_waiting)))
 
                 while len(buf) >= PACKET_SIZE:
                     try:
@@ -149,5 +243,4 @@ class DeviceConnection:
                 if self._running:
                     for cb in self._error_callbacks:
                         cb(f"Read error: {e}")
-
-            time.sleep(0.01)
+                time.sleep(0.01)
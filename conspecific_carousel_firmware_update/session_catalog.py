@@ -0,0 +1,330 @@
+# session_catalog.py — SQLite catalog of recorded sessions across task families
+#
+# One row per session folder (SocialMemoryData/<animal>_<n>_<mode>_<date>_<species>,
+# SocialRewardData/..., SocialChoiceData/..., SocialReward2AFCData/...) with the
+# metadata.json fields that matter for finding sessions, trial counts, summary
+# metrics and an inventory of the files in the folder.
+#
+# The main scripts add their session when it ends (record_session()), and
+# `scan` picks up anything else (older sessions, copied-in data). Scanning is
+# incremental: a folder is only re-read when its file listing or mtimes change.
+#
+# Usage:
+#   python session_catalog.py scan [DATA_ROOT ...]        # default: current directory
+#   python session_catalog.py add <session_dir>
+#   python session_catalog.py query --family socialreward2afc --phase mixed --animal Rat3
+#   python session_catalog.py query --species mouse --from 2026-06-01 --to 2026-06-30 --json
+#   python session_catalog.py files <session_dir>
+#
+# The catalog lives in CATALOG_PATH (next to the *Data folders) unless --db is given.
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from typing import Dict, Iterable, List, Optional
+
+from session_family import FAMILY_BY_FOLDER, detect_family
+
+CATALOG_PATH = "session_catalog.sqlite"
+
+# Trial-level CSVs written by the main scripts, in order of preference for
+# the session's headline trial count
+_TRIAL_FILES = ("trials.csv", "presentations.csv", "conditioning_trials.csv")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_dir   TEXT PRIMARY KEY,
+    family        TEXT,
+    animal        TEXT,
+    session_n     TEXT,
+    phase         TEXT,
+    species       TEXT,
+    date          TEXT,
+    started       TEXT,
+    n_trials      INTEGER,
+    summary       TEXT,
+    metadata      TEXT,
+    signature     TEXT,
+    cataloged     TEXT DEFAULT (datetime('now'))
+);
+CREATE INDEX IF NOT EXISTS sessions_lookup ON sessions (animal, family, phase, date);
+CREATE INDEX IF NOT EXISTS sessions_date ON sessions (date);
+CREATE TABLE IF NOT EXISTS files (
+    session_dir   TEXT REFERENCES sessions (session_dir) ON DELETE CASCADE,
+    name          TEXT,
+    bytes         INTEGER,
+    mtime         REAL,
+    PRIMARY KEY (session_dir, name)
+);
+"""
+
+
+def connect(db_path: str = CATALOG_PATH) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+# ── Reading a session folder ──────────────────────────────────────────────────
+
+def _inventory(session_dir: str) -> List[tuple]:
+    files = []
+    for entry in os.scandir(session_dir):
+        if entry.is_file():
+            st = entry.stat()
+            files.append((entry.name, st.st_size, st.st_mtime))
+    return sorted(files)
+
+
+def _signature(files: List[tuple]) -> str:
+    return json.dumps([(name, size, round(mtime, 3)) for name, size, mtime in files])
+
+
+def _summarise_csv(path: str) -> dict:
+    """Row count plus the metrics every family's trial CSVs can answer."""
+    import pandas as pd
+    try:
+        df = pd.read_csv(path)
+    except (pd.errors.EmptyDataError, pd.errors.ParserError):
+        return {"rows": 0}
+    out = {"rows": int(len(df))}
+    if "reward_triggered" in df.columns:
+        out["rewards"] = int(pd.to_numeric(df["reward_triggered"], errors="coerce").fillna(0).sum())
+    if "outcome" in df.columns:
+        out["outcomes"] = {str(k): int(v) for k, v in df["outcome"].value_counts().items()}
+    for col in ("rt", "sampling_time"):
+        if col in df.columns:
+            values = pd.to_numeric(df[col], errors="coerce").dropna()
+            if len(values):
+                out[f"{col}_median"] = round(float(values.median()), 4)
+    return out
+
+
+def read_session(session_dir: str, family: Optional[str] = None) -> dict:
+    """Everything the catalog stores about one session folder."""
+    session_dir = os.path.abspath(session_dir)
+    meta = {}
+    meta_path = os.path.join(session_dir, "metadata.json")
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+    if family is None:
+        try:
+            family = detect_family(session_dir)
+        except ValueError:
+            family = None
+
+    files = _inventory(session_dir)
+    names = {name for name, _, _ in files}
+    summary = {name: _summarise_csv(os.path.join(session_dir, name))
+               for name in _TRIAL_FILES if name in names}
+    n_trials = next((summary[name]["rows"] for name in _TRIAL_FILES if name in summary), None)
+
+    return {
+        "session_dir": session_dir,
+        "family": family,
+        "animal": meta.get("animal"),
+        "session_n": None if meta.get("session_n") is None else str(meta["session_n"]),
+        "phase": meta.get("phase", meta.get("mode")),
+        "species": meta.get("species"),
+        "date": meta.get("date"),
+        "started": meta.get("timestamp"),
+        "n_trials": n_trials,
+        "summary": json.dumps(summary),
+        "metadata": json.dumps(meta),
+        "signature": _signature(files),
+        "files": files,
+    }
+
+
+# ── Updating ──────────────────────────────────────────────────────────────────
+
+def add_session(conn: sqlite3.Connection, session_dir: str, family: Optional[str] = None) -> None:
+    row = read_session(session_dir, family)
+    files = row.pop("files")
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions "
+            "(session_dir, family, animal, session_n, phase, species, date, started, "
+            " n_trials, summary, metadata, signature) "
+            "VALUES (:session_dir, :family, :animal, :session_n, :phase, :species, :date, "
+            " :started, :n_trials, :summary, :metadata, :signature)",
+            row,
+        )
+        conn.execute("DELETE FROM files WHERE session_dir = ?", (row["session_dir"],))
+        conn.executemany(
+            "INSERT INTO files (session_dir, name, bytes, mtime) VALUES (?, ?, ?, ?)",
+            [(row["session_dir"], name, size, mtime) for name, size, mtime in files],
+        )
+
+
+def _session_dirs(root: str) -> Iterable[str]:
+    """Session folders under a data root (the directory holding the *Data
+    folders), or under a single *Data folder."""
+    root = os.path.abspath(root)
+    if os.path.basename(root) in FAMILY_BY_FOLDER:
+        family_dirs = [root]
+    else:
+        family_dirs = [os.path.join(root, name) for name in FAMILY_BY_FOLDER
+                       if os.path.isdir(os.path.join(root, name))]
+    for family_dir in family_dirs:
+        for entry in sorted(os.scandir(family_dir), key=lambda e: e.name):
+            if entry.is_dir():
+                yield entry.path
+
+
+def scan(conn: sqlite3.Connection, roots: Iterable[str], prune: bool = True) -> Dict[str, int]:
+    """Bring the catalog up to date with the session folders under roots.
+
+    Only folders whose file listing changed since they were last cataloged are
+    re-read. With prune, sessions whose folder no longer exists are dropped."""
+    known = dict(conn.execute("SELECT session_dir, signature FROM sessions").fetchall())
+    counts = {"added": 0, "updated": 0, "unchanged": 0, "removed": 0}
+    seen = set()
+    for root in roots:
+        for session_dir in _session_dirs(root):
+            seen.add(session_dir)
+            if known.get(session_dir) == _signature(_inventory(session_dir)):
+                counts["unchanged"] += 1
+                continue
+            counts["updated" if session_dir in known else "added"] += 1
+            add_session(conn, session_dir)
+    if prune:
+        gone = [d for d in known if d not in seen and not os.path.isdir(d)]
+        with conn:
+            conn.executemany("DELETE FROM sessions WHERE session_dir = ?", [(d,) for d in gone])
+        counts["removed"] = len(gone)
+    return counts
+
+
+def record_session(session_dir: str, db_path: Optional[str] = None) -> None:
+    """Catalog a just-finished session. Called from the main scripts' shutdown,
+    so failures are reported and swallowed."""
+    if db_path is None:
+        db_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(session_dir))),
+                               CATALOG_PATH)
+    try:
+        conn = connect(db_path)
+        try:
+            add_session(conn, session_dir)
+        finally:
+            conn.close()
+        print(f"[INFO] Session cataloged: {db_path}")
+    except Exception as e:
+        print(f"[WARN] Could not update session catalog: {e}")
+
+
+# ── Querying ──────────────────────────────────────────────────────────────────
+
+def query(
+    conn: sqlite3.Connection,
+    family: Optional[str] = None,
+    animal: Optional[str] = None,
+    phase: Optional[str] = None,
+    species: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> List[sqlite3.Row]:
+    """Sessions matching every given filter, oldest first. Dates are ISO
+    YYYY-MM-DD and inclusive."""
+    clauses, args = [], []
+    for column, value in (("family", family), ("animal", animal),
+                          ("phase", phase), ("species", species)):
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            args.append(value)
+    if date_from is not None:
+        clauses.append("date >= ?")
+        args.append(date_from)
+    if date_to is not None:
+        clauses.append("date <= ?")
+        args.append(date_to)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return conn.execute(
+        f"SELECT * FROM sessions {where} ORDER BY date, started, session_dir", args
+    ).fetchall()
+
+
+# ── CLI ───────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="Catalog and search recorded sessions.")
+    parser.add_argument("--db", default=CATALOG_PATH, help=f"Catalog file (default: {CATALOG_PATH})")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_scan = sub.add_parser("scan", help="Catalog new/changed session folders")
+    p_scan.add_argument("roots", nargs="*", default=["."],
+                        help="Folders holding the *Data folders, or *Data folders themselves")
+    p_scan.add_argument("--no-prune", action="store_true",
+                        help="Keep entries whose session folder no longer exists")
+
+    p_add = sub.add_parser("add", help="Catalog one session folder")
+    p_add.add_argument("session_dir")
+    p_add.add_argument("--family", default=None, help="Override task-family auto-detection")
+
+    p_query = sub.add_parser("query", help="List sessions matching filters")
+    p_query.add_argument("--family")
+    p_query.add_argument("--animal")
+    p_query.add_argument("--phase", help="Phase, or mode for SocialMemory")
+    p_query.add_argument("--species")
+    p_query.add_argument("--from", dest="date_from", metavar="YYYY-MM-DD")
+    p_query.add_argument("--to", dest="date_to", metavar="YYYY-MM-DD")
+    p_query.add_argument("--json", action="store_true", help="Print full rows as JSON")
+
+    p_files = sub.add_parser("files", help="List the cataloged files of a session")
+    p_files.add_argument("session_dir")
+
+    args = parser.parse_args()
+    conn = connect(args.db)
+
+    if args.command == "scan":
+        counts = scan(conn, args.roots, prune=not args.no_prune)
+        print(f"[INFO] {counts['added']} added, {counts['updated']} updated, "
+              f"{counts['unchanged']} unchanged, {counts['removed']} removed")
+
+    elif args.command == "add":
+        if not os.path.isdir(args.session_dir):
+            sys.exit(f"[ERROR] Not a directory: {args.session_dir}")
+        add_session(conn, args.session_dir, args.family)
+        print(f"[INFO] Cataloged {os.path.abspath(args.session_dir)}")
+
+    elif args.command == "query":
+        rows = query(conn, args.family, args.animal, args.phase, args.species,
+                     args.date_from, args.date_to)
+        if args.json:
+            out = []
+            for row in rows:
+                d = dict(row)
+                d["summary"] = json.loads(d["summary"] or "{}")
+                d["metadata"] = json.loads(d["metadata"] or "{}")
+                out.append(d)
+            print(json.dumps(out, indent=2))
+            return
+        print(f"{'date':<10}  {'family':<16}  {'animal':<10}  {'n':>3}  {'phase':<12}  "
+              f"{'species':<7}  {'trials':>6}  folder")
+        for row in rows:
+            print(f"{row['date'] or '':<10}  {row['family'] or '':<16}  {row['animal'] or '':<10}  "
+                  f"{row['session_n'] or '':>3}  {row['phase'] or '':<12}  {row['species'] or '':<7}  "
+                  f"{'' if row['n_trials'] is None else row['n_trials']:>6}  "
+                  f"{os.path.basename(row['session_dir'])}")
+        print(f"[INFO] {len(rows)} session(s)")
+
+    elif args.command == "files":
+        session_dir = os.path.abspath(args.session_dir)
+        rows = conn.execute("SELECT name, bytes FROM files WHERE session_dir = ? ORDER BY name",
+                            (session_dir,)).fetchall()
+        if not rows:
+            sys.exit(f"[ERROR] {session_dir} is not in the catalog")
+        for row in rows:
+            print(f"{row['bytes']:>12}  {row['name']}")
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# session_common.py — Trial bookkeeping shared by the four session bases
+#
+# BaseSCSession, BaseSMSession, BaseSocialSession and Base2AFCSession inherit
+# SessionCommon for what every family does the same way around a trial:
+#   schedule    seeded per-trial draws (trial_schedule.py), built by
+#               build_session() through make_schedule(); _next_iti() reads it
+#   adaptation  adaptive parameters (adaptation.py), fed each trial's logged
+#               row by _adapt_from_log(), or early fields through _adapt()
+#   params      live parameter changes (param_store.py)
+#
+# The base's __init__ calls _init_common() after setting trial_counter and
+# max_trials; the session loop (in each base) calls params.apply_pending(),
+# adaptation.before_trial(), _run_trial(), _adapt_from_log(), params.annotate().
+
+import random
+import threading
+
+from adaptation import AdaptationEngine
+from param_store import ParamStore
+from trial_schedule import TrialSchedule
+
+
+class SessionCommon:
+    """Mixin; the base defines ITI_MIN / ITI_MAX, trial_counter, max_trials."""
+
+    def _init_common(self) -> None:
+        self.schedule = None   # trial_schedule.TrialSchedule (build_session)
+        self.adaptation = AdaptationEngine(self)   # build_session adds params["adaptation"]
+        self.params = ParamStore(self)   # live changes (param_store.py)
+        self._adapted = 0   # last trial that fed its own fields (_adapt)
+
+    # ── Trial schedule ────────────────────────────────────────────────────────
+
+    def make_schedule(self, seed: int) -> TrialSchedule:
+        """Per-trial draws for this session, built by build_session() before
+        the first trial. Sessions that present angles override this."""
+        return TrialSchedule(seed, n_trials=self.max_trials)
+
+    def _next_iti(self) -> float:
+        """This trial's ITI — from the schedule, or drawn now for sessions
+        without one (replays of sessions recorded before schedules)."""
+        if self.schedule is not None:
+            return self.schedule.iti(self.trial_counter, self.ITI_MIN, self.ITI_MAX)
+        return random.uniform(self.ITI_MIN, self.ITI_MAX)
+
+    # ── Adaptation ────────────────────────────────────────────────────────────
+
+    def _adapt(self, **fields) -> None:
+        """Feed trial fields to the adaptation rules now — for decisions the
+        trial needs before its row is logged (anti-camping, block ends)."""
+        self._adapted = self.trial_counter
+        self.adaptation.update(fields)
+
+    def _adapt_from_log(self) -> None:
+        """Feed the trial's logged results row to the adaptation rules, unless
+        the trial fed its own fields through _adapt()."""
+        if not self.adaptation.rules or self._adapted == self.trial_counter:
+            return
+        with getattr(self, "_df_lock", None) or threading.Lock():
+            row = self._last_logged_row()
+        if row is not None:
+            self.adaptation.update(row)
+
+    def _last_logged_row(self):
+        df = getattr(self, "results_df", None)
+        if df is None or df.empty or df["trial_num"].iloc[-1] != self.trial_counter:
+            return None
+        return df.iloc[-1].to_dict()
@@ -0,0 +1,28 @@
+# session_family.py — Task family of a saved session folder
+#
+# Session folders live under one *Data folder per task family (created by the
+# main_*.py scripts), so the family follows from the parent folder's name:
+#   SocialReward2AFCData/Rat1_3_task_2026-06-20_rat  →  "socialreward2afc"
+# Kept free of pandas / matplotlib so the catalog and the replay tools can
+# look families up without importing the plotting stack.
+
+import os
+
+FAMILY_BY_FOLDER = {
+    "SocialMemoryData":       "socialmemory",
+    "SocialRewardData":       "socialreward",
+    "SocialChoiceData":       "socialchoice",
+    "SocialReward2AFCData":   "socialreward2afc",
+}
+
+
+def detect_family(session_dir: str) -> str:
+    """Family of session_dir from its parent folder; ValueError if unknown."""
+    parent = os.path.basename(os.path.dirname(os.path.abspath(session_dir)))
+    family = FAMILY_BY_FOLDER.get(parent)
+    if family is None:
+        raise ValueError(
+            f"Could not detect task family from parent folder '{parent}'. "
+            f"Pass --family explicitly (one of: {', '.join(sorted(set(FAMILY_BY_FOLDER.values())))})."
+        )
+    return family
@@ -0,0 +1,639 @@
+# session_replay.py — Deterministic, accelerated replay of a recorded session
+# against the current session code (no hardware / serial connection required).
+#
+# Usage:
+#   python session_replay.py <path> [<path> ...] [--family NAME]
+#                            [--tolerance S] [--out DIR] [--jobs N] [--verbose]
+#
+# Each <path> is either a session folder created by one of the main_*.py
+# scripts with "Record raw serial packets" enabled (it must contain
+# packets.bin and metadata.json), or any folder above them — every session
+# folder found underneath is replayed in turn.
+#
+# How it works:
+#   • The recorded firmware events in packets.bin are fed, at their recorded
+#     times, into a fresh EventLogger / SharedSensorState through a fake
+#     DeviceConnection (ReplayDevice) that ACKs every write immediately
+#     (after the median ACK latency seen in the recording).
+#   • The session is built with the same main_*.build_session() used by the
+#     live run, with the same params and random seed (metadata.json), and
+#     runs off the recorded trial schedule (schedule.npy) when there is one.
+#   • time.time() / time.sleep() are replaced by a VirtualClock. Virtual time
+#     only advances once every session thread is asleep, straight to the next
+#     sleeper's wake time or the next recorded event, so hours of polling
+#     loops replay in seconds, and threads are woken one at a time in a fixed
+#     order so every run is identical.
+#   • The replayed trial rows are compared with the recorded CSVs; numeric
+#     values must agree within --tolerance seconds. Exits non-zero if any
+#     session does not reproduce.
+#
+# Sessions recorded before random_seed was stored in metadata.json cannot
+# reproduce their random draws (ITIs, block order, return angles), so their
+# comparison is expected to fail on those columns.
+
+import argparse
+import contextlib
+import importlib
+import io
+import math
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional
+
+import pandas as pd
+
+import hardware
+import state_machine
+import utils
+from hardware import SharedSensorState, EventLogger, CameraTriggerLogger
+from packet_capture import (
+    read_capture, DIR_TX, DIR_ACK, DIR_EVENT, DIR_MARK,
+    MARK_SESSION_START, MARK_SESSION_STOP,
+)
+from protocol import MSG_WRITE, MSG_READ, REG_DOOR_OPN_SPD, REG_DOOR_CLS_SPD, REG_TABLE_SPD
+from replay_performance import _load_metadata
+from rig import MAIN_MODULES, result_files
+from session_family import FAMILY_BY_FOLDER, detect_family
+from trial_schedule import SCHEDULE_FILE
+
+
+_SPEED_REGS = (REG_DOOR_OPN_SPD, REG_DOOR_CLS_SPD, REG_TABLE_SPD)
+
+# Virtual seconds to keep running after the stop point while session threads
+# wind down (door close, table return, ...), before giving up on them.
+STOP_GRACE = 60.0
+
+
+class ReplayError(RuntimeError):
+    pass
+
+
+# ── Virtual clock ─────────────────────────────────────────────────────────────
+
+class VirtualClock:
+    """
+    Replaces time.time(), time.sleep(), Thread.join() and hardware/utils.now()
+    while installed (use as a context manager).
+
+    Threads that already exist when the clock is installed (the replay driver,
+    GUI, etc.) keep real sleeps; every thread started afterwards is a session
+    "participant". A participant's sleep() parks it until the driver advances
+    virtual time past its wake time. The driver only advances time when every
+    participant is parked (or joining a participant that is still alive), so
+    no polling loop can observe a time it would not have seen in real life.
+    """
+
+    def __init__(self, start: float, stall_timeout: float = 10.0):
+        self._now = start
+        self._cond = threading.Condition()
+        self._sleepers = {}   # Thread → (wake_time, seq)
+        self._joining = {}    # Thread → Thread it is joining
+        self._seq = 0
+        self._baseline = set()
+        self._participants = []
+        self._saved = None
+        self.stall_timeout = stall_timeout
+
+    # ── Patched functions ─────────────────────────────────────────────────────
+
+    def time(self) -> float:
+        return self._now
+
+    def now(self) -> datetime:
+        return datetime.fromtimestamp(self._now)
+
+    def sleep(self, seconds: float) -> None:
+        me = threading.current_thread()
+        if me in self._baseline:
+            self._real_sleep(seconds)
+            return
+        with self._cond:
+            self._seq += 1
+            self._sleepers[me] = (self._now + max(0.0, seconds), self._seq)
+            self._cond.notify_all()
+            # The driver removes us from _sleepers when it is our turn to run
+            while me in self._sleepers:
+                self._cond.wait()
+
+    def wait_event(self, events, timeout: Optional[float]):
+        """state_machine.wait_event() in virtual time: a blocking queue.get()
+        would leave the thread neither asleep nor runnable."""
+        import queue
+        deadline = None if timeout is None else self._now + timeout
+        while True:
+            try:
+                return events.get_nowait()
+            except queue.Empty:
+                pass
+            if deadline is not None and self._now >= deadline:
+                return None
+            self.sleep(0.001 if deadline is None else min(0.001, deadline - self._now))
+
+    def _join(self, thread: threading.Thread, timeout: Optional[float] = None) -> None:
+        me = threading.current_thread()
+        if me in self._baseline:
+            self._real_join(thread, timeout)
+            return
+        if timeout is not None:
+            deadline = self._now + timeout
+            while thread.is_alive() and self._now < deadline:
+                self.sleep(0.001)
+            return
+        with self._cond:
+            self._joining[me] = thread
+            self._cond.notify_all()
+        try:
+            self._real_join(thread)
+        finally:
+            with self._cond:
+                self._joining.pop(me, None)
+
+    # ── Install / restore ─────────────────────────────────────────────────────
+
+    def __enter__(self) -> "VirtualClock":
+        self._baseline = set(threading.enumerate())
+        self._saved = (time.time, time.sleep, threading.Thread.start,
+                       threading.Thread.join, hardware.now, utils.now,
+                       state_machine.wait_event)
+        self._real_sleep = time.sleep
+        self._real_join = threading.Thread.join
+        real_start = threading.Thread.start
+
+        clock = self
+
+        def start(thread):
+            # Registered before it runs; the starting thread is still busy
+            # (not parked), so the driver cannot advance before it is alive.
+            with clock._cond:
+                clock._participants.append(thread)
+            real_start(thread)
+
+        def join(thread, timeout=None):
+            clock._join(thread, timeout)
+
+        time.time = self.time
+        time.sleep = self.sleep
+        threading.Thread.start = start
+        threading.Thread.join = join
+        hardware.now = self.now
+        utils.now = self.now
+        state_machine.wait_event = self.wait_event
+        return self
+
+    def __exit__(self, *exc) -> None:
+        (time.time, time.sleep, threading.Thread.start, threading.Thread.join,
+         hardware.now, utils.now, state_machine.wait_event) = self._saved
+
+    # ── Driver side ───────────────────────────────────────────────────────────
+
+    def participants(self) -> List[threading.Thread]:
+        """Live threads started since the clock was installed."""
+        with self._cond:
+            self._participants = [t for t in self._participants if t.is_alive()]
+            return list(self._participants)
+
+    def _quiescent(self) -> bool:
+        for t in self._participants:
+            if not t.is_alive():
+                continue
+            if t in self._sleepers:
+                continue
+            target = self._joining.get(t)
+            if target is not None and target.is_alive():
+                continue
+            return False
+        return True
+
+    def wait_quiescent(self) -> None:
+        """Block (in real time) until every participant is parked or has exited."""
+        give_up = time.monotonic() + self.stall_timeout
+        with self._cond:
+            while not self._quiescent():
+                if time.monotonic() > give_up:
+                    busy = [t.name for t in self.participants() if t not in self._sleepers]
+                    raise ReplayError(
+                        f"Replay stalled at t={self._now:.3f}: thread(s) {busy} blocked "
+                        f"outside time.sleep() for {self.stall_timeout:.0f} s"
+                    )
+                self._cond.wait(0.0005)
+
+    def next_wake(self) -> Optional[float]:
+        with self._cond:
+            return min((w for w, _ in self._sleepers.values()), default=None)
+
+    def advance_to(self, t: float) -> None:
+        if t > self._now:
+            self._now = t
+
+    def wake_due(self) -> None:
+        """Wake every sleeper due at the current time, one at a time in
+        (wake time, sleep order), letting each run until it parks again."""
+        while True:
+            with self._cond:
+                due = [(w, seq, th) for th, (w, seq) in self._sleepers.items()
+                       if w <= self._now]
+                if not due:
+                    return
+                _, _, th = min(due, key=lambda d: (d[0], d[1]))
+                del self._sleepers[th]
+                self._cond.notify_all()
+            self.wait_quiescent()
+
+
+# ── Fake device ───────────────────────────────────────────────────────────────
+
+class ReplayDevice:
+    """
+    Stand-in for DeviceConnection. Writes and reads are ACKed after
+    ack_latency (virtual) seconds; recorded firmware events are pushed in by
+    the replay driver via dispatch_event(). Transmitted packets are kept in
+    .tx as (time, register, msg_type, value) for comparison with the capture.
+    """
+
+    def __init__(self, ack_latency: float = 0.0):
+        self.ack_latency = ack_latency
+        self.tx = []
+        self._registers = {}
+        self._event_callbacks = []
+        self._ack_callbacks = []
+        self._tx_callbacks = []
+        self._error_callbacks = []
+
+    def connect(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    @property
+    def is_connected(self):
+        return True
+
+    def on_event(self, cb):
+        self._event_callbacks.append(cb)
+
+    def on_ack(self, cb):
+        self._ack_callbacks.append(cb)
+
+    def on_tx(self, cb):
+        self._tx_callbacks.append(cb)
+
+    def on_error(self, cb):
+        self._error_callbacks.append(cb)
+
+    def write_register(self, register, value):
+        self._registers[register] = value & 0xFF
+        return self._transact(register, MSG_WRITE, value & 0xFF)
+
+    def read_register(self, register):
+        return self._transact(register, MSG_READ, 0)
+
+    def _transact(self, register, msg_type, value):
+        self.tx.append((time.time(), register, msg_type, value))
+        for cb in self._tx_callbacks:
+            cb(register, msg_type, value)
+        if self.ack_latency > 0:
+            time.sleep(self.ack_latency)
+        ack_value = self._registers.get(register, 0)
+        for cb in self._ack_callbacks:
+            cb(register, ack_value)
+        return register, ack_value
+
+    def dispatch_event(self, register, value):
+        self._registers[register] = value
+        for cb in self._event_callbacks:
+            cb(register, value)
+
+
+# ── Recording ─────────────────────────────────────────────────────────────────
+
+class RecordedEvent(NamedTuple):
+    t: float          # absolute time.time()
+    register: int
+    value: int
+
+
+@dataclass
+class Recording:
+    events: List[RecordedEvent]
+    tx_times: List[float]
+    start: float
+    stop: float
+    ack_latency: float
+    has_marks: bool
+
+
+def load_recording(path: str) -> Recording:
+    """Read packets.bin into the event list, session bounds and ACK latency."""
+    events, tx_times, latencies = [], [], []
+    start = stop = None
+    first_cmd = last_t = None
+    pending_tx = {}
+    for rec in read_capture(path):
+        last_t = rec.t_wall
+        if rec.direction == DIR_EVENT:
+            events.append(RecordedEvent(rec.t_wall, rec.register, rec.value))
+        elif rec.direction == DIR_TX:
+            tx_times.append(rec.t_wall)
+            pending_tx[rec.register] = rec.t_wall
+            if first_cmd is None and rec.register not in _SPEED_REGS:
+                first_cmd = rec.t_wall
+        elif rec.direction == DIR_ACK:
+            t_tx = pending_tx.pop(rec.register, None)
+            if t_tx is not None:
+                latencies.append(rec.t_wall - t_tx)
+        elif rec.direction == DIR_MARK:
+            if rec.register == MARK_SESSION_START and start is None:
+                start = rec.t_wall
+            elif rec.register == MARK_SESSION_STOP:
+                stop = rec.t_wall
+
+    has_marks = start is not None and stop is not None
+    if start is None:
+        start = first_cmd if first_cmd is not None else (events[0].t if events else None)
+    if stop is None:
+        stop = last_t
+    if start is None or stop is None:
+        raise ReplayError(f"{path} contains no packets")
+
+    return Recording(
+        events=events,
+        tx_times=[t for t in tx_times if start <= t <= stop],
+        start=start,
+        stop=stop,
+        ack_latency=statistics.median(latencies) if latencies else 0.0,
+        has_marks=has_marks,
+    )
+
+
+# ── Result comparison ─────────────────────────────────────────────────────────
+
+def _values_match(a, b, tolerance: float) -> bool:
+    a_nan = isinstance(a, float) and math.isnan(a)
+    b_nan = isinstance(b, float) and math.isnan(b)
+    if a_nan or b_nan:
+        return a_nan and b_nan
+    try:
+        return abs(float(a) - float(b)) <= tolerance
+    except (TypeError, ValueError):
+        return str(a) == str(b)
+
+
+def compare_frames(recorded: pd.DataFrame, replayed: pd.DataFrame,
+                   tolerance: float = 0.1) -> List[str]:
+    """Return human-readable differences between two trial tables.
+
+    The replayed frame is round-tripped through CSV first so both sides have
+    the dtypes a saved trials.csv is read back with."""
+    replayed = pd.read_csv(io.StringIO(replayed.to_csv(index=False)))
+    diffs = []
+    if len(recorded) != len(replayed):
+        diffs.append(f"row count: recorded {len(recorded)}, replayed {len(replayed)}")
+    missing = [c for c in recorded.columns if c not in replayed.columns]
+    if missing:
+        diffs.append(f"columns missing from replay: {missing}")
+    cols = [c for c in recorded.columns if c in replayed.columns]
+    for i in range(min(len(recorded), len(replayed))):
+        for c in cols:
+            a, b = recorded[c].iloc[i], replayed[c].iloc[i]
+            if not _values_match(a, b, tolerance):
+                diffs.append(f"row {i + 1} {c}: recorded {a!r}, replayed {b!r}")
+    return diffs
+
+
+# ── Replay driver ─────────────────────────────────────────────────────────────
+
+@dataclass
+class ReplayResult:
+    session_dir: str
+    family: str
+    rows: Dict[str, int] = field(default_factory=dict)
+    diffs: Dict[str, List[str]] = field(default_factory=dict)
+    tx_recorded: int = 0
+    tx_replayed: int = 0
+    virtual_seconds: float = 0.0
+    wall_seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return not any(self.diffs.values())
+
+
+def replay_session(
+    session_dir: str,
+    family: Optional[str] = None,
+    out_dir: Optional[str] = None,
+    tolerance: float = 0.1,
+    verbose: bool = False,
+) -> ReplayResult:
+    """Replay one recorded session folder and compare its trial tables."""
+    family = family or detect_family(session_dir)
+    params = _load_metadata(session_dir)
+    if not params:
+        raise ReplayError(f"No metadata.json in {session_dir}")
+    capture_path = os.path.join(session_dir, "packets.bin")
+    if not os.path.exists(capture_path):
+        raise FileNotFoundError(f"packets.bin not found in {session_dir}")
+
+    recording = load_recording(capture_path)
+    if not recording.has_marks:
+        print(f"[WARN] {session_dir}: capture has no session start/stop marks — "
+              f"using first command / last packet as session bounds")
+    if params.get("random_seed") is None:
+        print(f"[WARN] {session_dir}: no random_seed in metadata — random draws "
+              f"will not match the recording")
+
+    main_module = importlib.import_module(MAIN_MODULES[family])
+    out_dir = out_dir or tempfile.mkdtemp(prefix="replay_")
+    os.makedirs(out_dir, exist_ok=True)
+
+    device = ReplayDevice(ack_latency=recording.ack_latency)
+    shared = SharedSensorState(stop_event=threading.Event())   # scoped like a Rig
+    result = ReplayResult(session_dir=session_dir, family=family,
+                          tx_recorded=len(recording.tx_times))
+
+    events = recording.events
+    n_events = len(events)
+    wall_start = time.perf_counter()
+    first_t = min(recording.start, events[0].t) if events else recording.start
+
+    quiet = open(os.devnull, "w") if not verbose else None
+    redirect = contextlib.redirect_stdout(quiet) if quiet else contextlib.nullcontext()
+    try:
+        with VirtualClock(first_t) as clock, redirect:
+            logger = EventLogger(
+                shared,
+                event_log_path=os.path.join(out_dir, "sensor_events.csv"),
+                session_start=recording.start,
+            )
+            device.on_event(logger)
+            kwargs = {}
+            if family == "socialmemory":
+                camera_logger = CameraTriggerLogger(session_start=recording.start)
+                device.on_event(camera_logger)
+                kwargs["camera_logger"] = camera_logger
+
+            # Sensor state going into the session
+            i = 0
+            while i < n_events and events[i].t <= recording.start:
+                clock.advance_to(events[i].t)
+                device.dispatch_event(events[i].register, events[i].value)
+                i += 1
+            clock.advance_to(recording.start)
+
+            session = main_module.build_session(params, device, shared, **kwargs)
+            if session is None:
+                raise ReplayError(f"build_session() rejected params in {session_dir}")
+            if session.schedule is not None and not session.schedule.adopt(
+                    os.path.join(session_dir, SCHEDULE_FILE)):
+                session.schedule = None   # recorded before schedules: draw live, as it did
+            session.start()
+
+            stopping = False
+            while True:
+                clock.wait_quiescent()
+                if not clock.participants():
+                    break
+                if not stopping and (clock.time() >= recording.stop or not session.running):
+                    # Same as the main script's finally block
+                    stopping = True
+                    shared.stop_event.set()
+                    session.running = False
+                    continue
+                if stopping and clock.time() > recording.stop + STOP_GRACE:
+                    print(f"[WARN] Session threads still running {STOP_GRACE:.0f} s "
+                          f"after stop — abandoning them", file=sys.stderr)
+                    break
+
+                candidates = [t for t in (
+                    clock.next_wake(),
+                    events[i].t if i < n_events else None,
+                    None if stopping else recording.stop,
+                ) if t is not None]
+                if not candidates:
+                    raise ReplayError(f"Replay stalled at t={clock.time():.3f}: "
+                                      f"no sleeping threads and no events left")
+                clock.advance_to(min(candidates))
+                while i < n_events and events[i].t <= clock.time():
+                    device.dispatch_event(events[i].register, events[i].value)
+                    i += 1
+                clock.wake_due()
+
+            result.virtual_seconds = clock.time() - recording.start
+    finally:
+        if quiet is not None:
+            quiet.close()
+
+    result.wall_seconds = time.perf_counter() - wall_start
+    result.tx_replayed = sum(1 for t, *_ in device.tx
+                             if recording.start <= t <= recording.stop)
+
+    for attr, filename in result_files(family, params):
+        replayed = getattr(session, attr)
+        replayed.to_csv(os.path.join(out_dir, filename), index=False)
+        result.rows[filename] = len(replayed)
+        recorded_path = os.path.join(session_dir, filename)
+        if not os.path.exists(recorded_path):
+            result.diffs[filename] = [f"{filename} not found in recorded session"]
+            continue
+        result.diffs[filename] = compare_frames(pd.read_csv(recorded_path), replayed,
+                                                tolerance)
+    return result
+
+
+# ── CLI ───────────────────────────────────────────────────────────────────────
+
+def _find_sessions(path: str) -> List[str]:
+    if os.path.exists(os.path.join(path, "packets.bin")):
+        return [path]
+    found = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        if "packets.bin" in files:
+            found.append(root)
+    return found
+
+
+def _replay_job(job):
+    """Run one replay; returns a ReplayResult or the error message."""
+    session_dir, family, out_dir, tolerance, verbose = job
+    try:
+        return replay_session(session_dir, family=family, out_dir=out_dir,
+                              tolerance=tolerance, verbose=verbose)
+    except (FileNotFoundError, ValueError, ReplayError) as e:
+        return str(e)
+
+
+def _report(session_dir: str, res, max_diffs: int) -> bool:
+    """Print one session's outcome; returns True if it reproduced."""
+    if isinstance(res, str):
+        print(f"[ERROR] {session_dir}: {res}")
+        return False
+    speedup = res.virtual_seconds / res.wall_seconds if res.wall_seconds > 0 else float("inf")
+    rows = ", ".join(f"{n} {f}" for f, n in res.rows.items())
+    status = "OK  " if res.ok else "FAIL"
+    print(f"[{status}] {session_dir} — {rows}; {res.virtual_seconds:.0f} s replayed in "
+          f"{res.wall_seconds:.1f} s ({speedup:.0f}×); "
+          f"TX recorded {res.tx_recorded}, replayed {res.tx_replayed}")
+    for filename, diffs in res.diffs.items():
+        for d in diffs[:max_diffs]:
+            print(f"         {filename}: {d}")
+        if len(diffs) > max_diffs:
+            print(f"         {filename}: ... {len(diffs) - max_diffs} more")
+    return res.ok
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay recorded sessions (packets.bin) through the current "
+                    "session code and check the trial rows are reproduced."
+    )
+    parser.add_argument("paths", nargs="+",
+                        help="Session folder(s), or folders to search for sessions")
+    parser.add_argument("--family", choices=sorted(set(FAMILY_BY_FOLDER.values())),
+                        help="Override task-family auto-detection")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Allowed difference for numeric values, e.g. times in s (default 0.1)")
+    parser.add_argument("--out", default=None,
+                        help="Write replayed CSVs under this folder (default: temp folder)")
+    parser.add_argument("--max-diffs", type=int, default=10,
+                        help="Differences to print per table (default 10)")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Replay this many sessions in parallel processes (default 1)")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Show the session's own console output")
+    args = parser.parse_args()
+
+    sessions = [s for p in args.paths for s in _find_sessions(p)]
+    if not sessions:
+        sys.exit("[ERROR] No session folders with packets.bin found")
+
+    jobs = [
+        (session_dir, args.family,
+         os.path.join(args.out, os.path.basename(os.path.abspath(session_dir))) if args.out else None,
+         args.tolerance, args.verbose)
+        for session_dir in sessions
+    ]
+    if args.jobs > 1:
+        # Each replay patches the time module, so parallel replays need
+        # separate processes rather than threads.
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            outcomes = pool.map(_replay_job, jobs)
+            failed = sum(not _report(session_dir, outcome, args.max_diffs)
+                         for (session_dir, *_), outcome in zip(jobs, outcomes))
+    else:
+        failed = sum(not _report(job[0], _replay_job(job), args.max_diffs) for job in jobs)
+
+    print(f"[INFO] {len(sessions) - failed}/{len(sessions)} session(s) reproduced")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,15 @@
 """
 Setup control GUI for conspecific carousel (new firmware).
 Provides buttons for all basic device commands:
-  LEDs A/B/C, reward valves A/B/C, door open/close, turntable 90° CW/CCW.
+  LEDs A/B/C, reward valves A/B/C, door open/close, turntable 90° CW/CCW,
+and a Rules panel for host-side trigger → action rules (rule_engine.py),
+which run on the serial reader thread while connected.
 """
 
 import threading
 import time
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog
 
 from protocol import (
     REG_PA_LED, REG_PA_VALVE,
@@ -16,10 +18,13 @@ from protocol import (
     REG_PC_LED, REG_PC_VALVE,
     REG_DOOR_CMD, REG_TABLE_CMD,
     REG_DOOR_OPN_SPD, REG_DOOR_CLS_SPD, REG_TABLE_SPD,
+    READABLE_REGISTERS, TRIGGER_OPTIONS, ACTION_OPTIONS,
     build_table_command,
     reg_name, format_value,
 )
 from serial_comm import DeviceConnection, list_serial_ports
+import rig_discovery
+from rule_engine import MODES, Rule, RuleEngine, load_rules, save_rules
 from gui_utils import make_scrollable, fit_window_to_screen
 
 BAUDRATE = 115200
@@ -40,6 +45,7 @@ class App(tk.Tk):
         self.title("Carousel Setup Control")
         self.resizable(True, True)
         self.conn: DeviceConnection | None = None
+        self.rules = RuleEngine(on_fire=self._on_rule_fired)
         self._build_ui()
         self.protocol("WM_DELETE_WINDOW", self._on_close)
         fit_window_to_screen(self._scroll_body)
@@ -152,9 +158,52 @@ class App(tk.Tk):
                   font=("Arial", 8), foreground="gray").grid(
             row=len(speed_defs), column=0, columnspan=4, sticky="w", padx=6, pady=(0, 2))
 
+        # Rules (host-side, run on the serial reader thread)
+        rules_frame = ttk.LabelFrame(body, text="Rules (trigger → action)")
+        rules_frame.grid(row=4, column=0, columnspan=2, sticky="ew", **pad)
+
+        self.rule_trigger_var = tk.StringVar(value=TRIGGER_OPTIONS[0][0])
+        self.rule_action_var = tk.StringVar(value=ACTION_OPTIONS[0][0])
+        self.rule_guard_var = tk.StringVar(value="(none)")
+        self.rule_mode_var = tk.StringVar(value=MODES[0])
+        self.rule_pulse_var = tk.IntVar(value=0)
+
+        ttk.Label(rules_frame, text="When").grid(row=0, column=0, sticky="w", **pad)
+        ttk.Combobox(rules_frame, textvariable=self.rule_trigger_var, state="readonly", width=24,
+                     values=[name for name, _, _ in TRIGGER_OPTIONS]).grid(row=0, column=1, **pad)
+        ttk.Label(rules_frame, text="do").grid(row=0, column=2, **pad)
+        ttk.Combobox(rules_frame, textvariable=self.rule_action_var, state="readonly", width=20,
+                     values=[name for name, _, _ in ACTION_OPTIONS]).grid(row=0, column=3, **pad)
+
+        ttk.Label(rules_frame, text="Only if").grid(row=1, column=0, sticky="w", **pad)
+        ttk.Combobox(rules_frame, textvariable=self.rule_guard_var, state="readonly", width=24,
+                     values=["(none)"] + [name for name, _, _ in TRIGGER_OPTIONS]).grid(
+            row=1, column=1, **pad)
+        opts = ttk.Frame(rules_frame)
+        opts.grid(row=1, column=2, columnspan=2, sticky="w")
+        ttk.Combobox(opts, textvariable=self.rule_mode_var, state="readonly", width=6,
+                     values=list(MODES)).grid(row=0, column=0, **pad)
+        ttk.Label(opts, text="Pulse (ms):").grid(row=0, column=1)
+        ttk.Spinbox(opts, from_=0, to=5000, increment=10,
+                    textvariable=self.rule_pulse_var, width=6).grid(row=0, column=2, **pad)
+        ttk.Button(opts, text="Add", command=self._add_rule).grid(row=0, column=3, **pad)
+
+        self.rules_list = tk.Listbox(rules_frame, height=5, width=70, font=("Courier", 9))
+        self.rules_list.grid(row=2, column=0, columnspan=4, sticky="ew", **pad)
+
+        btns = ttk.Frame(rules_frame)
+        btns.grid(row=3, column=0, columnspan=4, sticky="ew")
+        for i, (label, cmd) in enumerate([("Remove", self._remove_rule),
+                                          ("Re-arm", self._rearm_rules),
+                                          ("Save…", self._save_rules),
+                                          ("Load…", self._load_rules)]):
+            ttk.Button(btns, text=label, command=cmd).grid(row=0, column=i, **pad)
+        self.rule_latency_lbl = ttk.Label(btns, text="", foreground="gray")
+        self.rule_latency_lbl.grid(row=0, column=4, sticky="w", **pad)
+
         # Log
         log_frame = ttk.LabelFrame(body, text="Log")
-        log_frame.grid(row=4, column=0, columnspan=2, sticky="ew", **pad)
+        log_frame.grid(row=5, column=0, columnspan=2, sticky="ew", **pad)
 
         self.log_text = tk.Text(log_frame, height=10, width=62, state="disabled", font=("Courier", 9))
         self.log_text.grid(row=0, column=0, **pad)
@@ -166,6 +215,10 @@ class App(tk.Tk):
 
     def _refresh_ports(self):
         ports = list_serial_ports()
+        rigs = rig_discovery.cached()      # carousels first if a dialog scanned recently
+        if rigs:
+            carousels = [r.port for r in rigs if r.is_carousel and r.port in ports]
+            ports = carousels + [p for p in ports if p not in carousels]
         self.port_combo["values"] = ports
         if ports and not self.port_var.get():
             self.port_var.set(ports[0])
@@ -183,9 +236,11 @@ class App(tk.Tk):
             return
         try:
             self.conn = DeviceConnection(port, baudrate=BAUDRATE)
+            self.rules.attach(self.conn)        # first: rules run before logging
             self.conn.on_event(self._on_event)
             self.conn.on_error(self._on_error)
             self.conn.connect()
+            threading.Thread(target=self._seed_rules, args=(self.conn,), daemon=True).start()
             self.status_lbl.config(text="Connected", fg="green")
             self.connect_btn.config(text="Disconnect")
             self.port_combo.config(state="disabled")
@@ -196,6 +251,7 @@ class App(tk.Tk):
             messagebox.showerror("Connection Error", str(e))
 
     def _disconnect(self):
+        self.rules.detach()
         if self.conn:
             self.conn.disconnect()
             self.conn = None
@@ -246,8 +302,80 @@ class App(tk.Tk):
 
         threading.Thread(target=pulse, daemon=True).start()
 
+    # --------------------------------------------------------------- rules --
+
+    def _add_rule(self) -> None:
+        guard = self.rule_guard_var.get()
+        try:
+            rule = Rule(self.rule_trigger_var.get(), self.rule_action_var.get(),
+                        pulse_ms=int(self.rule_pulse_var.get()), mode=self.rule_mode_var.get(),
+                        guard=None if guard == "(none)" else guard)
+        except (ValueError, tk.TclError) as e:
+            messagebox.showerror("Rule", str(e))
+            return
+        self.rules.add(rule)
+        self._refresh_rules()
+        self._log(f"[INFO] Rule added: {rule.describe()}")
+
+    def _remove_rule(self) -> None:
+        sel = self.rules_list.curselection()
+        if not sel:
+            return
+        rule = self.rules.rules[sel[0]]
+        self.rules.remove(rule)
+        self._refresh_rules()
+        self._log(f"[INFO] Rule removed: {rule.describe()}")
+
+    def _rearm_rules(self) -> None:
+        self.rules.rearm()
+        self._refresh_rules()
+
+    def _save_rules(self) -> None:
+        path = filedialog.asksaveasfilename(defaultextension=".json",
+                                            filetypes=[("Rules", "*.json")])
+        if path:
+            save_rules(self.rules.rules, path)
+            self._log(f"[INFO] Rules saved: {path}")
+
+    def _load_rules(self) -> None:
+        path = filedialog.askopenfilename(filetypes=[("Rules", "*.json")])
+        if not path:
+            return
+        try:
+            rules = load_rules(path)
+        except (OSError, ValueError, TypeError) as e:
+            messagebox.showerror("Rules", f"Could not load {path}: {e}")
+            return
+        self.rules.clear()
+        for rule in rules:
+            self.rules.add(rule)
+        self._refresh_rules()
+        self._log(f"[INFO] {len(rules)} rule(s) loaded: {path}")
+
+    def _refresh_rules(self) -> None:
+        self.rules_list.delete(0, "end")
+        for rule in self.rules.rules:
+            self.rules_list.insert("end", f"{rule.fired:4d}×  {rule.describe()}")
+        lat = sorted(self.rules.latencies)
+        if lat:
+            self.rule_latency_lbl.config(
+                text=f"event → command: median {lat[len(lat) // 2] * 1000:.2f} ms, "
+                     f"max {lat[-1] * 1000:.2f} ms (n={len(lat)})")
+
+    def _seed_rules(self, conn: DeviceConnection) -> None:
+        """Give rule guards the current register values (the board resets on connect)."""
+        try:
+            conn.wait_ready()
+            self.rules.seed(conn.read_registers(READABLE_REGISTERS, strict=False))
+        except Exception as e:
+            self._log(f"[WARN] Rule guards start unknown: {e}")
+
     # ----------------------------------------------------------- callbacks --
 
+    def _on_rule_fired(self, rule: Rule, latency: float) -> None:
+        self._log(f"[RULE] {rule.describe()} ({latency * 1000:.2f} ms)")
+        self.after(0, self._refresh_rules)
+
     def _on_event(self, register: int, value: int) -> None:
         self._log(f"[EVENT] {reg_name(register)} = {format_value(register, value)}")
 
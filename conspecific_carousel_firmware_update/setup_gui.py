@@ -5,7 +5,9 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 
 from utils import parse_motor_speed
-from gui_utils import make_scrollable, fit_window_to_screen
+from gui_utils import (make_scrollable, fit_window_to_screen,
+                       make_recording_options, recording_options, make_port_picker,
+                       disable_while_scanning)
 
 _SETTINGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
                                "socialreward_last_settings.json")
@@ -83,6 +85,7 @@ class SetupDialog:
         self._build_ui()
         self._on_species_change()
         self._on_phase_change()
+        self._adaptation = None   # "adaptation" rules from the settings file (adaptation.py)
         self._apply_saved_settings()
         fit_window_to_screen(self._scroll_body)
 
@@ -102,6 +105,8 @@ class SetupDialog:
             s[f"4stim_freq_{box}"] = v.get()
         for box, v in self._4stim_reward_vars.items():
             s[f"4stim_reward_{box}"] = v.get()
+        if self._adaptation:
+            s["adaptation"] = self._adaptation   # edited in the file, kept as is
         try:
             with open(_SETTINGS_FILE, "w") as f:
                 json.dump(s, f, indent=2)
@@ -114,6 +119,7 @@ class SetupDialog:
                 s = json.load(f)
         except Exception:
             return
+        self._adaptation = s.get("adaptation")
         if "species" in s:
             self._species_var.set(s["species"])
             self._on_species_change()
@@ -179,7 +185,10 @@ class SetupDialog:
         for i, (label, key, default) in enumerate(core_fields):
             var = tk.StringVar(value=default)
             self._vars[key] = var
-            self._row(root, label, var, row=3 + i)
+            if key == "port":
+                self._port_combo = make_port_picker(root, var, row=3 + i, label=label)
+            else:
+                self._row(root, label, var, row=3 + i)
 
         # Phase dropdown
         tk.Label(root, text="Phase:", anchor="w").grid(
@@ -357,12 +366,16 @@ class SetupDialog:
         self._notes = tk.Text(root, width=36, height=3, font=("Arial", 9))
         self._notes.grid(row=13, column=1, columnspan=3, sticky="ew", **pad)
 
+        make_recording_options(root, self._vars, row=14)
+
         # ── Buttons ───────────────────────────────────────────────────────────
         btn_frame = tk.Frame(root)
-        btn_frame.grid(row=14, column=0, columnspan=4, pady=(8, 14))
-        tk.Button(btn_frame, text="Start Session", bg="#4CAF50", fg="white",
-                  font=("Arial", 11, "bold"), width=18,
-                  command=self._on_start).pack(side="left", padx=8)
+        btn_frame.grid(row=15, column=0, columnspan=4, pady=(8, 14))
+        start_btn = tk.Button(btn_frame, text="Start Session", bg="#4CAF50", fg="white",
+                              font=("Arial", 11, "bold"), width=18,
+                              command=self._on_start)
+        start_btn.pack(side="left", padx=8)
+        disable_while_scanning(start_btn, self._port_combo)
         tk.Button(btn_frame, text="Cancel", width=10,
                   command=self.root.destroy).pack(side="left", padx=8)
 
@@ -621,6 +634,8 @@ class SetupDialog:
             "phase3b_thresholds": thresholds,
             "phase3b_holds": holds,
             "notes": self._notes.get("1.0", "end").strip(),
+            **recording_options(self._vars),
+            "adaptation": self._adaptation,
         }
         self._save_settings()
         self.root.destroy()
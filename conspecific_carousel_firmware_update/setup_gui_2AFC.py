@@ -5,7 +5,9 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 
 from utils import parse_motor_speed
-from gui_utils import make_scrollable, fit_window_to_screen
+from gui_utils import (make_scrollable, fit_window_to_screen,
+                       make_recording_options, recording_options, make_port_picker,
+                       disable_while_scanning)
 
 _SETTINGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
                                "socialreward2afc_last_settings.json")
@@ -76,6 +78,7 @@ class SetupDialog2AFC:
         self._build_ui()
         self._on_species_change()
         self._on_phase_change()
+        self._adaptation = None   # "adaptation" rules from the settings file (adaptation.py)
         self._apply_saved_settings()
         fit_window_to_screen(self._scroll_body)
 
@@ -91,6 +94,8 @@ class SetupDialog2AFC:
             s[f"p3b_thr_{i}"] = v.get()
         for i, v in enumerate(self._p3b_hold_vars):
             s[f"p3b_hold_{i}"] = v.get()
+        if self._adaptation:
+            s["adaptation"] = self._adaptation   # edited in the file, kept as is
         try:
             with open(_SETTINGS_FILE, "w") as f:
                 json.dump(s, f, indent=2)
@@ -103,6 +108,7 @@ class SetupDialog2AFC:
                 s = json.load(f)
         except Exception:
             return
+        self._adaptation = s.get("adaptation")
         if "species" in s:
             self._species_var.set(s["species"])
             self._on_species_change()
@@ -164,7 +170,10 @@ class SetupDialog2AFC:
         ]):
             v = tk.StringVar(value=default)
             self._vars[key] = v
-            self._row(root, label, v, row=3 + i)
+            if key == "port":
+                self._port_combo = make_port_picker(root, v, row=3 + i, label=label)
+            else:
+                self._row(root, label, v, row=3 + i)
 
         # Phase
         tk.Label(root, text="Phase:", anchor="w").grid(
@@ -288,11 +297,15 @@ class SetupDialog2AFC:
         self._notes = tk.Text(root, width=38, height=3, font=("Arial", 9))
         self._notes.grid(row=12, column=1, columnspan=3, sticky="ew", **pad)
 
+        make_recording_options(root, self._vars, row=13)
+
         bf = tk.Frame(root)
-        bf.grid(row=13, column=0, columnspan=4, pady=(8, 14))
-        tk.Button(bf, text="Start Session", bg="#4CAF50", fg="white",
-                  font=("Arial", 11, "bold"), width=18,
-                  command=self._on_start).pack(side="left", padx=8)
+        bf.grid(row=14, column=0, columnspan=4, pady=(8, 14))
+        start_btn = tk.Button(bf, text="Start Session", bg="#4CAF50", fg="white",
+                              font=("Arial", 11, "bold"), width=18,
+                              command=self._on_start)
+        start_btn.pack(side="left", padx=8)
+        disable_while_scanning(start_btn, self._port_combo)
         tk.Button(bf, text="Cancel", width=10,
                   command=self.root.destroy).pack(side="left", padx=8)
 
@@ -466,6 +479,8 @@ class SetupDialog2AFC:
             "phase3b_thresholds":thresholds,
             "phase3b_holds":     holds,
             "notes":             self._notes.get("1.0", "end").strip(),
+            **recording_options(self._vars),
+            "adaptation":        self._adaptation,
         }
         self._save_settings()
         self.root.destroy()
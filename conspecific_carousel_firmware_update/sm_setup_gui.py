@@ -11,7 +11,9 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 
 from utils import parse_motor_speed
-from gui_utils import make_scrollable, fit_window_to_screen
+from gui_utils import (make_scrollable, fit_window_to_screen,
+                       make_recording_options, recording_options, make_port_picker,
+                       disable_while_scanning)
 
 _SETTINGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
                                "socialmemory_last_settings.json")
@@ -105,6 +107,7 @@ class SMSetupDialog:
         self._build_ui()
         self._on_species_change()
         self._on_mode_change()
+        self._adaptation = None   # "adaptation" rules from the settings file (adaptation.py)
         self._apply_saved_settings()
         fit_window_to_screen(self._scroll_body)
 
@@ -131,6 +134,8 @@ class SMSetupDialog:
             s[f"task_port_{port}"] = v.get()
         for port, v in self._passive_port_vars.items():
             s[f"passive_port_{port}"] = v.get()
+        if self._adaptation:
+            s["adaptation"] = self._adaptation   # edited in the file, kept as is
         try:
             with open(_SETTINGS_FILE, "w") as f:
                 json.dump(s, f, indent=2)
@@ -143,6 +148,7 @@ class SMSetupDialog:
                 s = json.load(f)
         except Exception:
             return
+        self._adaptation = s.get("adaptation")
         if "species" in s:
             self._species_var.set(s["species"])
             self._on_species_change()
@@ -220,7 +226,10 @@ class SMSetupDialog:
         ]):
             v = tk.StringVar(value=default)
             self._vars[key] = v
-            self._row(root, label, v, row=3 + i, width=20)
+            if key == "port":
+                self._port_combo = make_port_picker(root, v, row=3 + i, label=label)
+            else:
+                self._row(root, label, v, row=3 + i, width=20)
 
         ttk.Separator(root, orient="horizontal").grid(
             row=7, column=0, columnspan=4, sticky="ew", padx=8, pady=4)
@@ -480,12 +489,16 @@ class SMSetupDialog:
         self._notes = tk.Text(root, width=40, height=3, font=("Arial", 9))
         self._notes.grid(row=14, column=1, columnspan=3, sticky="ew", **pad)
 
+        make_recording_options(root, self._vars, row=15)
+
         # ── Buttons ───────────────────────────────────────────────────────────
         bf = tk.Frame(root)
-        bf.grid(row=15, column=0, columnspan=4, pady=(8, 14))
-        tk.Button(bf, text="Start Session", bg="#4CAF50", fg="white",
-                  font=("Arial", 11, "bold"), width=18,
-                  command=self._on_start).pack(side="left", padx=8)
+        bf.grid(row=16, column=0, columnspan=4, pady=(8, 14))
+        start_btn = tk.Button(bf, text="Start Session", bg="#4CAF50", fg="white",
+                              font=("Arial", 11, "bold"), width=18,
+                              command=self._on_start)
+        start_btn.pack(side="left", padx=8)
+        disable_while_scanning(start_btn, self._port_combo)
         tk.Button(bf, text="Cancel", width=10,
                   command=self.root.destroy).pack(side="left", padx=8)
 
@@ -627,6 +640,7 @@ class SMSetupDialog:
                 "valve_times":     {"A": valve_time_A, "B": valve_time_B, "C": valve_time_C},
                 "session_duration":session_duration,
                 "notes":           self._notes.get("1.0", "end").strip(),
+                "adaptation":      self._adaptation,
             }
 
         elif mode == "task":
@@ -711,6 +725,7 @@ class SMSetupDialog:
                 "cc_delay":      cc_delay,
                 "valve_times":   {"A": valve_time_A, "B": valve_time_B, "C": valve_time_C},
                 "notes":         self._notes.get("1.0", "end").strip(),
+                "adaptation":    self._adaptation,
             }
 
         else:  # passivetest
@@ -791,8 +806,10 @@ class SMSetupDialog:
                 "cc_delay":        cc_delay,
                 "valve_times":     {"A": valve_time_A, "B": valve_time_B, "C": valve_time_C},
                 "notes":           self._notes.get("1.0", "end").strip(),
+                "adaptation":      self._adaptation,
             }
 
+        self.result.update(recording_options(self._vars))
         self._save_settings()
         self.root.destroy()
 
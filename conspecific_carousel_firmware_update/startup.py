@@ -0,0 +1,192 @@
+# startup.py — Startup-time budgets, import prewarming and an import-time
+# benchmark for the main_*.py entry points.
+#
+# Two spans are tracked on every run and printed against their budgets:
+#   dialog       — entry point started → setup dialog ready
+#   first_trial  — setup dialog closed → session.start() returned
+#
+# Keeping "dialog" short means the main_*.py modules import only what the
+# dialog needs (tkinter, serial); pandas, matplotlib, the GUI and session
+# modules and the optional gui_process / dashboard / event_raster modules
+# are imported inside main() once they are needed. While the user fills in
+# the dialog, prewarm() imports the heavy modules on a background thread so
+# they are already in sys.modules by the time the session is built.
+#
+# Usage in a main_* script:
+#   import startup                                  # first import: starts the clock
+#   ...
+#   startup.prewarm(*startup.HEAVY_MODULES, "gui_series", "SocialChoice.learning")
+#   dialog = SCSetupDialog()
+#   startup.mark("dialog")
+#   params = dialog.run()
+#   startup.mark("setup_done")
+#   ...
+#   session.start()
+#   startup.mark("first_trial")
+#   startup.save_timings(BASE_SAVE_DIR)             # → metadata.json "startup_s"
+#
+# Benchmark (import time of each entry point, from python -X importtime):
+#   python startup.py [main_socialreward2AFC ...] [--top N] [--repeat N]
+# exits 1 if any entry point's median import time exceeds IMPORT_BUDGET_S.
+
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+_T0 = time.perf_counter()
+
+# span name → (start mark, budget in seconds); "start" = this module's import
+BUDGETS_S: Dict[str, Tuple[str, float]] = {
+    "dialog":      ("start", 1.0),
+    "first_trial": ("setup_done", 5.0),
+}
+IMPORT_BUDGET_S = 0.15        # per entry point, `import main_x` alone
+
+ENTRY_POINTS = [
+    "main_socialreward2AFC",
+    "main_socialreward",
+    "main_socialmemory",
+    "main_socialchoice",
+]
+
+# Imported off the main thread while the setup dialog is open. pyplot itself
+# is left to the main thread: it picks the GUI backend on import.
+HEAVY_MODULES = ("numpy", "pandas", "matplotlib.figure", "matplotlib.patches")
+
+_marks: Dict[str, float] = {"start": _T0}
+
+
+# ── Spans and budgets ─────────────────────────────────────────────────────────
+
+def mark(name: str) -> None:
+    """Record the time of `name`; if it ends a span in BUDGETS_S, print the
+    span against its budget."""
+    _marks[name] = time.perf_counter()
+    if name in BUDGETS_S:
+        check_budget(name)
+
+
+def elapsed(name: str) -> Optional[float]:
+    """Length of span `name` in seconds, or None if either end is unmarked."""
+    start, _ = BUDGETS_S[name]
+    if start not in _marks or name not in _marks:
+        return None
+    return _marks[name] - _marks[start]
+
+
+def check_budget(name: str) -> bool:
+    """Print span `name` against its budget; False if it ran over."""
+    dt = elapsed(name)
+    if dt is None:
+        return True
+    budget = BUDGETS_S[name][1]
+    if dt > budget:
+        print(f"[WARN] Startup: {name} took {dt:.2f} s (budget {budget:.2f} s)")
+        return False
+    print(f"[INFO] Startup: {name} {dt:.2f} s (budget {budget:.2f} s)")
+    return True
+
+
+def timings() -> Dict[str, float]:
+    """Every span measured so far, in seconds."""
+    spans = {name: elapsed(name) for name in BUDGETS_S}
+    return {name: round(dt, 3) for name, dt in spans.items() if dt is not None}
+
+
+def save_timings(save_dir: str) -> None:
+    """Add the spans measured so far to <save_dir>/metadata.json as
+    "startup_s", so budgets can be tracked across sessions (session_catalog
+    indexes metadata.json as-is)."""
+    import json
+    path = os.path.join(save_dir, "metadata.json")
+    try:
+        with open(path) as f:
+            meta = json.load(f)
+        meta["startup_s"] = timings()
+        with open(path, "w") as f:
+            json.dump(meta, f, indent=2, default=str)
+    except (OSError, ValueError) as e:
+        print(f"[WARN] Could not save startup timings: {e}")
+
+
+# ── Prewarming ────────────────────────────────────────────────────────────────
+
+def prewarm(*modules: str) -> threading.Thread:
+    """Import `modules` on a daemon thread. A later `import` of the same
+    module on the main thread waits for this one (import lock) instead of
+    importing twice; import errors are left for that later import to raise."""
+    import importlib
+
+    def _run():
+        for name in modules:
+            try:
+                importlib.import_module(name)
+            except Exception:
+                pass
+
+    thread = threading.Thread(target=_run, name="prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+# ── Import-time benchmark ─────────────────────────────────────────────────────
+
+def import_times(module: str) -> Tuple[float, List[Tuple[float, str]]]:
+    """(total import time in s, [(cumulative s, module), ...]) for a fresh
+    `import module`, from python -X importtime."""
+    import subprocess                      # benchmark only — keep `import startup` cheap
+    here = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=here, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        try:
+            rows.append((int(cumulative) / 1e6, name.rstrip()))
+        except ValueError:
+            continue                       # header line
+    total = next((dt for dt, name in reversed(rows) if name.strip() == module), 0.0)
+    return total, rows
+
+
+def main(argv=None) -> int:
+    import argparse
+    ap = argparse.ArgumentParser(description="Import-time benchmark of the entry points.")
+    ap.add_argument("modules", nargs="*", default=ENTRY_POINTS)
+    ap.add_argument("--top", type=int, default=8,
+                    help="Show the N slowest direct imports of each module")
+    ap.add_argument("--repeat", type=int, default=3,
+                    help="Runs per module; the median is compared to the budget")
+    ap.add_argument("--budget", type=float, default=IMPORT_BUDGET_S)
+    args = ap.parse_args(argv)
+
+    over = 0
+    for module in args.modules:
+        try:
+            runs = [import_times(module) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"[ERROR] {module}: {e}")
+            over += 1
+            continue
+        runs.sort(key=lambda r: r[0])
+        total, rows = runs[len(runs) // 2]
+        status = "OK" if total <= args.budget else "OVER"
+        print(f"{module:<24} {total * 1000:7.1f} ms  [{status}, budget {args.budget * 1000:.0f} ms]")
+        direct = [(dt, name.strip()) for dt, name in rows
+                  if name.startswith("   ") and not name.startswith("    ")]
+        for dt, name in sorted(direct, reverse=True)[:args.top]:
+            print(f"    {dt * 1000:7.1f} ms  {name}")
+        over += total > args.budget
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,370 @@
+# state_machine.py — Declarative, event-driven trial state machines
+#
+# A trial is a graph of named states. Each state has an optional enter/exit
+# action and a list of transitions; the first transition whose trigger fires
+# (and whose guard passes) moves the machine to its target state:
+#
+#   on(port, state, target)       — sensor level: fires when `port` is (or
+#                                   becomes) `state`, optionally after it has
+#                                   stayed there for `hold` seconds
+#   poke(port, target)            — on(port, "triggered", hold=SENSOR_HOLD_TIME)
+#   poke_any(shared, ports, target, deadline)
+#                                 — first poke of several ports, or the
+#                                   deadline once no poke is in progress
+#   after(seconds, target)        — deadline, measured from state entry
+#   when(predicate, target)       — predicate(ctx) re-checked on entry and
+#                                   after every sensor event
+#
+# Sensor transitions arrive through SharedSensorState.add_listener() — the
+# machine sleeps on a queue until the next event or the next deadline, so
+# there is no polling loop and no polling delay. Every transition is logged
+# with the time of the event (or deadline) that caused it.
+#
+#   machine = StateMachine(shared, [
+#       State("wait_c", enter=led_c_on, transitions=[poke("C", "door")]),
+#       State("door", enter=open_door_async,
+#             transitions=[on("door", "door opened", None)]),   # None = done
+#   ])
+#   run = machine.run(ctx, should_stop=lambda: not session.running)
+#   run.final, run.stopped, run.log
+#
+# Actions get the trial context `ctx` (any object — a Trial by default);
+# ctx.t is the time of the event being handled and ctx.entered the time the
+# current state was entered.
+#
+# With a tracing.Tracer attached to `shared`, each state entered is recorded
+# as a span (cat "state") from entry to the transition out of it.
+
+import queue
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+from hardware import SENSOR_HOLD_TIME, SharedSensorState
+
+STOP_CHECK_S = 0.05           # longest wait between should_stop() checks
+# hardware.sensor_held() samples every 5 ms, so a clear within the last 5 ms
+# of a hold was never seen; holds keep that tolerance so a poke counts as it
+# did with the polling helpers.
+HOLD_SAMPLE_S = 0.005
+TABLE_START_GRACE_S = 0.5     # same grace as hardware.wait_for_table_stopped
+TABLE_MOVE_TIMEOUT_S = 30.0
+
+Action = Callable[[object], None]
+Guard = Callable[[object], bool]
+
+
+def wait_event(events: "queue.Queue", timeout: Optional[float]):
+    """Next (port, state, t) from `events`, or None after `timeout` s.
+    session_replay swaps this for a virtual-time version."""
+    try:
+        return events.get(timeout=timeout)
+    except queue.Empty:
+        return None
+
+
+def _drain(events: "queue.Queue", backlog: deque) -> None:
+    """Move every event already queued to backlog, without waiting."""
+    while True:
+        try:
+            backlog.append(events.get_nowait())
+        except queue.Empty:
+            return
+
+
+# ── Transitions ───────────────────────────────────────────────────────────────
+
+@dataclass(eq=False)                      # hashed by identity (timer keys)
+class Transition:
+    target: Optional[str]
+    port: Optional[str] = None            # sensor trigger
+    state: Optional[str] = None
+    hold: float = 0.0
+    seconds: Union[float, Callable[[object], float], None] = None   # deadline trigger
+    predicate: Optional[Guard] = None     # condition trigger
+    guard: Optional[Guard] = None
+    action: Optional[Action] = None
+
+    @property
+    def cause(self) -> str:
+        if self.port is not None:
+            return f"{self.port}={self.state}" + (f" {self.hold:g}s" if self.hold else "")
+        if self.seconds is not None:
+            return "timeout"
+        return "condition"
+
+
+def on(port: str, state: str, target: Optional[str], hold: float = 0.0,
+       guard: Optional[Guard] = None, action: Optional[Action] = None) -> Transition:
+    return Transition(target, port=port, state=state, hold=hold, guard=guard, action=action)
+
+
+def poke(port: str, target: Optional[str], guard: Optional[Guard] = None,
+         action: Optional[Action] = None) -> Transition:
+    return on(port, "triggered", target, hold=SENSOR_HOLD_TIME, guard=guard, action=action)
+
+
+def after(seconds: Union[float, Callable[[object], float]], target: Optional[str],
+          guard: Optional[Guard] = None, action: Optional[Action] = None) -> Transition:
+    return Transition(target, seconds=seconds, guard=guard, action=action)
+
+
+def when(predicate: Guard, target: Optional[str], guard: Optional[Guard] = None,
+         action: Optional[Action] = None) -> Transition:
+    return Transition(target, predicate=predicate, guard=guard, action=action)
+
+
+def poke_any(shared: SharedSensorState, ports: Sequence[str], target: Optional[str],
+             deadline: Union[None, float, Callable[[object], float]] = None,
+             action: Optional[Callable[[object, str], None]] = None) -> List[Transition]:
+    """poke() on each of `ports` (action(ctx, port) on the poke), plus an
+    optional deadline (absolute time.time(), or a callable of ctx) that also
+    goes to `target`. As with the polling helpers, a poke that started before
+    the deadline still counts if it is held past it."""
+    def _poked(c, p):
+        if action is not None:
+            action(c, p)
+
+    def _idle(c) -> bool:
+        return all(shared.get_port(p)[0] != "triggered" for p in ports)
+
+    transitions = [poke(p, target, action=lambda c, p=p: _poked(c, p)) for p in ports]
+    if deadline is not None:
+        due = deadline if callable(deadline) else (lambda c: deadline)
+        transitions.append(after(lambda c: due(c) - c.entered, target, guard=_idle))
+        # deadline passed during a hold that then failed
+        transitions += [on(p, "cleared", target, guard=lambda c: c.t >= due(c) and _idle(c))
+                        for p in ports]
+    return transitions
+
+
+# ── States ────────────────────────────────────────────────────────────────────
+
+@dataclass
+class State:
+    name: str
+    transitions: List[Transition] = field(default_factory=list)
+    enter: Optional[Action] = None
+    exit: Optional[Action] = None
+
+
+def table_move(name: str, target: Optional[str], start: Optional[Action] = None,
+               timeout: float = TABLE_MOVE_TIMEOUT_S) -> List[State]:
+    """States for "start a table move (optional), wait until it stops" —
+    the event-driven hardware.wait_for_table_stopped(): if the motor has not
+    reported moving within TABLE_START_GRACE_S the move counts as done."""
+    return [
+        State(name, enter=start, transitions=[
+            on("table_motor", "table moving", f"{name}:moving"),
+            after(TABLE_START_GRACE_S, target),
+        ]),
+        State(f"{name}:moving", transitions=[
+            on("table_motor", "table stopped", target),
+            after(timeout, target,
+                  action=lambda _c: print("[WARNING] Table did not stop within timeout")),
+        ]),
+    ]
+
+
+class Trial:
+    """Default trial context: attribute bag plus the engine's ctx.t / ctx.entered."""
+
+    def __init__(self, **fields):
+        self.t = None
+        self.entered = None
+        self.__dict__.update(fields)
+
+
+@dataclass
+class Run:
+    ctx: object
+    final: Optional[str]                  # last state entered
+    stopped: bool                         # ended by should_stop / shared.stop_event
+    log: List[dict]                       # {"t", "from", "to", "cause"} per transition
+
+
+# ── Engine ────────────────────────────────────────────────────────────────────
+
+class StateMachine:
+    """
+    Runs a graph of States on the calling thread. The first state in
+    `states` is the initial one; a transition to None ends the run.
+    """
+
+    def __init__(self, shared: SharedSensorState, states: Sequence[State],
+                 trace: bool = True):
+        self.shared = shared
+        self.trace = trace
+        self.states: Dict[str, State] = {}
+        for s in states:
+            if s.name in self.states:
+                raise ValueError(f"Duplicate state '{s.name}'")
+            self.states[s.name] = s
+        self.initial = states[0].name
+        for s in states:
+            for tr in s.transitions:
+                if tr.target is not None and tr.target not in self.states:
+                    raise ValueError(f"State '{s.name}' → unknown state '{tr.target}'")
+
+    def run(self, ctx=None, initial: Optional[str] = None,
+            should_stop: Optional[Callable[[], bool]] = None,
+            on_abort: Optional[Callable[[object, str], None]] = None) -> Run:
+        ctx = Trial() if ctx is None else ctx
+        events: "queue.Queue" = queue.Queue()
+
+        def _listener(port, state, ts) -> None:
+            events.put((port, state, ts.timestamp()))
+
+        def _stopping() -> bool:
+            return self.shared.stop_event.is_set() or (should_stop is not None and should_stop())
+
+        log = []
+        backlog: deque = deque()       # events drained early, not yet handled
+        tracer = self.shared.tracer if self.trace else None
+        self.shared.add_listener(_listener)
+        try:
+            name = initial or self.initial
+            ctx.t = time.time()
+            traced_from = tracer.now() if tracer is not None else None
+            self._enter(name, ctx)
+            timers = self._arm(name, ctx)
+            while True:
+                fired = self._check_levels(name, ctx, timers)
+                while fired is None:
+                    if _stopping():
+                        if on_abort is not None:
+                            on_abort(ctx, name)
+                        if tracer is not None:
+                            tracer.complete(name, traced_from, tracer.now(), "state",
+                                            {"to": None, "cause": "stop"})
+                        return Run(ctx, name, True, log)
+                    now = time.time()
+                    due = [(t, tr) for tr, t in timers.items() if t is not None]
+                    timeout = STOP_CHECK_S
+                    if due:
+                        t_next, tr = min(due, key=lambda d: d[0])
+                        if t_next <= now:
+                            # After a late wake-up, events queued from before
+                            # the deadline come first: a hold whose port has
+                            # since cleared must not fire
+                            _drain(events, backlog)
+                            if not backlog or backlog[0][2] > t_next:
+                                ctx.t = t_next
+                                if tr.guard is None or tr.guard(ctx):
+                                    fired = tr
+                                    break
+                                timers[tr] = None
+                                continue
+                            timeout = 0
+                        else:
+                            timeout = min(t_next - now, STOP_CHECK_S)
+                    event = backlog.popleft() if backlog else wait_event(events, timeout)
+                    # Events from before this state was entered are already
+                    # reflected in the levels read by _arm()
+                    if event is not None and event[2] >= ctx.entered:
+                        fired = self._on_event(name, ctx, timers, *event)
+
+                # ── take the transition ──
+                state = self.states[name]
+                if state.exit is not None:
+                    state.exit(ctx)
+                if fired.action is not None:
+                    fired.action(ctx)
+                log.append({"t": ctx.t, "from": name, "to": fired.target, "cause": fired.cause})
+                if tracer is not None:
+                    traced_to = tracer.now()
+                    tracer.complete(name, traced_from, traced_to, "state",
+                                    {"to": fired.target, "cause": fired.cause})
+                    traced_from = traced_to
+                if fired.target is None:
+                    return Run(ctx, name, False, log)
+                name = fired.target
+                self._enter(name, ctx)
+                timers = self._arm(name, ctx)
+        finally:
+            self.shared.remove_listener(_listener)
+
+    # ── internals ─────────────────────────────────────────────────────────────
+
+    def _enter(self, name: str, ctx) -> None:
+        ctx.entered = ctx.t
+        state = self.states[name]
+        if state.enter is not None:
+            state.enter(ctx)
+
+    def _arm(self, name: str, ctx) -> Dict[Transition, Optional[float]]:
+        """Deadline per timed transition (None = not armed). Sensor holds are
+        armed when their level becomes true."""
+        timers = {}
+        base = ctx.entered
+        for tr in self.states[name].transitions:
+            if tr.seconds is not None:
+                seconds = tr.seconds(ctx) if callable(tr.seconds) else tr.seconds
+                timers[tr] = base + seconds
+            elif tr.port is not None and tr.hold:
+                level, _ = self.shared.get_port(tr.port)
+                timers[tr] = base + tr.hold if level == tr.state else None
+        return timers
+
+    def _check_levels(self, name: str, ctx, timers) -> Optional[Transition]:
+        """Level / condition transitions that already hold (checked on entry
+        and after each event, in declaration order)."""
+        for tr in self.states[name].transitions:
+            if tr.predicate is not None:
+                ok = tr.predicate(ctx)
+            elif tr.port is not None and not tr.hold:
+                level, since = self.shared.get_port(tr.port)
+                ok = level == tr.state
+                if ok and since is not None:
+                    # The level may have changed after the event being handled
+                    ctx.t = max(ctx.t, since.timestamp())
+            else:
+                continue
+            if ok and (tr.guard is None or tr.guard(ctx)):
+                return tr
+        return None
+
+    def _on_event(self, name: str, ctx, timers, port: str, state: str,
+                  t: float) -> Optional[Transition]:
+        ctx.t = t
+        for tr in self.states[name].transitions:
+            if tr.port == port and tr.hold:
+                if state == tr.state:
+                    if timers.get(tr) is None:
+                        timers[tr] = t + tr.hold
+                elif timers.get(tr) is not None and t < timers[tr] - HOLD_SAMPLE_S:
+                    timers[tr] = None
+        return self._check_levels(name, ctx, timers)
+
+
+# ── One-state helpers for the base sessions ──────────────────────────────────
+
+def wait_for_any_poke(shared: SharedSensorState, ports: Sequence[str],
+                      deadline: Optional[float] = None,
+                      should_stop: Optional[Callable[[], bool]] = None) -> Optional[str]:
+    """Event-driven replacement for the polling _wait_for_any_poke(): the
+    first of `ports` triggered and held for SENSOR_HOLD_TIME, or None on
+    stop / deadline (absolute time.time()). As before, a poke that started
+    before the deadline still counts if it is held past it."""
+    transitions = poke_any(shared, ports, None, deadline,
+                           action=lambda c, p: setattr(c, "port", p))
+    run = StateMachine(shared, [State("wait", transitions)], trace=False).run(
+        Trial(port=None), should_stop=should_stop)
+    return None if run.stopped else run.ctx.port
+
+
+def wait_for_poke(shared: SharedSensorState, port: str, deadline: Optional[float] = None,
+                  should_stop: Optional[Callable[[], bool]] = None) -> bool:
+    return wait_for_any_poke(shared, [port], deadline, should_stop) is not None
+
+
+def save_log(rows: List[dict], path: str) -> None:
+    """Write Run.log rows (plus any extra keys, e.g. "trial") to a CSV."""
+    import csv
+    keys = ["t", "from", "to", "cause"]
+    keys = [k for k in rows[0] if k not in keys] + keys if rows else keys
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=keys)
+        writer.writeheader()
+        writer.writerows(rows)
@@ -0,0 +1,227 @@
+# thread_profiler.py — Low-rate sampling CPU profiler for live sessions, per thread
+#
+# A session process runs the serial reader thread, the session thread, GUI
+# updates on the main thread and short-lived helper threads (door / table
+# moves). ThreadProfiler samples every thread's Python stack SAMPLE_HZ times a
+# second from its own daemon thread (sys._current_frames(), no tracing hooks,
+# so the profiled threads are never slowed down) and reads each thread's CPU
+# clock on the same tick.
+#
+# Written to the session folder by save():
+#   profile_stacks.txt — collapsed stacks, one "thread;root;...;leaf count"
+#                        line per distinct stack (flamegraph.pl, or drop it
+#                        on https://www.speedscope.app)
+#   thread_cpu.csv     — per thread: samples, CPU seconds, % of one core
+#
+# Samples show where a thread *is* (waiting or running); the CPU totals show
+# which threads actually burn CPU. The profiler's own CPU time is reported as
+# the "profiler" row (under 1 % of one core at the default rate).
+#
+# Per-thread CPU clocks: pthread_getcpuclockid() on Linux / macOS,
+# GetThreadTimes() on Windows. Threads that exit between ticks lose at most
+# one tick of CPU time.
+#
+# Usage:
+#   profiler = ThreadProfiler()
+#   profiler.start()
+#   ...
+#   profiler.stop()
+#   profiler.save(save_dir)
+
+import csv
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+SAMPLE_HZ = 20
+MAX_DEPTH = 64
+
+_THREAD_NAME = re.compile(r"^Thread-\d+(?: \((.*)\))?$")
+
+
+def _thread_label(thread: Optional[threading.Thread], ident: int) -> str:
+    """Stable label: 'Thread-12 (open_door)' → 'open_door', so short-lived
+    helper threads running the same target share one row."""
+    if thread is None:
+        return f"thread-{ident}"
+    m = _THREAD_NAME.match(thread.name)
+    if m:
+        return m.group(1) or "Thread"
+    return thread.name
+
+
+def _code_label(code) -> str:
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+# ── Per-thread CPU clocks ─────────────────────────────────────────────────────
+
+def _cpu_clock(thread: threading.Thread) -> Optional[Callable[[], float]]:
+    """Callable returning the CPU seconds used by `thread`, or None when the
+    platform offers no per-thread clock."""
+    if hasattr(time, "pthread_getcpuclockid"):
+        try:
+            clock_id = time.pthread_getcpuclockid(thread.ident)
+        except (OSError, OverflowError):
+            return None
+        return lambda: time.clock_gettime(clock_id)
+    if sys.platform == "win32" and thread.native_id is not None:
+        return _win_thread_clock(thread.native_id)
+    return None
+
+
+def _win_thread_clock(native_id: int) -> Optional[Callable[[], float]]:
+    import ctypes
+    from ctypes import wintypes
+
+    kernel32 = ctypes.windll.kernel32
+    handle = kernel32.OpenThread(0x0800, False, native_id)   # THREAD_QUERY_LIMITED_INFORMATION
+    if not handle:
+        return None
+    times = [wintypes.FILETIME() for _ in range(4)]          # creation, exit, kernel, user
+
+    def _read() -> float:
+        if not kernel32.GetThreadTimes(handle, *[ctypes.byref(t) for t in times]):
+            raise OSError("GetThreadTimes failed")
+        kernel, user = times[2], times[3]
+        kernel_ticks = (kernel.dwHighDateTime << 32) | kernel.dwLowDateTime
+        user_ticks = (user.dwHighDateTime << 32) | user.dwLowDateTime
+        return (kernel_ticks + user_ticks) / 1e7              # 100 ns units
+    _read.close = lambda: kernel32.CloseHandle(handle)
+    return _read
+
+
+# ── Profiler ──────────────────────────────────────────────────────────────────
+
+class ThreadProfiler:
+    """Samples all threads of this process at `hz` until stop()."""
+
+    def __init__(self, hz: float = SAMPLE_HZ):
+        self.interval = 1.0 / hz
+        self._stacks: Counter = Counter()            # (thread, leaf code, ..., root code) → samples
+        self.samples: Counter = Counter()            # thread label → samples
+        self.cpu_s: Dict[str, float] = {}            # thread label → CPU seconds
+        self._clocks: Dict[int, tuple] = {}          # ident → (label, clock, start, last)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._wall_start: Optional[float] = None
+        self._wall_s = 0.0
+
+    def start(self) -> None:
+        self._wall_start = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._wall_s = time.perf_counter() - self._wall_start
+
+    # ── Sampling (profiler thread) ────────────────────────────────────────────
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        self._track(threading.current_thread())
+        next_tick = time.perf_counter()
+        while not self._stop.is_set():
+            self._sample(me)
+            next_tick += self.interval
+            delay = next_tick - time.perf_counter()
+            if delay < 0:                                   # fell behind: don't burst
+                next_tick = time.perf_counter()
+                delay = 0
+            self._stop.wait(delay)
+        self._read_clocks(final=True)
+
+    def _sample(self, me: int) -> None:
+        threads = {t.ident: t for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            thread = threads.get(ident)
+            label = _thread_label(thread, ident)
+            if ident not in self._clocks and thread is not None:
+                self._track(thread)
+            codes = [label]
+            while frame is not None and len(codes) <= MAX_DEPTH:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            self._stacks[tuple(codes)] += 1           # labelled at save time
+            self.samples[label] += 1
+        self._read_clocks()
+
+    def _track(self, thread: threading.Thread) -> None:
+        clock = _cpu_clock(thread)
+        start = clock() if clock is not None else None
+        self._clocks[thread.ident] = (_thread_label(thread, thread.ident), clock, start, start)
+
+    def _read_clocks(self, final: bool = False) -> None:
+        alive = {t.ident for t in threading.enumerate()}
+        for ident, (label, clock, start, last) in list(self._clocks.items()):
+            if clock is not None and ident in alive:
+                try:
+                    last = clock()
+                except OSError:
+                    pass
+                self._clocks[ident] = (label, clock, start, last)
+            if ident not in alive or final:
+                # Thread gone (or profiling over): bank its CPU time
+                if clock is not None:
+                    self.cpu_s[label] = self.cpu_s.get(label, 0.0) + (last - start)
+                    if hasattr(clock, "close"):
+                        clock.close()
+                del self._clocks[ident]
+
+    # ── Output ────────────────────────────────────────────────────────────────
+
+    def collapsed(self) -> Counter:
+        """{"thread;root frame;...;leaf frame": samples} — the collapsed-stack
+        format of flamegraph.pl."""
+        labels: Dict[object, str] = {}
+        stacks: Counter = Counter()
+        for (thread, *codes), count in list(self._stacks.items()):
+            for code in codes:
+                if code not in labels:
+                    labels[code] = _code_label(code)
+            stacks[";".join([thread] + [labels[c] for c in reversed(codes)])] += count
+        return stacks
+
+    def thread_rows(self) -> List[dict]:
+        """Per-thread totals, busiest first (CPU time where known)."""
+        wall = self._wall_s or (time.perf_counter() - self._wall_start)
+        rows = []
+        for label in sorted(set(self.samples) | set(self.cpu_s)):
+            cpu = self.cpu_s.get(label)
+            rows.append({
+                "thread": label,
+                "samples": self.samples.get(label, 0),
+                "cpu_s": None if cpu is None else round(cpu, 3),
+                "cpu_pct": None if cpu is None else round(100 * cpu / wall, 2),
+            })
+        return sorted(rows, key=lambda r: (-(r["cpu_s"] or 0), -r["samples"]))
+
+    def save(self, save_dir: str, top: int = 8) -> None:
+        """Write profile_stacks.txt and thread_cpu.csv; print the busiest threads."""
+        stacks_path = os.path.join(save_dir, "profile_stacks.txt")
+        with open(stacks_path, "w", encoding="utf-8") as f:
+            for stack, count in self.collapsed().most_common():
+                f.write(f"{stack} {count}\n")
+        rows = self.thread_rows()
+        with open(os.path.join(save_dir, "thread_cpu.csv"), "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["thread", "samples", "cpu_s", "cpu_pct"])
+            writer.writeheader()
+            writer.writerows(rows)
+
+        print(f"[INFO] CPU profile saved: {stacks_path} "
+              f"({sum(self.samples.values())} samples over {self._wall_s:.0f} s)")
+        for r in rows[:top]:
+            cpu = "   n/a" if r["cpu_s"] is None else f"{r['cpu_s']:8.2f} s ({r['cpu_pct']:5.1f} %)"
+            print(f"  {r['thread']:<28} {cpu}  samples {r['samples']}")
@@ -0,0 +1,242 @@
+# tracing.py — Per-trial stage latency tracing, exported as a Chrome trace
+#
+# A Tracer records spans (start + duration, perf_counter clock) for every
+# stage of a trial so a slow trial can be taken apart: where did the time go —
+# door, table, serial ACKs, the table settle delay, waits, the ITI?
+#
+# Sources:
+#   attach(device, shared)   — serial command → ACK round trips (timed by
+#                              DeviceConnection), command → motor start
+#                              latency, door opening / closing and table move
+#                              durations, beam-break intervals
+#   span(owner, name)        — stages in the hardware helpers and session
+#                              base classes (trial, iti, wait poke, reward,
+#                              wait door opened, ...); owner is the device or
+#                              SharedSensorState, a no-op when no Tracer is
+#                              attached to it
+#   StateMachine             — one span per state entered
+#
+# Spans on a thread nest on that thread's track; serial, door, table and
+# sensor spans get their own tracks.
+#
+# Usage:
+#   tracer = Tracer()
+#   tracer.attach(device, shared)
+#   ...
+#   with tracing.span(self.shared, "iti"):
+#       ...
+#   tracer.save(save_dir)        # trace.json + stage_latency.csv
+#
+# Open trace.json in https://ui.perfetto.dev (or chrome://tracing).
+
+import csv
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional
+
+from protocol import MSG_WRITE, REG_DOOR_CMD, REG_TABLE_CMD, reg_name
+
+MAX_EVENTS = 1_000_000        # ~100-200 MB of JSON; later events are dropped
+
+# Fixed tracks for spans that don't belong to a thread
+TRACK_SERIAL = 1
+TRACK_DOOR = 2
+TRACK_TABLE = 3
+TRACK_SENSORS = 4
+_TRACK_NAMES = {TRACK_SERIAL: "serial", TRACK_DOOR: "door",
+                TRACK_TABLE: "table", TRACK_SENSORS: "sensors"}
+
+_BEAM_PORTS = ("A", "B", "C", "doorsensor", "table")
+_NULL_SPAN = nullcontext()
+
+
+class Tracer:
+    """Collects trace events for one session; thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events: List[dict] = []
+        self._dropped = 0
+        self._t0 = time.perf_counter()
+        self._pid = os.getpid()
+        self._thread_names: Dict[int, str] = {}
+        self._motor_cmd: Dict[str, float] = {}         # "door"/"table" → command sent
+        self._motion: Dict[str, float] = {}            # "door"/"table" → moving since
+        self._beam: Dict[str, float] = {}              # port → triggered since
+
+    @staticmethod
+    def now() -> float:
+        return time.perf_counter()
+
+    # ── Recording ─────────────────────────────────────────────────────────────
+
+    def complete(self, name: str, start: float, end: float, cat: str = "stage",
+                 args: Optional[dict] = None, track: Optional[int] = None) -> None:
+        """Record a finished span [start, end] (Tracer.now() times)."""
+        event = {"name": name, "cat": cat, "ph": "X",
+                 "ts": (start - self._t0) * 1e6, "dur": max(0.0, end - start) * 1e6,
+                 "pid": self._pid, "tid": track or self._thread_id()}
+        if args:
+            event["args"] = args
+        self._append(event)
+
+    def instant(self, name: str, cat: str = "stage", args: Optional[dict] = None,
+                track: Optional[int] = None) -> None:
+        event = {"name": name, "cat": cat, "ph": "i", "s": "t",
+                 "ts": (self.now() - self._t0) * 1e6,
+                 "pid": self._pid, "tid": track or self._thread_id()}
+        if args:
+            event["args"] = args
+        self._append(event)
+
+    @contextmanager
+    def span(self, name: str, cat: str = "stage", **args):
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.complete(name, start, self.now(), cat, args or None)
+
+    def _thread_id(self) -> int:
+        tid = threading.get_ident()
+        if tid not in self._thread_names:
+            self._thread_names[tid] = threading.current_thread().name
+        return tid
+
+    def _append(self, event: dict) -> None:
+        with self._lock:
+            if len(self._events) < MAX_EVENTS:
+                self._events.append(event)
+            else:
+                self._dropped += 1
+
+    # ── Device / sensor sources ───────────────────────────────────────────────
+
+    def attach(self, device, shared) -> None:
+        """Trace serial exchanges of `device` and motor / sensor transitions
+        of `shared`, and make this the tracer span() finds on both."""
+        device.tracer = self
+        shared.tracer = self
+        device.on_tx(self._on_tx)
+        shared.add_listener(self._on_sensor)
+
+    def command(self, register: int, start: float, end: float, attempts: int = 1) -> None:
+        """A request → ACK exchange (DeviceConnection calls this; it knows
+        which ACK ends which request, including retries)."""
+        self.complete(f"ack {reg_name(register)}", start, end, "serial",
+                      {"attempts": attempts} if attempts > 1 else None, TRACK_SERIAL)
+
+    def _on_tx(self, register: int, msg_type: int, value: int) -> None:
+        if msg_type == MSG_WRITE and register in (REG_DOOR_CMD, REG_TABLE_CMD):
+            self._motor_cmd["door" if register == REG_DOOR_CMD else "table"] = self.now()
+
+    def _on_sensor(self, port: str, state: str, ts) -> None:
+        t = self.now()
+        if port == "door":
+            if state == "door moving":
+                self._motion_started("door", t, TRACK_DOOR)
+            elif state in ("door opened", "door closed"):
+                name = "door opening" if state == "door opened" else "door closing"
+                self._motion_ended("door", name, t, TRACK_DOOR)
+            else:
+                self.instant(state, "motor", track=TRACK_DOOR)
+        elif port == "table_motor":
+            if state == "table moving":
+                self._motion_started("table", t, TRACK_TABLE)
+            else:
+                self._motion_ended("table", "table move", t, TRACK_TABLE)
+        elif port in _BEAM_PORTS:
+            if state == "triggered":
+                self._beam[port] = t
+            else:
+                start = self._beam.pop(port, None)
+                if start is not None:
+                    self.complete(f"beam {port}", start, t, "sensor", track=TRACK_SENSORS)
+
+    def _motion_started(self, motor: str, t: float, track: int) -> None:
+        self._motion[motor] = t
+        cmd = self._motor_cmd.pop(motor, None)
+        if cmd is not None:
+            self.complete(f"{motor} start latency", cmd, t, "motor", track=track)
+
+    def _motion_ended(self, motor: str, name: str, t: float, track: int) -> None:
+        # A move that never reported "moving" is timed from its command
+        start = self._motion.pop(motor, None) or self._motor_cmd.pop(motor, None)
+        if start is not None:
+            self.complete(name, start, t, "motor", track=track)
+
+    # ── Export ────────────────────────────────────────────────────────────────
+
+    def events(self) -> List[dict]:
+        with self._lock:
+            return list(self._events)
+
+    def summary(self) -> List[dict]:
+        """Per-stage duration statistics in ms, slowest total first."""
+        by_stage: Dict[tuple, List[float]] = {}
+        for e in self.events():
+            if e["ph"] == "X":
+                by_stage.setdefault((e["cat"], e["name"]), []).append(e["dur"] / 1000)
+        rows = []
+        for (cat, name), durations in by_stage.items():
+            durations.sort()
+            pick = lambda q: durations[min(len(durations) - 1, int(q * len(durations)))]
+            rows.append({"cat": cat, "stage": name, "n": len(durations),
+                         "p50_ms": round(pick(0.5), 3), "p95_ms": round(pick(0.95), 3),
+                         "max_ms": round(durations[-1], 3),
+                         "total_s": round(sum(durations) / 1000, 3)})
+        return sorted(rows, key=lambda r: -r["total_s"])
+
+    def save(self, save_dir: str, top: int = 12) -> str:
+        """Write trace.json (Chrome trace-event format) and
+        stage_latency.csv to save_dir and print the slowest stages."""
+        meta = [{"name": "process_name", "ph": "M", "pid": self._pid, "tid": 0,
+                 "args": {"name": os.path.basename(os.path.normpath(save_dir))}}]
+        names = {**self._thread_names, **_TRACK_NAMES}
+        meta += [{"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid,
+                  "args": {"name": name}} for tid, name in names.items()]
+        trace_path = os.path.join(save_dir, "trace.json")
+        with open(trace_path, "w") as f:
+            json.dump({"traceEvents": meta + self.events(), "displayTimeUnit": "ms"}, f)
+
+        rows = self.summary()
+        with open(os.path.join(save_dir, "stage_latency.csv"), "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["cat", "stage", "n", "p50_ms",
+                                                   "p95_ms", "max_ms", "total_s"])
+            writer.writeheader()
+            writer.writerows(rows)
+
+        if self._dropped:
+            print(f"[WARN] Trace full: {self._dropped} events after the first {MAX_EVENTS} dropped")
+        print(f"[INFO] Stage trace saved: {trace_path}")
+        for r in rows[:top]:
+            print(f"  {r['stage']:<28} n={r['n']:<5} p50 {r['p50_ms']:9.1f} ms"
+                  f"  p95 {r['p95_ms']:9.1f} ms  total {r['total_s']:8.1f} s")
+        return trace_path
+
+
+# ── Instrumentation helpers ───────────────────────────────────────────────────
+
+def span(owner, name: str, cat: str = "stage", **args):
+    """tracer.span() of the Tracer attached to `owner` (a DeviceConnection or
+    SharedSensorState), or a no-op context when none is."""
+    tracer = getattr(owner, "tracer", None)
+    if tracer is None:
+        return _NULL_SPAN
+    return tracer.span(name, cat, **args)
+
+
+def traced(name: str, cat: str = "stage"):
+    """Decorator: trace calls of a function whose first argument is the
+    span() owner."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(owner, *args, **kwargs):
+            with span(owner, name, cat):
+                return fn(owner, *args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,173 @@
+# trial_schedule.py — Seeded trial schedules, drawn up front and saved with the session
+#
+# Every random draw a session makes per trial — presentation angle (balanced
+# blocks), position within the block, ITI, return angle, reward / choice
+# draws — comes from one NumPy structured array built from the session's
+# random_seed before the first trial. Sessions read row `trial_counter - 1`
+# instead of calling `random` mid-trial, and the array is written to the
+# session folder as schedule.npy, so the plan of any session can be inspected
+# (np.load) and the session reproduced exactly.
+#
+# Fields:
+#   angle         presentation angle, blocks of block_size holding each angle's
+#                 share (equal, or by weight), ordered by trial_sequence under
+#                 the session's constraints (-1 for sessions that present nothing)
+#   block_rank    0..block_size-1, a random permutation per block — sessions
+#                 that split a block by trial type (MixedChoice) use it
+#   iti_u         ITI as a fraction of [ITI_MIN, ITI_MAX] (scaled when used,
+#                 so the ITI range can still be set after the schedule is built)
+#   return_angle  turntable angle after the trial (-1 when unused)
+#   return_turn   signed turn away from the presentation angle, for sessions
+#                 that return relative to it (Phase 4 Stimuli; 0 when unused)
+#   reward_draw   uniform [0, 1): rewarded when below the reward probability
+#   choice_draw   uniform [0, 1): index into the choices left open
+#
+# Rows are drawn CHUNK_TRIALS at a time from np.random.default_rng([seed, k])
+# for chunk k, each chunk continuing the angle sequence of the one before, so
+# a session that outruns the schedule extends it with the same rows a longer
+# schedule would have had (and no run longer than max_run across the seam).
+#
+# Presentation sessions (Social Memory task / passive test) run no trials;
+# their CC ITI before presentation n uses iti_u of row n, and the CC session
+# inside that ITI gets its own TrialSchedule(seed, stream=(n,)).
+#
+# Usage (build_session in each main_*):
+#   session.schedule = session.make_schedule(params["random_seed"])
+#   ...
+#   session.schedule.save(save_dir)          # at session end, with any extension
+
+import os
+from dataclasses import replace
+from typing import Dict, Optional, Sequence, Union
+
+import numpy as np
+
+from trial_sequence import SequenceConstraints, apportion, generate_sequence
+
+SCHEDULE_FILE = "schedule.npy"
+CHUNK_TRIALS = 1000
+
+# Plain shuffle of each block's quota
+_ANY_ORDER = SequenceConstraints(max_run=None, transition_weight=0,
+                                 position_weight=0, candidates=1)
+
+SCHEDULE_DTYPE = np.dtype([
+    ("angle",        "<i2"),
+    ("block_rank",   "u1"),
+    ("iti_u",        "<f8"),
+    ("return_angle", "<i2"),
+    ("reward_draw",  "<f8"),
+    ("choice_draw",  "<f8"),
+    ("return_turn",  "<i2"),    # drawn last: older schedule.npy files lack it
+])
+
+
+class TrialSchedule:
+    """Per-trial draws for one session; row(n) is trial n (1-based)."""
+
+    def __init__(self, seed: int, angles: Union[Sequence[int], Dict[int, float]] = (),
+                 block_size: int = 10, return_angles: Sequence[int] = (),
+                 n_trials: Optional[int] = None,
+                 constraints: Optional[SequenceConstraints] = None,
+                 return_turns: Sequence[int] = (), stream: Sequence[int] = ()):
+        """angles: a list (equal shares) or {angle: relative weight}.
+        constraints: ordering of the angles (default: any order within a block).
+        stream: extra seed words, for a second schedule from the same seed."""
+        self.seed = int(seed)
+        self.stream = tuple(int(w) for w in stream)
+        weights = angles if isinstance(angles, dict) else dict.fromkeys(angles, 1)
+        self.angle_weights = {int(a): w for a, w in weights.items()}
+        self.block_size = block_size
+        self.constraints = replace(constraints or _ANY_ORDER, block_size=block_size)
+        self.return_angles = [int(a) for a in return_angles]
+        self.return_turns = [int(a) for a in return_turns]
+        # Whole blocks per chunk, so extending never splits a block
+        self._chunk = -(-CHUNK_TRIALS // block_size) * block_size
+        self.rows = np.empty(0, dtype=SCHEDULE_DTYPE)
+        self._extend(n_trials or self._chunk)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    # ── Generation ────────────────────────────────────────────────────────────
+
+    def _extend(self, n_trials: int) -> None:
+        while len(self.rows) < n_trials:
+            chunk = self._draw_chunk(len(self.rows) // self._chunk, self.rows["angle"])
+            self.rows = np.concatenate([self.rows, chunk])
+
+    def _draw_chunk(self, k: int, history: np.ndarray) -> np.ndarray:
+        """Rows of chunk k; history: the angles before it, so max_run and the
+        transition balance carry across the seam."""
+        rng = np.random.default_rng([self.seed, *self.stream, k])
+        n, bs = self._chunk, self.block_size
+        rows = np.empty(n, dtype=SCHEDULE_DTYPE)
+
+        if self.angle_weights:
+            counts = apportion(self.angle_weights, n)
+            history = history[-(self.constraints.max_run or 1):].tolist()
+            try:
+                rows["angle"] = generate_sequence(counts, self.constraints, rng, history)
+            except ValueError as e:
+                print(f"[WARN] Trial schedule: {e} — ordering without a run limit")
+                rows["angle"] = generate_sequence(
+                    counts, replace(self.constraints, max_run=None), rng, history)
+        else:
+            rows["angle"] = -1
+        rows["block_rank"] = rng.permuted(np.tile(np.arange(bs), (n // bs, 1)), axis=1).ravel()
+        rows["iti_u"] = rng.random(n)
+        rows["return_angle"] = (rng.choice(self.return_angles, n)
+                                if self.return_angles else -1)
+        rows["reward_draw"] = rng.random(n)
+        rows["choice_draw"] = rng.random(n)
+        rows["return_turn"] = rng.choice(self.return_turns, n) if self.return_turns else 0
+        return rows
+
+    # ── Access ────────────────────────────────────────────────────────────────
+
+    def row(self, trial: int) -> np.void:
+        """Draws for trial `trial` (1-based, i.e. the session's trial_counter)."""
+        if trial > len(self.rows):
+            self._extend(trial)
+        return self.rows[trial - 1]
+
+    def iti(self, trial: int, iti_min: float, iti_max: float) -> float:
+        return iti_min + float(self.row(trial)["iti_u"]) * (iti_max - iti_min)
+
+    def angle_sequence(self, n_trials: int) -> list:
+        """Presentation angles of trials 1..n_trials."""
+        if n_trials > len(self.rows):
+            self._extend(n_trials)
+        return self.rows["angle"][:n_trials].tolist()
+
+    # ── Persistence ───────────────────────────────────────────────────────────
+
+    def save(self, save_dir: str) -> str:
+        path = os.path.join(save_dir, SCHEDULE_FILE)
+        np.save(path, self.rows, allow_pickle=False)
+        print(f"[INFO] Trial schedule saved: {path} ({len(self.rows)} trials)")
+        return path
+
+    def adopt(self, path: str) -> bool:
+        """Replace the rows with a recorded schedule.npy (session replay).
+        Returns False, keeping the regenerated rows, if the file is missing.
+        Warns when the recording differs from what this seed draws now (a
+        NumPy release that changed its generator streams). Fields a recording
+        predates (return_turn) are taken from the regenerated rows."""
+        if not os.path.exists(path):
+            return False
+        recorded = np.load(path, allow_pickle=False)
+        names = recorded.dtype.names or ()
+        if not names or names != SCHEDULE_DTYPE.names[:len(names)]:
+            print(f"[WARN] {path}: unknown schedule layout — using the regenerated schedule")
+            return False
+        n = min(len(recorded), len(self.rows))
+        if any(not np.array_equal(recorded[f][:n], self.rows[f][:n]) for f in names):
+            print(f"[WARN] {path}: recorded schedule differs from seed {self.seed} "
+                  f"— using the recorded one")
+        self._extend(len(recorded))
+        rows = self.rows[:len(recorded)].copy()
+        for name in names:
+            rows[name] = recorded[name]
+        self.rows = rows
+        return True
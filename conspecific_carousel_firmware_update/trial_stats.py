@@ -0,0 +1,462 @@
+# trial_stats.py — incremental trial statistics shared by the GUIs and sessions
+#
+# Every accumulator here is updated in O(1) per appended trial, so callers
+# feed each trial once (as it is recorded) instead of re-deriving metrics
+# from the full results table on every refresh:
+#   HitRate       — running hits / valid trials (NaN / None outcomes skipped)
+#   BlockRates    — hit rate per consecutive block of block_size trials
+#   RollingRate   — mean over the last `window` values
+#
+# Choice metrics (two-sided tasks), also O(1) memory and time per trial:
+#   P2Quantile    — one streaming quantile, P² algorithm (Jain & Chlamtac 1985)
+#   QuantileSketch — several P2Quantiles, e.g. RT median and 10th / 90th pct
+#   SideBias      — share of one side over the last `window` choices and a
+#                   binomial test against 50 / 50 (normal approximation)
+#   WinStayLoseShift — P(same side after a reward), P(other side after none)
+#   DPrime        — d′ and criterion c from stimulus side vs chosen side
+#   ChoiceMetrics — the above for one results table, fed row by row or
+#                   caught up with sync(df) (only rows not yet seen are read)
+#
+#   metrics = ChoiceMetrics(choice="poked_port", correct="correct_port")
+#   metrics.sync(session.results_df)          # O(new rows)
+#   metrics.bias.p_value, metrics.wsls.win_stay, metrics.dprime.value,
+#   metrics.rt.quantile(0.5)
+
+import math
+from collections import deque
+from statistics import NormalDist
+from typing import Callable, Iterable, Optional, Sequence, Union
+
+import numpy as np
+
+
+def _is_missing(x) -> bool:
+    return x is None or (isinstance(x, float) and math.isnan(x))
+
+
+def _as_float(x) -> float:
+    if _is_missing(x):
+        return math.nan
+    try:
+        return float(x)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class HitRate:
+    """Running hit rate over every pushed outcome that is not NaN/None."""
+
+    __slots__ = ("hits", "n")
+
+    def __init__(self):
+        self.hits = 0
+        self.n = 0
+
+    def push(self, hit) -> None:
+        hit = _as_float(hit)
+        if not math.isnan(hit):
+            self.hits += hit
+            self.n += 1
+
+    def reset(self) -> None:
+        self.hits = 0
+        self.n = 0
+
+    @property
+    def rate(self) -> float:
+        """Fraction of hits (NaN before the first valid outcome)."""
+        return self.hits / self.n if self.n else math.nan
+
+    @property
+    def percent(self) -> float:
+        return self.rate * 100
+
+
+class BlockRates:
+    """
+    Hit rate per consecutive block of block_size trials. Blocks count every
+    pushed trial (a NaN outcome still fills its slot) so block b always
+    covers trials b*block_size … (b+1)*block_size − 1; the rate of a block
+    only counts its valid outcomes.
+    """
+
+    def __init__(self, block_size: int = 10):
+        self.block_size = block_size
+        self.n = 0                       # trials pushed
+        self._blocks = []                # HitRate per block
+        self._labels = []                # [first label, last label] per block
+
+    def __len__(self) -> int:
+        return len(self._blocks)
+
+    def push(self, hit, label=None) -> None:
+        if self.n % self.block_size == 0:
+            self._blocks.append(HitRate())
+            self._labels.append([label, label])
+        self._blocks[-1].push(hit)
+        self._labels[-1][1] = label
+        self.n += 1
+
+    def extend(self, hits: Iterable, labels: Optional[Iterable] = None) -> None:
+        if labels is None:
+            for hit in hits:
+                self.push(hit)
+        else:
+            for hit, label in zip(hits, labels):
+                self.push(hit, label)
+
+    def percent(self, block: int) -> float:
+        return self._blocks[block].percent
+
+    def rate(self, block: int) -> float:
+        return self._blocks[block].rate
+
+    def label(self, block: int) -> str:
+        """'first–last' trial labels of the block, or 1-based row numbers."""
+        first, last = self._labels[block]
+        if first is None:
+            start = (block % len(self._blocks)) * self.block_size
+            return f"{start + 1}–{min(start + self.block_size, self.n)}"
+        return f"{first}–{last}"
+
+    def complete(self, block: int) -> bool:
+        return (block % len(self._blocks)) < self.n // self.block_size
+
+
+class RollingRate:
+    """Mean of the last `window` pushed values (fewer at the start)."""
+
+    def __init__(self, window: int = 10):
+        self.window = window
+        self._values = deque()
+        self._sum = 0.0
+        self._n_valid = 0
+
+    def push(self, value) -> float:
+        value = _as_float(value)
+        self._values.append(value)
+        if not math.isnan(value):
+            self._sum += value
+            self._n_valid += 1
+        if len(self._values) > self.window:
+            old = self._values.popleft()
+            if not math.isnan(old):
+                self._sum -= old
+                self._n_valid -= 1
+        return self.value
+
+    def extend(self, values: Iterable) -> np.ndarray:
+        """Push every value; returns the rolling mean after each one."""
+        return np.array([self.push(v) for v in values], dtype=float)
+
+    @property
+    def value(self) -> float:
+        return self._sum / self._n_valid if self._n_valid else math.nan
+
+    @property
+    def percent(self) -> float:
+        return self.value * 100
+
+
+Field = Union[str, Callable[[dict], object], None]
+
+
+def _getter(field: Field):
+    if field is None or callable(field):
+        return field
+    return lambda row: row.get(field)
+
+
+# ── Choice metrics ────────────────────────────────────────────────────────────
+
+class P2Quantile:
+    """
+    Streaming estimate of quantile p (P² algorithm): five markers whose
+    heights track the minimum, p/2, p, (1+p)/2 quantiles and the maximum,
+    adjusted by a parabolic step per value. Exact for the first five values.
+    """
+
+    __slots__ = ("p", "n", "_q", "_pos", "_want", "_step")
+
+    def __init__(self, p: float):
+        self.p = p
+        self.n = 0
+        self._q = []                                    # marker heights
+        self._pos = [0.0, 1.0, 2.0, 3.0, 4.0]           # marker positions
+        self._want = [0.0, 2 * p, 4 * p, 2 + 2 * p, 4.0]
+        self._step = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def push(self, value) -> None:
+        x = _as_float(value)
+        if math.isnan(x):
+            return
+        self.n += 1
+        q = self._q
+        if self.n <= 5:
+            q.append(x)
+            q.sort()
+            return
+
+        if x < q[0]:
+            q[0], k = x, 0
+        elif x >= q[4]:
+            q[4], k = x, 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        pos, want = self._pos, self._want
+        for i in range(k + 1, 5):
+            pos[i] += 1
+        for i in range(5):
+            want[i] += self._step[i]
+
+        for i in (1, 2, 3):
+            d = want[i] - pos[i]
+            if (d >= 1 and pos[i + 1] - pos[i] > 1) or (d <= -1 and pos[i - 1] - pos[i] < -1):
+                d = 1 if d > 0 else -1
+                h = q[i] + d / (pos[i + 1] - pos[i - 1]) * (
+                    (pos[i] - pos[i - 1] + d) * (q[i + 1] - q[i]) / (pos[i + 1] - pos[i])
+                    + (pos[i + 1] - pos[i] - d) * (q[i] - q[i - 1]) / (pos[i] - pos[i - 1]))
+                if not q[i - 1] < h < q[i + 1]:
+                    h = q[i] + d * (q[i + d] - q[i]) / (pos[i + d] - pos[i])
+                q[i] = h
+                pos[i] += d
+
+    @property
+    def value(self) -> float:
+        """Current estimate (NaN before the first value)."""
+        if self.n == 0:
+            return math.nan
+        if self.n <= 5:
+            return float(np.quantile(self._q, self.p))
+        return self._q[2]
+
+
+class QuantileSketch:
+    """P² estimates of several quantiles of the pushed values (NaN skipped)."""
+
+    def __init__(self, quantiles: Sequence[float] = (0.1, 0.5, 0.9)):
+        self._est = {q: P2Quantile(q) for q in quantiles}
+
+    def push(self, value) -> None:
+        for est in self._est.values():
+            est.push(value)
+
+    @property
+    def n(self) -> int:
+        return next(iter(self._est.values())).n if self._est else 0
+
+    def quantile(self, q: float) -> float:
+        return self._est[q].value
+
+    def as_dict(self) -> dict:
+        return {q: est.value for q, est in self._est.items()}
+
+
+class SideBias:
+    """
+    Choices of sides[0] vs sides[1] over the last `window` trials (None /
+    NaN / other ports skipped). index runs from -1 (all sides[1]) to +1 (all
+    sides[0]); p_value is the two-sided binomial test of the window against
+    50 / 50, normal approximation with continuity correction.
+    """
+
+    def __init__(self, sides: Sequence[str] = ("A", "B"), window: int = 20):
+        self.sides = tuple(sides)
+        self.window = window
+        self._recent = RollingRate(window)
+        self.counts = {side: 0 for side in self.sides}      # whole session
+
+    def push(self, side) -> None:
+        if side not in self.counts:
+            return
+        self.counts[side] += 1
+        self._recent.push(side == self.sides[0])
+
+    def reset(self) -> None:
+        """Start a new window (the session totals are kept)."""
+        self._recent = RollingRate(self.window)
+
+    @property
+    def n(self) -> int:
+        return self._recent._n_valid
+
+    @property
+    def index(self) -> float:
+        return 2 * self._recent.value - 1 if self.n else math.nan
+
+    @property
+    def preferred(self) -> Optional[str]:
+        if not self.n or self.index == 0:
+            return None
+        return self.sides[0] if self.index > 0 else self.sides[1]
+
+    @property
+    def p_value(self) -> float:
+        n = self.n
+        if not n:
+            return math.nan
+        k = self._recent._sum
+        z = max(0.0, abs(k - n / 2) - 0.5) / math.sqrt(n / 4)
+        return math.erfc(z / math.sqrt(2))
+
+
+class WinStayLoseShift:
+    """P(choose the same side again | last choice rewarded) and
+    P(switch side | last choice unrewarded), over consecutive choices."""
+
+    __slots__ = ("_last", "_last_win", "wins", "stays", "losses", "shifts")
+
+    def __init__(self):
+        self._last = None
+        self._last_win = False
+        self.wins = self.stays = self.losses = self.shifts = 0
+
+    def push(self, side, rewarded) -> None:
+        if _is_missing(side):
+            return          # no choice: the next one still follows the last
+        if self._last is not None:
+            if self._last_win:
+                self.wins += 1
+                self.stays += side == self._last
+            else:
+                self.losses += 1
+                self.shifts += side != self._last
+        self._last = side
+        self._last_win = bool(_as_float(rewarded) == 1.0)
+
+    @property
+    def win_stay(self) -> float:
+        return self.stays / self.wins if self.wins else math.nan
+
+    @property
+    def lose_shift(self) -> float:
+        return self.shifts / self.losses if self.losses else math.nan
+
+
+_Z = NormalDist().inv_cdf
+
+
+class DPrime:
+    """
+    Signal detection for a 2AFC: "signal" trials are those whose correct
+    side is sides[0], a "yes" is choosing sides[0]. Rates use the log-linear
+    correction ((k + 0.5) / (n + 1)) so d′ stays finite at 0 % / 100 %.
+    Trials without a choice on either side are skipped.
+    """
+
+    __slots__ = ("sides", "hits", "signal", "false_alarms", "noise")
+
+    def __init__(self, sides: Sequence[str] = ("A", "B")):
+        self.sides = tuple(sides)
+        self.hits = self.signal = self.false_alarms = self.noise = 0
+
+    def push(self, correct, choice) -> None:
+        if correct not in self.sides or choice not in self.sides:
+            return
+        yes = choice == self.sides[0]
+        if correct == self.sides[0]:
+            self.signal += 1
+            self.hits += yes
+        else:
+            self.noise += 1
+            self.false_alarms += yes
+
+    def _rates(self):
+        return ((self.hits + 0.5) / (self.signal + 1),
+                (self.false_alarms + 0.5) / (self.noise + 1))
+
+    @property
+    def value(self) -> float:
+        """d′ (NaN until both stimulus sides have been shown)."""
+        if not (self.signal and self.noise):
+            return math.nan
+        h, f = self._rates()
+        return _Z(h) - _Z(f)
+
+    @property
+    def criterion(self) -> float:
+        """c: > 0 is a bias toward sides[1], < 0 toward sides[0]."""
+        if not (self.signal and self.noise):
+            return math.nan
+        h, f = self._rates()
+        return -(_Z(h) + _Z(f)) / 2
+
+
+class ChoiceMetrics:
+    """
+    Side bias, win-stay / lose-shift, d′ and RT quantiles for one results
+    table. choice, correct, reward and rt are column names or callables on
+    the row dict (correct=None for sessions without a correct side, which
+    leaves d′ NaN). Fed with append(row) as trials are recorded, or caught
+    up from a growing DataFrame with sync(df).
+    """
+
+    def __init__(
+        self,
+        choice: Field = "poked_port",
+        correct: Field = None,
+        reward: Field = "reward_triggered",
+        rt: Field = "rt",
+        sides: Sequence[str] = ("A", "B"),
+        window: int = 20,
+        quantiles: Sequence[float] = (0.1, 0.5, 0.9),
+    ):
+        self._choice = _getter(choice)
+        self._correct = _getter(correct)
+        self._reward = _getter(reward)
+        self._rt = _getter(rt)
+        self.n = 0
+        self.bias = SideBias(sides, window)
+        self.wsls = WinStayLoseShift()
+        self.dprime = DPrime(sides)
+        self.rt = QuantileSketch(quantiles)
+
+    def append(self, row: dict) -> None:
+        choice = self._choice(row) if self._choice else None
+        self.bias.push(choice)
+        self.wsls.push(choice, self._reward(row) if self._reward else None)
+        if self._correct:
+            self.dprime.push(self._correct(row), choice)
+        if self._rt:
+            self.rt.push(self._rt(row))
+        self.n += 1
+
+    def sync(self, df) -> int:
+        """Append the rows of df past the ones already seen; returns how many."""
+        if df is None or len(df) <= self.n:
+            return 0
+        new = df.iloc[self.n:]
+        for row in new.to_dict("records"):
+            self.append(row)
+        return len(new)
+
+    def summary(self) -> dict:
+        return {
+            "n": self.n,
+            "side_bias": self.bias.index,
+            "side_bias_p": self.bias.p_value,
+            "win_stay": self.wsls.win_stay,
+            "lose_shift": self.wsls.lose_shift,
+            "dprime": self.dprime.value,
+            "criterion": self.dprime.criterion,
+            "rt_quantiles": self.rt.as_dict(),
+        }
+
+    def describe(self) -> str:
+        """One line for a GUI panel; metrics not available yet are left out."""
+        parts = []
+        b = self.bias
+        if b.n:
+            parts.append(f"bias {b.sides[0]}−{b.sides[1]} {b.index:+.2f} "
+                         f"(last {b.n}, p={b.p_value:.3f})")
+        if self.wsls.wins or self.wsls.losses:
+            parts.append(f"win-stay {self.wsls.win_stay:.0%}  lose-shift {self.wsls.lose_shift:.0%}"
+                         .replace("nan%", "–"))
+        if not math.isnan(self.dprime.value):
+            parts.append(f"d′ {self.dprime.value:.2f} (c {self.dprime.criterion:+.2f})")
+        if self.rt.n:
+            parts.append("RT " + " / ".join(f"p{q * 100:g} {v:.2f}"
+                                            for q, v in self.rt.as_dict().items()) + " s")
+        return "   |   ".join(parts)